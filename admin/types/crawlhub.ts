@@ -8,6 +8,8 @@ export type Project = {
   id: string
   name: string
   description: string | null
+  schedule_weight: number
+  max_concurrency: number | null
   created_at: string
   updated_at: string
   spider_count?: number
@@ -16,11 +18,29 @@ export type Project = {
 export type ProjectCreate = {
   name: string
   description?: string
+  schedule_weight?: number
+  max_concurrency?: number | null
 }
 
 export type ProjectUpdate = {
   name?: string
   description?: string
+  schedule_weight?: number
+  max_concurrency?: number | null
+}
+
+export type ProjectQueueStats = {
+  project_id: string
+  project_name: string | null
+  depth: number
+  depth_by_priority: Record<'manual' | 'schedule' | 'retry', number>
+  delayed: number
+  inflight: number
+  enqueued: number
+  dispatched: number
+  oldest_wait_seconds: number
+  avg_wait_seconds: number | null
+  max_wait_seconds: number | null
 }
 
 export type ProjectsQueryParams = {
@@ -45,6 +65,8 @@ export type Spider = {
   start_url: string | null
   script_content: string | null
   cron_expr: string | null
+  next_run_at: string | null
+  schedule_jitter_seconds: number | null
   is_active: boolean
   entry_point: string | null
   source: ProjectSource
@@ -58,6 +80,9 @@ export type Spider = {
   timeout_seconds: number | null
   max_items: number | null
   memory_limit_mb: number | null
+  cpu_limit: number | null
+  io_weight: number | null
+  shard_count: number | null
   requirements_txt: string | null
   env_vars: string | null
   // 代理与限速
@@ -90,6 +115,7 @@ export type SpiderUpdate = {
   start_url?: string
   script_content?: string
   cron_expr?: string
+  schedule_jitter_seconds?: number | null
   is_active?: boolean
   entry_point?: string
   source?: ProjectSource
@@ -98,6 +124,9 @@ export type SpiderUpdate = {
   timeout_seconds?: number | null
   max_items?: number | null
   memory_limit_mb?: number | null
+  cpu_limit?: number | null
+  io_weight?: number | null
+  shard_count?: number | null
   requirements_txt?: string | null
   env_vars?: string | null
   proxy_enabled?: boolean | null
@@ -154,6 +183,15 @@ export type CrawlHubTask = {
   last_heartbeat: string | null
   items_per_second: number | null
   peak_memory_mb: number | null
+  cpu_seconds: number | null
+  io_read_bytes: number | null
+  io_write_bytes: number | null
+  oom_killed: boolean | null
+  parent_task_id: string | null
+  shard_index: number | null
+  shard_count: number | null
+  scheduled_for: string | null
+  dispatch_delay_seconds: number | null
   created_at: string
   updated_at: string
 }
@@ -0,0 +1,38 @@
+"""add sharded run fields
+
+Revision ID: a7b8c9d0e1f2
+Revises: f6a7b8c9d0e1
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7b8c9d0e1f2'
+down_revision: Union[str, Sequence[str], None] = 'f6a7b8c9d0e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add shard count to spiders and parent/shard fields to tasks."""
+    op.add_column('crawlhub_spiders', sa.Column('shard_count', sa.Integer(), nullable=True, comment='分片数(大于1时拆分为多个子任务并行执行)'))
+
+    op.add_column('crawlhub_tasks', sa.Column('parent_task_id', UUID(as_uuid=False), nullable=True, comment='分片父任务ID'))
+    op.add_column('crawlhub_tasks', sa.Column('shard_index', sa.Integer(), nullable=True, comment='分片序号'))
+    op.add_column('crawlhub_tasks', sa.Column('shard_count', sa.Integer(), nullable=True, comment='分片总数'))
+    op.create_index('crawlhub_tasks_parent_task_id_idx', 'crawlhub_tasks', ['parent_task_id'])
+
+
+def downgrade() -> None:
+    """Remove sharded run fields."""
+    op.drop_index('crawlhub_tasks_parent_task_id_idx', table_name='crawlhub_tasks')
+    op.drop_column('crawlhub_tasks', 'shard_count')
+    op.drop_column('crawlhub_tasks', 'shard_index')
+    op.drop_column('crawlhub_tasks', 'parent_task_id')
+
+    op.drop_column('crawlhub_spiders', 'shard_count')
@@ -0,0 +1,32 @@
+"""add spider next_run_at
+
+Revision ID: b8c9d0e1f2a3
+Revises: a7b8c9d0e1f2
+Create Date: 2026-10-16 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8c9d0e1f2a3'
+down_revision: Union[str, Sequence[str], None] = 'a7b8c9d0e1f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add indexed next scheduled run time to spiders.
+
+    Existing cron spiders are filled in by the scheduler on its first tick.
+    """
+    op.add_column('crawlhub_spiders', sa.Column('next_run_at', sa.DateTime(), nullable=True, comment='下次定时调度时间'))
+    op.create_index('crawlhub_spiders_next_run_at_idx', 'crawlhub_spiders', ['next_run_at'])
+
+
+def downgrade() -> None:
+    """Remove spider next_run_at."""
+    op.drop_index('crawlhub_spiders_next_run_at_idx', table_name='crawlhub_spiders')
+    op.drop_column('crawlhub_spiders', 'next_run_at')
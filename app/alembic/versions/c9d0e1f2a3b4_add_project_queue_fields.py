@@ -0,0 +1,29 @@
+"""add project queue fields
+
+Revision ID: c9d0e1f2a3b4
+Revises: b8c9d0e1f2a3
+Create Date: 2026-10-16 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9d0e1f2a3b4'
+down_revision: Union[str, Sequence[str], None] = 'b8c9d0e1f2a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add fair-queue weight and concurrency cap to projects."""
+    op.add_column('crawlhub_projects', sa.Column('schedule_weight', sa.Integer(), server_default='1', nullable=False, comment='调度权重(公平队列中的份额)'))
+    op.add_column('crawlhub_projects', sa.Column('max_concurrency', sa.Integer(), nullable=True, comment='最大并发运行数'))
+
+
+def downgrade() -> None:
+    """Remove project queue fields."""
+    op.drop_column('crawlhub_projects', 'max_concurrency')
+    op.drop_column('crawlhub_projects', 'schedule_weight')
@@ -0,0 +1,33 @@
+"""add schedule smoothing fields
+
+Revision ID: d0e1f2a3b4c5
+Revises: c9d0e1f2a3b4
+Create Date: 2026-10-16 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'd0e1f2a3b4c5'
+down_revision: Union[str, Sequence[str], None] = 'c9d0e1f2a3b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add spider schedule jitter and task dispatch delay fields."""
+    op.add_column('crawlhub_spiders', sa.Column('schedule_jitter_seconds', sa.Integer(), nullable=True, comment='定时调度错峰窗口(秒)'))
+
+    op.add_column('crawlhub_tasks', sa.Column('scheduled_for', sa.DateTime(), nullable=True, comment='计划执行时间'))
+    op.add_column('crawlhub_tasks', sa.Column('dispatch_delay_seconds', sa.Float(), nullable=True, comment='调度延迟(秒)'))
+
+
+def downgrade() -> None:
+    """Remove schedule smoothing fields."""
+    op.drop_column('crawlhub_tasks', 'dispatch_delay_seconds')
+    op.drop_column('crawlhub_tasks', 'scheduled_for')
+
+    op.drop_column('crawlhub_spiders', 'schedule_jitter_seconds')
@@ -0,0 +1,32 @@
+"""add task running heartbeat index
+
+Revision ID: e1f2a3b4c5d6
+Revises: d0e1f2a3b4c5
+Create Date: 2026-10-16 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1f2a3b4c5d6'
+down_revision: Union[str, Sequence[str], None] = 'd0e1f2a3b4c5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add partial index for the heartbeat timeout sweep."""
+    op.create_index(
+        'crawlhub_tasks_running_heartbeat_idx',
+        'crawlhub_tasks',
+        ['last_heartbeat'],
+        postgresql_where=sa.text("status = 'running'"),
+    )
+
+
+def downgrade() -> None:
+    """Remove the heartbeat sweep index."""
+    op.drop_index('crawlhub_tasks_running_heartbeat_idx', table_name='crawlhub_tasks')
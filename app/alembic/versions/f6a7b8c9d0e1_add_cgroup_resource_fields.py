@@ -0,0 +1,39 @@
+"""add cgroup resource limits and accounting fields
+
+Revision ID: f6a7b8c9d0e1
+Revises: e5f6a7b8c9d0
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6a7b8c9d0e1'
+down_revision: Union[str, Sequence[str], None] = 'e5f6a7b8c9d0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add cgroup limits to spiders and resource usage to tasks."""
+    op.add_column('crawlhub_spiders', sa.Column('cpu_limit', sa.Float(), nullable=True, comment='CPU 配额(核)'))
+    op.add_column('crawlhub_spiders', sa.Column('io_weight', sa.Integer(), nullable=True, comment='IO 权重(1-10000)'))
+
+    op.add_column('crawlhub_tasks', sa.Column('cpu_seconds', sa.Float(), nullable=True, comment='CPU 时间(秒)'))
+    op.add_column('crawlhub_tasks', sa.Column('io_read_bytes', sa.BigInteger(), nullable=True, comment='磁盘读取字节数'))
+    op.add_column('crawlhub_tasks', sa.Column('io_write_bytes', sa.BigInteger(), nullable=True, comment='磁盘写入字节数'))
+    op.add_column('crawlhub_tasks', sa.Column('oom_killed', sa.Boolean(), nullable=True, comment='是否因内存超限被终止'))
+
+
+def downgrade() -> None:
+    """Remove cgroup resource fields."""
+    op.drop_column('crawlhub_tasks', 'oom_killed')
+    op.drop_column('crawlhub_tasks', 'io_write_bytes')
+    op.drop_column('crawlhub_tasks', 'io_read_bytes')
+    op.drop_column('crawlhub_tasks', 'cpu_seconds')
+
+    op.drop_column('crawlhub_spiders', 'io_weight')
+    op.drop_column('crawlhub_spiders', 'cpu_limit')
@@ -20,9 +20,21 @@ function start_serve() {
   done
 }
 
+function setup_cgroup() {
+  # cgroup v2: 将容器内现有进程移入叶子节点 worker，
+  # 使 crawlhub 节点可以启用 cpu/memory/io 控制器为每个爬虫任务创建子 cgroup
+  if [ "${CRAWLHUB_CGROUP_ENABLED:-auto}" = "false" ] || [ ! -w /sys/fs/cgroup/cgroup.subtree_control ]; then
+    return
+  fi
+  mkdir -p /sys/fs/cgroup/worker 2>/dev/null || return
+  for pid in $(cat /sys/fs/cgroup/cgroup.procs); do
+    echo "$pid" > /sys/fs/cgroup/worker/cgroup.procs 2>/dev/null || true
+  done
+}
+
 function start_worker() {
   while true; do
-    exec celery -A app.celery worker --loglevel=info --pool=prefork --concurrency=4 &
+    exec celery -A app.celery worker --loglevel=info --pool=${CELERY_WORKER_POOL:-prefork} --concurrency=${CELERY_WORKER_CONCURRENCY:-4} &
     wait -n
   done
 }
@@ -42,6 +54,7 @@ case "${MODE}" in
   ;;
 "worker")
   echo "Starting worker"
+  setup_cgroup
   start_worker &
   ;;
   "beat")
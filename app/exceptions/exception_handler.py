@@ -42,6 +42,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
     return JSONResponse(
         status_code=exc.status_code,
         content=ApiResponse(code=code, msg=exc.detail, data=None).model_dump(),
+        headers=exc.headers,
     )
 
 
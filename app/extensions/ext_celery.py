@@ -133,6 +133,11 @@ def init_app(app: FastAPI) -> Celery:
             "task": "tasks.spider_tasks.run_scheduled_spiders",
             "schedule": crontab(minute="*"),  # 每分钟检查一次
         },
+        # 公平队列下发（入队和运行结束时会立即触发，这里兜底处理重试退避到期等）
+        "crawlhub.dispatch_spider_queue": {
+            "task": "tasks.spider_tasks.dispatch_spider_queue",
+            "schedule": timedelta(seconds=5),
+        },
         # 代理健康检查
         "crawlhub.check_all_proxies": {
             "task": "tasks.proxy_tasks.check_all_proxies",
@@ -142,6 +147,11 @@ def init_app(app: FastAPI) -> Celery:
             "task": "tasks.proxy_tasks.reset_cooldown_proxies",
             "schedule": crontab(minute="*"),  # 每分钟重置冷却
         },
+        # 运行中任务的实时数据（计数、进度、心跳）写回数据库
+        "crawlhub.flush_task_telemetry": {
+            "task": "tasks.spider_tasks.flush_task_telemetry",
+            "schedule": timedelta(seconds=5),
+        },
         # 心跳检查
         "crawlhub.check_task_heartbeats": {
             "task": "tasks.spider_tasks.check_task_heartbeats",
@@ -5,6 +5,7 @@ CrawlHub SDK - 爬虫数据上报 SDK
 
 用法:
     from crawlhub import save_item, report_progress, log, save_checkpoint, load_checkpoint, get_proxy, throttle
+    from crawlhub import get_start_urls, in_shard  # 分片运行
 
     save_item({"title": "...", "url": "..."})
     report_progress(50, "已处理50%")
@@ -15,10 +16,15 @@ CrawlHub SDK - 爬虫数据上报 SDK
 
 import atexit
 import collections
+import gzip
+import hashlib
+import http.client
 import http.cookiejar
+import io
 import json
 import os
 import random
+import signal
 import threading
 import time
 import urllib.error
@@ -35,24 +41,132 @@ _RATE_LIMIT = os.environ.get("CRAWLHUB_RATE_LIMIT", "")
 _MAX_ITEMS = int(os.environ.get("CRAWLHUB_MAX_ITEMS", "0")) or None
 _OUTPUT_DIR = os.environ.get("CRAWLHUB_OUTPUT_DIR", "")
 _DATASOURCES_JSON = os.environ.get("CRAWLHUB_DATASOURCES", "")
+# Runner 通过 SIGTERM 推送取消时为 "1"，此时不再轮询 /task/status
+_CANCEL_VIA_SIGNAL = os.environ.get("CRAWLHUB_CANCEL_VIA_SIGNAL", "") == "1"
+# 分片运行：当前分片序号 / 分片总数，以及分配给本分片的起始 URL（JSON 列表）
+_SHARD_INDEX = int(os.environ.get("CRAWLHUB_SHARD_INDEX", "0"))
+_SHARD_COUNT = max(int(os.environ.get("CRAWLHUB_SHARD_COUNT", "1")), 1)
+_START_URLS_JSON = os.environ.get("CRAWLHUB_START_URLS", "")
 
 # ─── Internal state ───
 
 _buffer: list[dict] = []
 _buffer_lock = threading.Lock()
-_FLUSH_SIZE = 50
+_FLUSH_SIZE = 500
+# 数据缓冲超过该时间（秒）也会上报，采集较慢时数据不会长时间滞留
+_FLUSH_INTERVAL = 5.0
+_last_flush = time.monotonic()
+# 旧接口单次最多接收的条数
+_LEGACY_BATCH_SIZE = 1000
+# 服务端不支持批量接口时回退到 /items
+_bulk_supported = True
+# 服务端写入队列积压时返回 429，按 Retry-After 等待后重试
+_BACKPRESSURE_RETRIES = 5
+_MAX_RETRY_AFTER = 60.0
 _total_saved = 0
 _total_saved_lock = threading.Lock()
 _heartbeat_thread: threading.Thread | None = None
 _heartbeat_stop = threading.Event()
 _last_throttle = 0.0
 _throttle_lock = threading.Lock()
+# 持久连接（HTTP keep-alive）：每个线程复用一条到平台的连接，避免每次调用都重新建连和 TLS 握手
+_conn_local = threading.local()
+# 连接空闲超过该时长（秒）后重新建连，应小于服务端的 keep-alive 超时（uvicorn 默认 5 秒）
+_KEEPALIVE_IDLE = float(os.environ.get("CRAWLHUB_KEEPALIVE_IDLE", "4"))
+# 控制通道：长轮询 /control 接收取消、限速变更和代理轮换；可用时心跳不再轮询任务状态
+_CONTROL_WAIT = 25
+_control_thread: threading.Thread | None = None
+_control_active = False
 
 
 def _is_configured() -> bool:
     return bool(_TASK_ID and _SPIDER_ID and _API_URL)
 
 
+def _close_connection() -> None:
+    conn = getattr(_conn_local, "conn", None)
+    _conn_local.conn = None
+    if conn is not None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+class _RequestNotSent(Exception):
+    """请求未能完整发出（如服务端已关闭空闲的持久连接），服务端不会处理，可以安全重发"""
+
+
+def _keepalive_request(req: urllib.request.Request, timeout: float):
+    """在当前线程的持久连接上发送请求，返回 (status, reason, headers, body)"""
+    parts = urllib.parse.urlsplit(req.full_url)
+    conn = getattr(_conn_local, "conn", None)
+    if conn is not None and (
+        getattr(_conn_local, "netloc", None) != parts.netloc
+        or time.monotonic() - getattr(_conn_local, "last_used", 0.0) > _KEEPALIVE_IDLE
+    ):
+        _close_connection()
+        conn = None
+    if conn is None:
+        conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        conn = conn_cls(parts.netloc, timeout=timeout)
+        _conn_local.conn, _conn_local.netloc = conn, parts.netloc
+    conn.timeout = timeout
+    if conn.sock is not None:
+        conn.sock.settimeout(timeout)
+
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    try:
+        conn.request(req.get_method(), path, body=req.data, headers=dict(req.header_items()))
+    except TimeoutError:
+        _close_connection()
+        raise
+    except (OSError, http.client.HTTPException) as e:
+        _close_connection()
+        raise _RequestNotSent(e) from e
+    except BaseException:
+        _close_connection()
+        raise
+    try:
+        resp = conn.getresponse()
+        body = resp.read()
+    except BaseException:
+        _close_connection()
+        raise
+    if resp.will_close:
+        _close_connection()
+    else:
+        _conn_local.last_used = time.monotonic()
+    return resp.status, resp.reason, resp.headers, body
+
+
+def _open(req: urllib.request.Request, timeout: float) -> bytes:
+    """发送请求并返回响应体，4xx/5xx 时抛出 HTTPError（与 urlopen 一致）
+
+    优先使用持久连接；请求未能发出时用新连接重发一次。请求发出后的失败（如读取响应时
+    连接断开）直接抛出，服务端可能已经处理，重发会导致数据重复写入。
+    """
+    try:
+        status, reason, headers, body = _keepalive_request(req, timeout)
+    except _RequestNotSent:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.read()
+    if status >= 400:
+        raise urllib.error.HTTPError(req.full_url, status, reason, headers, io.BytesIO(body))
+    return body
+
+
+def _retry_after(e: urllib.error.HTTPError) -> float | None:
+    """429 响应建议的等待秒数，其他错误返回 None"""
+    if e.code != 429:
+        return None
+    try:
+        seconds = float(e.headers.get("Retry-After", "5"))
+    except (TypeError, ValueError):
+        seconds = 5.0
+    return min(max(seconds, 0.5), _MAX_RETRY_AFTER)
+
+
 def _post(path: str, data: dict) -> dict | None:
     """Send a POST request to the internal API. Returns parsed JSON or None on failure."""
     if not _API_URL:
@@ -65,18 +179,22 @@ def _post(path: str, data: dict) -> dict | None:
         headers={"Content-Type": "application/json"},
         method="POST",
     )
-    try:
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            return json.loads(resp.read().decode("utf-8"))
-    except urllib.error.HTTPError as e:
-        import sys
-        body = e.read().decode("utf-8", errors="replace")[:200] if e.fp else ""
-        print(f"[crawlhub:error] POST {url} → {e.code}: {body}", file=sys.stderr)
-        return None
-    except Exception as e:
-        import sys
-        print(f"[crawlhub:error] POST {url} failed: {e}", file=sys.stderr)
-        return None
+    for attempt in range(_BACKPRESSURE_RETRIES + 1):
+        try:
+            return json.loads(_open(req, timeout=10).decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            wait = _retry_after(e)
+            if wait is not None and attempt < _BACKPRESSURE_RETRIES:
+                time.sleep(wait)
+                continue
+            import sys
+            body = e.read().decode("utf-8", errors="replace")[:200] if e.fp else ""
+            print(f"[crawlhub:error] POST {url} → {e.code}: {body}", file=sys.stderr)
+            return None
+        except Exception as e:
+            import sys
+            print(f"[crawlhub:error] POST {url} failed: {e}", file=sys.stderr)
+            return None
 
 
 def _get(path: str) -> dict | None:
@@ -86,8 +204,7 @@ def _get(path: str) -> dict | None:
     url = f"{_API_URL}/crawlhub/internal{path}"
     req = urllib.request.Request(url, method="GET")
     try:
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            return json.loads(resp.read().decode("utf-8"))
+        return json.loads(_open(req, timeout=10).decode("utf-8"))
     except urllib.error.HTTPError as e:
         import sys
         print(f"[crawlhub:error] GET {url} → {e.code}", file=sys.stderr)
@@ -98,10 +215,52 @@ def _get(path: str) -> dict | None:
         return None
 
 
+def _post_bulk(items: list[dict]) -> bool:
+    """以 gzip 压缩的 NDJSON 上报到批量接口。服务端不支持时返回 False，由调用方回退到旧接口"""
+    global _bulk_supported
+    query = urllib.parse.urlencode({"task_id": _TASK_ID, "spider_id": _SPIDER_ID})
+    url = f"{_API_URL}/crawlhub/internal/items/bulk?{query}"
+    try:
+        body = "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in items)
+        payload = gzip.compress(body.encode("utf-8"), compresslevel=1)
+    except (TypeError, ValueError) as e:
+        import sys
+        print(f"[crawlhub:error] encode items failed: {e}", file=sys.stderr)
+        return True
+    req = urllib.request.Request(
+        url,
+        data=payload,
+        headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"},
+        method="POST",
+    )
+    for attempt in range(_BACKPRESSURE_RETRIES + 1):
+        try:
+            _open(req, timeout=30)
+            return True
+        except urllib.error.HTTPError as e:
+            if e.code in (404, 405, 415):
+                _bulk_supported = False
+                return False
+            wait = _retry_after(e)
+            if wait is not None and attempt < _BACKPRESSURE_RETRIES:
+                time.sleep(wait)
+                continue
+            import sys
+            body = e.read().decode("utf-8", errors="replace")[:200] if e.fp else ""
+            print(f"[crawlhub:error] POST {url} → {e.code}: {body}", file=sys.stderr)
+            return True
+        except Exception as e:
+            import sys
+            print(f"[crawlhub:error] POST {url} failed: {e}", file=sys.stderr)
+            return True
+    return True
+
+
 def _flush() -> None:
     """Flush buffered items to the API."""
-    global _buffer
+    global _buffer, _last_flush
     with _buffer_lock:
+        _last_flush = time.monotonic()
         if not _buffer:
             return
         items = _buffer[:]
@@ -110,15 +269,19 @@ def _flush() -> None:
     if not _is_configured():
         return
 
-    _post("/items", {
-        "task_id": _TASK_ID,
-        "spider_id": _SPIDER_ID,
-        "items": items,
-    })
+    if _bulk_supported and _post_bulk(items):
+        return
+
+    for start in range(0, len(items), _LEGACY_BATCH_SIZE):
+        _post("/items", {
+            "task_id": _TASK_ID,
+            "spider_id": _SPIDER_ID,
+            "items": items[start:start + _LEGACY_BATCH_SIZE],
+        })
 
 
 def save_item(item: dict) -> None:
-    """Save a single crawled item. Buffers locally and flushes in batches of 50."""
+    """Save a single crawled item. Buffers locally and flushes in batches of 500 (or every 5s)."""
     global _total_saved
 
     if not isinstance(item, dict):
@@ -133,7 +296,10 @@ def save_item(item: dict) -> None:
 
     with _buffer_lock:
         _buffer.append(item)
-        should_flush = len(_buffer) >= _FLUSH_SIZE
+        should_flush = (
+            len(_buffer) >= _FLUSH_SIZE
+            or time.monotonic() - _last_flush >= _FLUSH_INTERVAL
+        )
 
     if should_flush:
         _flush()
@@ -167,10 +333,13 @@ def save_checkpoint(data: dict) -> None:
 
 
 def load_checkpoint() -> dict | None:
-    """Load checkpoint from the most recent failed task of the same spider."""
+    """Load checkpoint from the most recent failed task of the same spider (and shard)."""
     if not _is_configured():
         return None
-    result = _get(f"/checkpoint?spider_id={_SPIDER_ID}")
+    path = f"/checkpoint?spider_id={_SPIDER_ID}"
+    if _SHARD_COUNT > 1:
+        path += f"&shard_index={_SHARD_INDEX}"
+    result = _get(path)
     if result and isinstance(result, dict) and "data" in result:
         data = result["data"]
         if isinstance(data, dict) and data.get("checkpoint_data"):
@@ -229,6 +398,39 @@ def get_datasource(name: str) -> dict | None:
     return None
 
 
+# ─── Sharded runs ───
+
+def get_shard() -> tuple[int, int]:
+    """返回 (分片序号, 分片总数)，未分片运行时为 (0, 1)。"""
+    return _SHARD_INDEX, _SHARD_COUNT
+
+
+def in_shard(key: str) -> bool:
+    """判断 key（通常是 URL）是否归当前分片处理。
+
+    按稳定哈希分配，所有分片对同一 key 的判断一致，可用于切分动态发现的抓取队列。
+    """
+    if _SHARD_COUNT <= 1:
+        return True
+    digest = hashlib.md5(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % _SHARD_COUNT == _SHARD_INDEX
+
+
+def get_start_urls(default: list[str] | None = None) -> list[str]:
+    """返回当前分片的起始 URL。
+
+    优先使用平台按分片切分好的起始 URL；否则从 default 中筛选归属本分片的 URL。
+    """
+    if _START_URLS_JSON:
+        try:
+            urls = json.loads(_START_URLS_JSON)
+            if isinstance(urls, list):
+                return [str(u) for u in urls]
+        except (json.JSONDecodeError, TypeError):
+            pass
+    return [u for u in (default or []) if in_shard(u)]
+
+
 # ─── Heartbeat background thread ───
 
 _cancelled = False
@@ -259,11 +461,33 @@ def _check_cancellation() -> None:
             os._exit(130)
 
 
+def _on_sigterm(signum, frame) -> None:
+    """SIGTERM from the runner means the task was cancelled."""
+    global _cancelled
+    with _cancelled_lock:
+        _cancelled = True
+    os._exit(130)
+
+
+def _install_cancel_handler() -> None:
+    # Only the main thread can install handlers; keep any handler the spider set itself
+    if threading.current_thread() is not threading.main_thread():
+        return
+    if signal.getsignal(signal.SIGTERM) in (signal.SIG_DFL, None):
+        signal.signal(signal.SIGTERM, _on_sigterm)
+
+
 def _heartbeat_loop() -> None:
-    """Background thread: send heartbeat every 30 seconds + check cancellation."""
+    """Background thread: send heartbeat every 30 seconds + check cancellation.
+
+    When the runner pushes cancellation via SIGTERM the status poll is skipped.
+    """
     while not _heartbeat_stop.wait(30):
         if not _is_configured():
             continue
+        # 采集停顿时缓冲中的数据也能及时上报
+        if time.monotonic() - _last_flush >= _FLUSH_INTERVAL:
+            _flush()
         with _total_saved_lock:
             count = _total_saved
         _post("/heartbeat", {
@@ -271,7 +495,8 @@ def _heartbeat_loop() -> None:
             "items_count": count,
         })
         # Check for cancellation
-        _check_cancellation()
+        if not _CANCEL_VIA_SIGNAL and not _control_active:
+            _check_cancellation()
 
 
 def _start_heartbeat() -> None:
@@ -282,6 +507,71 @@ def _start_heartbeat() -> None:
     _heartbeat_thread.start()
 
 
+# ─── Control channel ───
+
+def _apply_control(message: dict) -> None:
+    """执行平台下发的控制消息"""
+    global _cancelled, _RATE_LIMIT, _current_proxy
+    kind = message.get("type")
+    data = message.get("data") or {}
+    if kind == "cancel":
+        with _cancelled_lock:
+            _cancelled = True
+        os._exit(130)
+    elif kind == "rate_limit":
+        rps = data.get("rps")
+        _RATE_LIMIT = str(rps) if rps else ""
+    elif kind == "proxy" and data.get("proxy_url"):
+        _current_proxy = data["proxy_url"]
+
+
+def _control_loop() -> None:
+    """Background thread: long-poll the platform's control channel.
+
+    While the channel works the heartbeat loop skips the status poll. An older platform
+    without /control (404) stops the loop; other failures back off and retry.
+    """
+    global _control_active
+    cursor = ""
+    failures = 0
+    while not _heartbeat_stop.is_set():
+        query = {"task_id": _TASK_ID, "spider_id": _SPIDER_ID, "wait": _CONTROL_WAIT}
+        if cursor:
+            query["cursor"] = cursor
+        req = urllib.request.Request(
+            f"{_API_URL}/crawlhub/internal/control?{urllib.parse.urlencode(query)}", method="GET"
+        )
+        try:
+            result = json.loads(_open(req, timeout=_CONTROL_WAIT + 10).decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            if e.code in (404, 405):
+                _control_active = False
+                return
+            result = None
+        except Exception:
+            result = None
+
+        data = result.get("data") if isinstance(result, dict) else None
+        if not isinstance(data, dict):
+            _control_active = False
+            failures += 1
+            _heartbeat_stop.wait(min(2 ** failures, 30))
+            continue
+        failures = 0
+        _control_active = True
+        cursor = data.get("cursor") or cursor
+        for message in data.get("messages") or []:
+            _apply_control(message)
+
+
+def _start_control() -> None:
+    global _control_thread
+    if _control_thread is not None:
+        return
+    _control_thread = threading.Thread(target=_control_loop, daemon=True)
+    _control_thread.start()
+
+
 # ─── Scrapy Pipeline ───
 
 class CrawlHubPipeline:
@@ -561,12 +851,16 @@ class URLFrontier:
     Uses a deque for FIFO ordering and a set for O(1) seen-URL lookups.
     URLs are normalized (fragment removed, query params sorted, scheme/host
     lowercased) before dedup checks.
+
+    With ``sharded=True`` URLs that belong to other shards (see ``in_shard``)
+    are dropped, so each shard of a sharded run crawls a disjoint frontier.
     """
 
-    def __init__(self):
+    def __init__(self, sharded: bool = False):
         self._queue: collections.deque[tuple[str, dict | None]] = collections.deque()
         self._seen: set[str] = set()
         self._lock = threading.Lock()
+        self._sharded = sharded
 
     def add(self, url: str, meta: dict | None = None) -> bool:
         """Add a URL to the frontier.
@@ -576,9 +870,12 @@ class URLFrontier:
             meta: Optional metadata dict to associate with this URL.
 
         Returns:
-            True if the URL was newly added, False if it was already seen.
+            True if the URL was newly added, False if it was already seen
+            or belongs to another shard.
         """
         normalized = _normalize_url(url)
+        if self._sharded and not in_shard(normalized):
+            return False
         with self._lock:
             if normalized in self._seen:
                 return False
@@ -599,6 +896,8 @@ class URLFrontier:
         with self._lock:
             for url in urls:
                 normalized = _normalize_url(url)
+                if self._sharded and not in_shard(normalized):
+                    continue
                 if normalized not in self._seen:
                     self._seen.add(normalized)
                     self._queue.append((url, None))
@@ -957,8 +1256,7 @@ def _upload_file(local_path: str, filename: str) -> None:
         method="POST",
     )
     try:
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            resp.read()
+        _open(req, timeout=30)
     except Exception as e:
         import sys
         print(f"[crawlhub:error] File upload failed: {e}", file=sys.stderr)
@@ -968,5 +1266,8 @@ def _upload_file(local_path: str, filename: str) -> None:
 
 if _is_configured():
     _start_heartbeat()
+    _start_control()
+    if _CANCEL_VIA_SIGNAL:
+        _install_cancel_handler()
     atexit.register(_flush)
     atexit.register(_heartbeat_stop.set)
@@ -1,4 +1,4 @@
-from sqlalchemy import String, Text
+from sqlalchemy import Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from models.base import Base, DefaultFieldsMixin
@@ -11,6 +11,13 @@ class Project(DefaultFieldsMixin, Base):
 
     name: Mapped[str] = mapped_column(String(255), nullable=False, comment="项目名称")
     description: Mapped[str | None] = mapped_column(Text, nullable=True, comment="项目描述")
+    # 调度队列
+    schedule_weight: Mapped[int] = mapped_column(
+        Integer, default=1, server_default="1", comment="调度权重(公平队列中的份额)"
+    )
+    max_concurrency: Mapped[int | None] = mapped_column(
+        Integer, nullable=True, comment="最大并发运行数"
+    )
 
     def __repr__(self) -> str:
         return f"<Project {self.name}>"
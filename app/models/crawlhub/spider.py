@@ -1,6 +1,7 @@
 import enum
+from datetime import datetime
 
-from sqlalchemy import Boolean, Float, Integer, String, Text
+from sqlalchemy import Boolean, DateTime, Float, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from models.base import Base, DefaultFieldsMixin
@@ -27,6 +28,12 @@ class Spider(DefaultFieldsMixin, Base):
     script_content: Mapped[str | None] = mapped_column(Text, nullable=True, comment="脚本内容")
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, comment="是否启用")
     cron_expr: Mapped[str | None] = mapped_column(String(100), nullable=True, comment="Cron表达式")
+    next_run_at: Mapped[datetime | None] = mapped_column(
+        DateTime, nullable=True, index=True, comment="下次定时调度时间"
+    )
+    schedule_jitter_seconds: Mapped[int | None] = mapped_column(
+        Integer, nullable=True, comment="定时调度错峰窗口(秒)"
+    )
     entry_point: Mapped[str | None] = mapped_column(String(255), nullable=True, comment="入口点")
     # Coder 工作区相关
     source: Mapped[ProjectSource] = mapped_column(
@@ -56,6 +63,15 @@ class Spider(DefaultFieldsMixin, Base):
     memory_limit_mb: Mapped[int | None] = mapped_column(
         Integer, nullable=True, comment="内存限制(MB)"
     )
+    cpu_limit: Mapped[float | None] = mapped_column(
+        Float, nullable=True, comment="CPU 配额(核)"
+    )
+    io_weight: Mapped[int | None] = mapped_column(
+        Integer, nullable=True, comment="IO 权重(1-10000)"
+    )
+    shard_count: Mapped[int | None] = mapped_column(
+        Integer, nullable=True, comment="分片数(大于1时拆分为多个子任务并行执行)"
+    )
     requirements_txt: Mapped[str | None] = mapped_column(
         Text, nullable=True, comment="依赖列表"
     )
@@ -1,7 +1,7 @@
 import enum
 from datetime import datetime
 
-from sqlalchemy import Boolean, DateTime, Float, Integer, String, Text
+from sqlalchemy import BigInteger, Boolean, DateTime, Float, Index, Integer, String, Text, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from models.base import Base, DefaultFieldsMixin
@@ -21,6 +21,14 @@ class SpiderTask(DefaultFieldsMixin, Base):
     """爬虫任务"""
 
     __tablename__ = "crawlhub_tasks"
+    __table_args__ = (
+        # 心跳超时扫描只涉及运行中的任务
+        Index(
+            "crawlhub_tasks_running_heartbeat_idx",
+            "last_heartbeat",
+            postgresql_where=text("status = 'running'"),
+        ),
+    )
 
     spider_id: Mapped[str] = mapped_column(StringUUID, nullable=False)
     status: Mapped[SpiderTaskStatus] = mapped_column(
@@ -55,6 +63,40 @@ class SpiderTask(DefaultFieldsMixin, Base):
     peak_memory_mb: Mapped[int | None] = mapped_column(
         Integer, nullable=True, comment="峰值内存(MB)"
     )
+    # 资源统计（cgroup v2）
+    cpu_seconds: Mapped[float | None] = mapped_column(
+        Float, nullable=True, comment="CPU 时间(秒)"
+    )
+    io_read_bytes: Mapped[int | None] = mapped_column(
+        BigInteger, nullable=True, comment="磁盘读取字节数"
+    )
+    io_write_bytes: Mapped[int | None] = mapped_column(
+        BigInteger, nullable=True, comment="磁盘写入字节数"
+    )
+    oom_killed: Mapped[bool | None] = mapped_column(
+        Boolean, nullable=True, comment="是否因内存超限被终止"
+    )
+    # 分片运行：父任务 shard_index 为空，子任务指向父任务
+    parent_task_id: Mapped[str | None] = mapped_column(
+        StringUUID, nullable=True, index=True, comment="分片父任务ID"
+    )
+    shard_index: Mapped[int | None] = mapped_column(
+        Integer, nullable=True, comment="分片序号"
+    )
+    shard_count: Mapped[int | None] = mapped_column(
+        Integer, nullable=True, comment="分片总数"
+    )
+    # 调度延迟：计划执行时间与实际开始执行时间之差
+    scheduled_for: Mapped[datetime | None] = mapped_column(
+        DateTime, nullable=True, comment="计划执行时间"
+    )
+    dispatch_delay_seconds: Mapped[float | None] = mapped_column(
+        Float, nullable=True, comment="调度延迟(秒)"
+    )
+
+    @property
+    def is_shard_parent(self) -> bool:
+        return bool(self.shard_count) and self.parent_task_id is None
 
     def __repr__(self) -> str:
         return f"<SpiderTask {self.id} status={self.status}>"
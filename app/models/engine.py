@@ -36,8 +36,25 @@ TaskSessionLocal = async_sessionmaker(
 )
 
 
+# Set by the spider executor when the worker runs one shared event loop
+_task_runner = None
+
+
+def set_task_runner(runner) -> None:
+    """Route run_async() through a shared event loop (None restores asyncio.run)."""
+    global _task_runner
+    _task_runner = runner
+
+
 def run_async(coro):
-    """Run an async coroutine in Celery worker context (prefork pool)."""
+    """Run an async coroutine in Celery worker context.
+
+    Prefork workers get a fresh event loop per task; in executor mode all tasks
+    of the process share the executor loop so that many spiders can be supervised
+    concurrently and loop-bound clients (Motor) are not rebuilt per task.
+    """
+    if _task_runner is not None:
+        return _task_runner(coro)
     import asyncio
     return asyncio.run(coro)
 
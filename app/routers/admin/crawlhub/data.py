@@ -7,6 +7,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from models.engine import get_db
 from schemas.response import ApiResponse, MessageResponse
 from services.crawlhub.data_service import DataService
+from services.crawlhub.dedup import dedup_service
+from services.crawlhub.ingest_queue import ingest_queue
 
 router = APIRouter(prefix="/data", tags=["CrawlHub - Data"])
 
@@ -211,3 +213,24 @@ async def delete_data(
         count = await service.delete_by_spider(spider_id)
 
     return MessageResponse(msg=f"已删除 {count} 条数据")
+
+
+@router.get("/ingest/lag", response_model=ApiResponse)
+async def get_ingest_lag():
+    """异步写入队列的积压情况（按爬虫统计待写入的数据项数）"""
+    return ApiResponse(data=ingest_queue.lag())
+
+
+@router.get("/dedup/stats", response_model=ApiResponse)
+async def get_dedup_stats(spider_id: str = Query(...)):
+    """去重统计：布隆过滤器内存占用和误判率"""
+    return ApiResponse(data=await dedup_service.stats(spider_id))
+
+
+@router.post("/dedup/seed", response_model=MessageResponse)
+async def seed_dedup(spider_id: str = Query(...)):
+    """用已有数据重建爬虫的去重索引（异步）"""
+    from tasks.data_tasks import seed_spider_dedup
+
+    seed_spider_dedup.delay(spider_id)
+    return MessageResponse(msg="去重索引重建已提交")
@@ -17,6 +17,7 @@ from schemas.crawlhub.datasource import (
 from schemas.platform import PaginatedResponse
 from schemas.response import ApiResponse, MessageResponse
 from services.crawlhub.datasource_service import DataSourceService
+from services.crawlhub.run_context import run_contexts
 from services.crawlhub.spider_datasource_service import SpiderDataSourceService
 
 logger = logging.getLogger(__name__)
@@ -195,6 +196,7 @@ async def start_datasource_container(
     await manager.start_container(ds.container_id)
     ds.status = DataSourceStatus.ACTIVE
     await db.commit()
+    await run_contexts.invalidate_datasource(db, datasource_id)
     return MessageResponse(msg="容器已启动")
 
 
@@ -218,6 +220,7 @@ async def stop_datasource_container(
     await manager.stop_container(ds.container_id)
     ds.status = DataSourceStatus.INACTIVE
     await db.commit()
+    await run_contexts.invalidate_datasource(db, datasource_id)
     return MessageResponse(msg="容器已停止")
 
 
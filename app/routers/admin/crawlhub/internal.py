@@ -1,10 +1,10 @@
-import hashlib
 import json
 import logging
+from collections.abc import AsyncIterator
 from datetime import datetime
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile
-from sqlalchemy import select, text
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, UploadFile
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from extensions.ext_mongodb import mongodb_client
@@ -18,6 +18,15 @@ from schemas.crawlhub.internal import (
     ProxyRotateResponse,
 )
 from schemas.response import ApiResponse, MessageResponse
+from services.crawlhub.bulk_ingest import BULK_BATCH_SIZE, BulkDecoder, RecordTooLarge
+from services.crawlhub.dedup import dedup_service
+from services.crawlhub.ingest_queue import INGEST_WRITE_BEHIND, ingest_queue
+from services.crawlhub.item_schema import REJECTED_SAMPLE_SIZE, item_schemas, record_rejected
+from services.crawlhub.item_sink import ItemSink
+from services.crawlhub.run_context import RunContext, run_contexts
+from services.crawlhub.shard_service import ShardService
+from services.crawlhub.task_control import poll_control
+from services.crawlhub.task_telemetry import task_telemetry
 
 logger = logging.getLogger(__name__)
 
@@ -41,141 +50,196 @@ async def _validate_task(
     return task
 
 
+async def _load_run_context(task_id: str, spider_id: str, db: AsyncSession) -> RunContext:
+    """数据上报的任务校验，读取缓存的运行上下文，命中时不访问数据库"""
+    context = await run_contexts.get(db, task_id, spider_id)
+    if not context:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if context.spider_id != spider_id:
+        raise HTTPException(status_code=400, detail="spider_id 不匹配")
+    if context.status != SpiderTaskStatus.RUNNING:
+        raise HTTPException(status_code=400, detail="任务不在运行状态")
+    return context
+
+
+async def _schema_filter(spider: Spider | None, items: list[dict], sink: ItemSink) -> list[dict]:
+    """按爬虫的 item_schema（JSON Schema）校验，未通过的计入任务 failed_count 并保留样本"""
+    validator = item_schemas.get(spider)
+    if validator is None or not items:
+        return items
+    valid, rejected = validator.validate(items)
+    if rejected:
+        record_rejected(sink.task_id, [
+            {"error": validator.describe(item), "item": item} for item in rejected[:REJECTED_SAMPLE_SIZE]
+        ])
+        await sink.add_failed(len(rejected))
+    return valid
+
+
+def _open_sink(db: AsyncSession, context: RunContext) -> ItemSink:
+    """创建数据写入器，外部数据源使用运行上下文中缓存的结果"""
+    if not context.targets and not mongodb_client.is_enabled():
+        raise HTTPException(status_code=503, detail="MongoDB 未启用且未配置外部数据源")
+    return ItemSink(db, context.task_id, context.spider_id, is_test=context.is_test, targets=context.targets)
+
+
+def _check_backpressure() -> None:
+    """异步写入模式下写入队列积压过多时返回 429，SDK 按 Retry-After 等待后重试"""
+    if not INGEST_WRITE_BEHIND:
+        return
+    retry_after = ingest_queue.retry_after()
+    if retry_after is not None:
+        raise HTTPException(
+            status_code=429, detail="数据写入队列积压，请稍后重试", headers={"Retry-After": str(retry_after)}
+        )
+
+
+def _enqueue(context: RunContext, items: list[dict]) -> bool:
+    """异步写入模式下追加到写入队列，未启用或 Redis 不可用时返回 False，由调用方同步写入"""
+    if not INGEST_WRITE_BEHIND:
+        return False
+    try:
+        ingest_queue.enqueue(context, items)
+        return True
+    except Exception as e:
+        logger.warning(f"Failed to enqueue items for task {context.task_id}, writing directly: {e}")
+        return False
+
+
+async def _write_claimed(sink: ItemSink, items: list[dict]) -> int:
+    """写入已去重认领的数据项，写入失败时释放认领"""
+    hashes = [item["_dedup_hash"] for item in items if "_dedup_hash" in item]
+    try:
+        return await sink.write(items)
+    except Exception:
+        await dedup_service.release(sink.spider_id, hashes)
+        raise
+
+
 @router.post("/items", response_model=MessageResponse)
 async def ingest_items(
     data: ItemsIngestRequest,
     db: AsyncSession = Depends(get_db),
 ):
     """接收爬虫上报的数据项"""
-    task = await _validate_task(data.task_id, data.spider_id, db)
-
-    spider_result = await db.execute(
-        select(Spider).where(Spider.id == data.spider_id)
-    )
-    spider = spider_result.scalar_one_or_none()
+    context = await _load_run_context(data.task_id, data.spider_id, db)
+    _check_backpressure()
+    spider = context.spider
 
-    items_to_insert = data.items
-
-    # Schema validation
-    if spider and spider.item_schema:
-        try:
-            schema = json.loads(spider.item_schema)
-            required_fields = schema.get("required", [])
-            properties = schema.get("properties", {})
-            type_map = {"string": str, "number": (int, float), "integer": int, "boolean": bool, "array": list, "object": dict}
-
-            validated_items = []
-            for item in items_to_insert:
-                valid = True
-                # Check required fields
-                for field in required_fields:
-                    if field not in item or item[field] is None:
-                        logger.warning(f"Item missing required field '{field}', skipping")
-                        valid = False
-                        break
-                if not valid:
-                    continue
-                # Check types
-                for field, field_schema in properties.items():
-                    if field in item and item[field] is not None:
-                        expected_type = type_map.get(field_schema.get("type"))
-                        if expected_type and not isinstance(item[field], expected_type):
-                            logger.warning(f"Item field '{field}' type mismatch, skipping")
-                            valid = False
-                            break
-                if valid:
-                    validated_items.append(item)
-
-            items_to_insert = validated_items
-            if not items_to_insert:
-                return MessageResponse(msg="所有数据未通过 Schema 校验")
-        except json.JSONDecodeError:
-            logger.warning(f"Invalid item_schema for spider {data.spider_id}")
-
-    # 检查是否配置了外部数据源
-    has_datasources = await _has_active_datasources(db, data.spider_id)
-
-    # 去重检查（仅在写入默认 MongoDB 时生效）
-    if not has_datasources and spider and spider.dedup_enabled and spider.dedup_fields:
-        if not mongodb_client.is_enabled():
-            raise HTTPException(status_code=503, detail="MongoDB 未启用且未配置外部数据源")
-        collection = mongodb_client.get_collection("spider_data")
-        dedup_fields = [f.strip() for f in spider.dedup_fields.split(",") if f.strip()]
-        if dedup_fields:
-            filtered = []
-            for item in data.items:
-                hash_parts = {k: item.get(k) for k in sorted(dedup_fields)}
-                dedup_hash = hashlib.md5(
-                    json.dumps(hash_parts, sort_keys=True, default=str).encode()
-                ).hexdigest()
-                existing = await collection.find_one({
-                    "spider_id": data.spider_id,
-                    "dedup_hash": dedup_hash,
-                })
-                if not existing:
-                    item["_dedup_hash"] = dedup_hash
-                    filtered.append(item)
-            items_to_insert = filtered
+    sink = _open_sink(db, context)
+    items_to_insert = await _schema_filter(spider, data.items, sink)
+    if not items_to_insert:
+        return MessageResponse(msg="所有数据未通过 Schema 校验")
+    # 异步写入：去重和写入由消费者完成
+    if _enqueue(context, items_to_insert):
+        return MessageResponse(msg=f"已接收 {len(items_to_insert)} 条数据")
 
+    # 去重检查（与写入目标无关）
+    items_to_insert = await dedup_service.claim(spider, items_to_insert, context.task_id)
     if not items_to_insert:
         return MessageResponse(msg="所有数据已去重，无新数据")
 
-    count = len(items_to_insert)
-
-    if has_datasources:
-        # 有外部数据源 → 只写外部数据源
-        await _fanout_to_datasources(db, data.spider_id, data.task_id, items_to_insert)
-    else:
-        # 无外部数据源 → 写默认 MongoDB
-        if not mongodb_client.is_enabled():
-            raise HTTPException(status_code=503, detail="MongoDB 未启用且未配置外部数据源")
-
-        collection = mongodb_client.get_collection("spider_data")
-        docs = []
-        for item in items_to_insert:
-            dedup_hash = item.pop("_dedup_hash", None)
-            doc = {
-                "task_id": data.task_id,
-                "spider_id": data.spider_id,
-                "data": item,
-                "is_test": task.is_test,
-                "created_at": datetime.utcnow(),
-            }
-            if dedup_hash:
-                doc["dedup_hash"] = dedup_hash
-            docs.append(doc)
-        await collection.insert_many(docs)
-
-    # Atomic increment total_count
-    await db.execute(
-        text(
-            "UPDATE crawlhub_tasks SET total_count = total_count + :n, "
-            "success_count = success_count + :n WHERE id = :task_id"
-        ),
-        {"n": count, "task_id": data.task_id},
-    )
-    await db.commit()
+    count = await _write_claimed(sink, items_to_insert)
 
     return MessageResponse(msg=f"已接收 {count} 条数据")
 
 
+async def _decode_body(request: Request, decoder: BulkDecoder) -> AsyncIterator[list[dict]]:
+    """边读请求体边解码，每个解压输出块产出一组数据，调用方及时写入，内存占用与解压后大小无关"""
+    async for chunk in request.stream():
+        for items in decoder.feed(chunk):
+            yield items
+    for items in decoder.close():
+        yield items
+
+
+@router.post("/items/bulk", response_model=ApiResponse)
+async def ingest_items_bulk(
+    request: Request,
+    task_id: str,
+    spider_id: str,
+    db: AsyncSession = Depends(get_db),
+):
+    """批量接收数据项：请求体为 NDJSON 或 msgpack（可 gzip / zstd 压缩），流式解析并按大批次写入"""
+    context = await _load_run_context(task_id, spider_id, db)
+    _check_backpressure()
+    try:
+        decoder = BulkDecoder(
+            request.headers.get("content-type"), request.headers.get("content-encoding")
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ImportError as e:
+        raise HTTPException(status_code=415, detail=f"服务端未安装 {e.name}，不支持该格式")
+
+    spider = context.spider
+    sink = _open_sink(db, context)
+
+    received = 0
+    written = 0
+    queued = 0
+    rejected = 0
+
+    async def write_batch(batch: list[dict]) -> None:
+        nonlocal received, written, queued, rejected
+        received += len(batch)
+        valid = await _schema_filter(spider, batch, sink)
+        rejected += len(batch) - len(valid)
+        batch = valid
+        if batch and _enqueue(context, batch):
+            queued += len(batch)
+            return
+        if batch:
+            batch = await dedup_service.claim(spider, batch, context.task_id)
+        if batch:
+            written += await _write_claimed(sink, batch)
+
+    pending: list[dict] = []
+    decoded = _decode_body(request, decoder)
+    while True:
+        try:
+            items = await anext(decoded, None)
+        except RecordTooLarge as e:
+            raise HTTPException(status_code=413, detail=f"{e}（已写入 {written + queued} 条）")
+        except Exception as e:
+            logger.warning(f"Failed to decode bulk items for task {task_id}: {e}")
+            raise HTTPException(status_code=400, detail=f"请求体解析失败（已写入 {written + queued} 条）: {e}")
+        if items is None:
+            break
+        pending += items
+        while len(pending) >= BULK_BATCH_SIZE:
+            batch, pending = pending[:BULK_BATCH_SIZE], pending[BULK_BATCH_SIZE:]
+            await write_batch(batch)
+    if pending:
+        await write_batch(pending)
+
+    if decoder.errors:
+        await sink.add_failed(decoder.errors)
+
+    return ApiResponse(data={
+        "received": received, "written": written, "queued": queued, "failed": decoder.errors + rejected,
+    })
+
+
 @router.post("/progress", response_model=MessageResponse)
 async def report_progress(
     data: ProgressReport,
     db: AsyncSession = Depends(get_db),
 ):
     """接收进度上报"""
-    result = await db.execute(
-        select(SpiderTask).where(SpiderTask.id == data.task_id)
-    )
-    task = result.scalar_one_or_none()
-    if not task:
+    # 任务状态走运行上下文缓存，命中时不访问数据库
+    context = await run_contexts.get_task(db, data.task_id)
+    if not context:
         raise HTTPException(status_code=404, detail="任务不存在")
-    if task.status != SpiderTaskStatus.RUNNING:
+    if context.status != SpiderTaskStatus.RUNNING:
         raise HTTPException(status_code=400, detail="任务不在运行状态")
 
-    task.progress = data.progress
-    await db.commit()
+    # 写入 Redis 实时数据，由定时任务批量写回数据库
+    if not task_telemetry.set_progress(context.task_id, data.progress):
+        task = await db.get(SpiderTask, context.task_id)
+        if task:
+            task.progress = data.progress
+            await db.commit()
 
     return MessageResponse(msg="进度已更新")
 
@@ -186,26 +250,33 @@ async def report_heartbeat(
     db: AsyncSession = Depends(get_db),
 ):
     """接收心跳上报"""
-    result = await db.execute(
-        select(SpiderTask).where(SpiderTask.id == data.task_id)
-    )
-    task = result.scalar_one_or_none()
-    if not task:
+    # 任务状态走运行上下文缓存，命中时不访问数据库
+    context = await run_contexts.get_task(db, data.task_id)
+    if not context:
         raise HTTPException(status_code=404, detail="任务不存在")
-    if task.status != SpiderTaskStatus.RUNNING:
+    if context.status != SpiderTaskStatus.RUNNING:
         return MessageResponse(msg="任务不在运行状态")
 
-    task.last_heartbeat = datetime.utcnow()
-    if data.memory_mb is not None:
-        if task.peak_memory_mb is None or data.memory_mb > task.peak_memory_mb:
-            task.peak_memory_mb = int(data.memory_mb)
-    if data.items_count is not None:
-        # Calculate items_per_second
-        if task.started_at:
-            elapsed = (datetime.utcnow() - task.started_at).total_seconds()
-            if elapsed > 0:
-                task.items_per_second = round(data.items_count / elapsed, 2)
-    await db.commit()
+    items_per_second = None
+    if data.items_count is not None and context.started_at:
+        elapsed = (datetime.utcnow() - context.started_at).total_seconds()
+        if elapsed > 0:
+            items_per_second = round(data.items_count / elapsed, 2)
+
+    # 写入 Redis 实时数据，由定时任务批量写回数据库（分片在写回后汇总到父任务）
+    if not task_telemetry.heartbeat(context.task_id, data.memory_mb, items_per_second):
+        task = await db.get(SpiderTask, context.task_id)
+        if not task:
+            raise HTTPException(status_code=404, detail="任务不存在")
+        task.last_heartbeat = datetime.utcnow()
+        if data.memory_mb is not None:
+            if task.peak_memory_mb is None or data.memory_mb > task.peak_memory_mb:
+                task.peak_memory_mb = int(data.memory_mb)
+        if items_per_second is not None:
+            task.items_per_second = items_per_second
+        await db.commit()
+        if task.parent_task_id:
+            await ShardService(db).rollup(task.parent_task_id)
 
     return MessageResponse(msg="心跳已更新")
 
@@ -232,18 +303,19 @@ async def save_checkpoint(
 @router.get("/checkpoint", response_model=ApiResponse)
 async def get_checkpoint(
     spider_id: str,
+    shard_index: int | None = None,
     db: AsyncSession = Depends(get_db),
 ):
-    """获取最近失败任务的断点数据"""
+    """获取最近失败任务的断点数据（分片运行时只取同一分片的断点）"""
+    query = select(SpiderTask).where(
+        SpiderTask.spider_id == spider_id,
+        SpiderTask.status == SpiderTaskStatus.FAILED,
+        SpiderTask.checkpoint_data.isnot(None),
+    )
+    if shard_index is not None:
+        query = query.where(SpiderTask.shard_index == shard_index)
     result = await db.execute(
-        select(SpiderTask)
-        .where(
-            SpiderTask.spider_id == spider_id,
-            SpiderTask.status == SpiderTaskStatus.FAILED,
-            SpiderTask.checkpoint_data.isnot(None),
-        )
-        .order_by(SpiderTask.created_at.desc())
-        .limit(1)
+        query.order_by(SpiderTask.created_at.desc()).limit(1)
     )
     task = result.scalar_one_or_none()
 
@@ -273,62 +345,30 @@ async def get_task_status(
     return ApiResponse(data={"status": task.status.value, "task_id": str(task.id)})
 
 
-async def _has_active_datasources(db: AsyncSession, spider_id: str) -> bool:
-    """检查爬虫是否配置了活跃的外部数据源"""
-    from sqlalchemy import func
-
-    from models.crawlhub import DataSource, DataSourceStatus, SpiderDataSource
-
-    result = await db.execute(
-        select(func.count())
-        .select_from(SpiderDataSource)
-        .join(DataSource, SpiderDataSource.datasource_id == DataSource.id)
-        .where(
-            SpiderDataSource.spider_id == spider_id,
-            SpiderDataSource.is_enabled.is_(True),
-            DataSource.status == DataSourceStatus.ACTIVE,
-        )
-    )
-    return (result.scalar() or 0) > 0
-
-
-async def _fanout_to_datasources(
-    db: AsyncSession, spider_id: str, task_id: str, items: list[dict]
-) -> None:
-    """将数据扇出写入关联的外部数据源"""
-    import asyncio
-
-    from models.crawlhub import DataSource, DataSourceStatus, SpiderDataSource
-    from services.crawlhub.datasource_writer import get_writer
-
-    # 查询启用的关联数据源
-    result = await db.execute(
-        select(SpiderDataSource, DataSource)
-        .join(DataSource, SpiderDataSource.datasource_id == DataSource.id)
-        .where(
-            SpiderDataSource.spider_id == spider_id,
-            SpiderDataSource.is_enabled.is_(True),
-            DataSource.status == DataSourceStatus.ACTIVE,
-        )
-    )
-    rows = result.all()
-    if not rows:
-        return
-
-    semaphore = asyncio.Semaphore(5)
+@router.get("/control", response_model=ApiResponse)
+async def get_control(
+    task_id: str,
+    spider_id: str,
+    cursor: str | None = None,
+    wait: float = Query(25, ge=0, le=30, description="没有新消息时最多等待的秒数"),
+):
+    """SDK 控制通道：长轮询读取平台下发的取消、限速变更和代理轮换消息
 
-    async def _write_to_ds(assoc: SpiderDataSource, datasource: DataSource):
-        async with semaphore:
-            try:
-                writer = get_writer(datasource)
-                await writer.write_items(items, task_id, spider_id, assoc.target_table)
-            except Exception as e:
-                logger.error(
-                    f"Failed to write to datasource {datasource.name} "
-                    f"(table={assoc.target_table}): {e}"
-                )
+    SDK 在持久连接上循环调用，带上次返回的 cursor；有新消息时立即返回，
+    否则等待消息发布通知或超时后返回空列表。等待期间不占用数据库连接。
+    """
+    try:
+        result = await poll_control(task_id, spider_id, cursor, wait)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.warning(f"Failed to read control messages for task {task_id}: {e}")
+        raise HTTPException(status_code=503, detail="控制通道暂不可用")
+    if result is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
 
-    await asyncio.gather(*[_write_to_ds(assoc, ds) for assoc, ds in rows])
+    messages, next_cursor = result
+    return ApiResponse(data={"messages": messages, "cursor": next_cursor})
 
 
 @router.get("/proxy/rotate", response_model=ApiResponse)
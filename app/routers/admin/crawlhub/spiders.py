@@ -1,12 +1,10 @@
-import json
-
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from models.crawlhub import SpiderTask, SpiderTaskStatus
-from models.engine import get_db
+from models.crawlhub import Spider, SpiderTask, SpiderTaskStatus
+from models.engine import AsyncSessionLocal, get_db
 from schemas.crawlhub import (
     SpiderCreate,
     SpiderUpdate,
@@ -15,6 +13,13 @@ from schemas.crawlhub import (
 from schemas.platform import PaginatedResponse
 from schemas.response import ApiResponse, MessageResponse
 from services.crawlhub import SpiderService
+from services.crawlhub.log_stream import (
+    TestRunStream,
+    follow_task_log,
+    format_sse,
+    start_test_run,
+    test_run_streams,
+)
 from services.crawlhub.spider_runner_service import SpiderRunnerService
 
 router = APIRouter(prefix="/spiders", tags=["CrawlHub - Spiders"])
@@ -103,12 +108,23 @@ async def delete_spider(
     return MessageResponse(msg="爬虫删除成功")
 
 
+async def _run_test(spider_id: str, task_id: str, stream: TestRunStream) -> None:
+    # 后台运行不能复用请求的数据库会话
+    async with AsyncSessionLocal() as session:
+        spider = await session.get(Spider, spider_id)
+        task = await session.get(SpiderTask, task_id)
+        await SpiderRunnerService(session).run_test(spider, task, stream)
+
+
 @router.post("/{spider_id}/test-run")
 async def test_run_spider(
     spider_id: str,
     db: AsyncSession = Depends(get_db),
 ):
-    """启动测试运行"""
+    """启动测试运行
+
+    输出按批次以 SSE 推送，事件 id 可用于通过 test-run/{task_id}/events 断线续传。
+    """
     service = SpiderService(db)
     spider = await service.get_by_id(spider_id)
     if not spider:
@@ -117,13 +133,44 @@ async def test_run_spider(
     runner = SpiderRunnerService(db)
     task = await runner.create_test_task(spider)
 
+    stream = TestRunStream(task.id)
+    stream.publish_event("status", {"status": "pending", "task_id": task.id})
+    start_test_run(stream, _run_test(spider_id, task.id, stream))
+
+    async def event_generator():
+        async for event in stream.events():
+            yield format_sse(event)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"X-Task-Id": task.id, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/{spider_id}/test-run/{task_id}/events")
+async def test_run_events(
+    spider_id: str,
+    task_id: str,
+    request: Request,
+    last_event_id: str | None = Query(None, description="上次收到的事件 id（也可用 Last-Event-ID 头）"),
+):
+    """重新连接测试运行的输出流
+
+    运行在当前进程时从环形缓冲区续传（缺口从分块日志补读），否则从分块日志跟随。
+    """
+    last_event_id = request.headers.get("last-event-id") or last_event_id
+    stream = test_run_streams.get(task_id)
+    events = stream.events(last_event_id) if stream else follow_task_log(task_id, last_event_id)
+
     async def event_generator():
-        async for event in runner.run_test(spider, task):
-            yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+        async for event in events:
+            yield format_sse(event)
 
     return StreamingResponse(
         event_generator(),
         media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
@@ -133,7 +180,7 @@ async def run_spider(
     db: AsyncSession = Depends(get_db),
 ):
     """手动触发爬虫执行（走 Celery 队列）"""
-    from tasks.spider_tasks import execute_spider
+    from tasks.spider_tasks import submit_spider_run
 
     service = SpiderService(db)
     spider = await service.get_by_id(spider_id)
@@ -156,5 +203,5 @@ async def run_spider(
     runner = SpiderRunnerService(db)
     task = await runner.create_task(spider, trigger_type="manual")
 
-    execute_spider.delay(spider_id, task_id=str(task.id), trigger_type="manual")
+    submit_spider_run(spider, task, "manual")
     return MessageResponse(msg="任务已提交到执行队列")
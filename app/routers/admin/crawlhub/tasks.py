@@ -1,7 +1,8 @@
-import asyncio
 import json
+import logging
+from typing import Literal
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
 from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -11,15 +12,31 @@ from models.engine import AsyncSessionLocal, get_db
 from schemas.crawlhub import TaskResponse
 from schemas.platform import PaginatedResponse
 from schemas.response import ApiResponse, MessageResponse
-from services.crawlhub.log_service import LogService
+from services.crawlhub.item_schema import get_rejected
+from services.crawlhub.log_service import LOG_READ_MAX_BYTES, LogService
+from services.crawlhub.log_stream import follow_task_log, format_sse
+from services.crawlhub.run_context import run_contexts
+from services.crawlhub.shard_service import ShardService
+from services.crawlhub.task_control import CONTROL_CANCEL, CONTROL_PROXY, send_control
+from services.crawlhub.task_events import task_event_hub
+from services.crawlhub.task_signals import publish_cancel
+from services.crawlhub.task_telemetry import task_telemetry
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/tasks", tags=["CrawlHub - Tasks"])
 
+TERMINAL_STATUSES = {SpiderTaskStatus.COMPLETED, SpiderTaskStatus.FAILED, SpiderTaskStatus.CANCELLED}
+_TERMINAL_VALUES = {status.value for status in TERMINAL_STATUSES}
+# SSE 超过该时长（秒）没有收到推送时从数据库校验一次状态，兜底未发布的状态变更
+_SSE_DB_CHECK_INTERVAL = 30
+
 
 @router.get("", response_model=ApiResponse[PaginatedResponse[TaskResponse]])
 async def list_tasks(
     spider_id: str | None = Query(None),
     status: SpiderTaskStatus | None = Query(None),
+    parent_task_id: str | None = Query(None, description="查看分片父任务的子任务"),
     page: int = Query(1, ge=1),
     page_size: int = Query(20, ge=1, le=100),
     db: AsyncSession = Depends(get_db),
@@ -31,6 +48,11 @@ async def list_tasks(
         query = query.where(SpiderTask.spider_id == spider_id)
     if status:
         query = query.where(SpiderTask.status == status)
+    # 分片子任务默认不出现在任务列表中
+    if parent_task_id:
+        query = query.where(SpiderTask.parent_task_id == parent_task_id)
+    else:
+        query = query.where(SpiderTask.parent_task_id.is_(None))
 
     count_query = select(func.count()).select_from(query.subquery())
     total = await db.scalar(count_query) or 0
@@ -66,18 +88,74 @@ async def get_task(
     return ApiResponse(data=TaskResponse.model_validate(task))
 
 
+@router.get("/{task_id}/rejected-items", response_model=ApiResponse)
+async def get_rejected_items(task_id: str):
+    """任务最近未通过 item_schema 校验的数据样本"""
+    return ApiResponse(data=get_rejected(task_id))
+
+
 @router.get("/{task_id}/logs")
 async def get_task_logs(
     task_id: str,
+    stream: Literal["stdout", "stderr"] | None = Query(None, description="按日志流分块读取"),
+    tail: int | None = Query(None, ge=1, le=10000, description="读取最后 N 行"),
+    offset: int | None = Query(None, ge=0, description="起始字节偏移"),
+    limit: int = Query(256 * 1024, ge=1, le=LOG_READ_MAX_BYTES, description="最多读取字节数"),
 ):
-    """获取任务日志"""
+    """获取任务日志
+
+    不带参数时返回任务结束后的日志摘要；指定 stream 时从分块日志读取（运行中也可读），
+    tail 读取最后 N 行，offset/limit 按字节范围读取，返回的 next_offset 用于续读。
+    """
     log_service = LogService()
+    if stream:
+        if tail is not None or offset is None:
+            data = await log_service.read_tail(task_id, stream, lines=tail or 200)
+        else:
+            data = await log_service.read_range(task_id, stream, offset=offset, limit=limit)
+        return ApiResponse(data=data)
+
     log = await log_service.get_by_task(task_id)
     if not log:
         return ApiResponse(data={"stdout": "", "stderr": "", "message": "暂无日志"})
     return ApiResponse(data=log)
 
 
+@router.get("/{task_id}/logs/follow")
+async def follow_task_logs(
+    task_id: str,
+    request: Request,
+    stdout_offset: int = Query(0, ge=0),
+    stderr_offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_db),
+):
+    """SSE 实时跟随任务日志
+
+    事件 id 为 "stdout偏移:stderr偏移"，断线重连时通过 Last-Event-ID 从断点继续。
+    """
+    result = await db.execute(
+        select(SpiderTask.id).where(SpiderTask.id == task_id)
+    )
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    last_event_id = request.headers.get("last-event-id") or f"{stdout_offset}:{stderr_offset}"
+
+    async def event_generator():
+        async for event in follow_task_log(task_id, last_event_id):
+            yield format_sse(event)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
 @router.post("/{task_id}/cancel", response_model=MessageResponse)
 async def cancel_task(
     task_id: str,
@@ -95,11 +173,88 @@ async def cancel_task(
         raise HTTPException(status_code=409, detail="任务已完成，无法取消")
 
     task.status = SpiderTaskStatus.CANCELLED
+    task_ids = [task_id]
+    shard_service = ShardService(db)
+    if task.is_shard_parent:
+        for shard in await shard_service.get_shards(task_id):
+            if shard.status in (SpiderTaskStatus.PENDING, SpiderTaskStatus.RUNNING):
+                shard.status = SpiderTaskStatus.CANCELLED
+                task_ids.append(str(shard.id))
     await db.commit()
+
+    # 推送取消信号，运行中的 Runner 立即终止爬虫进程；状态已提交，单个任务的推送失败
+    # 不影响其余分片（Runner 的数据库兜底检查仍会发现取消）
+    for cancelled_id in task_ids:
+        for notify, args in (
+            (publish_cancel, ()),
+            (task_telemetry.set_status, (SpiderTaskStatus.CANCELLED,)),
+            (run_contexts.invalidate_task, ()),
+            (send_control, (CONTROL_CANCEL,)),
+        ):
+            try:
+                notify(cancelled_id, *args)
+            except Exception as e:
+                logger.warning(f"Failed to signal cancel for task {cancelled_id}: {e}")
+
+    if task.parent_task_id:
+        await shard_service.rollup(task.parent_task_id)
     return MessageResponse(msg="任务已取消")
 
 
-TERMINAL_STATUSES = {SpiderTaskStatus.COMPLETED, SpiderTaskStatus.FAILED, SpiderTaskStatus.CANCELLED}
+@router.post("/{task_id}/rotate-proxy", response_model=MessageResponse)
+async def rotate_task_proxy(
+    task_id: str,
+    db: AsyncSession = Depends(get_db),
+):
+    """为运行中的任务更换代理，通过控制通道推送给 SDK"""
+    task = await db.get(SpiderTask, task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if task.status != SpiderTaskStatus.RUNNING:
+        raise HTTPException(status_code=409, detail="任务不在运行状态")
+
+    from services.crawlhub.proxy_service import ProxyService
+
+    proxy = await ProxyService(db).get_available_proxy(min_success_rate=0.5)
+    if not proxy:
+        raise HTTPException(status_code=404, detail="无可用代理")
+    auth = ""
+    if proxy.username and proxy.password:
+        auth = f"{proxy.username}:{proxy.password}@"
+    send_control(task_id, CONTROL_PROXY, {"proxy_url": f"{proxy.protocol}://{auth}{proxy.host}:{proxy.port}"})
+    return MessageResponse(msg="代理轮换已下发")
+
+
+def _live_fields(live: dict) -> dict:
+    fields = {
+        field: live[field]
+        for field in ("status", "progress", "total_count", "success_count", "failed_count", "items_per_second")
+        if field in live
+    }
+    if "started_at" in live:
+        fields["started_at"] = live["started_at"].isoformat()
+    return fields
+
+
+def _task_event_data(task: SpiderTask, live: dict | None = None) -> dict:
+    """任务的 SSE 事件数据；运行中以 Redis 实时数据为准（数据库可能滞后一个写回周期）"""
+    event_data = {
+        "task_id": str(task.id),
+        "status": task.status.value,
+        "progress": task.progress,
+        "total_count": task.total_count,
+        "success_count": task.success_count,
+        "failed_count": task.failed_count,
+        "items_per_second": task.items_per_second,
+        "error_message": task.error_message,
+        "started_at": task.started_at.isoformat() if task.started_at else None,
+        "finished_at": task.finished_at.isoformat() if task.finished_at else None,
+    }
+    if live and task.status not in TERMINAL_STATUSES:
+        fields = _live_fields(live)
+        fields.pop("status", None)
+        event_data.update(fields)
+    return event_data
 
 
 @router.get("/{task_id}/events")
@@ -117,47 +272,38 @@ async def task_events(
         raise HTTPException(status_code=404, detail="任务不存在")
 
     async def event_generator():
-        last_status = None
-        last_progress = None
+        # 先订阅再读取当前状态，避免错过两者之间的变更
+        async with task_event_hub.subscribe(task_id) as subscription:
+            event_data = _task_event_data(task, task_telemetry.get(task_id))
+            last_state = None
 
-        while True:
-            async with AsyncSessionLocal() as session:
-                result = await session.execute(
-                    select(SpiderTask).where(SpiderTask.id == task_id)
+            while True:
+                # Only send event if status, progress or counts changed
+                state = (
+                    event_data["status"], event_data["progress"],
+                    event_data["total_count"], event_data["failed_count"],
                 )
-                task = result.scalar_one_or_none()
-
-                if not task:
-                    yield f"data: {json.dumps({'error': '任务不存在'})}\n\n"
-                    return
-
-                current_status = task.status.value
-                current_progress = task.progress
-
-                # Only send event if status or progress changed
-                if current_status != last_status or current_progress != last_progress:
-                    event_data = {
-                        "task_id": task.id,
-                        "status": current_status,
-                        "progress": current_progress,
-                        "total_count": task.total_count,
-                        "success_count": task.success_count,
-                        "failed_count": task.failed_count,
-                        "items_per_second": task.items_per_second,
-                        "error_message": task.error_message,
-                        "started_at": task.started_at.isoformat() if task.started_at else None,
-                        "finished_at": task.finished_at.isoformat() if task.finished_at else None,
-                    }
+                if state != last_state:
                     yield f"data: {json.dumps(event_data, ensure_ascii=False)}\n\n"
+                    last_state = state
 
-                    last_status = current_status
-                    last_progress = current_progress
+                # If terminal status, final event has been sent
+                if event_data["status"] in _TERMINAL_VALUES:
+                    return
 
-                    # If terminal status, send final event and close
-                    if task.status in TERMINAL_STATUSES:
+                live = await subscription.next(timeout=_SSE_DB_CHECK_INTERVAL)
+                if live is None or live.get("status") in _TERMINAL_VALUES:
+                    # 长时间无推送时兜底校验；结束时从数据库读取最终结果（错误信息、结束时间）
+                    async with AsyncSessionLocal() as session:
+                        current = await session.scalar(
+                            select(SpiderTask).where(SpiderTask.id == task_id)
+                        )
+                    if not current:
+                        yield f"data: {json.dumps({'error': '任务不存在'})}\n\n"
                         return
-
-            await asyncio.sleep(2)
+                    event_data = _task_event_data(current, live)
+                else:
+                    event_data.update(_live_fields(live))
 
     return StreamingResponse(
         event_generator(),
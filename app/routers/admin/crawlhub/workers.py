@@ -1,5 +1,9 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from models.crawlhub import Project
+from models.engine import get_db
 from schemas.response import ApiResponse
 
 router = APIRouter(prefix="/workers", tags=["CrawlHub - Workers"])
@@ -48,3 +52,36 @@ async def get_queued_tasks(request: Request):
         "tasks": tasks,
         "total": len(tasks),
     })
+
+
+@router.get("/cache-stats")
+async def get_cache_stats():
+    """获取 Worker 本地缓存命中统计"""
+    from services.crawlhub.disk_cache import get_worker_cache_stats
+
+    stats = get_worker_cache_stats()
+
+    return ApiResponse(data={
+        "caches": stats,
+        "total": len(stats),
+    })
+
+
+@router.get("/queue-stats")
+async def get_queue_stats(db: AsyncSession = Depends(get_db)):
+    """获取各项目的调度队列深度、并发与等待时间"""
+    from services.crawlhub.fair_queue import fair_queue
+
+    stats = fair_queue.stats()
+    project_ids = [s["project_id"] for s in stats]
+    names = {}
+    if project_ids:
+        result = await db.execute(select(Project.id, Project.name).where(Project.id.in_(project_ids)))
+        names = {str(project_id): name for project_id, name in result.all()}
+    for item in stats:
+        item["project_name"] = names.get(item["project_id"])
+
+    return ApiResponse(data={
+        "projects": stats,
+        "total": len(stats),
+    })
@@ -6,6 +6,8 @@ from pydantic import BaseModel, Field
 class ProjectBase(BaseModel):
     name: str = Field(..., min_length=1, max_length=255, description="项目名称")
     description: str | None = Field(None, description="项目描述")
+    schedule_weight: int = Field(1, ge=1, le=1000, description="调度权重")
+    max_concurrency: int | None = Field(None, ge=1, description="最大并发运行数")
 
 
 class ProjectCreate(ProjectBase):
@@ -15,6 +17,8 @@ class ProjectCreate(ProjectBase):
 class ProjectUpdate(BaseModel):
     name: str | None = Field(None, min_length=1, max_length=255)
     description: str | None = None
+    schedule_weight: int | None = Field(None, ge=1, le=1000)
+    max_concurrency: int | None = Field(None, ge=1)
 
 
 class ProjectResponse(ProjectBase):
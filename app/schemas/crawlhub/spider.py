@@ -12,6 +12,7 @@ class SpiderBase(BaseModel):
     script_content: str | None = Field(None, description="脚本内容")
     is_active: bool = Field(default=True, description="是否启用")
     cron_expr: str | None = Field(None, description="Cron表达式")
+    schedule_jitter_seconds: int | None = Field(None, ge=0, le=3600, description="定时调度错峰窗口(秒)")
     entry_point: str | None = Field(None, description="入口点")
     source: ProjectSource = Field(default=ProjectSource.EMPTY, description="项目来源")
     git_repo: str | None = Field(None, description="Git 仓库地址")
@@ -20,6 +21,9 @@ class SpiderBase(BaseModel):
     timeout_seconds: int | None = Field(None, description="执行超时(秒)")
     max_items: int | None = Field(None, description="最大采集条数")
     memory_limit_mb: int | None = Field(None, description="内存限制(MB)")
+    cpu_limit: float | None = Field(None, gt=0, description="CPU 配额(核)")
+    io_weight: int | None = Field(None, ge=1, le=10000, description="IO 权重(1-10000)")
+    shard_count: int | None = Field(None, ge=1, le=256, description="分片数(大于1时分布式执行)")
     requirements_txt: str | None = Field(None, description="依赖列表")
     env_vars: str | None = Field(None, description="自定义环境变量 JSON")
     # 代理与限速
@@ -43,6 +47,7 @@ class SpiderUpdate(BaseModel):
     script_content: str | None = None
     is_active: bool | None = None
     cron_expr: str | None = None
+    schedule_jitter_seconds: int | None = Field(None, ge=0, le=3600)
     entry_point: str | None = None
     source: ProjectSource | None = None
     git_repo: str | None = None
@@ -50,6 +55,9 @@ class SpiderUpdate(BaseModel):
     timeout_seconds: int | None = None
     max_items: int | None = None
     memory_limit_mb: int | None = None
+    cpu_limit: float | None = Field(None, gt=0)
+    io_weight: int | None = Field(None, ge=1, le=10000)
+    shard_count: int | None = Field(None, ge=1, le=256)
     requirements_txt: str | None = None
     env_vars: str | None = None
     proxy_enabled: bool | None = None
@@ -67,6 +75,7 @@ class SpiderResponse(SpiderBase):
     coder_workspace_name: str | None = None
     active_deployment_id: str | None = None
     code_sync_status: str | None = None
+    next_run_at: datetime | None = None
     created_at: datetime
     updated_at: datetime
 
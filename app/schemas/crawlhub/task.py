@@ -27,6 +27,15 @@ class TaskResponse(BaseModel):
     checkpoint_data: str | None = None
     items_per_second: float | None = None
     peak_memory_mb: int | None = None
+    cpu_seconds: float | None = None
+    io_read_bytes: int | None = None
+    io_write_bytes: int | None = None
+    oom_killed: bool | None = None
+    parent_task_id: str | None = None
+    shard_index: int | None = None
+    shard_count: int | None = None
+    scheduled_for: datetime | None = None
+    dispatch_delay_seconds: float | None = None
     created_at: datetime
     updated_at: datetime
 
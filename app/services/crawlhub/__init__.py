@@ -2,6 +2,9 @@ from .project_service import ProjectService
 from .spider_service import SpiderService
 from .proxy_service import ProxyService
 from .spider_runner_service import SpiderRunnerService
+from .shard_service import ShardService
+from .schedule_service import ScheduleService
+from .heartbeat_service import HeartbeatService
 from .coder_client import CoderClient, CoderAPIError
 from .coder_workspace_service import CoderWorkspaceService
 from .filebrowser_service import FileBrowserService, FileBrowserError
@@ -20,6 +23,9 @@ __all__ = [
     "SpiderService",
     "ProxyService",
     "SpiderRunnerService",
+    "ShardService",
+    "ScheduleService",
+    "HeartbeatService",
     "CoderClient",
     "CoderAPIError",
     "CoderWorkspaceService",
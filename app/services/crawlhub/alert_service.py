@@ -30,6 +30,13 @@ class AlertService(BaseService):
         await self.db.refresh(alert)
         return alert
 
+    async def create_alerts(self, alerts: list[dict]) -> None:
+        """批量创建告警（参数同 create_alert），一次提交"""
+        if not alerts:
+            return
+        self.db.add_all([Alert(**fields) for fields in alerts])
+        await self.db.commit()
+
     async def get_list(
         self,
         page: int = 1,
@@ -0,0 +1,224 @@
+import json
+import os
+import zlib
+from collections.abc import Iterator
+
+# 批量上报接口每批写入的条数
+BULK_BATCH_SIZE = int(os.getenv("CRAWLHUB_BULK_BATCH_SIZE", "1000"))
+# 单条记录（NDJSON 一行 / msgpack 一个对象）的上限，超过时整个请求以 413 拒绝
+BULK_MAX_LINE_BYTES = int(os.getenv("CRAWLHUB_BULK_MAX_LINE_BYTES", str(4 * 1024 * 1024)))
+# 每次解压输出的上限，避免高压缩比的数据一次展开过大
+_DECOMPRESS_CHUNK = 1024 * 1024
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+class RecordTooLarge(ValueError):
+    """单条记录超过 BULK_MAX_LINE_BYTES"""
+
+
+class _NeedInput(Exception):
+    pass
+
+
+class _ZstdInput:
+    """zstd 流式读取的输入源：已收到的数据读完而请求体未结束时抛出 _NeedInput
+
+    stream_reader.read1() 只在尚未产生输出时向输入源要数据，此时中断不会丢失已解压的内容，
+    下次 feed 后从中断处继续。
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.closed = False
+
+    def feed(self, data: bytes) -> None:
+        self._buffer += data
+
+    def read(self, size: int = -1) -> bytes:
+        if not self._buffer:
+            if self.closed:
+                return b""
+            raise _NeedInput
+        size = len(self._buffer) if size < 0 else size
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+class _ZstdDecompressor:
+    """zstd 增量解压，每次输出不超过 _DECOMPRESS_CHUNK（解压对象本身不能限制输出大小）"""
+
+    def __init__(self):
+        import zstandard
+
+        self._input = _ZstdInput()
+        self._reader = zstandard.ZstdDecompressor().stream_reader(
+            self._input, read_across_frames=True
+        )
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        self._input.feed(data)
+        return self._drain()
+
+    def flush(self) -> Iterator[bytes]:
+        self._input.closed = True
+        return self._drain()
+
+    def _drain(self) -> Iterator[bytes]:
+        while True:
+            try:
+                out = self._reader.read1(_DECOMPRESS_CHUNK)
+            except _NeedInput:
+                return
+            if not out:
+                return
+            yield out
+
+
+class _ZlibDecompressor:
+    """gzip / deflate 增量解压，每次输出不超过 _DECOMPRESS_CHUNK"""
+
+    def __init__(self, wbits: int):
+        self._obj = zlib.decompressobj(wbits)
+
+    def feed(self, data: bytes) -> Iterator[bytes]:
+        while data:
+            yield self._obj.decompress(data, _DECOMPRESS_CHUNK)
+            data = self._obj.unconsumed_tail
+
+    def flush(self) -> Iterator[bytes]:
+        rest = self._obj.flush()
+        if rest:
+            yield rest
+
+
+def _decompressor(encoding: str):
+    """返回增量解压对象（feed / flush 均返回输出块的迭代器），不压缩时返回 None"""
+    if encoding in ("", "identity"):
+        return None
+    if encoding in ("gzip", "x-gzip"):
+        return _ZlibDecompressor(zlib.MAX_WBITS | 16)
+    if encoding == "deflate":
+        return _ZlibDecompressor(zlib.MAX_WBITS)
+    if encoding == "zstd":
+        return _ZstdDecompressor()
+    raise ValueError(f"不支持的 Content-Encoding: {encoding}")
+
+
+class _NdjsonParser:
+    def __init__(self, max_line_bytes: int):
+        self.max_line_bytes = max_line_bytes
+        self._pending = b""
+        self.errors = 0
+
+    def feed(self, data: bytes) -> list[dict]:
+        data = self._pending + data
+        cut = data.rfind(b"\n") + 1
+        self._pending = data[cut:]
+        if len(self._pending) > self.max_line_bytes:
+            raise RecordTooLarge(f"单行超过 {self.max_line_bytes} 字节")
+        return self._parse(data[:cut])
+
+    def close(self) -> list[dict]:
+        data, self._pending = self._pending, b""
+        return self._parse(data)
+
+    def _parse(self, data: bytes) -> list[dict]:
+        lines = [line for line in data.splitlines() if line.strip()]
+        if not lines:
+            return []
+        # 整段拼成数组一次解析，比逐行 json.loads 快约一倍；有无效行时再逐行解析
+        try:
+            values = json.loads(b"[" + b",".join(lines) + b"]")
+        except ValueError:
+            values = None
+        if values is None or len(values) != len(lines):
+            values = []
+            for line in lines:
+                try:
+                    values.append(json.loads(line))
+                except ValueError:
+                    self.errors += 1
+
+        items = [value for value in values if isinstance(value, dict)]
+        self.errors += len(values) - len(items)
+        return items
+
+
+class _MsgpackParser:
+    """连续的 msgpack map 流"""
+
+    def __init__(self, max_line_bytes: int):
+        import msgpack
+
+        self.max_line_bytes = max_line_bytes
+        # 缓冲区上限 = 未解析完的对象 + 一次输入，单个对象过大时 feed 抛出 BufferFull
+        self._unpacker = msgpack.Unpacker(
+            raw=False, strict_map_key=False, max_buffer_size=max_line_bytes + _DECOMPRESS_CHUNK
+        )
+        self._buffer_full = msgpack.BufferFull
+        self._fed = 0
+        self.errors = 0
+
+    def feed(self, data: bytes) -> list[dict]:
+        try:
+            self._unpacker.feed(data)
+        except self._buffer_full:
+            raise RecordTooLarge(f"单个对象超过 {self.max_line_bytes} 字节") from None
+        self._fed += len(data)
+        items = []
+        for item in self._unpacker:
+            if isinstance(item, dict):
+                items.append(item)
+            else:
+                self.errors += 1
+        return items
+
+    def close(self) -> list[dict]:
+        # 流末尾剩余不完整的对象
+        if self._unpacker.tell() < self._fed:
+            self.errors += 1
+        return []
+
+
+class BulkDecoder:
+    """批量上报请求体的增量解码
+
+    支持 NDJSON（每行一个 JSON 对象）或 msgpack（连续的 map），可用 gzip / deflate / zstd 压缩。
+    请求体按块边读边解压、解析，内存占用与请求体大小无关；无法解析的记录计入 errors。
+    """
+
+    def __init__(
+        self,
+        content_type: str | None,
+        content_encoding: str | None = None,
+        max_line_bytes: int = BULK_MAX_LINE_BYTES,
+    ):
+        media_type = (content_type or "").split(";")[0].strip().lower()
+        if media_type in NDJSON_TYPES:
+            self._parser = _NdjsonParser(max_line_bytes)
+        elif media_type in MSGPACK_TYPES:
+            self._parser = _MsgpackParser(max_line_bytes)
+        else:
+            raise ValueError(f"不支持的 Content-Type: {media_type or '空'}")
+        self._decompressor = _decompressor((content_encoding or "").strip().lower())
+
+    @property
+    def errors(self) -> int:
+        return self._parser.errors
+
+    def feed(self, chunk: bytes) -> Iterator[list[dict]]:
+        """逐个解压输出块解析，调用方边迭代边写入，高压缩比的请求体也不会一次展开"""
+        if self._decompressor is None:
+            yield self._parser.feed(chunk)
+            return
+        for data in self._decompressor.feed(chunk):
+            yield self._parser.feed(data)
+
+    def close(self) -> Iterator[list[dict]]:
+        if self._decompressor is not None:
+            for data in self._decompressor.flush():
+                yield self._parser.feed(data)
+        yield self._parser.close()
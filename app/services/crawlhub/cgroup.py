@@ -0,0 +1,170 @@
+import contextlib
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# auto: 检测到可写的 cgroup v2 时启用；false: 始终使用 RLIMIT_AS
+CGROUP_ENABLED = os.getenv("CRAWLHUB_CGROUP_ENABLED", "auto")
+CGROUP_ROOT = Path(os.getenv("CRAWLHUB_CGROUP_ROOT", "/sys/fs/cgroup/crawlhub"))
+_CONTROLLERS = ("cpu", "memory", "io")
+_CPU_PERIOD_US = 100_000
+
+_root_ready: bool | None = None
+
+
+@dataclass
+class CgroupUsage:
+    """任务 cgroup 资源统计"""
+    cpu_seconds: float | None = None
+    peak_memory_mb: int | None = None
+    io_read_bytes: int | None = None
+    io_write_bytes: int | None = None
+    oom_killed: bool = False
+
+
+def _write(path: Path, value: str) -> None:
+    with open(path, "w") as f:
+        f.write(value)
+
+
+def _ensure_root() -> bool:
+    """创建任务 cgroup 的父节点并启用 cpu/memory/io 控制器（进程内只检测一次）"""
+    global _root_ready
+    if _root_ready is not None:
+        return _root_ready
+
+    _root_ready = False
+    if CGROUP_ENABLED.lower() in ("false", "0", "no"):
+        return False
+
+    parent = CGROUP_ROOT.parent
+    if not (parent / "cgroup.controllers").exists():
+        logger.info("cgroup v2 not available, falling back to RLIMIT_AS")
+        return False
+
+    try:
+        available = set((parent / "cgroup.controllers").read_text().split())
+        missing = [c for c in _CONTROLLERS if c not in available]
+        if missing:
+            raise OSError(f"controllers not delegated: {missing}")
+        enable = " ".join(f"+{c}" for c in _CONTROLLERS)
+        _write(parent / "cgroup.subtree_control", enable)
+        CGROUP_ROOT.mkdir(exist_ok=True)
+        _write(CGROUP_ROOT / "cgroup.subtree_control", enable)
+    except OSError as e:
+        logger.warning(f"cgroup v2 not usable at {CGROUP_ROOT}, falling back to RLIMIT_AS: {e}")
+        return False
+
+    _root_ready = True
+    return True
+
+
+class TaskCgroup:
+    """单个爬虫任务的 cgroup v2 节点
+
+    爬虫进程在 exec 前把自己写入 cgroup.procs，其派生的所有子进程（如 Chromium）
+    都受同一份 CPU 配额 / 内存上限 / IO 权重约束，退出后从 cgroup 读取资源统计。
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    @classmethod
+    def create(
+        cls,
+        task_id: str,
+        cpu_limit: float | None = None,
+        memory_limit_mb: int | None = None,
+        io_weight: int | None = None,
+    ) -> "TaskCgroup | None":
+        """创建任务 cgroup，cgroup 不可用时返回 None"""
+        if not _ensure_root():
+            return None
+
+        path = CGROUP_ROOT / f"task-{task_id}"
+        try:
+            path.mkdir(exist_ok=True)
+            if cpu_limit:
+                quota = max(int(cpu_limit * _CPU_PERIOD_US), 1000)
+                _write(path / "cpu.max", f"{quota} {_CPU_PERIOD_US}")
+            if memory_limit_mb:
+                _write(path / "memory.max", str(memory_limit_mb * 1024 * 1024))
+                with contextlib.suppress(OSError):
+                    _write(path / "memory.swap.max", "0")
+            if io_weight:
+                _write(path / "io.weight", f"default {io_weight}")
+        except OSError as e:
+            logger.warning(f"Failed to create cgroup for task {task_id}: {e}")
+            with contextlib.suppress(OSError):
+                path.rmdir()
+            return None
+        return cls(path)
+
+    @property
+    def procs_path(self) -> str:
+        return str(self.path / "cgroup.procs")
+
+    def preexec_fn(self):
+        """子进程 exec 前加入 cgroup"""
+        procs_path = self.procs_path
+
+        def preexec():
+            fd = os.open(procs_path, os.O_WRONLY)
+            try:
+                os.write(fd, b"0")
+            finally:
+                os.close(fd)
+
+        return preexec
+
+    def _read(self, name: str) -> str | None:
+        try:
+            return (self.path / name).read_text()
+        except OSError:
+            return None
+
+    def usage(self) -> CgroupUsage:
+        usage = CgroupUsage()
+
+        cpu_stat = self._read("cpu.stat")
+        if cpu_stat:
+            match = re.search(r"^usage_usec (\d+)", cpu_stat, re.M)
+            if match:
+                usage.cpu_seconds = round(int(match.group(1)) / 1_000_000, 3)
+
+        # memory.peak 需要 5.19+ 内核
+        peak = self._read("memory.peak")
+        if peak and peak.strip().isdigit():
+            usage.peak_memory_mb = int(peak) // (1024 * 1024)
+
+        io_stat = self._read("io.stat")
+        if io_stat is not None:
+            usage.io_read_bytes = sum(int(v) for v in re.findall(r"\brbytes=(\d+)", io_stat))
+            usage.io_write_bytes = sum(int(v) for v in re.findall(r"\bwbytes=(\d+)", io_stat))
+
+        events = self._read("memory.events")
+        if events:
+            match = re.search(r"^oom_kill (\d+)", events, re.M)
+            usage.oom_killed = bool(match and int(match.group(1)) > 0)
+
+        return usage
+
+    def destroy(self) -> None:
+        """结束 cgroup 内残留进程并删除节点"""
+        with contextlib.suppress(OSError):
+            _write(self.path / "cgroup.kill", "1")
+        for _ in range(50):
+            try:
+                self.path.rmdir()
+                return
+            except FileNotFoundError:
+                return
+            except OSError:
+                # 进程尚未完全退出
+                time.sleep(0.1)
+        logger.warning(f"Failed to remove cgroup {self.path}")
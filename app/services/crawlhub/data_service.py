@@ -66,10 +66,29 @@ class DataService:
                 "created_at",
                 expire_seconds=SPIDER_DATA_TTL_DAYS * 24 * 60 * 60,
             )
+            await self._ensure_dedup_index()
             DataService._indexes_created = True
         except Exception as e:
             logger.warning(f"Failed to create spider_data indexes: {e}")
 
+    async def _ensure_dedup_index(self) -> None:
+        """去重索引：(spider_id, dedup_hash) 唯一，只包含带 dedup_hash 的文档
+
+        已有数据中存在重复时无法建立唯一索引，退回普通索引（查询仍可走索引）。
+        """
+        keys = [("spider_id", 1), ("dedup_hash", 1)]
+        partial = {"dedup_hash": {"$exists": True}}
+        try:
+            await mongodb_client.create_index(
+                SPIDER_DATA_COLLECTION, keys, name="spider_id_dedup_hash_unique",
+                unique=True, partialFilterExpression=partial,
+            )
+        except Exception as e:
+            logger.warning(f"Failed to create unique dedup index, falling back to non-unique: {e}")
+            await mongodb_client.create_index(
+                SPIDER_DATA_COLLECTION, keys, name="spider_id_dedup_hash", partialFilterExpression=partial,
+            )
+
     async def _try_read_from_datasource(
         self,
         spider_id: str,
@@ -316,12 +335,19 @@ class DataService:
             logger.error(f"Failed to preview data: {e}")
             return {"items": [], "total": 0, "fields": {}}
 
+    async def _forget_dedup(self, **kwargs) -> None:
+        """删除数据后同步删除去重记录，允许重新采集"""
+        from services.crawlhub.dedup import dedup_service
+
+        await dedup_service.forget(**kwargs)
+
     async def delete_by_task(self, task_id: str) -> int:
         """删除指定任务的数据"""
         if not mongodb_client.is_enabled():
             return 0
         try:
             result = await self.collection.delete_many({"task_id": task_id})
+            await self._forget_dedup(task_id=task_id)
             return result.deleted_count
         except Exception as e:
             logger.error(f"Failed to delete data for task {task_id}: {e}")
@@ -333,6 +359,7 @@ class DataService:
             return 0
         try:
             result = await self.collection.delete_many({"spider_id": spider_id})
+            await self._forget_dedup(spider_id=spider_id)
             return result.deleted_count
         except Exception as e:
             logger.error(f"Failed to delete data for spider {spider_id}: {e}")
@@ -5,6 +5,7 @@ from sqlalchemy import func, select
 from models.crawlhub import DataSource, DataSourceStatus, SpiderDataSource
 from schemas.crawlhub.datasource import DataSourceCreate, DataSourceTestRequest, DataSourceUpdate
 from services.base_service import BaseService
+from services.crawlhub.run_context import run_contexts
 
 logger = logging.getLogger(__name__)
 
@@ -69,6 +70,7 @@ class DataSourceService(BaseService):
             setattr(ds, key, value)
 
         await self.db.commit()
+        await run_contexts.invalidate_datasource(self.db, datasource_id)
         await self.db.refresh(ds)
         return ds
 
@@ -107,11 +109,13 @@ class DataSourceService(BaseService):
             from datetime import datetime
             ds.last_check_at = datetime.utcnow()
             await self.db.commit()
+            await run_contexts.invalidate_datasource(self.db, datasource_id)
             return result
         except Exception as e:
             ds.status = DataSourceStatus.ERROR
             ds.last_error = str(e)
             await self.db.commit()
+            await run_contexts.invalidate_datasource(self.db, datasource_id)
             return {"ok": False, "message": str(e), "latency_ms": 0}
 
     @staticmethod
@@ -0,0 +1,426 @@
+import hashlib
+import json
+import logging
+import math
+import os
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from extensions.ext_mongodb import mongodb_client
+from extensions.ext_redis import redis_client
+from models.crawlhub import Spider
+from services.crawlhub.data_service import SPIDER_DATA_COLLECTION, _get_spider_datasource_info
+
+logger = logging.getLogger(__name__)
+
+DEDUP_PREFIX = "crawlhub:dedup"
+# 精确去重记录，与数据写入目标无关
+DEDUP_KEYS_COLLECTION = "spider_dedup_keys"
+# 精确去重记录的保留天数，0 表示永久保留。不跟随 spider_data 的过期时间：
+# 写入外部数据源的数据不会过期，去重记录过期后同样的数据会被再次写入
+DEDUP_KEY_TTL_DAYS = int(os.getenv("CRAWLHUB_DEDUP_KEY_TTL_DAYS", "0"))
+_TTL_INDEX = "created_at_ttl"
+# 每个爬虫布隆过滤器的设计容量和误判率，创建后参数保存在 Redis 中，修改只影响新建的过滤器
+BLOOM_CAPACITY = int(os.getenv("CRAWLHUB_DEDUP_BLOOM_CAPACITY", "1000000"))
+BLOOM_ERROR_RATE = float(os.getenv("CRAWLHUB_DEDUP_BLOOM_ERROR_RATE", "0.001"))
+_SEED_BATCH_SIZE = 1000
+# 回填任务的排他锁时长，任务异常退出时锁过期后才会重新排队
+_BACKFILL_LOCK_SECONDS = 3600
+_DUPLICATE_KEY = 11000
+_STATS_FIELDS = ("checked", "possible", "false_positive", "new", "duplicates")
+
+
+def dedup_fields(spider: Spider | None) -> list[str]:
+    """爬虫配置的去重字段，未启用去重时返回空列表"""
+    if not spider or not spider.dedup_enabled or not spider.dedup_fields:
+        return []
+    return sorted(f.strip() for f in spider.dedup_fields.split(",") if f.strip())
+
+
+def dedup_hash(item: dict, fields: list[str]) -> str:
+    hash_parts = {k: item.get(k) for k in fields}
+    return hashlib.md5(json.dumps(hash_parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def bloom_params(capacity: int, error_rate: float) -> tuple[int, int]:
+    """按容量和误判率计算布隆过滤器的 (位数, 哈希函数个数)"""
+    bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+    return bits, max(1, round(bits / capacity * math.log(2)))
+
+
+def _positions(hash_value: str, bits: int, hashes: int) -> list[int]:
+    # 双重哈希：由 md5 的高低 64 位派生 k 个位置
+    h1 = int(hash_value[:16], 16)
+    h2 = int(hash_value[16:], 16) | 1
+    return [(h1 + i * h2) % bits for i in range(hashes)]
+
+
+class DedupService:
+    """爬虫数据去重，与写入目标（默认 MongoDB 或外部数据源）无关
+
+    每个爬虫一个 Redis 位图布隆过滤器（BITFIELD 实现，不依赖 RedisBloom 模块）：
+    整批数据一次 pipeline 判断，未命中的一定是新数据；只有可能命中的才到精确存储
+    （MongoDB spider_dedup_keys）确认。新数据通过插入精确存储的唯一索引认领，
+    并发批次之间的重复在认领时拦截。MongoDB 未启用时只用布隆过滤器，
+    新数据会按误判率被当作重复丢弃。
+
+    spider_dedup_keys 启用前写入的数据只在 spider_data.dedup_hash 中有记录：
+    爬虫首次认领时排队回填，回填完成（Redis 中有 seeded 标记）前同时查询 spider_data。
+    """
+
+    _indexes_created = False
+
+    def __init__(self):
+        self._params: dict[str, tuple[int, int]] = {}
+        self._seeded: set[str] = set()
+
+    @staticmethod
+    def _key(spider_id: str, name: str) -> str:
+        return f"{DEDUP_PREFIX}:{spider_id}:{name}"
+
+    @property
+    def collection(self):
+        return mongodb_client.get_collection(DEDUP_KEYS_COLLECTION)
+
+    async def ensure_indexes(self) -> None:
+        if DedupService._indexes_created or not mongodb_client.is_enabled():
+            return
+        try:
+            await mongodb_client.ensure_indexes(
+                DEDUP_KEYS_COLLECTION,
+                [
+                    {"keys": [("spider_id", 1), ("dedup_hash", 1)], "unique": True},
+                    {"keys": "task_id"},
+                ],
+            )
+            await self._sync_ttl_index()
+            DedupService._indexes_created = True
+        except Exception as e:
+            logger.warning(f"Failed to create {DEDUP_KEYS_COLLECTION} indexes: {e}")
+
+    async def _sync_ttl_index(self) -> None:
+        """按 DEDUP_KEY_TTL_DAYS 创建、修改或删除过期索引
+
+        早期版本按 spider_data 的保留期创建过该索引，保留期改为永久时需要删除。
+        """
+        indexes = await self.collection.index_information()
+        current = indexes.get(_TTL_INDEX, {}).get("expireAfterSeconds")
+        expire_seconds = DEDUP_KEY_TTL_DAYS * 24 * 60 * 60
+        if expire_seconds <= 0:
+            if _TTL_INDEX in indexes:
+                await self.collection.drop_index(_TTL_INDEX)
+        elif current is None:
+            await mongodb_client.create_ttl_index(
+                DEDUP_KEYS_COLLECTION, "created_at",
+                expire_seconds=expire_seconds, index_name=_TTL_INDEX,
+            )
+        elif current != expire_seconds:
+            await mongodb_client.db.command(
+                "collMod", DEDUP_KEYS_COLLECTION,
+                index={"name": _TTL_INDEX, "expireAfterSeconds": expire_seconds},
+            )
+
+    def _bloom_params(self, spider_id: str) -> tuple[int, int]:
+        params = self._params.get(spider_id)
+        if params is None:
+            bits, hashes = bloom_params(BLOOM_CAPACITY, BLOOM_ERROR_RATE)
+            key = self._key(spider_id, "meta")
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.hsetnx(key, "bits", bits)
+            pipe.hsetnx(key, "hashes", hashes)
+            pipe.hmget(key, ["bits", "hashes"])
+            stored = pipe.execute()[-1]
+            params = self._params[spider_id] = (int(stored[0]), int(stored[1]))
+        return params
+
+    def _bloom_check(self, spider_id: str, hashes: list[str]) -> list[bool] | None:
+        """布隆过滤器判断每个哈希是否可能已存在，Redis 不可用时返回 None"""
+        try:
+            bits, k = self._bloom_params(spider_id)
+            key = self._key(spider_id, "bloom")
+            pipe = redis_client.pipeline(transaction=False)
+            for hash_value in hashes:
+                args = []
+                for pos in _positions(hash_value, bits, k):
+                    args += ["GET", "u1", pos]
+                pipe.execute_command("BITFIELD", key, *args)
+            return [all(values) for values in pipe.execute()]
+        except Exception as e:
+            logger.warning(f"Dedup bloom filter check failed for spider {spider_id}: {e}")
+            return None
+
+    def _bloom_add(self, spider_id: str, hashes: list[str], stats: dict[str, int] | None = None) -> None:
+        try:
+            bits, k = self._bloom_params(spider_id)
+            key = self._key(spider_id, "bloom")
+            pipe = redis_client.pipeline(transaction=False)
+            for hash_value in hashes:
+                args = []
+                for pos in _positions(hash_value, bits, k):
+                    args += ["SET", "u1", pos, 1]
+                pipe.execute_command("BITFIELD", key, *args)
+            for field, count in (stats or {}).items():
+                if count:
+                    pipe.hincrby(self._key(spider_id, "stats"), field, count)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Dedup bloom filter update failed for spider {spider_id}: {e}")
+
+    async def _find_existing(self, spider_id: str, hashes: set[str]) -> set[str]:
+        cursor = self.collection.find(
+            {"spider_id": spider_id, "dedup_hash": {"$in": list(hashes)}},
+            {"dedup_hash": 1, "_id": 0},
+        )
+        return {doc["dedup_hash"] async for doc in cursor}
+
+    async def _find_legacy(self, spider_id: str, hashes: set[str]) -> set[str]:
+        """回填完成前，在 spider_data 中查找只有旧数据记录的哈希"""
+        cursor = mongodb_client.get_collection(SPIDER_DATA_COLLECTION).find(
+            {"spider_id": spider_id, "dedup_hash": {"$in": list(hashes)}},
+            {"dedup_hash": 1, "_id": 0},
+        )
+        return {doc["dedup_hash"] async for doc in cursor}
+
+    def _is_seeded(self, spider_id: str) -> bool:
+        if spider_id in self._seeded:
+            return True
+        try:
+            if redis_client.exists(self._key(spider_id, "seeded")):
+                self._seeded.add(spider_id)
+                return True
+        except Exception as e:
+            logger.warning(f"Failed to read dedup seed marker for spider {spider_id}: {e}")
+        return False
+
+    def _mark_seeded(self, spider_id: str) -> None:
+        try:
+            redis_client.set(self._key(spider_id, "seeded"), 1)
+            self._seeded.add(spider_id)
+        except Exception as e:
+            logger.warning(f"Failed to set dedup seed marker for spider {spider_id}: {e}")
+
+    def _request_backfill(self, spider_id: str) -> None:
+        """排队回填任务，同一爬虫同时只排队一次"""
+        try:
+            lock = self._key(spider_id, "backfill")
+            if not redis_client.set(lock, 1, ex=_BACKFILL_LOCK_SECONDS, nx=True):
+                return
+            from tasks.data_tasks import backfill_spider_dedup
+
+            backfill_spider_dedup.delay(spider_id)
+        except Exception as e:
+            logger.warning(f"Failed to schedule dedup backfill for spider {spider_id}: {e}")
+
+    async def _insert_keys(self, spider_id: str, keys: list[tuple[str, str | None]]) -> list[str]:
+        """写入 (哈希, task_id) 精确记录，返回写入成功（未被其他批次抢先认领）的哈希"""
+        if not keys:
+            return []
+        now = datetime.utcnow()
+        docs = [
+            {"spider_id": spider_id, "dedup_hash": hash_value, "task_id": task_id, "created_at": now}
+            for hash_value, task_id in keys
+        ]
+        try:
+            await self.collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != _DUPLICATE_KEY for error in errors):
+                raise
+            taken = {error["index"] for error in errors}
+            return [hash_value for i, (hash_value, _) in enumerate(keys) if i not in taken]
+        return [hash_value for hash_value, _ in keys]
+
+    async def claim(self, spider: Spider | None, items: list[dict], task_id: str | None = None) -> list[dict]:
+        """过滤重复数据并认领新数据，为新数据项附加 _dedup_hash
+
+        认领后写入失败时应调用 release 释放，否则这些数据之后会被当作重复。
+        """
+        fields = dedup_fields(spider)
+        if not fields:
+            return items
+        spider_id = str(spider.id)
+
+        batch: dict[str, dict] = {}
+        for item in items:
+            batch.setdefault(dedup_hash(item, fields), item)
+        hashes = list(batch)
+
+        maybe = self._bloom_check(spider_id, hashes)
+        possible = set(hashes) if maybe is None else {h for h, hit in zip(hashes, maybe) if hit}
+        stats = {"checked": len(hashes), "possible": len(possible) if maybe is not None else 0}
+
+        if mongodb_client.is_enabled():
+            await self.ensure_indexes()
+            existing = await self._find_existing(spider_id, possible) if possible else set()
+            if not self._is_seeded(spider_id):
+                self._request_backfill(spider_id)
+                # 旧数据不在布隆过滤器中，整批都要到 spider_data 确认
+                unknown = set(hashes) - existing
+                if unknown:
+                    existing |= await self._find_legacy(spider_id, unknown)
+            if maybe is not None:
+                stats["false_positive"] = len(possible - existing)
+            claimed = await self._insert_keys(
+                spider_id, [(h, task_id) for h in hashes if h not in existing]
+            )
+        else:
+            claimed = [h for h in hashes if maybe is None or h not in possible]
+
+        stats["new"] = len(claimed)
+        stats["duplicates"] = len(hashes) - len(claimed)
+        self._bloom_add(spider_id, claimed, stats)
+
+        filtered = []
+        for hash_value in claimed:
+            item = batch[hash_value]
+            item["_dedup_hash"] = hash_value
+            filtered.append(item)
+        return filtered
+
+    async def release(self, spider_id: str, hashes: list[str]) -> None:
+        """释放未成功写入的认领（布隆过滤器中的位无法删除，只略微增加误判）"""
+        if not hashes or not mongodb_client.is_enabled():
+            return
+        try:
+            await self.collection.delete_many({"spider_id": str(spider_id), "dedup_hash": {"$in": hashes}})
+        except Exception as e:
+            logger.error(f"Failed to release dedup keys for spider {spider_id}: {e}")
+
+    async def forget(self, spider_id: str | None = None, task_id: str | None = None) -> None:
+        """删除数据时同步删除精确记录，允许重新采集"""
+        if not mongodb_client.is_enabled() or not (spider_id or task_id):
+            return
+        query = {"task_id": task_id} if task_id else {"spider_id": spider_id}
+        try:
+            await self.collection.delete_many(query)
+        except Exception as e:
+            logger.error(f"Failed to delete dedup keys for {query}: {e}")
+
+    async def reset(self, spider_id: str) -> None:
+        """清空爬虫的布隆过滤器、统计、回填标记和精确记录"""
+        spider_id = str(spider_id)
+        self._params.pop(spider_id, None)
+        self._seeded.discard(spider_id)
+        redis_client.delete(
+            *(self._key(spider_id, name) for name in ("bloom", "meta", "stats", "seeded", "backfill"))
+        )
+        await self.forget(spider_id=spider_id)
+
+    async def _add_keys(self, spider_id: str, keys: dict[str, str | None]) -> int:
+        if mongodb_client.is_enabled():
+            await self._insert_keys(spider_id, list(keys.items()))
+        self._bloom_add(spider_id, list(keys))
+        return len(keys)
+
+    async def _seed_batch(self, spider_id: str, fields: list[str], docs: list[dict]) -> int:
+        keys = {}
+        for doc in docs:
+            if isinstance(doc.get("data"), dict):
+                keys.setdefault(dedup_hash(doc["data"], fields), doc.get("task_id"))
+        return await self._add_keys(spider_id, keys)
+
+    async def backfill(self, spider_id: str) -> int:
+        """把 spider_data 中已有的 dedup_hash 补录到精确存储和布隆过滤器，完成后标记已回填
+
+        与 seed 不同，不清空已有记录、不重新计算哈希，可以在爬虫写入数据时执行。
+        """
+        spider_id = str(spider_id)
+        if not mongodb_client.is_enabled():
+            return 0
+        await self.ensure_indexes()
+
+        backfilled = 0
+        cursor = mongodb_client.get_collection(SPIDER_DATA_COLLECTION).find(
+            {"spider_id": spider_id, "dedup_hash": {"$exists": True}},
+            {"dedup_hash": 1, "task_id": 1, "_id": 0}, batch_size=_SEED_BATCH_SIZE,
+        )
+        keys: dict[str, str | None] = {}
+        async for doc in cursor:
+            keys.setdefault(doc["dedup_hash"], doc.get("task_id"))
+            if len(keys) >= _SEED_BATCH_SIZE:
+                backfilled += await self._add_keys(spider_id, keys)
+                keys = {}
+        backfilled += await self._add_keys(spider_id, keys)
+
+        self._mark_seeded(spider_id)
+        logger.info(f"Backfilled dedup index for spider {spider_id} with {backfilled} keys")
+        return backfilled
+
+    async def seed(self, db: AsyncSession, spider: Spider) -> int:
+        """按当前去重字段，用默认 MongoDB 和外部数据源中的已有数据重建去重索引"""
+        fields = dedup_fields(spider)
+        if not fields:
+            return 0
+        spider_id = str(spider.id)
+        await self.reset(spider_id)
+        await self.ensure_indexes()
+
+        seeded = 0
+        if mongodb_client.is_enabled():
+            cursor = mongodb_client.get_collection(SPIDER_DATA_COLLECTION).find(
+                {"spider_id": spider_id}, {"data": 1, "task_id": 1, "_id": 0}, batch_size=_SEED_BATCH_SIZE,
+            )
+            docs = []
+            async for doc in cursor:
+                docs.append(doc)
+                if len(docs) >= _SEED_BATCH_SIZE:
+                    seeded += await self._seed_batch(spider_id, fields, docs)
+                    docs = []
+            seeded += await self._seed_batch(spider_id, fields, docs)
+
+        from services.crawlhub.datasource_writer import get_writer
+
+        for datasource, target_table in await _get_spider_datasource_info(db, spider_id):
+            writer = get_writer(datasource)
+            page = 1
+            while True:
+                docs, _ = await writer.read_items(
+                    target_table, spider_id=spider_id, page=page, page_size=_SEED_BATCH_SIZE
+                )
+                seeded += await self._seed_batch(spider_id, fields, docs)
+                if len(docs) < _SEED_BATCH_SIZE:
+                    break
+                page += 1
+
+        self._mark_seeded(spider_id)
+        logger.info(f"Seeded dedup index for spider {spider_id} with {seeded} keys")
+        return seeded
+
+    async def stats(self, spider_id: str) -> dict:
+        """去重统计：布隆过滤器内存占用、估算误判率和实际观测的误判率"""
+        spider_id = str(spider_id)
+        data: dict = {}
+        try:
+            bits, k = self._bloom_params(spider_id)
+            key = self._key(spider_id, "bloom")
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.strlen(key)
+            pipe.bitcount(key)
+            pipe.hgetall(self._key(spider_id, "stats"))
+            memory, set_bits, counters = pipe.execute()
+            fill = set_bits / bits
+            data.update({
+                "bloom_bits": bits,
+                "bloom_hashes": k,
+                "bloom_memory_bytes": memory,
+                "bloom_fill_ratio": round(fill, 6),
+                "bloom_estimated_items": round(-bits / k * math.log(1 - fill)) if fill < 1 else None,
+                "estimated_false_positive_rate": fill ** k,
+            })
+            counters = {f.decode() if isinstance(f, bytes) else f: int(v) for f, v in counters.items()}
+            data.update({field: counters.get(field, 0) for field in _STATS_FIELDS})
+            # 误判：布隆过滤器判为可能存在、精确存储中并不存在的新数据
+            data["observed_false_positive_rate"] = (
+                data["false_positive"] / data["new"] if data["new"] else 0.0
+            )
+        except Exception as e:
+            logger.warning(f"Failed to read dedup stats for spider {spider_id}: {e}")
+
+        if mongodb_client.is_enabled():
+            data["exact_keys"] = await self.collection.count_documents({"spider_id": spider_id})
+        return data
+
+
+dedup_service = DedupService()
@@ -0,0 +1,85 @@
+import asyncio
+import contextlib
+import hashlib
+import logging
+import os
+import platform
+import re
+import sys
+from pathlib import Path
+
+from services.crawlhub.disk_cache import DiskLRUCache
+
+logger = logging.getLogger(__name__)
+
+DEPS_CACHE_DIR = os.getenv("CRAWLHUB_DEPS_CACHE_DIR", "/tmp/crawlhub/deps")
+DEPS_CACHE_MAX_MB = int(os.getenv("CRAWLHUB_DEPS_CACHE_MAX_MB", "5120"))
+PIP_INSTALL_TIMEOUT = 120
+
+_COMMENT_RE = re.compile(r"(^|\s)#.*$")
+
+
+def requirements_hash(requirements_txt: str) -> str:
+    """计算 requirements 内容哈希（忽略注释、空行与首尾空白）
+
+    解释器版本和平台也计入哈希，避免不同 Python 版本的 worker 共享编译产物。
+    """
+    lines = []
+    for line in requirements_txt.splitlines():
+        line = _COMMENT_RE.sub("", line).strip()
+        if line:
+            lines.append(line)
+    runtime = f"py{sys.version_info.major}.{sys.version_info.minor}-{platform.machine()}"
+    digest = hashlib.sha256("\n".join([runtime, *lines]).encode("utf-8")).hexdigest()
+    return digest[:32]
+
+
+class DependencyCache(DiskLRUCache):
+    """per-spider 依赖环境缓存
+
+    以 requirements_txt 内容哈希为 key，`pip install --target` 的结果在 worker 上复用，
+    依赖变化时才重新安装。
+    """
+
+    def __init__(self, root: str | Path = DEPS_CACHE_DIR, max_mb: int = DEPS_CACHE_MAX_MB):
+        super().__init__("deps", root, max_mb * 1024 * 1024)
+
+    def lease_for(self, requirements_txt: str) -> contextlib.AbstractAsyncContextManager[Path]:
+        """获取 requirements 对应的依赖目录（只读，可直接加入 PYTHONPATH）"""
+        key = requirements_hash(requirements_txt)
+
+        async def build(target_dir: Path) -> None:
+            await _pip_install(requirements_txt, target_dir)
+
+        return self.lease(key, build)
+
+
+async def _pip_install(requirements_txt: str, target_dir: Path) -> None:
+    req_file = target_dir.parent / f"{target_dir.name}.requirements.txt"
+    req_file.write_text(requirements_txt)
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "pip", "install", "--target", str(target_dir),
+            "-r", str(req_file), "--quiet", "--disable-pip-version-check",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            _, stderr = await asyncio.wait_for(
+                process.communicate(), timeout=PIP_INSTALL_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise RuntimeError(f"pip install 超时 ({PIP_INSTALL_TIMEOUT} 秒)")
+
+        if process.returncode != 0:
+            message = stderr.decode("utf-8", errors="replace").strip()[-2000:]
+            raise RuntimeError(f"pip install 失败 (退出码 {process.returncode}): {message}")
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            req_file.unlink()
+
+
+dependency_cache = DependencyCache()
+
@@ -0,0 +1,100 @@
+import asyncio
+import errno
+import fcntl
+import logging
+import os
+import re
+import shutil
+import stat
+from pathlib import Path
+
+from models.crawlhub.deployment import Deployment
+from services.crawlhub.disk_cache import DiskLRUCache
+
+logger = logging.getLogger(__name__)
+
+DEPLOY_CACHE_DIR = os.getenv("CRAWLHUB_DEPLOY_CACHE_DIR", "/tmp/crawlhub/deployments")
+DEPLOY_CACHE_MAX_MB = int(os.getenv("CRAWLHUB_DEPLOY_CACHE_MAX_MB", "2048"))
+
+# linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+# 文件系统不支持 reflink 时返回的错误码
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EOPNOTSUPP, errno.EINVAL, errno.ENOTTY, errno.EPERM}
+
+
+class DeploymentCache(DiskLRUCache):
+    """部署快照解压树缓存
+
+    部署包在 file_archive_id 确定后不可变，因此按 deployment 缓存解压结果，
+    每次运行只需把缓存树 reflink（不支持时复制）到工作目录，跳过 GridFS 下载和 gzip 解压。
+    不使用硬链接：爬虫以可写方式打开随包文件时会直接改写缓存，污染后续运行。
+    """
+
+    def __init__(self, root: str | Path = DEPLOY_CACHE_DIR, max_mb: int = DEPLOY_CACHE_MAX_MB):
+        super().__init__("deployments", root, max_mb * 1024 * 1024)
+        # 首次链接失败后降级，避免每个文件重复尝试不支持的方式
+        self._link_mode = "reflink"
+
+    @staticmethod
+    def cache_key(deployment: Deployment) -> str:
+        return re.sub(r"[^a-zA-Z0-9_-]", "_", f"{deployment.id}-{deployment.file_archive_id}")
+
+    async def materialize(self, deployment: Deployment, work_dir: Path) -> None:
+        """将部署快照展开到工作目录"""
+        from services.crawlhub.deployment_service import DeploymentService
+
+        async def build(target_dir: Path) -> None:
+            archive = await DeploymentService.download_archive(deployment.file_archive_id)
+            await DeploymentService.extract_archive(archive, target_dir)
+
+        async with self.lease(self.cache_key(deployment), build) as tree:
+            await asyncio.to_thread(self._link_tree, tree, work_dir)
+
+    def _link_tree(self, src: Path, dst: Path) -> None:
+        for dirpath, dirnames, filenames in os.walk(src):
+            rel = Path(dirpath).relative_to(src)
+            target_dir = dst / rel
+            target_dir.mkdir(parents=True, exist_ok=True)
+            for dirname in list(dirnames):
+                if (Path(dirpath) / dirname).is_symlink():
+                    dirnames.remove(dirname)
+                    os.symlink(os.readlink(Path(dirpath) / dirname), target_dir / dirname)
+            for filename in filenames:
+                self._link_file(Path(dirpath) / filename, target_dir / filename)
+
+    def _link_file(self, src: Path, dst: Path) -> None:
+        if src.is_symlink():
+            os.symlink(os.readlink(src), dst)
+            return
+
+        cloned = False
+        if self._link_mode == "reflink":
+            try:
+                _reflink(src, dst)
+                cloned = True
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED_ERRNOS:
+                    raise
+                logger.info(f"[{self.name}] reflink unsupported ({e}), falling back to copy")
+                self._link_mode = "copy"
+        if not cloned:
+            shutil.copy2(src, dst)
+        # 缓存中的文件是只读的，工作目录中的副本恢复属主写权限，非 root 运行的爬虫才能改写
+        os.chmod(dst, stat.S_IMODE(os.stat(src).st_mode) | stat.S_IWUSR)
+
+
+def _reflink(src: Path, dst: Path) -> None:
+    """写时复制克隆文件（btrfs/xfs 等支持 FICLONE 的文件系统）"""
+    with open(src, "rb") as fsrc:
+        fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            fcntl.ioctl(fd, FICLONE, fsrc.fileno())
+        except OSError:
+            os.close(fd)
+            os.unlink(dst)
+            raise
+        os.close(fd)
+    shutil.copystat(src, dst)
+
+
+deployment_cache = DeploymentCache()
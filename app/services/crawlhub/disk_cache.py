@@ -0,0 +1,296 @@
+import asyncio
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import shutil
+import socket
+import stat
+import time
+import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+WORKER_CACHE_STATS_PREFIX = "crawlhub:worker_cache"
+# 构建中断遗留的临时目录超过该时长后清理
+STALE_TMP_SECONDS = 6 * 60 * 60
+
+
+class DiskLRUCache:
+    """Worker 本地磁盘缓存（按 key 复用只读目录，按磁盘预算 LRU 淘汰）
+
+    目录结构:
+        <root>/entries/<key>/     已就绪的缓存条目
+        <root>/meta/<key>.json    条目元数据，文件 mtime 即最近使用时间
+        <root>/locks/<key>.build  构建锁（排他），保证同一 key 只构建一次
+        <root>/locks/<key>.use    使用锁：运行期间共享持有，淘汰时非阻塞排他尝试
+        <root>/tmp/               构建中的临时目录，完成后原子 rename 到 entries
+
+    多个 Celery 进程共享同一目录，跨进程互斥依赖 flock。
+    """
+
+    def __init__(self, name: str, root: str | Path, max_bytes: int):
+        self.name = name
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.build_failures = 0
+
+    def _ensure_dirs(self) -> None:
+        for sub in ("entries", "meta", "locks", "tmp"):
+            (self.root / sub).mkdir(parents=True, exist_ok=True)
+
+    def _entry_path(self, key: str) -> Path:
+        return self.root / "entries" / key
+
+    def _meta_path(self, key: str) -> Path:
+        return self.root / "meta" / f"{key}.json"
+
+    def _lock_path(self, key: str, kind: str) -> Path:
+        return self.root / "locks" / f"{key}.{kind}"
+
+    def _is_ready(self, key: str) -> bool:
+        return self._meta_path(key).exists() and self._entry_path(key).is_dir()
+
+    def _touch(self, key: str) -> None:
+        with contextlib.suppress(OSError):
+            os.utime(self._meta_path(key))
+
+    @staticmethod
+    async def _lock(path: Path, operation: int) -> int:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            await asyncio.to_thread(fcntl.flock, fd, operation)
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    @staticmethod
+    def _unlock(fd: int) -> None:
+        with contextlib.suppress(OSError):
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+    @contextlib.asynccontextmanager
+    async def lease(
+        self,
+        key: str,
+        build: Callable[[Path], Awaitable[None]],
+    ) -> AsyncIterator[Path]:
+        """获取缓存条目，未命中时调用 build(tmp_dir) 构建
+
+        在 with 块内条目保证不会被淘汰；调用方只能读取，不能修改条目内容。
+        """
+        self._ensure_dirs()
+        use_fd = await self._lock(self._lock_path(key, "use"), fcntl.LOCK_SH)
+        try:
+            if self._is_ready(key):
+                self._record("hits")
+                self._touch(key)
+                entry = self._entry_path(key)
+            else:
+                entry = await self._build(key, build)
+            yield entry
+        finally:
+            self._unlock(use_fd)
+
+    async def _build(self, key: str, build: Callable[[Path], Awaitable[None]]) -> Path:
+        build_fd = await self._lock(self._lock_path(key, "build"), fcntl.LOCK_EX)
+        try:
+            entry = self._entry_path(key)
+            # 等待构建锁期间可能已由其他进程构建完成
+            if self._is_ready(key):
+                self._record("hits")
+                self._touch(key)
+                return entry
+
+            self._record("misses")
+            tmp_dir = self.root / "tmp" / f"{key}-{uuid.uuid4().hex[:8]}"
+            tmp_dir.mkdir(parents=True)
+            started = time.monotonic()
+            try:
+                await build(tmp_dir)
+            except BaseException:
+                self._record("build_failures")
+                _rmtree(tmp_dir)
+                raise
+
+            size = _dir_size(tmp_dir)
+            _make_read_only(tmp_dir)
+            if entry.exists():
+                # 上次构建在写 meta 前中断留下的残留
+                _rmtree(entry)
+            os.rename(tmp_dir, entry)
+            self._meta_path(key).write_text(json.dumps({
+                "key": key,
+                "size": size,
+                "created_at": time.time(),
+            }))
+            logger.info(
+                f"[{self.name}] built cache entry {key}: {size} bytes "
+                f"in {time.monotonic() - started:.1f}s"
+            )
+        finally:
+            self._unlock(build_fd)
+
+        self._evict(exclude=key)
+        return entry
+
+    def _list_entries(self) -> list[tuple[float, str, int]]:
+        """返回 [(last_used, key, size), ...]"""
+        entries = []
+        for meta in (self.root / "meta").glob("*.json"):
+            try:
+                last_used = meta.stat().st_mtime
+                size = int(json.loads(meta.read_text()).get("size", 0))
+            except (OSError, ValueError):
+                continue
+            entries.append((last_used, meta.stem, size))
+        return entries
+
+    def _evict(self, exclude: str | None = None) -> None:
+        """按最近使用时间淘汰条目直到总大小不超过预算，跳过正在使用的条目"""
+        self._cleanup_stale_tmp()
+        entries = self._list_entries()
+        count = len(entries)
+        total = sum(size for _, _, size in entries)
+        if total > self.max_bytes:
+            for _, key, size in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if key == exclude:
+                    continue
+                if self._try_remove(key):
+                    total -= size
+                    count -= 1
+                    self._record("evictions")
+                    logger.info(f"[{self.name}] evicted cache entry {key} ({size} bytes)")
+        self._record_usage(count, total)
+
+    def _try_remove(self, key: str) -> bool:
+        fd = os.open(self._lock_path(key, "use"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            # 先删 meta，使新的读者视为未命中
+            with contextlib.suppress(FileNotFoundError):
+                self._meta_path(key).unlink()
+            _rmtree(self._entry_path(key))
+            return True
+        finally:
+            with contextlib.suppress(OSError):
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _cleanup_stale_tmp(self) -> None:
+        now = time.time()
+        for tmp in (self.root / "tmp").iterdir():
+            with contextlib.suppress(OSError):
+                if now - tmp.stat().st_mtime > STALE_TMP_SECONDS:
+                    _rmtree(tmp)
+
+    def _stats_key(self) -> str:
+        return f"{WORKER_CACHE_STATS_PREFIX}:{self.name}:{socket.gethostname()}"
+
+    def _record(self, field: str) -> None:
+        setattr(self, field, getattr(self, field) + 1)
+        try:
+            from extensions.ext_redis import redis_client
+
+            redis_client.hincrby(self._stats_key(), field, 1)
+        except Exception as e:
+            logger.debug(f"Failed to record cache stats: {e}")
+
+    def _record_usage(self, entries: int, size: int) -> None:
+        try:
+            from extensions.ext_redis import redis_client
+
+            redis_client.hset(self._stats_key(), mapping={
+                "entries": entries,
+                "size_bytes": size,
+                "max_bytes": self.max_bytes,
+            })
+        except Exception as e:
+            logger.debug(f"Failed to record cache usage: {e}")
+
+    def stats(self) -> dict:
+        """当前进程视角的缓存统计"""
+        entries = self._list_entries() if (self.root / "meta").exists() else []
+        return {
+            "name": self.name,
+            "entries": len(entries),
+            "size_bytes": sum(size for _, _, size in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "build_failures": self.build_failures,
+        }
+
+
+def get_worker_cache_stats() -> list[dict]:
+    """汇总所有 Worker 上报到 Redis 的缓存统计"""
+    from extensions.ext_redis import redis_client
+
+    stats = []
+    for raw_key in redis_client.scan_iter(match=f"{WORKER_CACHE_STATS_PREFIX}:*", count=100):
+        key = raw_key.decode() if isinstance(raw_key, bytes) else raw_key
+        _, _, name, host = key.split(":", 3)
+        values = {
+            (k.decode() if isinstance(k, bytes) else k): int(v)
+            for k, v in redis_client.hgetall(key).items()
+        }
+        lookups = values.get("hits", 0) + values.get("misses", 0)
+        stats.append({
+            "cache": name,
+            "worker": host,
+            **values,
+            "hit_rate": round(values.get("hits", 0) / lookups, 4) if lookups else None,
+        })
+    return sorted(stats, key=lambda s: (s["cache"], s["worker"]))
+
+
+def _dir_size(path: Path) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            with contextlib.suppress(OSError):
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+    return total
+
+
+def _make_read_only(path: Path) -> None:
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            file_path = os.path.join(dirpath, filename)
+            if not os.path.islink(file_path):
+                mode = os.lstat(file_path).st_mode
+                os.chmod(file_path, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+        for dirname in dirnames:
+            dir_path = os.path.join(dirpath, dirname)
+            if not os.path.islink(dir_path):
+                os.chmod(dir_path, 0o555)
+    os.chmod(path, 0o555)
+
+
+def _rmtree(path: Path) -> None:
+    """删除只读目录树（需先恢复目录写权限）"""
+    if not path.exists():
+        return
+    for dirpath, dirnames, _ in os.walk(path):
+        with contextlib.suppress(OSError):
+            os.chmod(dirpath, 0o755)
+        for dirname in dirnames:
+            with contextlib.suppress(OSError):
+                dir_path = os.path.join(dirpath, dirname)
+                if not os.path.islink(dir_path):
+                    os.chmod(dir_path, 0o755)
+    shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,314 @@
+import enum
+import json
+import logging
+import os
+import time
+from collections.abc import Callable
+
+from extensions.ext_redis import redis_client
+
+logger = logging.getLogger(__name__)
+
+FAIR_QUEUE_ENABLED = os.getenv("CRAWLHUB_FAIR_QUEUE_ENABLED", "true").lower() == "true"
+# 同时下发给 Celery 的运行数上限（约等于所有 worker 的槽位数），其余留在公平队列中排队
+QUEUE_MAX_INFLIGHT = int(os.getenv("CRAWLHUB_QUEUE_MAX_INFLIGHT", "16"))
+# 项目未设置 max_concurrency 时的默认并发上限，0 表示不限
+QUEUE_PROJECT_CONCURRENCY = int(os.getenv("CRAWLHUB_QUEUE_PROJECT_CONCURRENCY", "0"))
+# 已下发运行的占位超时，worker 异常退出未释放时回收
+QUEUE_INFLIGHT_TTL = int(os.getenv("CRAWLHUB_QUEUE_INFLIGHT_TTL", str(6 * 60 * 60)))
+# 全局准入：定时与重试运行的下发速率（次/秒，令牌桶），0 表示不限；手动运行不受限制
+QUEUE_DISPATCH_RATE = float(os.getenv("CRAWLHUB_QUEUE_DISPATCH_RATE", "2"))
+QUEUE_DISPATCH_BURST = int(os.getenv("CRAWLHUB_QUEUE_DISPATCH_BURST", "10"))
+
+QUEUE_PREFIX = "crawlhub:fq"
+
+
+class RunPriority(enum.IntEnum):
+    """运行优先级，数值越小越先下发"""
+    MANUAL = 0
+    SCHEDULE = 1
+    RETRY = 2
+
+
+def run_priority(trigger_type: str, retries: int = 0) -> RunPriority:
+    if retries:
+        return RunPriority.RETRY
+    if trigger_type == "manual":
+        return RunPriority.MANUAL
+    return RunPriority.SCHEDULE
+
+
+def _str(value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+class FairQueue:
+    """按项目加权公平排队的爬虫运行队列（Redis）
+
+    每个项目按优先级各有一个待运行列表。下发时先按优先级（手动 > 定时 > 重试），
+    同一优先级内按项目的虚拟时间（start-time fair queuing）选取：项目每下发一次，
+    虚拟时间增加 1/schedule_weight，权重越大分到的份额越多；空闲后重新入队的项目
+    从当前虚拟时钟开始，不会积攒额度。
+    已下发、未结束的运行计入全局与项目并发，分别受 QUEUE_MAX_INFLIGHT 和项目 max_concurrency 限制。
+    定时与重试运行另经全局令牌桶准入，整点集中到期的运行按固定速率放行。
+    """
+
+    def __init__(self, prefix: str = QUEUE_PREFIX):
+        self.prefix = prefix
+
+    # ─── keys ───
+
+    def _pending(self, project_id: str, priority: int) -> str:
+        return f"{self.prefix}:pending:{project_id}:{priority}"
+
+    def _projects(self, priority: int) -> str:
+        return f"{self.prefix}:projects:{priority}"
+
+    def _inflight_project(self, project_id: str) -> str:
+        return f"{self.prefix}:inflight:{project_id}"
+
+    def _stats(self, project_id: str) -> str:
+        return f"{self.prefix}:stats:{project_id}"
+
+    @property
+    def _inflight(self) -> str:
+        return f"{self.prefix}:inflight"
+
+    @property
+    def _owners(self) -> str:
+        return f"{self.prefix}:inflight_owner"
+
+    @property
+    def _finish(self) -> str:
+        return f"{self.prefix}:finish"
+
+    @property
+    def _clock(self) -> str:
+        return f"{self.prefix}:clock"
+
+    @property
+    def _delayed(self) -> str:
+        return f"{self.prefix}:delayed"
+
+    @property
+    def _bucket(self) -> str:
+        return f"{self.prefix}:bucket"
+
+    # ─── 入队 ───
+
+    def enqueue(self, job: dict, delay: float = 0) -> None:
+        """加入队列；delay 秒后才可下发（用于重试退避）
+
+        job 需包含 project_id、task_id 与 priority，其余字段原样传给执行任务。
+        """
+        job = {**job, "enqueued_at": time.time()}
+        if delay > 0:
+            redis_client.zadd(self._delayed, {json.dumps(job): time.time() + delay})
+        else:
+            self._push(job)
+        redis_client.hincrby(self._stats(job["project_id"]), "enqueued", 1)
+
+    def _push(self, job: dict) -> None:
+        project_id = job["project_id"]
+        priority = int(job["priority"])
+        redis_client.rpush(self._pending(project_id, priority), json.dumps(job))
+        # 空闲项目从当前虚拟时钟开始排队
+        start = max(self._get_float(self._clock), self._get_finish(project_id))
+        redis_client.zadd(self._projects(priority), {project_id: start}, nx=True)
+
+    def promote_delayed(self, now: float | None = None) -> int:
+        """将退避结束的任务移入待运行列表"""
+        now = now or time.time()
+        ready = redis_client.zrangebyscore(self._delayed, "-inf", now)
+        for raw in ready:
+            # 多个调度器并发时只有删除成功的一方入队
+            if redis_client.zrem(self._delayed, raw):
+                self._push(json.loads(raw))
+        return len(ready)
+
+    # ─── 下发 ───
+
+    def active_projects(self) -> set[str]:
+        """有待运行任务的项目"""
+        projects = set()
+        for priority in RunPriority:
+            projects.update(_str(p) for p in redis_client.zrange(self._projects(priority), 0, -1))
+        return projects
+
+    def dispatch(
+        self,
+        send: Callable[[dict], None],
+        weights: dict[str, int] | None = None,
+        caps: dict[str, int | None] | None = None,
+        max_inflight: int = QUEUE_MAX_INFLIGHT,
+        rate: float = QUEUE_DISPATCH_RATE,
+        burst: int = QUEUE_DISPATCH_BURST,
+    ) -> int:
+        """在并发上限和准入速率内按优先级与公平份额下发任务，返回下发数
+
+        调用方需保证同一时刻只有一个 dispatch 在执行。
+        """
+        weights = weights or {}
+        caps = caps or {}
+        self.expire_inflight()
+
+        now = time.time()
+        tokens = self._refill(now, rate, burst)
+        dispatched = 0
+        inflight = redis_client.zcard(self._inflight)
+        while not max_inflight or inflight < max_inflight:
+            # 令牌用尽后只放行手动运行
+            priorities = list(RunPriority) if tokens >= 1 else [RunPriority.MANUAL]
+            picked = self._pick(caps, priorities)
+            if not picked:
+                break
+            project_id, priority, start, job = picked
+
+            dispatched_at = time.time()
+            task_id = str(job["task_id"])
+            redis_client.zadd(self._inflight, {task_id: dispatched_at})
+            redis_client.zadd(self._inflight_project(project_id), {task_id: dispatched_at})
+            redis_client.hset(self._owners, task_id, project_id)
+            try:
+                send(job)
+            except Exception as e:
+                logger.error(f"Failed to dispatch task {task_id}: {e}")
+                self.release(task_id)
+                redis_client.lpush(self._pending(project_id, priority), json.dumps(job))
+                redis_client.zadd(self._projects(priority), {project_id: start}, nx=True)
+                break
+
+            # 推进虚拟时间
+            finish = start + 1 / max(weights.get(project_id) or 1, 1)
+            redis_client.set(self._clock, start)
+            redis_client.hset(self._finish, project_id, finish)
+            for p in RunPriority:
+                redis_client.zadd(self._projects(p), {project_id: finish}, xx=True)
+
+            self._record_wait(project_id, dispatched_at - job.get("enqueued_at", dispatched_at))
+            if priority != RunPriority.MANUAL:
+                tokens -= 1
+            inflight += 1
+            dispatched += 1
+
+        if rate > 0:
+            redis_client.hset(self._bucket, "tokens", tokens)
+            redis_client.hset(self._bucket, "ts", now)
+        return dispatched
+
+    def _refill(self, now: float, rate: float, burst: int) -> float:
+        """令牌桶按经过的时间补充令牌，rate 为 0 时不限速"""
+        if rate <= 0:
+            return float("inf")
+        tokens = redis_client.hget(self._bucket, "tokens")
+        ts = redis_client.hget(self._bucket, "ts")
+        if tokens is None or ts is None:
+            return float(burst)
+        return min(float(burst), float(tokens) + max(now - float(ts), 0) * rate)
+
+    def _pick(
+        self, caps: dict[str, int | None], priorities: list[RunPriority]
+    ) -> tuple[str, int, float, dict] | None:
+        full: set[str] = set()
+        for priority in priorities:
+            for raw_id, start in redis_client.zrange(self._projects(priority), 0, -1, withscores=True):
+                project_id = _str(raw_id)
+                if project_id in full:
+                    continue
+                cap = caps.get(project_id) or QUEUE_PROJECT_CONCURRENCY
+                if cap and redis_client.zcard(self._inflight_project(project_id)) >= cap:
+                    full.add(project_id)
+                    continue
+                pending = self._pending(project_id, priority)
+                raw = redis_client.lpop(pending)
+                if not redis_client.llen(pending):
+                    redis_client.zrem(self._projects(priority), project_id)
+                    # 与并发入队竞争：删除后又有新任务时放回
+                    if redis_client.llen(pending):
+                        redis_client.zadd(self._projects(priority), {project_id: start}, nx=True)
+                if raw is None:
+                    continue
+                return project_id, priority, float(start), json.loads(raw)
+        return None
+
+    # ─── 完成 ───
+
+    def release(self, task_id: str) -> None:
+        """运行结束，释放并发占位"""
+        task_id = str(task_id)
+        project_id = redis_client.hget(self._owners, task_id)
+        redis_client.zrem(self._inflight, task_id)
+        redis_client.hdel(self._owners, task_id)
+        if project_id is not None:
+            redis_client.zrem(self._inflight_project(_str(project_id)), task_id)
+
+    def expire_inflight(self, ttl: int = QUEUE_INFLIGHT_TTL) -> int:
+        stale = redis_client.zrangebyscore(self._inflight, "-inf", time.time() - ttl)
+        for task_id in stale:
+            logger.warning(f"Releasing stale queue slot of task {_str(task_id)}")
+            self.release(_str(task_id))
+        return len(stale)
+
+    # ─── 统计 ───
+
+    def _record_wait(self, project_id: str, wait: float) -> None:
+        wait_ms = int(max(wait, 0) * 1000)
+        key = self._stats(project_id)
+        redis_client.hincrby(key, "dispatched", 1)
+        redis_client.hincrby(key, "wait_ms_total", wait_ms)
+        if wait_ms > int(redis_client.hget(key, "wait_ms_max") or 0):
+            redis_client.hset(key, "wait_ms_max", wait_ms)
+
+    def stats(self) -> list[dict]:
+        """各项目的队列深度、并发与等待时间"""
+        delayed: dict[str, int] = {}
+        for raw in redis_client.zrange(self._delayed, 0, -1):
+            project_id = json.loads(raw)["project_id"]
+            delayed[project_id] = delayed.get(project_id, 0) + 1
+
+        project_ids = self.active_projects() | set(delayed)
+        for key in redis_client.scan_iter(match=f"{self.prefix}:stats:*", count=100):
+            project_ids.add(_str(key).rsplit(":", 1)[1])
+
+        now = time.time()
+        result = []
+        for project_id in sorted(project_ids):
+            depth = {}
+            oldest = None
+            for priority in RunPriority:
+                key = self._pending(project_id, priority)
+                depth[priority.name.lower()] = redis_client.llen(key)
+                head = redis_client.lindex(key, 0)
+                if head is not None:
+                    enqueued_at = json.loads(head)["enqueued_at"]
+                    oldest = enqueued_at if oldest is None else min(oldest, enqueued_at)
+
+            values = {_str(k): int(v) for k, v in redis_client.hgetall(self._stats(project_id)).items()}
+            dispatched = values.get("dispatched", 0)
+            avg_wait = values.get("wait_ms_total", 0) / dispatched / 1000 if dispatched else None
+            result.append({
+                "project_id": project_id,
+                "depth": sum(depth.values()),
+                "depth_by_priority": depth,
+                "delayed": delayed.get(project_id, 0),
+                "inflight": redis_client.zcard(self._inflight_project(project_id)),
+                "enqueued": values.get("enqueued", 0),
+                "dispatched": dispatched,
+                "oldest_wait_seconds": round(now - oldest, 3) if oldest else 0,
+                "avg_wait_seconds": round(avg_wait, 3) if avg_wait is not None else None,
+                "max_wait_seconds": round(values.get("wait_ms_max", 0) / 1000, 3) if dispatched else None,
+            })
+        return result
+
+    # ─── helpers ───
+
+    def _get_float(self, key: str) -> float:
+        value = redis_client.get(key)
+        return float(value) if value is not None else 0.0
+
+    def _get_finish(self, project_id: str) -> float:
+        value = redis_client.hget(self._finish, project_id)
+        return float(value) if value is not None else 0.0
+
+
+fair_queue = FairQueue()
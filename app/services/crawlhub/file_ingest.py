@@ -0,0 +1,445 @@
+import asyncio
+import csv
+import ctypes
+import ctypes.util
+import gzip
+import io
+import json
+import logging
+import os
+import sys
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from services.crawlhub.item_sink import ItemSink
+
+logger = logging.getLogger(__name__)
+
+FILE_BATCH_SIZE = int(os.getenv("CRAWLHUB_FILE_BATCH_SIZE", "1000"))
+# 运行期间扫描输出目录的间隔（inotify 可用时作为兜底）
+OUTPUT_TAIL_INTERVAL = float(os.getenv("CRAWLHUB_OUTPUT_TAIL_INTERVAL", "5"))
+# 单次从文件读取的最大字节数
+OUTPUT_TAIL_READ_BYTES = 4 * 1024 * 1024
+# 收到 inotify 事件后等待一段时间再扫描，合并连续写入
+_TAIL_DEBOUNCE = 0.5
+
+_READ_SIZE = 64 * 1024
+_JSON_WHITESPACE = " \t\r\n"
+
+
+def _split_suffix(path: Path) -> tuple[str, str | None]:
+    """返回 (格式, 压缩方式)，如 data.jsonl.gz -> ("jsonl", "gz")"""
+    suffixes = [s.lower().lstrip(".") for s in path.suffixes]
+    compression = None
+    if suffixes and suffixes[-1] in ("gz", "zst"):
+        compression = suffixes.pop()
+    fmt = suffixes[-1] if suffixes else ""
+    if fmt == "ndjson":
+        fmt = "jsonl"
+    return fmt, compression
+
+
+def _open_text(path: Path, compression: str | None) -> io.TextIOBase:
+    if compression == "gz":
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    if compression == "zst":
+        import zstandard
+
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return io.TextIOWrapper(raw, encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+class _RowErrors:
+    """记录解析失败的行数"""
+
+    def __init__(self):
+        self.count = 0
+
+
+def _iter_jsonl(f: io.TextIOBase, errors: _RowErrors) -> Iterator[dict]:
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            errors.count += 1
+            continue
+        if isinstance(data, dict):
+            yield data
+        elif isinstance(data, list):
+            yield from (d for d in data if isinstance(d, dict))
+        else:
+            errors.count += 1
+
+
+def _iter_json(f: io.TextIOBase, errors: _RowErrors) -> Iterator[dict]:
+    """增量解析顶层 JSON 数组，每次只缓存一个元素；顶层为对象时视为一条数据"""
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    in_array = None
+
+    def fill() -> bool:
+        nonlocal buf, pos, eof
+        chunk = f.read(_READ_SIZE)
+        if not chunk:
+            eof = True
+            return False
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    while True:
+        # 跳过空白和数组分隔符
+        while True:
+            while pos < len(buf) and buf[pos] in _JSON_WHITESPACE:
+                pos += 1
+            if pos < len(buf) or not fill():
+                break
+        if pos >= len(buf):
+            return
+
+        char = buf[pos]
+        if in_array is None:
+            in_array = char == "["
+            if in_array:
+                pos += 1
+                continue
+        elif in_array and char == ",":
+            pos += 1
+            continue
+        elif in_array and char == "]":
+            return
+
+        try:
+            value, end = decoder.raw_decode(buf, pos)
+            # 数字等值可能被截断在缓冲区末尾，未到 EOF 时需要读到后续字符才能确认
+            if end >= len(buf) and not eof and fill():
+                continue
+        except json.JSONDecodeError:
+            if not eof and fill():
+                continue
+            errors.count += 1
+            return
+        pos = end
+
+        if isinstance(value, dict):
+            yield value
+        else:
+            errors.count += 1
+        if not in_array:
+            return
+
+
+def _iter_csv(f: io.TextIOBase, errors: _RowErrors) -> Iterator[dict]:
+    yield from csv.DictReader(f)
+
+
+_TEXT_READERS = {"json": _iter_json, "jsonl": _iter_jsonl, "csv": _iter_csv}
+
+
+def _iter_parquet(path: Path, batch_size: int) -> Iterator[dict]:
+    """按 row group 流式读取 Parquet"""
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    try:
+        for record_batch in parquet.iter_batches(batch_size=batch_size):
+            yield from record_batch.to_pylist()
+    finally:
+        parquet.close()
+
+
+def iter_file_items(
+    path: Path, errors: _RowErrors | None = None, batch_size: int = FILE_BATCH_SIZE
+) -> Iterator[dict]:
+    """流式读取输出文件中的数据项，不支持的格式返回空"""
+    errors = errors or _RowErrors()
+    fmt, compression = _split_suffix(path)
+    if fmt == "parquet" and compression is None:
+        yield from _iter_parquet(path, batch_size)
+        return
+
+    reader = _TEXT_READERS.get(fmt)
+    if reader is None:
+        return
+    with _open_text(path, compression) as f:
+        yield from reader(f, errors)
+
+
+def _take(items: Iterator[dict], size: int) -> list[dict]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            break
+    return batch
+
+
+class FileOutputCollector:
+    """CRAWLHUB_OUTPUT_DIR 文件输出采集
+
+    支持 JSON 数组 / JSONL / CSV（可 .gz / .zst 压缩）和 Parquet，逐条流式解析，
+    按固定批次经 ItemSink 写入，内存占用与文件大小无关。解析在线程中进行，不阻塞事件循环。
+    每批写入即累加任务计数，解析失败的行计入 failed_count。
+    """
+
+    def __init__(self, sink: ItemSink, batch_size: int = FILE_BATCH_SIZE):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.ingested = 0
+        self.failed = 0
+
+    async def collect(self, output_dir: Path, exclude: Iterable[str] = ()) -> int:
+        """采集目录下所有文件（exclude 中的文件名除外），返回写入条数"""
+        if not output_dir.exists() or not await self.sink.is_writable():
+            return 0
+        exclude = set(exclude)
+        for path in sorted(output_dir.iterdir()):
+            if path.is_file() and path.name not in exclude:
+                await self.collect_file(path)
+        return self.ingested
+
+    async def collect_file(self, path: Path) -> int:
+        errors = _RowErrors()
+        items = iter_file_items(path, errors, self.batch_size)
+        count = 0
+        try:
+            while True:
+                batch = await asyncio.to_thread(_take, items, self.batch_size)
+                if not batch:
+                    break
+                count += await self.sink.write(batch)
+        except ImportError as e:
+            logger.warning(f"Skip file output {path.name}: missing optional dependency ({e.name})")
+        except Exception as e:
+            logger.warning(f"Failed to collect file output {path}: {e}")
+        finally:
+            items.close()
+
+        self.ingested += count
+        if errors.count:
+            self.failed += errors.count
+            await self.sink.add_failed(errors.count)
+        if count or errors.count:
+            logger.info(
+                f"Task {self.sink.task_id}: collected {count} items from {path.name}"
+                + (f", {errors.count} rows failed" if errors.count else "")
+            )
+        return count
+
+
+# inotify 事件掩码
+_IN_MODIFY = 0x002
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+
+
+class _DirWatcher:
+    """inotify 监听目录内的写入，事件到达时置位 event"""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        self.event = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._loop.add_reader(fd, self._on_readable)
+
+    @classmethod
+    def create(cls, path: Path) -> "_DirWatcher | None":
+        """inotify 不可用时返回 None，由调用方轮询"""
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                return None
+            mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+            if libc.inotify_add_watch(fd, str(path).encode(), mask) < 0:
+                os.close(fd)
+                return None
+        except (OSError, AttributeError):
+            return None
+        return cls(fd)
+
+    def _on_readable(self) -> None:
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        self.event.set()
+
+    def close(self) -> None:
+        self._loop.remove_reader(self.fd)
+        os.close(self.fd)
+
+
+def _csv_cut(data: bytes) -> int:
+    """最后一个不在引号内的换行之后的位置（引号内的换行属于同一条记录）"""
+    if b'"' not in data:
+        return data.rfind(b"\n") + 1
+    cut = 0
+    quoted = False
+    for i, byte in enumerate(data):
+        if byte == 0x22:
+            quoted = not quoted
+        elif byte == 0x0A and not quoted:
+            cut = i + 1
+    return cut
+
+
+class OutputTailer:
+    """运行期间跟踪输出目录中追加写入的 JSONL / CSV 文件
+
+    inotify 通知或定期扫描时读取各文件新增的完整记录，按批次经 ItemSink 写入，
+    写入后推进文件偏移。进程超时、失败时已写出的部分不会丢失；
+    结束时 stop() 读取剩余内容（包括没有换行结尾的最后一行）。
+    压缩文件、JSON 数组和 Parquet 无法增量读取，仍由 FileOutputCollector 在结束后采集。
+    """
+
+    TAILABLE_SUFFIXES = (".jsonl", ".ndjson", ".csv")
+
+    def __init__(
+        self,
+        sink: ItemSink,
+        output_dir: Path,
+        batch_size: int = FILE_BATCH_SIZE,
+        poll_interval: float = OUTPUT_TAIL_INTERVAL,
+        read_bytes: int = OUTPUT_TAIL_READ_BYTES,
+    ):
+        self.sink = sink
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.read_bytes = read_bytes
+        # 文件名 -> 已采集的字节偏移
+        self.offsets: dict[str, int] = {}
+        self.ingested = 0
+        self.failed = 0
+        self._csv_headers: dict[str, list[str]] = {}
+        self._stopped = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @classmethod
+    def is_tailable(cls, path: Path) -> bool:
+        return path.name.lower().endswith(cls.TAILABLE_SUFFIXES)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止跟踪并采集剩余内容"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        if self._task:
+            await asyncio.gather(self._task, return_exceptions=True)
+        if await self.sink.is_writable():
+            await self.scan(final=True)
+
+    async def _run(self) -> None:
+        if not await self.sink.is_writable():
+            return
+        watcher = _DirWatcher.create(self.output_dir)
+        try:
+            while not self._stopped.is_set():
+                if watcher:
+                    watcher.event.clear()
+                await self.scan()
+                waiters = {asyncio.ensure_future(self._stopped.wait())}
+                if watcher:
+                    waiters.add(asyncio.ensure_future(watcher.event.wait()))
+                try:
+                    await asyncio.wait(
+                        waiters, timeout=self.poll_interval, return_when=asyncio.FIRST_COMPLETED
+                    )
+                finally:
+                    for waiter in waiters:
+                        waiter.cancel()
+                if watcher and watcher.event.is_set() and not self._stopped.is_set():
+                    await asyncio.sleep(_TAIL_DEBOUNCE)
+        except Exception as e:
+            logger.warning(f"Task {self.sink.task_id}: output tailing stopped: {e}")
+        finally:
+            if watcher:
+                watcher.close()
+
+    async def scan(self, final: bool = False) -> None:
+        """读取所有可跟踪文件的新增内容"""
+        if not self.output_dir.exists():
+            return
+        for path in sorted(self.output_dir.iterdir()):
+            if path.is_file() and self.is_tailable(path):
+                try:
+                    await self._tail_file(path, final)
+                except Exception as e:
+                    logger.warning(f"Failed to tail file output {path}: {e}")
+
+    async def _tail_file(self, path: Path, final: bool) -> None:
+        name = path.name
+        offset = self.offsets.setdefault(name, 0)
+        size = path.stat().st_size
+        if size < offset:
+            logger.warning(f"Task {self.sink.task_id}: {name} was truncated, tailing from start")
+            offset = self.offsets[name] = 0
+            self._csv_headers.pop(name, None)
+
+        is_csv = name.lower().endswith(".csv")
+        while offset < size:
+            data, cut = await asyncio.to_thread(_read_records, path, offset, self.read_bytes, is_csv)
+            if not data:
+                break
+            if not cut:
+                # 最后一行尚未写完；结束时或单行超过读取上限时整段处理
+                if not final and len(data) < self.read_bytes:
+                    break
+                cut = len(data)
+
+            text = data[:cut].decode("utf-8", errors="replace")
+            errors = _RowErrors()
+            if is_csv:
+                items = list(self._parse_csv(name, text))
+            else:
+                items = list(_iter_jsonl(io.StringIO(text), errors))
+            await self._write(items, errors.count)
+            # 写入后再推进偏移
+            offset += cut
+            self.offsets[name] = offset
+
+    def _parse_csv(self, name: str, text: str) -> Iterator[dict]:
+        header = self._csv_headers.get(name)
+        reader = csv.reader(io.StringIO(text, newline=""))
+        if header is None:
+            header = next(reader, None)
+            if header is None:
+                return
+            self._csv_headers[name] = header
+        for row in reader:
+            if row:
+                yield dict(zip(header, row))
+
+    async def _write(self, items: list[dict], failed: int) -> None:
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start:start + self.batch_size]
+            try:
+                self.ingested += await self.sink.write(batch)
+            except Exception as e:
+                failed += len(batch)
+                logger.warning(f"Failed to ingest tailed items for task {self.sink.task_id}: {e}")
+        if failed:
+            self.failed += failed
+            await self.sink.add_failed(failed)
+
+
+def _read_records(path: Path, offset: int, limit: int, is_csv: bool) -> tuple[bytes, int]:
+    """从 offset 读取至多 limit 字节，返回数据和完整记录的结束位置"""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(limit)
+    return data, _csv_cut(data) if is_csv else data.rfind(b"\n") + 1
@@ -0,0 +1,70 @@
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_, select, update
+
+from models.crawlhub import SpiderTask, SpiderTaskStatus
+from services.base_service import BaseService
+
+logger = logging.getLogger(__name__)
+
+# 超过该时长未收到心跳的运行中任务视为已停止响应
+HEARTBEAT_TIMEOUT = timedelta(minutes=2)
+# 开始运行后该时长内不检查
+HEARTBEAT_GRACE = timedelta(minutes=3)
+# 单条 UPDATE 处理的任务数，卡住的任务很多时分批标记
+SWEEP_BATCH_SIZE = 1000
+
+HEARTBEAT_TIMEOUT_MESSAGE = "心跳超时：任务可能已停止响应"
+
+
+class HeartbeatService(BaseService):
+    """心跳超时扫描
+
+    由一条 UPDATE ... WHERE status = 'running' AND last_heartbeat < 截止时间 RETURNING
+    完成筛选和标记（走 crawlhub_tasks_running_heartbeat_idx 部分索引），运行中的任务
+    不再逐个加载到 Python 中判断。从未上报心跳的任务（可能未使用 SDK）不处理；
+    分片父任务没有自己的进程，由子任务汇总状态。
+    """
+
+    def _stale_ids(self, now: datetime):
+        return (
+            select(SpiderTask.id)
+            .where(
+                SpiderTask.status == SpiderTaskStatus.RUNNING,
+                SpiderTask.last_heartbeat < now - HEARTBEAT_TIMEOUT,
+                or_(SpiderTask.started_at.is_(None), SpiderTask.started_at < now - HEARTBEAT_GRACE),
+                or_(SpiderTask.parent_task_id.isnot(None), func.coalesce(SpiderTask.shard_count, 0) == 0),
+            )
+            .limit(SWEEP_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+
+    async def sweep_timeouts(self, now: datetime) -> list[SpiderTask]:
+        """将心跳超时的任务标记为失败，返回被标记的任务"""
+        swept: list[SpiderTask] = []
+        while True:
+            result = await self.db.execute(
+                update(SpiderTask)
+                .where(
+                    SpiderTask.id.in_(self._stale_ids(now)),
+                    SpiderTask.status == SpiderTaskStatus.RUNNING,
+                )
+                .values(
+                    status=SpiderTaskStatus.FAILED,
+                    error_category="system",
+                    error_message=HEARTBEAT_TIMEOUT_MESSAGE,
+                    finished_at=now,
+                )
+                .returning(SpiderTask)
+                .execution_options(synchronize_session=False)
+            )
+            batch = list(result.scalars().all())
+            await self.db.commit()
+            swept.extend(batch)
+            if len(batch) < SWEEP_BATCH_SIZE:
+                break
+
+        if swept:
+            logger.warning(f"{len(swept)} tasks heartbeat timeout, marked as failed")
+        return swept
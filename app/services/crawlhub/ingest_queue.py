@@ -0,0 +1,284 @@
+import asyncio
+import contextlib
+import json
+import logging
+import math
+import os
+import socket
+import threading
+import time
+
+from redis.exceptions import ResponseError
+
+from extensions.ext_redis import redis_client
+from models.engine import TaskSessionLocal
+from services.crawlhub.dedup import dedup_service
+from services.crawlhub.item_sink import ItemSink
+from services.crawlhub.run_context import RunContext, run_contexts
+
+logger = logging.getLogger(__name__)
+
+# 异步写入模式：上报接口写入 Redis Stream 后立即返回，由消费者批量写入数据库
+INGEST_WRITE_BEHIND = os.getenv("CRAWLHUB_INGEST_WRITE_BEHIND", "false").lower() == "true"
+INGEST_STREAM = "crawlhub:ingest:stream"
+INGEST_GROUP = "crawlhub-ingest-writers"
+_LAG_KEY = "crawlhub:ingest:lag"
+_LAG_TOTAL_KEY = "crawlhub:ingest:lag_total"
+# 积压的数据项超过该数量时上报接口返回 429
+INGEST_MAX_LAG = int(os.getenv("CRAWLHUB_INGEST_MAX_LAG", "200000"))
+# 积压达到上限时建议 SDK 等待的秒数，积压越多等待越久
+_BASE_RETRY_AFTER = 5
+_MAX_RETRY_AFTER = 60
+# 每次读取的消息数，同一任务的消息合并后按 _WRITE_BATCH_SIZE 批量写入
+_READ_COUNT = 200
+_WRITE_BATCH_SIZE = 5000
+_READ_BLOCK_MS = 1000
+# 消费者异常退出后，未确认的消息超过该时长由其他消费者接管
+_CLAIM_IDLE_MS = 60 * 1000
+# 常驻消费者检查待接管消息的间隔（秒），以及 Redis 或数据库异常后的等待时长
+_CLAIM_INTERVAL = 30
+_ERROR_BACKOFF = 5
+# 持续写入失败的消息超过该时长后丢弃并计入失败
+_MAX_AGE_SECONDS = 60 * 60
+
+
+def _str(value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def _entry_age(entry_id) -> float:
+    return time.time() - int(_str(entry_id).split("-")[0]) / 1000
+
+
+class IngestQueue:
+    """数据上报的异步写入队列（Redis Stream + 消费者组）
+
+    上报接口只追加一条消息即返回，SDK 不再等待最慢的写入目标；消费者每次读取多条消息，
+    按任务合并后去重、批量写入。消息写入成功后才确认，消费者异常时由其他消费者接管，
+    至少写入一次。按爬虫统计积压的数据项数，积压过多时上报接口返回 429 和 Retry-After。
+    """
+
+    def __init__(self, stream: str = INGEST_STREAM, group: str = INGEST_GROUP):
+        self.stream = stream
+        self.group = group
+        self._group_ready = False
+
+    # ─── 生产 ───
+
+    def retry_after(self) -> int | None:
+        """积压超过上限时返回建议的重试等待秒数，否则返回 None"""
+        try:
+            lag = int(redis_client.get(_LAG_TOTAL_KEY) or 0)
+        except Exception as e:
+            logger.warning(f"Failed to read ingest lag: {e}")
+            return None
+        if lag < INGEST_MAX_LAG:
+            return None
+        return min(_MAX_RETRY_AFTER, math.ceil(_BASE_RETRY_AFTER * lag / INGEST_MAX_LAG))
+
+    def enqueue(self, context: RunContext, items: list[dict]) -> None:
+        """追加一批数据项，Redis 不可用时抛出异常，由调用方改为同步写入"""
+        if not items:
+            return
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.xadd(self.stream, {
+            "task_id": context.task_id,
+            "spider_id": context.spider_id,
+            "items": json.dumps(items, ensure_ascii=False, default=str),
+        })
+        pipe.hincrby(_LAG_KEY, context.spider_id, len(items))
+        pipe.incrby(_LAG_TOTAL_KEY, len(items))
+        pipe.execute()
+
+    # ─── 消费 ───
+
+    def _ensure_group(self) -> None:
+        if self._group_ready:
+            return
+        try:
+            redis_client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    @staticmethod
+    def _consumer_name(consumer: str | None) -> str:
+        return consumer or f"{socket.gethostname()}-{os.getpid()}"
+
+    async def _claim(self, consumer: str) -> int:
+        """接管其他消费者长时间未确认的消息"""
+        _, entries, *_ = await asyncio.to_thread(
+            redis_client.xautoclaim,
+            self.stream, self.group, consumer, _CLAIM_IDLE_MS, start_id="0-0", count=_READ_COUNT,
+        )
+        return await self._process(entries) if entries else 0
+
+    async def _read(self, consumer: str) -> int | None:
+        """阻塞读取一批新消息并写入，没有新消息时返回 None"""
+        response = await asyncio.to_thread(
+            redis_client.xreadgroup,
+            self.group, consumer, {self.stream: ">"}, count=_READ_COUNT, block=_READ_BLOCK_MS,
+        )
+        if not response:
+            return None
+        return await self._process(response[0][1])
+
+    async def consume(self, consumer: str | None = None, seconds: float = 5.0) -> int:
+        """在给定时长内读取并写入队列中的数据，返回写入条数（一次性排空，常驻消费使用 run）"""
+        consumer = self._consumer_name(consumer)
+        await asyncio.to_thread(self._ensure_group)
+        deadline = time.monotonic() + seconds
+
+        written = await self._claim(consumer)
+        while time.monotonic() < deadline:
+            batch = await self._read(consumer)
+            if batch is None:
+                break
+            written += batch
+        return written
+
+    async def run(self, stop: asyncio.Event, consumer: str | None = None) -> None:
+        """常驻消费，直到 stop 被设置；Redis 调用在线程中执行，不阻塞事件循环"""
+        consumer = self._consumer_name(consumer)
+        next_claim = 0.0
+        while not stop.is_set():
+            try:
+                await asyncio.to_thread(self._ensure_group)
+                if time.monotonic() >= next_claim:
+                    next_claim = time.monotonic() + _CLAIM_INTERVAL
+                    await self._claim(consumer)
+                written = await self._read(consumer)
+                if written:
+                    logger.info(f"Wrote {written} queued items")
+            except Exception as e:
+                logger.error(f"Ingest consumer {consumer} failed: {e}")
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(stop.wait(), _ERROR_BACKOFF)
+
+    async def _process(self, entries: list) -> int:
+        groups: dict[str, dict] = {}
+        for entry_id, fields in entries:
+            if not fields:
+                # 已被删除的消息
+                continue
+            fields = {_str(k): v for k, v in fields.items()}
+            group = groups.setdefault(_str(fields["task_id"]), {
+                "spider_id": _str(fields["spider_id"]), "ids": [], "items": [], "oldest": entry_id,
+            })
+            group["ids"].append(entry_id)
+            group["items"] += json.loads(fields["items"])
+
+        written = 0
+        async with TaskSessionLocal() as db:
+            for task_id, group in groups.items():
+                try:
+                    written += await self._write(db, task_id, group["spider_id"], group["items"])
+                except Exception as e:
+                    await db.rollback()
+                    if _entry_age(group["oldest"]) < _MAX_AGE_SECONDS:
+                        logger.warning(f"Failed to write queued items for task {task_id}, will retry: {e}")
+                        continue
+                    logger.error(f"Dropping {len(group['items'])} queued items for task {task_id}: {e}")
+                    await ItemSink(db, task_id, group["spider_id"]).add_failed(len(group["items"]))
+                await asyncio.to_thread(self._ack, group["ids"], group["spider_id"], len(group["items"]))
+        return written
+
+    async def _write(self, db, task_id: str, spider_id: str, items: list[dict]) -> int:
+        context = await run_contexts.get(db, task_id, spider_id)
+        if context is None:
+            logger.warning(f"Task {task_id} not found, dropping {len(items)} queued items")
+            return 0
+        sink = ItemSink(db, task_id, spider_id, is_test=context.is_test, targets=context.targets)
+        written = 0
+        for start in range(0, len(items), _WRITE_BATCH_SIZE):
+            batch = await dedup_service.claim(context.spider, items[start:start + _WRITE_BATCH_SIZE], task_id)
+            hashes = [item["_dedup_hash"] for item in batch if "_dedup_hash" in item]
+            try:
+                written += await sink.write(batch)
+            except Exception:
+                await dedup_service.release(spider_id, hashes)
+                raise
+        return written
+
+    def _ack(self, entry_ids: list, spider_id: str, count: int) -> None:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.xack(self.stream, self.group, *entry_ids)
+        pipe.xdel(self.stream, *entry_ids)
+        pipe.hincrby(_LAG_KEY, spider_id, -count)
+        pipe.incrby(_LAG_TOTAL_KEY, -count)
+        pipe.execute()
+
+    # ─── 监控 ───
+
+    def lag(self) -> dict:
+        """积压情况：各爬虫待写入的数据项数、队列长度和最早消息的等待时长"""
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hgetall(_LAG_KEY)
+        pipe.xlen(self.stream)
+        pipe.xrange(self.stream, count=1)
+        spiders, length, oldest = pipe.execute()
+        spiders = {_str(k): max(int(v), 0) for k, v in spiders.items() if int(v) > 0}
+        return {
+            "enabled": INGEST_WRITE_BEHIND,
+            "spiders": spiders,
+            "total_items": sum(spiders.values()),
+            "stream_length": length,
+            "oldest_age_seconds": round(_entry_age(oldest[0][0]), 1) if oldest else 0,
+        }
+
+
+ingest_queue = IngestQueue()
+
+
+class IngestConsumer:
+    """Worker 进程内的常驻队列消费者
+
+    在独立线程的事件循环中运行 IngestQueue.run，不占用 Celery 任务槽位，
+    也不与爬虫执行器的事件循环争用；同一消费者组内多个 worker 进程的消费者分摊消息。
+    """
+
+    def __init__(self, queue: IngestQueue):
+        self.queue = queue
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stop: asyncio.Event | None = None
+        self._thread: threading.Thread | None = None
+        self._owner_pid: int | None = None
+
+    @property
+    def running(self) -> bool:
+        # fork 出的子进程不会继承消费者线程
+        return self._owner_pid == os.getpid() and self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        ready = threading.Event()
+
+        def _run() -> None:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            self._loop = loop
+            self._stop = asyncio.Event()
+            loop.call_soon(ready.set)
+            try:
+                loop.run_until_complete(self.queue.run(self._stop))
+            finally:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+                loop.close()
+
+        self._owner_pid = os.getpid()
+        self._thread = threading.Thread(target=_run, name="ingest-consumer", daemon=True)
+        self._thread.start()
+        ready.wait()
+        logger.info("Ingest consumer started")
+
+    def stop(self, timeout: float = 30) -> None:
+        """通知消费者退出并等待当前一批写完"""
+        if not self.running:
+            return
+        self._loop.call_soon_threadsafe(self._stop.set)
+        self._thread.join(timeout=timeout)
+
+
+ingest_consumer = IngestConsumer(ingest_queue)
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+
+from jsonschema import FormatChecker, validators
+from jsonschema.exceptions import SchemaError, best_match
+
+from extensions.ext_redis import redis_client
+from models.crawlhub import Spider
+
+logger = logging.getLogger(__name__)
+
+REJECTED_PREFIX = "crawlhub:rejected"
+# 每个任务保留的校验失败样本数
+REJECTED_SAMPLE_SIZE = 20
+REJECTED_TTL = 7 * 24 * 60 * 60
+# 进程内缓存的校验器数量
+_CACHE_SIZE = 256
+
+
+class ItemValidator:
+    """编译后的 item_schema 校验器，支持完整 JSON Schema（嵌套对象、format、enum 等）"""
+
+    def __init__(self, schema: dict):
+        validator_cls = validators.validator_for(schema)
+        validator_cls.check_schema(schema)
+        self._validator = validator_cls(schema, format_checker=FormatChecker())
+
+    def validate(self, items: list[dict]) -> tuple[list[dict], list[dict]]:
+        """校验一批数据项，返回 (通过的, 未通过的)"""
+        valid, rejected = [], []
+        for item in items:
+            (valid if self._validator.is_valid(item) else rejected).append(item)
+        return valid, rejected
+
+    def describe(self, item: dict) -> str:
+        """数据项未通过校验的原因"""
+        error = best_match(self._validator.iter_errors(item))
+        if error is None:
+            return ""
+        path = "/".join(str(p) for p in error.absolute_path)
+        return f"{path}: {error.message}" if path else error.message
+
+
+class ItemSchemaCache:
+    """按 (spider_id, schema 哈希) 缓存编译后的校验器
+
+    schema 变更后哈希不同会重新编译，其他进程无需通知；本进程更新爬虫时调用 invalidate 及时释放。
+    schema 无效时缓存 None（不校验），同一 schema 只记录一次告警。
+    """
+
+    def __init__(self, max_size: int = _CACHE_SIZE):
+        self.max_size = max_size
+        self._cache: OrderedDict[str, tuple[str, ItemValidator | None]] = OrderedDict()
+
+    def get(self, spider: Spider | None) -> ItemValidator | None:
+        if not spider or not spider.item_schema:
+            return None
+        spider_id = str(spider.id)
+        digest = hashlib.md5(spider.item_schema.encode()).hexdigest()
+        cached = self._cache.get(spider_id)
+        if cached and cached[0] == digest:
+            self._cache.move_to_end(spider_id)
+            return cached[1]
+
+        try:
+            validator = ItemValidator(json.loads(spider.item_schema))
+        except (ValueError, SchemaError) as e:
+            logger.warning(f"Invalid item_schema for spider {spider_id}: {e}")
+            validator = None
+        self._cache[spider_id] = (digest, validator)
+        self._cache.move_to_end(spider_id)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+        return validator
+
+    def invalidate(self, spider_id: str) -> None:
+        self._cache.pop(str(spider_id), None)
+
+
+def _rejected_key(task_id: str) -> str:
+    return f"{REJECTED_PREFIX}:{task_id}"
+
+
+def record_rejected(task_id: str, samples: list[dict]) -> None:
+    """保存任务最近的校验失败样本（{"error", "item"}）"""
+    if not samples:
+        return
+    key = _rejected_key(task_id)
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.lpush(key, *(json.dumps(s, ensure_ascii=False, default=str) for s in samples))
+        pipe.ltrim(key, 0, REJECTED_SAMPLE_SIZE - 1)
+        pipe.expire(key, REJECTED_TTL)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to record rejected items for task {task_id}: {e}")
+
+
+def get_rejected(task_id: str) -> list[dict]:
+    """任务最近的校验失败样本，新的在前"""
+    try:
+        return [json.loads(s) for s in redis_client.lrange(_rejected_key(task_id), 0, -1)]
+    except Exception as e:
+        logger.warning(f"Failed to read rejected items for task {task_id}: {e}")
+        return []
+
+
+item_schemas = ItemSchemaCache()
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from extensions.ext_mongodb import mongodb_client
+from models.crawlhub import DataSource, DataSourceStatus, SpiderDataSource
+from services.crawlhub.datasource_writer import get_writer
+from services.crawlhub.task_telemetry import task_telemetry
+
+logger = logging.getLogger(__name__)
+
+_DUPLICATE_KEY = 11000
+
+
+class ItemSink:
+    """爬虫数据项写入
+
+    有启用的外部数据源时扇出写入外部数据源，否则写入默认 MongoDB spider_data；
+    每批写入后在 Redis 实时数据中累加任务的 total_count / success_count，由 TaskTelemetry
+    定期写回数据库；Redis 不可用时直接在数据库中原子累加。
+    SDK 上报接口和 Runner 的 stdout/文件采集共用同一写入路径。
+    同一实例可被多个采集协程共享，数据库操作串行执行。
+    """
+
+    def __init__(
+        self,
+        db: AsyncSession,
+        task_id: str,
+        spider_id: str,
+        is_test: bool = False,
+        targets: list[tuple[SpiderDataSource, DataSource]] | None = None,
+    ):
+        self.db = db
+        self.task_id = str(task_id)
+        self.spider_id = str(spider_id)
+        self.is_test = is_test
+        self.written = 0
+        # 调用方已加载的外部数据源（如 RunContext 缓存），为 None 时首次写入前查询
+        self._targets = targets
+        self._lock = asyncio.Lock()
+
+    async def _load_targets(self) -> list[tuple[SpiderDataSource, DataSource]]:
+        if self._targets is None:
+            result = await self.db.execute(
+                select(SpiderDataSource, DataSource)
+                .join(DataSource, SpiderDataSource.datasource_id == DataSource.id)
+                .where(
+                    SpiderDataSource.spider_id == self.spider_id,
+                    SpiderDataSource.is_enabled.is_(True),
+                    DataSource.status == DataSourceStatus.ACTIVE,
+                )
+            )
+            self._targets = list(result.all())
+        return self._targets
+
+    async def has_datasources(self) -> bool:
+        """是否配置了活跃的外部数据源"""
+        return bool(await self._load_targets())
+
+    async def is_writable(self) -> bool:
+        """是否存在可写入的目标"""
+        return await self.has_datasources() or mongodb_client.is_enabled()
+
+    async def write(self, items: list[dict]) -> int:
+        """写入一批数据项并累加任务计数，返回写入条数（不含被去重索引拦截的重复项）"""
+        if not items:
+            return 0
+
+        async with self._lock:
+            targets = await self._load_targets()
+            if targets:
+                # 去重哈希只写入默认 MongoDB，不写入外部数据源
+                await self._fanout(targets, [
+                    {k: v for k, v in item.items() if k != "_dedup_hash"} for item in items
+                ])
+                count = len(items)
+            else:
+                if not mongodb_client.is_enabled():
+                    raise RuntimeError("MongoDB 未启用且未配置外部数据源")
+                count = await self._insert_mongo(items)
+
+            if not task_telemetry.add_counts(self.task_id, success=count):
+                await self.db.execute(
+                    text(
+                        "UPDATE crawlhub_tasks SET total_count = total_count + :n, "
+                        "success_count = success_count + :n WHERE id = :task_id"
+                    ),
+                    {"n": count, "task_id": self.task_id},
+                )
+                await self.db.commit()
+        self.written += count
+        return count
+
+    async def add_failed(self, count: int) -> None:
+        """累加任务的失败条数"""
+        if not count:
+            return
+        if task_telemetry.add_counts(self.task_id, failed=count):
+            return
+        async with self._lock:
+            await self.db.execute(
+                text("UPDATE crawlhub_tasks SET failed_count = failed_count + :n WHERE id = :task_id"),
+                {"n": count, "task_id": self.task_id},
+            )
+            await self.db.commit()
+
+    async def task_total_count(self) -> int:
+        """任务当前的 total_count（包含 SDK 通过 API 上报的部分）"""
+        live = task_telemetry.get(self.task_id)
+        if live and "total_count" in live:
+            return live["total_count"]
+        async with self._lock:
+            result = await self.db.execute(
+                text("SELECT total_count FROM crawlhub_tasks WHERE id = :task_id"),
+                {"task_id": self.task_id},
+            )
+            return result.scalar() or 0
+
+    async def _insert_mongo(self, items: list[dict]) -> int:
+        collection = mongodb_client.get_collection("spider_data")
+        now = datetime.utcnow()
+        docs = []
+        for item in items:
+            dedup_hash = item.pop("_dedup_hash", None)
+            doc = {
+                "task_id": self.task_id,
+                "spider_id": self.spider_id,
+                "data": item,
+                "is_test": self.is_test,
+                "created_at": now,
+            }
+            if dedup_hash:
+                doc["dedup_hash"] = dedup_hash
+            docs.append(doc)
+        # 无序写入：并发批次之间的重复数据被 (spider_id, dedup_hash) 唯一索引拦截，其余照常写入
+        try:
+            result = await collection.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            if any(error.get("code") != _DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+                raise
+            return e.details.get("nInserted", 0)
+        return len(result.inserted_ids)
+
+    async def _fanout(
+        self, targets: list[tuple[SpiderDataSource, DataSource]], items: list[dict]
+    ) -> None:
+        """将数据扇出写入关联的外部数据源"""
+        semaphore = asyncio.Semaphore(5)
+
+        async def _write_to_ds(assoc: SpiderDataSource, datasource: DataSource):
+            async with semaphore:
+                try:
+                    writer = get_writer(datasource)
+                    await writer.write_items(
+                        items, self.task_id, self.spider_id, assoc.target_table
+                    )
+                except Exception as e:
+                    logger.error(
+                        f"Failed to write to datasource {datasource.name} "
+                        f"(table={assoc.target_table}): {e}"
+                    )
+
+        await asyncio.gather(*[_write_to_ds(assoc, ds) for assoc, ds in targets])
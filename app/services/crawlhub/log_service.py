@@ -1,6 +1,12 @@
+import asyncio
+import contextlib
 import logging
+import os
+import zlib
 from datetime import datetime
 
+from pymongo.errors import DuplicateKeyError
+
 from extensions.ext_mongodb import mongodb_client
 
 logger = logging.getLogger(__name__)
@@ -8,6 +14,18 @@ logger = logging.getLogger(__name__)
 SPIDER_LOGS_COLLECTION = "spider_logs"
 SPIDER_LOG_TTL_DAYS = 90
 
+# 分块日志：运行期间按块追加写入，每块 zlib 压缩，按 (task_id, seq) 索引
+SPIDER_LOG_CHUNKS_COLLECTION = "spider_log_chunks"
+LOG_CHUNK_BYTES = int(os.getenv("CRAWLHUB_LOG_CHUNK_BYTES", str(256 * 1024)))
+LOG_CHUNK_FLUSH_INTERVAL = float(os.getenv("CRAWLHUB_LOG_CHUNK_FLUSH_INTERVAL", "2"))
+LOG_CHUNK_TTL_DAYS = int(os.getenv("CRAWLHUB_LOG_CHUNK_TTL_DAYS", str(SPIDER_LOG_TTL_DAYS)))
+LOG_STREAMS = ("stdout", "stderr")
+# 分块写入失败时的重试次数与退避基数（秒）
+_EMIT_ATTEMPTS = 3
+_EMIT_RETRY_DELAY = 0.5
+# 单次范围读取的上限
+LOG_READ_MAX_BYTES = 4 * 1024 * 1024
+
 
 class LogService:
     """爬虫任务日志服务"""
@@ -40,6 +58,19 @@ class LogService:
                 "created_at",
                 expire_seconds=SPIDER_LOG_TTL_DAYS * 24 * 60 * 60,
             )
+            await mongodb_client.ensure_indexes(
+                SPIDER_LOG_CHUNKS_COLLECTION,
+                [
+                    {"keys": [("task_id", 1), ("seq", 1)], "unique": True},
+                    {"keys": [("task_id", 1), ("stream", 1), ("offset", 1)]},
+                ],
+            )
+            # 过期按块删除，无需逐条清理
+            await mongodb_client.create_ttl_index(
+                SPIDER_LOG_CHUNKS_COLLECTION,
+                "created_at",
+                expire_seconds=LOG_CHUNK_TTL_DAYS * 24 * 60 * 60,
+            )
             LogService._indexes_created = True
         except Exception as e:
             logger.warning(f"Failed to create spider_logs indexes: {e}")
@@ -112,3 +143,213 @@ class LogService:
         except Exception as e:
             logger.error(f"Failed to get logs for spider {spider_id}: {e}")
             return [], 0
+
+    @property
+    def chunks(self):
+        return mongodb_client.get_collection(SPIDER_LOG_CHUNKS_COLLECTION)
+
+    async def has_chunks(self, task_id: str) -> bool:
+        if not mongodb_client.is_enabled():
+            return False
+        return await self.chunks.find_one({"task_id": task_id}, {"_id": 1}) is not None
+
+    async def stream_size(self, task_id: str, stream: str) -> int:
+        """日志流当前的总字节数（即下一次追加的偏移）"""
+        doc = await self.chunks.find_one(
+            {"task_id": task_id, "stream": stream},
+            {"offset": 1, "length": 1},
+            sort=[("seq", -1)],
+        )
+        return doc["offset"] + doc["length"] if doc else 0
+
+    async def read_range(
+        self,
+        task_id: str,
+        stream: str = "stdout",
+        offset: int = 0,
+        limit: int = LOG_READ_MAX_BYTES,
+    ) -> dict:
+        """按字节偏移读取日志，返回内容和下一次读取的偏移"""
+        if not mongodb_client.is_enabled():
+            return {"stream": stream, "offset": offset, "next_offset": offset, "content": ""}
+        limit = min(max(limit, 1), LOG_READ_MAX_BYTES)
+        offset = max(offset, 0)
+
+        # 从包含 offset 的块开始
+        first = await self.chunks.find_one(
+            {"task_id": task_id, "stream": stream, "offset": {"$lte": offset}},
+            {"offset": 1},
+            sort=[("offset", -1)],
+        )
+        start = first["offset"] if first else offset
+        cursor = self.chunks.find(
+            {"task_id": task_id, "stream": stream, "offset": {"$gte": start, "$lt": offset + limit}}
+        ).sort("offset", 1)
+
+        parts = []
+        async for doc in cursor:
+            data = zlib.decompress(doc["data"])
+            lo = max(offset - doc["offset"], 0)
+            parts.append(data[lo:offset + limit - doc["offset"]])
+        data = b"".join(parts)
+        return {
+            "stream": stream,
+            "offset": offset,
+            "next_offset": offset + len(data),
+            "content": data.decode("utf-8", errors="replace"),
+        }
+
+    async def read_tail(self, task_id: str, stream: str = "stdout", lines: int = 200) -> dict:
+        """读取日志最后若干行，从最后一块往前读直到行数足够"""
+        if not mongodb_client.is_enabled():
+            return {"stream": stream, "offset": 0, "next_offset": 0, "content": ""}
+        cursor = self.chunks.find({"task_id": task_id, "stream": stream}).sort("seq", -1)
+
+        parts: list[bytes] = []
+        newlines = 0
+        end = None
+        read_bytes = 0
+        async for doc in cursor:
+            data = zlib.decompress(doc["data"])
+            if end is None:
+                end = doc["offset"] + len(data)
+            parts.append(data)
+            newlines += data.count(b"\n")
+            read_bytes += len(data)
+            if newlines > lines or read_bytes >= LOG_READ_MAX_BYTES:
+                break
+
+        if end is None:
+            return {"stream": stream, "offset": 0, "next_offset": 0, "content": ""}
+
+        data = b"".join(reversed(parts))
+        kept = data.rstrip(b"\n").split(b"\n")[-lines:] if lines > 0 else []
+        content = b"\n".join(kept)
+        if data.endswith(b"\n") and content:
+            content += b"\n"
+        return {
+            "stream": stream,
+            "offset": end - len(content),
+            "next_offset": end,
+            "content": content.decode("utf-8", errors="replace"),
+        }
+
+
+class LogChunkWriter:
+    """任务日志分块写入器
+
+    stdout/stderr 原始字节先进入各自的缓冲区，满一块（按行边界切分）或每隔
+    flush_interval 秒追加为一个压缩块，内存占用与日志总量无关。
+    同一任务重试时从已有的最后一块之后继续追加。
+    """
+
+    def __init__(
+        self,
+        task_id: str,
+        spider_id: str,
+        chunk_bytes: int = LOG_CHUNK_BYTES,
+        flush_interval: float = LOG_CHUNK_FLUSH_INTERVAL,
+    ):
+        self.task_id = task_id
+        self.spider_id = spider_id
+        self.chunk_bytes = chunk_bytes
+        self.flush_interval = flush_interval
+        self.enabled = mongodb_client.is_enabled()
+        self._buffers: dict[str, bytearray] = {s: bytearray() for s in LOG_STREAMS}
+        self._offsets: dict[str, int] = {s: 0 for s in LOG_STREAMS}
+        self._seq = 0
+        self._lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+
+    async def __aenter__(self) -> "LogChunkWriter":
+        if not self.enabled:
+            return self
+        service = LogService()
+        await service.ensure_indexes()
+        try:
+            last = await service.chunks.find_one({"task_id": self.task_id}, {"seq": 1}, sort=[("seq", -1)])
+            if last:
+                self._seq = last["seq"] + 1
+                for stream in LOG_STREAMS:
+                    self._offsets[stream] = await service.stream_size(self.task_id, stream)
+        except Exception as e:
+            logger.warning(f"Log chunk store unavailable for task {self.task_id}: {e}")
+            self.enabled = False
+            return self
+        self._flusher = asyncio.create_task(self._flush_periodically())
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        if self._flusher:
+            self._flusher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._flusher
+        await self.flush(final=True)
+
+    async def write(self, stream: str, data: bytes) -> None:
+        if not self.enabled or not data:
+            return
+        buffer = self._buffers[stream]
+        buffer += data
+        while len(buffer) >= self.chunk_bytes:
+            await self._emit(stream, self._cut(buffer, self.chunk_bytes))
+
+    async def flush(self, final: bool = False) -> None:
+        """写出缓冲区中的完整行（final 时包括不完整的最后一行）"""
+        if not self.enabled:
+            return
+        for stream, buffer in self._buffers.items():
+            if not buffer:
+                continue
+            end = len(buffer) if final else buffer.rfind(b"\n") + 1
+            if end > 0:
+                await self._emit(stream, self._cut(buffer, end))
+
+    @staticmethod
+    def _cut(buffer: bytearray, limit: int) -> bytes:
+        # 尽量在行边界处切块，超长行按块大小硬切
+        end = buffer.rfind(b"\n", 0, limit) + 1 if len(buffer) > limit else limit
+        end = end or limit
+        data = bytes(buffer[:end])
+        del buffer[:end]
+        return data
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Failed to flush log chunks for task {self.task_id}: {e}")
+
+    async def _emit(self, stream: str, data: bytes) -> None:
+        """追加一个压缩块；偏移和序号只在写入成功后前进，避免后续块的偏移整体错位"""
+        async with self._lock:
+            doc = {
+                "task_id": self.task_id,
+                "spider_id": self.spider_id,
+                "stream": stream,
+                "seq": self._seq,
+                "offset": self._offsets[stream],
+                "length": len(data),
+                "data": zlib.compress(data),
+                "created_at": datetime.utcnow(),
+            }
+            for attempt in range(1, _EMIT_ATTEMPTS + 1):
+                try:
+                    await LogService().chunks.insert_one(doc)
+                    break
+                except DuplicateKeyError:
+                    # 上一次尝试实际已写入（如响应超时）
+                    break
+                except Exception as e:
+                    if attempt == _EMIT_ATTEMPTS:
+                        logger.error(
+                            f"Dropped {len(data)} bytes of {stream} log "
+                            f"for task {self.task_id}: {e}"
+                        )
+                        return
+                    logger.warning(f"Failed to append log chunk for task {self.task_id}: {e}")
+                    await asyncio.sleep(_EMIT_RETRY_DELAY * attempt)
+            self._seq += 1
+            self._offsets[stream] += len(data)
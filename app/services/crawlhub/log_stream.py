@@ -0,0 +1,379 @@
+import asyncio
+import collections
+import json
+import logging
+import os
+import time
+from collections.abc import Coroutine
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import select
+
+from models.crawlhub import SpiderTask, SpiderTaskStatus
+from models.engine import AsyncSessionLocal
+from services.crawlhub.log_service import LOG_STREAMS, LogChunkWriter, LogService
+
+logger = logging.getLogger(__name__)
+
+# 环形缓冲区保留的最近输出，超出部分从分块日志补读
+TEST_RUN_BUFFER_BYTES = int(os.getenv("CRAWLHUB_TEST_RUN_BUFFER_BYTES", str(1024 * 1024)))
+# SSE 批量发送间隔（秒）
+TEST_RUN_BATCH_INTERVAL = float(os.getenv("CRAWLHUB_TEST_RUN_BATCH_INTERVAL", "0.2"))
+# 所有客户端断开超过该时间后终止测试运行
+TEST_RUN_DETACH_GRACE = float(os.getenv("CRAWLHUB_TEST_RUN_DETACH_GRACE", "60"))
+# 单行最大长度，超出部分按多行发送
+TEST_RUN_MAX_LINE_BYTES = 64 * 1024
+# stdout 转发给采集器时最多缓冲的字节数，超出后暂停读取管道
+TEST_RUN_TEE_BUFFER_BYTES = int(
+    os.getenv("CRAWLHUB_TEST_RUN_TEE_BUFFER_BYTES", str(1024 * 1024))
+)
+_READ_SIZE = 65536
+# 运行结束后保留多久以便断线重连
+_RETAIN_SECONDS = 60
+
+_TERMINAL_STATUSES = {SpiderTaskStatus.COMPLETED, SpiderTaskStatus.FAILED, SpiderTaskStatus.CANCELLED}
+
+
+@dataclass
+class _Entry:
+    seq: int
+    stream: str | None  # None 表示状态等控制事件
+    start: int = 0
+    raw: bytes = b""
+    event: str | None = None
+    data: dict | None = None
+
+
+def parse_event_id(event_id: str | None) -> tuple[dict[str, int], int]:
+    """解析 "stdout偏移:stderr偏移[:seq]" 格式的事件 id"""
+    offsets = {stream: 0 for stream in LOG_STREAMS}
+    seq = -1
+    if event_id:
+        parts = event_id.split(":")
+        try:
+            offsets = {"stdout": int(parts[0]), "stderr": int(parts[1])}
+            if len(parts) > 2:
+                seq = int(parts[2])
+        except (IndexError, ValueError):
+            pass
+    return offsets, seq
+
+
+def _lines(raw: bytes) -> list[str]:
+    return raw.decode("utf-8", errors="replace").rstrip("\r\n").split("\n")
+
+
+class TeePipe:
+    """pump 转发 stdout 给采集器的有界管道（单写单读）
+
+    缓冲区满时 write() 等待读取方消费：入库变慢会暂停读取爬虫的 stdout 管道，
+    由管道把反压传给爬虫，而不是在内存中堆积输出。读取方退出后调用 close()，之后的写入直接丢弃。
+    """
+
+    def __init__(self, max_bytes: int = TEST_RUN_TEE_BUFFER_BYTES):
+        self.max_bytes = max_bytes
+        self._buffer = bytearray()
+        self._eof = False
+        self._closed = False
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+    async def write(self, data: bytes) -> None:
+        while len(self._buffer) >= self.max_bytes and not self._closed:
+            self._writable.clear()
+            await self._writable.wait()
+        if self._closed:
+            return
+        self._buffer += data
+        self._readable.set()
+
+    def feed_eof(self) -> None:
+        self._eof = True
+        self._readable.set()
+
+    def close(self) -> None:
+        self._closed = True
+        self._buffer.clear()
+        self._writable.set()
+
+    async def read(self, n: int = -1) -> bytes:
+        """与 StreamReader.read 一致：n < 0 时读到 EOF，否则最多读 n 字节，EOF 后返回空字节串"""
+        if n < 0:
+            parts = []
+            while chunk := await self.read(_READ_SIZE):
+                parts.append(chunk)
+            return b"".join(parts)
+        while not self._buffer and not self._eof:
+            self._readable.clear()
+            await self._readable.wait()
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        if len(self._buffer) < self.max_bytes:
+            self._writable.set()
+        return data
+
+
+class TestRunStream:
+    """测试运行的实时输出流
+
+    stdout/stderr 并发读取，逐行写入按字节数限长的环形缓冲区，订阅者按批次收到事件。
+    事件 id 记录两个流的字节偏移，与分块日志一致：重连时缓冲区已淘汰的部分从分块日志补读。
+    """
+
+    def __init__(
+        self,
+        task_id: str,
+        log_writer: LogChunkWriter | None = None,
+        buffer_bytes: int = TEST_RUN_BUFFER_BYTES,
+        batch_interval: float = TEST_RUN_BATCH_INTERVAL,
+    ):
+        self.task_id = task_id
+        self.log_writer = log_writer
+        self.buffer_bytes = buffer_bytes
+        self.batch_interval = batch_interval
+        self.offsets = {stream: 0 for stream in LOG_STREAMS}
+        self.closed = False
+        self.subscribers = 0
+        self._ring: collections.deque[_Entry] = collections.deque()
+        self._ring_bytes = 0
+        self._seq = 0
+        self._changed = asyncio.Event()
+        self._detached_since: float | None = time.monotonic()
+
+    # ─── 生产者 ───
+
+    def _append(self, entry: _Entry) -> None:
+        self._ring.append(entry)
+        self._ring_bytes += len(entry.raw)
+        while self._ring_bytes > self.buffer_bytes and len(self._ring) > 1:
+            self._ring_bytes -= len(self._ring.popleft().raw)
+        self._changed.set()
+
+    def publish_event(self, event: str, data: dict) -> None:
+        self._append(_Entry(seq=self._next_seq(), stream=None, event=event, data=data))
+
+    def publish_line(self, stream: str, raw: bytes) -> None:
+        start = self.offsets[stream]
+        self.offsets[stream] += len(raw)
+        self._append(_Entry(seq=self._next_seq(), stream=stream, start=start, raw=raw))
+
+    def _next_seq(self) -> int:
+        self._seq += 1
+        return self._seq
+
+    def close(self) -> None:
+        self.closed = True
+        self._changed.set()
+
+    async def pump(
+        self,
+        stream: str,
+        reader: asyncio.StreamReader,
+        tee: TeePipe | None = None,
+        tail_bytes: int = 0,
+    ) -> bytes:
+        """读取管道直到 EOF：写入分块日志、按行发布，可选转发给 tee，返回末尾 tail_bytes 字节
+
+        tee 缓冲区满时暂停读取，由管道反压给爬虫。
+        """
+        pending = bytearray()
+        tail = bytearray()
+        try:
+            while True:
+                chunk = await reader.read(_READ_SIZE)
+                if not chunk:
+                    break
+                if self.log_writer:
+                    await self.log_writer.write(stream, chunk)
+                if tee is not None:
+                    await tee.write(chunk)
+                if tail_bytes:
+                    tail += chunk
+                    if len(tail) > tail_bytes:
+                        del tail[:len(tail) - tail_bytes]
+
+                pending += chunk
+                while True:
+                    end = pending.find(b"\n") + 1
+                    if not end:
+                        if len(pending) < TEST_RUN_MAX_LINE_BYTES:
+                            break
+                        end = TEST_RUN_MAX_LINE_BYTES
+                    self.publish_line(stream, bytes(pending[:end]))
+                    del pending[:end]
+            if pending:
+                self.publish_line(stream, bytes(pending))
+        finally:
+            if tee is not None:
+                tee.feed_eof()
+        return bytes(tail)
+
+    async def wait_detached(self, grace: float = TEST_RUN_DETACH_GRACE) -> None:
+        """所有订阅者断开超过 grace 秒后返回"""
+        while True:
+            if self._detached_since is not None:
+                remaining = self._detached_since + grace - time.monotonic()
+                if remaining <= 0:
+                    return
+                await asyncio.sleep(min(remaining, 1))
+            else:
+                await asyncio.sleep(1)
+
+    # ─── 订阅者 ───
+
+    async def events(self, last_event_id: str | None = None):
+        """按批次产出 SSE 事件，从 last_event_id 之后继续"""
+        pos, last_seq = parse_event_id(last_event_id)
+        self.subscribers += 1
+        self._detached_since = None
+        try:
+            while True:
+                async for event in self._fill_gaps(pos):
+                    yield event
+
+                entries = [e for e in self._ring if e.seq > last_seq]
+                if entries:
+                    last_seq = entries[-1].seq
+                    for event in self._batch(entries, pos):
+                        yield event
+                elif self.closed:
+                    return
+                else:
+                    self._changed.clear()
+                    await self._changed.wait()
+                await asyncio.sleep(self.batch_interval)
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers:
+                self._detached_since = time.monotonic()
+
+    def _event_id(self, pos: dict[str, int], seq: int) -> str:
+        return f"{pos['stdout']}:{pos['stderr']}:{seq}"
+
+    def _batch(self, entries: list[_Entry], pos: dict[str, int]):
+        """连续的同一流输出合并为一个事件"""
+        lines: list[str] = []
+        current = None
+        seq = -1
+
+        def flush():
+            return {
+                "event": current,
+                "id": self._event_id(pos, seq),
+                "data": {"lines": lines, "timestamp": datetime.utcnow().isoformat()},
+            }
+
+        for entry in entries:
+            if entry.stream is None:
+                if lines:
+                    yield flush()
+                    lines, current = [], None
+                yield {"event": entry.event, "id": self._event_id(pos, entry.seq), "data": entry.data}
+                continue
+            if entry.start < pos[entry.stream]:
+                continue  # 已从分块日志补读过
+            if current is not None and entry.stream != current:
+                yield flush()
+                lines = []
+            current = entry.stream
+            seq = entry.seq
+            lines.extend(_lines(entry.raw))
+            pos[entry.stream] = entry.start + len(entry.raw)
+        if lines:
+            yield flush()
+
+    async def _fill_gaps(self, pos: dict[str, int]):
+        """补读已被环形缓冲区淘汰、订阅者尚未收到的输出"""
+        for stream in LOG_STREAMS:
+            while True:
+                ring_start = next(
+                    (e.start for e in self._ring if e.stream == stream), self.offsets[stream]
+                )
+                if pos[stream] >= ring_start:
+                    break
+                if self.log_writer:
+                    await self.log_writer.flush()
+                data = await LogService().read_range(
+                    self.task_id, stream, offset=pos[stream], limit=ring_start - pos[stream]
+                )
+                if not data["content"]:
+                    # 分块日志不可用，跳过缺口
+                    pos[stream] = ring_start
+                    break
+                pos[stream] = data["next_offset"]
+                yield {
+                    "event": stream,
+                    "id": self._event_id(pos, -1),
+                    "data": {"lines": data["content"].rstrip("\n").split("\n"), "replayed": True},
+                }
+
+
+def format_sse(event: dict) -> str:
+    message = f"event: {event['event']}\n"
+    if event.get("id"):
+        message += f"id: {event['id']}\n"
+    return message + f"data: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+
+
+# 当前进程中的测试运行（task_id -> stream）
+test_run_streams: dict[str, TestRunStream] = {}
+_running: set[asyncio.Task] = set()
+
+
+def start_test_run(stream: TestRunStream, run: Coroutine) -> None:
+    """在后台执行测试运行，与发起请求的连接解耦，客户端可断线重连"""
+    test_run_streams[stream.task_id] = stream
+
+    async def _run() -> None:
+        try:
+            await run
+        except Exception as e:
+            logger.exception(f"Test run {stream.task_id} failed: {e}")
+            stream.publish_event("error", {"message": str(e)})
+        finally:
+            stream.close()
+            # 结束后保留一段时间供断线重连
+            asyncio.get_running_loop().call_later(
+                _RETAIN_SECONDS, lambda: test_run_streams.pop(stream.task_id, None)
+            )
+
+    task = asyncio.create_task(_run())
+    _running.add(task)
+    task.add_done_callback(_running.discard)
+
+
+async def follow_task_log(task_id: str, last_event_id: str | None = None):
+    """从分块日志跟随任务输出（不在当前进程运行的任务）"""
+    pos, _ = parse_event_id(last_event_id)
+    log_service = LogService()
+    while True:
+        # 先读取状态再读日志，确保结束前写入的最后一块不会漏掉
+        async with AsyncSessionLocal() as session:
+            status = await session.scalar(
+                select(SpiderTask.status).where(SpiderTask.id == task_id)
+            )
+
+        sent = False
+        for stream in LOG_STREAMS:
+            data = await log_service.read_range(task_id, stream, offset=pos[stream])
+            if data["content"]:
+                pos[stream] = data["next_offset"]
+                sent = True
+                yield {
+                    "event": stream,
+                    "id": f"{pos['stdout']}:{pos['stderr']}",
+                    "data": {"lines": data["content"].rstrip("\n").split("\n"), "offset": data["offset"]},
+                }
+
+        if status is None or status in _TERMINAL_STATUSES:
+            if not sent:
+                yield {"event": "status", "data": {"status": status.value if status else None}}
+                return
+            continue
+        await asyncio.sleep(1)
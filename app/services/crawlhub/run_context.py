@@ -0,0 +1,286 @@
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.inspection import inspect as sa_inspect
+
+from extensions.ext_redis import redis_client
+from models.crawlhub import (
+    DataSource,
+    DataSourceStatus,
+    Spider,
+    SpiderDataSource,
+    SpiderTask,
+    SpiderTaskStatus,
+)
+
+logger = logging.getLogger(__name__)
+
+RUN_CONTEXT_PREFIX = "crawlhub:run_context"
+# Redis 中的缓存时长（秒），变更时主动删除，过期只是兜底
+RUN_CONTEXT_TTL = int(os.getenv("CRAWLHUB_RUN_CONTEXT_TTL", "30"))
+# 进程内缓存时长（秒），其他进程的变更最多延迟这么久生效
+RUN_CONTEXT_LOCAL_TTL = float(os.getenv("CRAWLHUB_RUN_CONTEXT_LOCAL_TTL", "5"))
+_LOCAL_MAX_SIZE = 1024
+
+# 写入路径用到的爬虫字段，不缓存脚本内容等大字段
+_SPIDER_FIELDS = ("id", "project_id", "name", "item_schema", "dedup_enabled", "dedup_fields")
+_ASSOC_FIELDS = ("id", "spider_id", "datasource_id", "target_table", "is_enabled")
+
+
+def _columns(obj, fields: tuple[str, ...] | None = None) -> dict:
+    keys = fields or tuple(attr.key for attr in sa_inspect(obj).mapper.column_attrs)
+    return {
+        key: getattr(obj, key) for key in keys
+        if not isinstance(getattr(obj, key), datetime)
+    }
+
+
+@dataclass
+class RunContext:
+    """数据上报接口需要的任务运行上下文：任务状态、爬虫配置和启用的外部数据源"""
+
+    task_id: str
+    spider_id: str
+    status: SpiderTaskStatus
+    is_test: bool
+    started_at: datetime | None = None
+    spider: Spider | None = None
+    targets: list[tuple[SpiderDataSource, DataSource]] = field(default_factory=list)
+
+    def task_payload(self) -> dict:
+        return {
+            "task_id": self.task_id, "spider_id": self.spider_id,
+            "status": self.status.value, "is_test": self.is_test,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+        }
+
+    def spider_payload(self) -> dict:
+        # 只缓存数据源关联（含 datasource_id），连接信息和凭据不进入 Redis
+        return {
+            "spider": _columns(self.spider, _SPIDER_FIELDS) if self.spider else None,
+            "targets": [{"assoc": _columns(assoc, _ASSOC_FIELDS)} for assoc, _ in self.targets],
+        }
+
+    @classmethod
+    def from_payloads(
+        cls, task: dict, spider: dict, datasources: dict[str, DataSource] | None = None
+    ) -> "RunContext":
+        """由缓存内容还原；datasources 为按 ID 加载的活跃数据源，不在其中的关联被忽略"""
+        # 缓存中的对象都是新建的临时对象，不关联任何会话
+        datasources = datasources or {}
+        return cls(
+            task_id=task["task_id"],
+            spider_id=task["spider_id"],
+            status=SpiderTaskStatus(task["status"]),
+            is_test=task["is_test"],
+            started_at=(
+                datetime.fromisoformat(task["started_at"]) if task.get("started_at") else None
+            ),
+            spider=Spider(**spider["spider"]) if spider["spider"] else None,
+            targets=[
+                (SpiderDataSource(**target["assoc"]), ds)
+                for target in spider["targets"]
+                if (ds := datasources.get(str(target["assoc"]["datasource_id"])))
+            ],
+        )
+
+
+class RunContextCache:
+    """任务运行上下文的两级缓存（进程内 + Redis）
+
+    数据上报每批都要校验任务状态、读取爬虫的 Schema / 去重配置和外部数据源，
+    缓存命中时不访问数据库；未命中时一次 JOIN 查询全部加载。
+    任务状态和爬虫配置分两个 Redis 键缓存，取消任务、修改爬虫或数据源时分别删除。
+    数据源的连接信息（含密码）不写入 Redis，只按 ID 从数据库加载后缓存在进程内。
+    """
+
+    def __init__(self):
+        self._local: dict[str, tuple[float, RunContext]] = {}
+        self._datasources: dict[str, tuple[float, DataSource]] = {}
+
+    @staticmethod
+    def _task_key(task_id: str) -> str:
+        return f"{RUN_CONTEXT_PREFIX}:task:{task_id}"
+
+    @staticmethod
+    def _spider_key(spider_id: str) -> str:
+        return f"{RUN_CONTEXT_PREFIX}:spider:{spider_id}"
+
+    async def get(self, db: AsyncSession, task_id: str, spider_id: str) -> RunContext | None:
+        """读取任务运行上下文，任务不存在时返回 None；spider_id 为上报方声明的爬虫，用于一次读取两个缓存键"""
+        task_id = str(task_id)
+        now = time.monotonic()
+        cached = self._local.get(task_id)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        context = None
+        payloads = self._from_redis(task_id, str(spider_id))
+        if payloads is not None:
+            task, spider = payloads
+            context = RunContext.from_payloads(task, spider, await self._load_datasources(db, spider))
+        if context is None:
+            context = await self._load(db, task_id)
+            if context is None:
+                return None
+            self._to_redis(context)
+
+        self._remember(context, now)
+        return context
+
+    async def get_task(self, db: AsyncSession, task_id: str) -> RunContext | None:
+        """只校验任务状态时使用（心跳、进度上报）：只读任务缓存键，返回的上下文不含爬虫配置"""
+        task_id = str(task_id)
+        now = time.monotonic()
+        cached = self._local.get(task_id)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        try:
+            raw = redis_client.get(self._task_key(task_id))
+            if raw:
+                return RunContext.from_payloads(json.loads(raw), {"spider": None, "targets": []})
+        except Exception as e:
+            logger.warning(f"Failed to read run context for task {task_id}: {e}")
+
+        context = await self._load(db, task_id)
+        if context is None:
+            return None
+        self._to_redis(context)
+        self._remember(context, now)
+        return context
+
+    def _remember(self, context: RunContext, now: float) -> None:
+        if len(self._local) >= _LOCAL_MAX_SIZE:
+            self._local = {k: v for k, v in self._local.items() if v[0] > now}
+            if len(self._local) >= _LOCAL_MAX_SIZE:
+                self._local.clear()
+        self._local[context.task_id] = (now + RUN_CONTEXT_LOCAL_TTL, context)
+
+    def _from_redis(self, task_id: str, spider_id: str) -> tuple[dict, dict] | None:
+        try:
+            task_raw, spider_raw = redis_client.mget([self._task_key(task_id), self._spider_key(spider_id)])
+            if not task_raw or not spider_raw:
+                return None
+            task = json.loads(task_raw)
+            if task["spider_id"] != spider_id:
+                return None
+            return task, json.loads(spider_raw)
+        except Exception as e:
+            logger.warning(f"Failed to read run context for task {task_id}: {e}")
+            return None
+
+    async def _load_datasources(self, db: AsyncSession, spider: dict) -> dict[str, DataSource]:
+        """按 ID 读取关联的活跃数据源：先查进程内缓存，缺失的一次查询数据库"""
+        ids = {str(target["assoc"]["datasource_id"]) for target in spider["targets"]}
+        now = time.monotonic()
+        found = {}
+        for datasource_id in ids:
+            cached = self._datasources.get(datasource_id)
+            if cached and cached[0] > now:
+                found[datasource_id] = cached[1]
+        missing = ids - found.keys()
+        if missing:
+            result = await db.execute(
+                select(DataSource).where(
+                    DataSource.id.in_(missing), DataSource.status == DataSourceStatus.ACTIVE,
+                )
+            )
+            for ds in result.scalars().all():
+                found[str(ds.id)] = self._remember_datasource(ds, now)
+        return found
+
+    def _remember_datasource(self, ds: DataSource, now: float) -> DataSource:
+        if len(self._datasources) >= _LOCAL_MAX_SIZE:
+            self._datasources = {k: v for k, v in self._datasources.items() if v[0] > now}
+            if len(self._datasources) >= _LOCAL_MAX_SIZE:
+                self._datasources.clear()
+        detached = DataSource(**_columns(ds))
+        self._datasources[str(ds.id)] = (now + RUN_CONTEXT_LOCAL_TTL, detached)
+        return detached
+
+    def _to_redis(self, context: RunContext) -> None:
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.set(self._task_key(context.task_id), json.dumps(context.task_payload()), ex=RUN_CONTEXT_TTL)
+            pipe.set(
+                self._spider_key(context.spider_id),
+                json.dumps(context.spider_payload(), ensure_ascii=False, default=str),
+                ex=RUN_CONTEXT_TTL,
+            )
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to cache run context for task {context.task_id}: {e}")
+
+    async def _load(self, db: AsyncSession, task_id: str) -> RunContext | None:
+        result = await db.execute(
+            select(SpiderTask, Spider, SpiderDataSource, DataSource)
+            .outerjoin(Spider, Spider.id == SpiderTask.spider_id)
+            .outerjoin(SpiderDataSource, and_(
+                SpiderDataSource.spider_id == SpiderTask.spider_id,
+                SpiderDataSource.is_enabled.is_(True),
+            ))
+            .outerjoin(DataSource, and_(
+                DataSource.id == SpiderDataSource.datasource_id,
+                DataSource.status == DataSourceStatus.ACTIVE,
+            ))
+            .where(SpiderTask.id == task_id)
+        )
+        rows = result.all()
+        if not rows:
+            return None
+        task, spider = rows[0][0], rows[0][1]
+        context = RunContext(
+            task_id=str(task.id),
+            spider_id=str(task.spider_id),
+            status=task.status,
+            is_test=bool(task.is_test),
+            started_at=task.started_at,
+            spider=spider,
+            targets=[(assoc, ds) for _, _, assoc, ds in rows if assoc is not None and ds is not None],
+        )
+        # 经过与 Redis 缓存相同的序列化，缓存中不保留会话中的 ORM 对象
+        now = time.monotonic()
+        return RunContext.from_payloads(
+            context.task_payload(),
+            json.loads(json.dumps(context.spider_payload(), default=str)),
+            {str(ds.id): self._remember_datasource(ds, now) for _, ds in context.targets},
+        )
+
+    # ─── 失效 ───
+
+    def invalidate_task(self, task_id: str) -> None:
+        """任务状态变更（如取消）后调用"""
+        task_id = str(task_id)
+        self._local.pop(task_id, None)
+        self._delete(self._task_key(task_id))
+
+    def invalidate_spider(self, spider_id: str) -> None:
+        """爬虫配置或其数据源关联变更后调用"""
+        spider_id = str(spider_id)
+        self._local = {k: v for k, v in self._local.items() if v[1].spider_id != spider_id}
+        self._delete(self._spider_key(spider_id))
+
+    async def invalidate_datasource(self, db: AsyncSession, datasource_id: str) -> None:
+        """数据源变更后，使关联的所有爬虫失效"""
+        self._datasources.pop(str(datasource_id), None)
+        result = await db.execute(
+            select(SpiderDataSource.spider_id).where(SpiderDataSource.datasource_id == datasource_id)
+        )
+        for spider_id in set(result.scalars().all()):
+            self.invalidate_spider(spider_id)
+
+    def _delete(self, key: str) -> None:
+        try:
+            redis_client.delete(key)
+        except Exception as e:
+            logger.warning(f"Failed to invalidate run context {key}: {e}")
+
+
+run_contexts = RunContextCache()
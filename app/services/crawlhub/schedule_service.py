@@ -0,0 +1,124 @@
+import hashlib
+import logging
+from datetime import datetime, timedelta
+
+from croniter import croniter
+from sqlalchemy import select
+
+from models.crawlhub import Spider, SpiderTask, SpiderTaskStatus
+from services.base_service import BaseService
+
+logger = logging.getLogger(__name__)
+
+# 单次调度最多处理的到期爬虫数
+SCHEDULE_BATCH_SIZE = 500
+# 超过该时长未触发的调度视为错过（如调度器停机），只推进不补跑，避免恢复后集中触发
+MISFIRE_GRACE = timedelta(minutes=2)
+
+_ACTIVE_STATUSES = (SpiderTaskStatus.PENDING, SpiderTaskStatus.RUNNING)
+
+
+def next_cron_run(cron_expr: str | None, base: datetime | None = None) -> datetime | None:
+    """cron 表达式在 base 之后的下一次触发时间，表达式为空或无效时返回 None"""
+    if not cron_expr or not cron_expr.strip():
+        return None
+    try:
+        return croniter(cron_expr, base or datetime.utcnow()).get_next(datetime)
+    except (ValueError, KeyError) as e:
+        logger.warning(f"Invalid cron expression '{cron_expr}': {e}")
+        return None
+
+
+def schedule_offset(spider_id: str, jitter_seconds: int | None) -> int:
+    """错峰偏移：按爬虫 ID 在 [0, jitter_seconds] 内确定性取值，同一爬虫每次相同"""
+    if not jitter_seconds:
+        return 0
+    return int(hashlib.md5(str(spider_id).encode()).hexdigest(), 16) % (jitter_seconds + 1)
+
+
+def refresh_next_run(spider: Spider, base: datetime | None = None) -> None:
+    """cron、错峰窗口或启用状态变更后重新计算 next_run_at（停用的爬虫不进入调度索引）"""
+    next_run = next_cron_run(spider.cron_expr, base) if spider.is_active else None
+    if next_run:
+        next_run += timedelta(seconds=schedule_offset(spider.id, spider.schedule_jitter_seconds))
+    spider.next_run_at = next_run
+
+
+class ScheduleService(BaseService):
+    """基于 next_run_at 索引的定时调度
+
+    每次只取出到期的爬虫，触发后按 cron 推进 next_run_at，无需每分钟解析所有 cron 表达式。
+    """
+
+    async def init_missing(self, now: datetime) -> int:
+        """为配置了 cron 但尚未计算 next_run_at 的爬虫补齐调度时间"""
+        result = await self.db.execute(
+            select(Spider)
+            .where(
+                Spider.is_active == True,
+                Spider.next_run_at.is_(None),
+                Spider.cron_expr.isnot(None),
+                Spider.cron_expr != "",
+            )
+            .limit(SCHEDULE_BATCH_SIZE)
+        )
+        spiders = list(result.scalars().all())
+        for spider in spiders:
+            refresh_next_run(spider, now)
+        if spiders:
+            await self.db.commit()
+        return len(spiders)
+
+    async def pop_due(self, now: datetime) -> list[tuple[Spider, SpiderTask]]:
+        """取出到期的爬虫并推进下一次调度时间，为需要触发的爬虫创建待执行任务
+
+        有进行中任务的爬虫跳过本次触发；错过太久的调度只推进不触发。
+        任务与调度时间在同一事务中提交。
+        """
+        result = await self.db.execute(
+            select(Spider)
+            .where(Spider.is_active == True, Spider.next_run_at <= now)
+            .order_by(Spider.next_run_at)
+            .limit(SCHEDULE_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        spiders = list(result.scalars().all())
+        if not spiders:
+            return []
+
+        active = await self.active_spider_ids([s.id for s in spiders])
+        due = []
+        tasks = []
+        for spider in spiders:
+            if spider.id in active:
+                logger.debug(f"Spider {spider.id} already has active tasks, skipping")
+            elif spider.next_run_at < now - MISFIRE_GRACE:
+                logger.info(f"Spider {spider.id} missed schedule at {spider.next_run_at}, skipping")
+            else:
+                due.append(spider)
+                tasks.append(SpiderTask(
+                    spider_id=spider.id,
+                    status=SpiderTaskStatus.PENDING,
+                    is_test=False,
+                    trigger_type="schedule",
+                    scheduled_for=spider.next_run_at,
+                ))
+            refresh_next_run(spider, now)
+
+        self.db.add_all(tasks)
+        await self.db.commit()
+        return list(zip(due, tasks))
+
+    async def active_spider_ids(self, spider_ids: list[str]) -> set[str]:
+        """一次查询返回其中有待执行或运行中任务的爬虫"""
+        if not spider_ids:
+            return set()
+        result = await self.db.execute(
+            select(SpiderTask.spider_id)
+            .where(
+                SpiderTask.spider_id.in_(spider_ids),
+                SpiderTask.status.in_(_ACTIVE_STATUSES),
+            )
+            .distinct()
+        )
+        return {str(spider_id) for spider_id in result.scalars().all()}
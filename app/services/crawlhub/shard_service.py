@@ -0,0 +1,135 @@
+import logging
+import re
+from datetime import datetime
+
+from sqlalchemy import select
+
+from models.crawlhub import Spider, SpiderTask, SpiderTaskStatus
+from services.base_service import BaseService
+from services.crawlhub.run_context import run_contexts
+from services.crawlhub.task_telemetry import task_telemetry
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = {SpiderTaskStatus.COMPLETED, SpiderTaskStatus.FAILED, SpiderTaskStatus.CANCELLED}
+
+
+def partition_start_urls(start_url: str | None, shard_index: int, shard_count: int) -> list[str]:
+    """按行（或空白）拆分起始 URL，轮询分配给各分片"""
+    urls = [u for u in re.split(r"\s+", start_url or "") if u]
+    return urls[shard_index::shard_count]
+
+
+def _sum(values) -> int | float | None:
+    values = [v for v in values if v is not None]
+    return sum(values) if values else None
+
+
+def _max(values):
+    values = [v for v in values if v is not None]
+    return max(values) if values else None
+
+
+class ShardService(BaseService):
+    """分片运行：父任务拆分为多个子任务，子任务的进度与结果汇总回父任务"""
+
+    async def get_shards(self, parent_id: str) -> list[SpiderTask]:
+        result = await self.db.execute(
+            select(SpiderTask)
+            .where(SpiderTask.parent_task_id == parent_id)
+            .order_by(SpiderTask.shard_index)
+            .execution_options(populate_existing=True)
+        )
+        return list(result.scalars().all())
+
+    async def create_shards(self, spider: Spider, parent: SpiderTask) -> list[SpiderTask]:
+        """为父任务创建 shard_count 个子任务（已创建过则直接返回）"""
+        shards = await self.get_shards(parent.id)
+        if shards:
+            return shards
+
+        count = spider.shard_count
+        parent.shard_count = count
+        parent.status = SpiderTaskStatus.RUNNING
+        parent.started_at = datetime.utcnow()
+        if parent.scheduled_for and parent.dispatch_delay_seconds is None:
+            parent.dispatch_delay_seconds = max((parent.started_at - parent.scheduled_for).total_seconds(), 0)
+        shards = [
+            SpiderTask(
+                spider_id=spider.id,
+                status=SpiderTaskStatus.PENDING,
+                is_test=False,
+                trigger_type=parent.trigger_type,
+                parent_task_id=parent.id,
+                shard_index=i,
+                shard_count=count,
+                scheduled_for=parent.started_at,
+            )
+            for i in range(count)
+        ]
+        self.db.add_all(shards)
+        await self.db.commit()
+        return shards
+
+    async def rollup(self, parent_id: str) -> SpiderTask | None:
+        """汇总子任务的计数、进度、心跳与结果到父任务"""
+        # 行锁串行化并发完成的子任务，避免互相覆盖
+        result = await self.db.execute(
+            select(SpiderTask)
+            .where(SpiderTask.id == parent_id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )
+        parent = result.scalar_one_or_none()
+        if not parent:
+            return None
+
+        shards = await self.get_shards(parent_id)
+        if not shards:
+            await self.db.commit()
+            return parent
+
+        parent.total_count = _sum(s.total_count for s in shards) or 0
+        parent.success_count = _sum(s.success_count for s in shards) or 0
+        parent.failed_count = _sum(s.failed_count for s in shards) or 0
+        parent.progress = sum(
+            100 if s.status in TERMINAL_STATUSES else (s.progress or 0) for s in shards
+        ) // len(shards)
+        parent.last_heartbeat = _max(s.last_heartbeat for s in shards)
+        parent.items_per_second = _sum(
+            s.items_per_second for s in shards if s.status == SpiderTaskStatus.RUNNING
+        )
+        parent.peak_memory_mb = _max(s.peak_memory_mb for s in shards)
+        parent.cpu_seconds = _sum(s.cpu_seconds for s in shards)
+        parent.io_read_bytes = _sum(s.io_read_bytes for s in shards)
+        parent.io_write_bytes = _sum(s.io_write_bytes for s in shards)
+        parent.oom_killed = any(s.oom_killed for s in shards) or None
+
+        # 父任务被取消后保持取消状态
+        if parent.status != SpiderTaskStatus.CANCELLED:
+            if all(s.status in TERMINAL_STATUSES for s in shards):
+                failed = [s for s in shards if s.status == SpiderTaskStatus.FAILED]
+                if failed:
+                    parent.status = SpiderTaskStatus.FAILED
+                    parent.error_category = failed[0].error_category
+                    parent.error_message = (
+                        f"{len(failed)}/{len(shards)} 个分片失败"
+                        f"（分片 {failed[0].shard_index}: {failed[0].error_message or '未知错误'}）"
+                    )
+                elif all(s.status == SpiderTaskStatus.CANCELLED for s in shards):
+                    parent.status = SpiderTaskStatus.CANCELLED
+                else:
+                    parent.status = SpiderTaskStatus.COMPLETED
+                    parent.error_message = None
+                    parent.error_category = None
+                parent.finished_at = _max(s.finished_at for s in shards) or datetime.utcnow()
+            else:
+                # 失败的分片重试时父任务回到运行状态
+                parent.status = SpiderTaskStatus.RUNNING
+                parent.finished_at = None
+
+        await self.db.commit()
+        # 父任务没有自己的实时数据，汇总后直接推送给 SSE 订阅者
+        task_telemetry.publish_task(parent)
+        run_contexts.invalidate_task(parent.id)
+        return parent
@@ -9,6 +9,7 @@ from schemas.crawlhub.datasource import (
     SpiderDataSourceUpdate,
 )
 from services.base_service import BaseService
+from services.crawlhub.run_context import run_contexts
 
 logger = logging.getLogger(__name__)
 
@@ -52,6 +53,7 @@ class SpiderDataSourceService(BaseService):
         )
         self.db.add(assoc)
         await self.db.commit()
+        run_contexts.invalidate_spider(spider_id)
         await self.db.refresh(assoc)
         return assoc
 
@@ -68,6 +70,7 @@ class SpiderDataSourceService(BaseService):
             setattr(assoc, key, value)
 
         await self.db.commit()
+        run_contexts.invalidate_spider(assoc.spider_id)
         await self.db.refresh(assoc)
         return assoc
 
@@ -81,4 +84,5 @@ class SpiderDataSourceService(BaseService):
 
         await self.db.delete(assoc)
         await self.db.commit()
+        run_contexts.invalidate_spider(assoc.spider_id)
         return True
@@ -0,0 +1,165 @@
+import asyncio
+import contextlib
+import logging
+import os
+import threading
+from collections.abc import AsyncIterator
+
+from models.engine import set_task_runner
+
+logger = logging.getLogger(__name__)
+
+# process: 每个 Celery 任务 asyncio.run（prefork 默认行为）
+# async: 进程内一个常驻事件循环同时监管多个爬虫（需配合 --pool=threads）
+EXECUTOR_MODE = os.getenv("CRAWLHUB_EXECUTOR_MODE", "process")
+EXECUTOR_SLOTS = int(os.getenv("CRAWLHUB_EXECUTOR_SLOTS", "16"))
+# 所有运行中爬虫的内存预算，0 表示不限制
+EXECUTOR_MEMORY_MB = int(os.getenv("CRAWLHUB_EXECUTOR_MEMORY_MB", "0"))
+# 未设置 memory_limit_mb 的爬虫按此值占用预算
+EXECUTOR_DEFAULT_TASK_MB = int(os.getenv("CRAWLHUB_EXECUTOR_DEFAULT_TASK_MB", "512"))
+EXECUTOR_DRAIN_SECONDS = int(os.getenv("CRAWLHUB_EXECUTOR_DRAIN_SECONDS", "300"))
+
+
+class SpiderExecutor:
+    """Worker 进程内的常驻事件循环
+
+    Celery 线程池中的任务线程把协程提交到同一个事件循环并阻塞等待结果，
+    由该循环同时监管多个爬虫子进程；slot() 按并发槽位和内存预算做准入控制。
+    """
+
+    def __init__(
+        self,
+        slots: int = EXECUTOR_SLOTS,
+        memory_budget_mb: int = EXECUTOR_MEMORY_MB,
+        default_task_mb: int = EXECUTOR_DEFAULT_TASK_MB,
+    ):
+        self.slots = max(slots, 1)
+        self.memory_budget_mb = memory_budget_mb
+        self.default_task_mb = default_task_mb
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._cond: asyncio.Condition | None = None
+        self._active = 0
+        self._reserved_mb = 0
+        self._accepting = False
+        self._inflight: set[asyncio.Future] = set()
+        self._owner_pid: int | None = None
+
+    @property
+    def running(self) -> bool:
+        # fork 出的子进程不会继承事件循环线程
+        return self._owner_pid == os.getpid() and self.loop is not None and self.loop.is_running()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        ready = threading.Event()
+
+        def _run() -> None:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            self.loop = loop
+            self._cond = asyncio.Condition()
+            loop.call_soon(ready.set)
+            try:
+                loop.run_forever()
+            finally:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+                loop.close()
+
+        self._owner_pid = os.getpid()
+        self._thread = threading.Thread(target=_run, name="spider-executor", daemon=True)
+        self._thread.start()
+        ready.wait()
+        self._accepting = True
+        set_task_runner(self.run)
+        logger.info(
+            f"Spider executor started: slots={self.slots}, "
+            f"memory_budget={self.memory_budget_mb or 'unlimited'}MB"
+        )
+
+    def run(self, coro):
+        """在执行器事件循环中运行协程，阻塞当前线程直到完成"""
+        if not self._accepting:
+            coro.close()
+            raise RuntimeError("Spider executor is not accepting tasks")
+        future = asyncio.run_coroutine_threadsafe(self._track(coro), self.loop)
+        return future.result()
+
+    async def _track(self, coro):
+        task = asyncio.current_task()
+        self._inflight.add(task)
+        try:
+            return await coro
+        finally:
+            self._inflight.discard(task)
+
+    def _reservation(self, memory_limit_mb: int | None) -> int:
+        if not self.memory_budget_mb:
+            return 0
+        # 超过总预算的任务按总预算计，独占执行而不是永远等待
+        return min(memory_limit_mb or self.default_task_mb, self.memory_budget_mb)
+
+    def _admissible(self, need_mb: int) -> bool:
+        if self._active >= self.slots:
+            return False
+        return not self.memory_budget_mb or self._reserved_mb + need_mb <= self.memory_budget_mb
+
+    @contextlib.asynccontextmanager
+    async def slot(self, memory_limit_mb: int | None = None) -> AsyncIterator[None]:
+        """占用一个执行槽位（及内存预算），不在执行器循环中时不做限制"""
+        if self._cond is None or asyncio.get_running_loop() is not self.loop:
+            yield
+            return
+
+        need_mb = self._reservation(memory_limit_mb)
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._admissible(need_mb))
+            self._active += 1
+            self._reserved_mb += need_mb
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self._active -= 1
+                self._reserved_mb -= need_mb
+                self._cond.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "mode": EXECUTOR_MODE,
+            "slots": self.slots,
+            "active": self._active,
+            "reserved_mb": self._reserved_mb,
+            "memory_budget_mb": self.memory_budget_mb,
+            "inflight": len(self._inflight),
+        }
+
+    def shutdown(self, timeout: float = EXECUTOR_DRAIN_SECONDS) -> None:
+        """停止接收新任务，等待运行中的任务结束，超时后取消（Runner 会终止爬虫进程）"""
+        if not self.running:
+            return
+        # 排空期间的其他任务回退到各自的 asyncio.run
+        set_task_runner(None)
+        self._accepting = False
+
+        async def _drain() -> None:
+            pending = set(self._inflight)
+            if pending:
+                logger.info(f"Draining {len(pending)} running spider task(s)...")
+                _, pending = await asyncio.wait(pending, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning(f"Cancelled {len(pending)} spider task(s) after drain timeout")
+                await asyncio.wait(pending, timeout=30)
+
+        try:
+            asyncio.run_coroutine_threadsafe(_drain(), self.loop).result()
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            if self._thread:
+                self._thread.join(timeout=10)
+
+
+spider_executor = SpiderExecutor()
@@ -1,5 +1,6 @@
 # app/services/crawlhub/spider_runner_service.py
 import asyncio
+import contextlib
 import json
 import logging
 import os
@@ -7,14 +8,28 @@ import shutil
 import tempfile
 from datetime import datetime
 from pathlib import Path
-from typing import AsyncGenerator
 
 from models.crawlhub import ProjectSource, Spider, SpiderTask, SpiderTaskStatus
+from models.engine import TaskSessionLocal
 from services.base_service import BaseService
+from services.crawlhub.cgroup import TaskCgroup
+from services.crawlhub.file_ingest import FileOutputCollector, OutputTailer
+from services.crawlhub.item_sink import ItemSink
+from services.crawlhub.log_service import LogChunkWriter
+from services.crawlhub.log_stream import TeePipe, TestRunStream
+from services.crawlhub.run_context import run_contexts
+from services.crawlhub.shard_service import partition_start_urls
+from services.crawlhub.stdout_ingest import StdoutItemIngestor
+from services.crawlhub.task_signals import CancelWatcher
+from services.crawlhub.task_telemetry import COUNTER_FIELDS, task_telemetry
 
 logger = logging.getLogger(__name__)
 
 SDK_SOURCE_PATH = Path(__file__).parent.parent.parent / "libs" / "crawlhub_sdk" / "crawlhub.py"
+# 取消时 SIGTERM 后等待进程自行退出的时间，超时 SIGKILL
+CANCEL_GRACE_SECONDS = 5
+# 日志摘要中保留的 stderr 尾部大小（完整日志见分块日志）
+STDERR_TAIL_BYTES = 1024 * 1024
 
 
 class SpiderRunnerService(BaseService):
@@ -48,6 +63,7 @@ class SpiderRunnerService(BaseService):
             status=SpiderTaskStatus.PENDING,
             is_test=False,
             trigger_type=trigger_type,
+            scheduled_for=datetime.utcnow(),
         )
         self.db.add(task)
         await self.db.commit()
@@ -79,6 +95,14 @@ class SpiderRunnerService(BaseService):
         if spider.max_items:
             env["CRAWLHUB_MAX_ITEMS"] = str(spider.max_items)
 
+        # 分片运行：分片序号与分配给本分片的起始 URL
+        if task.shard_index is not None and task.shard_count:
+            env["CRAWLHUB_SHARD_INDEX"] = str(task.shard_index)
+            env["CRAWLHUB_SHARD_COUNT"] = str(task.shard_count)
+            start_urls = partition_start_urls(spider.start_url, task.shard_index, task.shard_count)
+            if start_urls:
+                env["CRAWLHUB_START_URLS"] = json.dumps(start_urls)
+
         # Scrapy 特殊环境变量
         if spider.source == ProjectSource.SCRAPY:
             if spider.rate_limit_rps:
@@ -160,31 +184,29 @@ class SpiderRunnerService(BaseService):
         """复制 SDK 到工作目录，使爬虫可以 from crawlhub import ..."""
         target = work_dir / "crawlhub.py"
         if SDK_SOURCE_PATH.exists():
+            # 部署包中可能自带只读的 crawlhub.py，先删除再复制
+            target.unlink(missing_ok=True)
             shutil.copy2(str(SDK_SOURCE_PATH), str(target))
 
-    async def _install_requirements(self, spider: Spider, work_dir: Path, env: dict) -> None:
-        """安装 per-spider 依赖"""
+    async def _install_requirements(
+        self, spider: Spider, env: dict, stack: contextlib.AsyncExitStack
+    ) -> None:
+        """安装 per-spider 依赖
+
+        依赖按 requirements_txt 内容哈希缓存在 worker 本地，同一份依赖只安装一次；
+        缓存目录的租约挂在 stack 上，进程运行期间不会被淘汰。
+        """
         if not spider.requirements_txt or not spider.requirements_txt.strip():
             return
 
-        req_file = work_dir / "requirements.txt"
-        req_file.write_text(spider.requirements_txt)
-
-        deps_dir = work_dir / ".deps"
-        deps_dir.mkdir(exist_ok=True)
+        from services.crawlhub.dependency_cache import dependency_cache
 
-        process = await asyncio.create_subprocess_exec(
-            "pip", "install", "--target", str(deps_dir),
-            "-r", str(req_file), "--quiet",
-            cwd=str(work_dir),
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
         try:
-            await asyncio.wait_for(process.communicate(), timeout=120)
-        except asyncio.TimeoutError:
-            process.kill()
-            logger.warning(f"pip install timeout for spider {spider.id}")
+            deps_dir = await stack.enter_async_context(
+                dependency_cache.lease_for(spider.requirements_txt)
+            )
+        except Exception as e:
+            logger.warning(f"Failed to prepare requirements for spider {spider.id}: {e}")
             return
 
         # Add deps to PYTHONPATH
@@ -194,6 +216,55 @@ class SpiderRunnerService(BaseService):
         else:
             env["PYTHONPATH"] = str(deps_dir)
 
+    async def _start_process(
+        self,
+        spider: Spider,
+        cmd: list[str],
+        work_dir: Path,
+        env: dict,
+        cgroup: TaskCgroup | None = None,
+    ):
+        """启动爬虫进程
+
+        CRAWLHUB_RUNNER_MODE=zygote 时从预热的 zygote fork，省去解释器启动和库导入；
+        有 per-spider 依赖的爬虫（依赖版本可能与预导入的库冲突）或 zygote 不可用时使用普通子进程。
+        有任务 cgroup 时由 cgroup 限制内存，不再设置 RLIMIT_AS。
+        """
+        from services.crawlhub.zygote import RUNNER_MODE, ZygoteError, zygote_pool
+
+        memory_limit_mb = None if cgroup else spider.memory_limit_mb
+        has_requirements = bool(spider.requirements_txt and spider.requirements_txt.strip())
+        if RUNNER_MODE == "zygote" and not has_requirements:
+            try:
+                return await zygote_pool.spawn(
+                    cmd, work_dir, env, memory_limit_mb,
+                    cgroup_procs=cgroup.procs_path if cgroup else None,
+                )
+            except ZygoteError as e:
+                logger.warning(f"Zygote unavailable, falling back to subprocess: {e}")
+
+        return await asyncio.create_subprocess_exec(
+            *cmd,
+            cwd=str(work_dir),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=env,
+            preexec_fn=cgroup.preexec_fn() if cgroup else self._make_preexec_fn(memory_limit_mb),
+        )
+
+    def _record_usage(self, task: SpiderTask, cgroup: TaskCgroup) -> None:
+        """从任务 cgroup 读取资源统计写入任务"""
+        usage = cgroup.usage()
+        task.cpu_seconds = usage.cpu_seconds
+        task.io_read_bytes = usage.io_read_bytes
+        task.io_write_bytes = usage.io_write_bytes
+        task.oom_killed = usage.oom_killed
+        if usage.peak_memory_mb is not None:
+            task.peak_memory_mb = max(task.peak_memory_mb or 0, usage.peak_memory_mb)
+        if usage.oom_killed and task.status == SpiderTaskStatus.FAILED:
+            task.error_message = f"内存超限被 OOM 终止\n{task.error_message or ''}"
+            task.error_category = "system"
+
     def _classify_error(self, error_msg: str, stderr: str) -> str:
         """根据错误内容自动分类"""
         combined = f"{error_msg} {stderr}".lower()
@@ -207,13 +278,22 @@ class SpiderRunnerService(BaseService):
 
     async def run_spider_sync(self, spider: Spider, task: SpiderTask) -> None:
         """同步执行爬虫（用于 Celery worker 调用，不走 SSE）"""
+        # 排队期间已被取消
+        if task.status == SpiderTaskStatus.CANCELLED:
+            return
+
         task.status = SpiderTaskStatus.RUNNING
         task.started_at = datetime.utcnow()
+        # 首次开始执行时记录相对计划时间的延迟（错峰、排队与限速）
+        if task.scheduled_for and task.dispatch_delay_seconds is None:
+            task.dispatch_delay_seconds = max((task.started_at - task.scheduled_for).total_seconds(), 0)
         await self.db.commit()
+        task_telemetry.start(task)
+        run_contexts.invalidate_task(task.id)
 
         try:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                work_dir = Path(temp_dir)
+            async with contextlib.AsyncExitStack() as stack:
+                work_dir = Path(stack.enter_context(tempfile.TemporaryDirectory()))
                 await self.prepare_from_deployment(spider, work_dir)
 
                 # 嵌入 SDK
@@ -239,77 +319,98 @@ class SpiderRunnerService(BaseService):
                 await self._inject_datasource_env(spider, env)
 
                 # 安装依赖
-                await self._install_requirements(spider, work_dir, env)
+                await self._install_requirements(spider, env, stack)
 
                 cmd = self._build_command(spider, work_dir)
 
-                preexec = self._make_preexec_fn(spider.memory_limit_mb)
-                process = await asyncio.create_subprocess_exec(
-                    *cmd,
-                    cwd=str(work_dir),
-                    stdout=asyncio.subprocess.PIPE,
-                    stderr=asyncio.subprocess.PIPE,
-                    env=env,
-                    preexec_fn=preexec,
+                # 在启动进程前订阅取消信号；SDK 收到 SIGTERM 即退出，无需再轮询任务状态
+                cancel_watcher = await stack.enter_async_context(CancelWatcher(task.id))
+                env["CRAWLHUB_CANCEL_VIA_SIGNAL"] = "1"
+
+                # 任务 cgroup：退出时先记录资源统计再删除（栈回调后进先出）
+                cgroup = TaskCgroup.create(
+                    task.id,
+                    cpu_limit=spider.cpu_limit,
+                    memory_limit_mb=spider.memory_limit_mb,
+                    io_weight=spider.io_weight,
                 )
+                if cgroup:
+                    stack.push_async_callback(asyncio.to_thread, cgroup.destroy)
+                    stack.callback(self._record_usage, task, cgroup)
+
+                process = await self._start_process(spider, cmd, work_dir, env, cgroup)
+                # 执行器排空超时取消本协程时，不留下无人监管的爬虫进程
+                stack.callback(self._kill_if_running, process)
 
                 timeout = spider.timeout_seconds or 300
                 deadline = asyncio.get_event_loop().time() + timeout
 
-                # Start reading streams concurrently
-                async def read_stream(stream):
-                    chunks = []
-                    while True:
-                        chunk = await stream.read(8192)
-                        if not chunk:
-                            break
-                        chunks.append(chunk)
-                    return b"".join(chunks)
-
-                stdout_task = asyncio.create_task(read_stream(process.stdout))
-                stderr_task = asyncio.create_task(read_stream(process.stderr))
-
-                # Poll for completion or cancellation
-                while process.returncode is None:
-                    try:
-                        await asyncio.wait_for(asyncio.shield(process.wait()), timeout=5.0)
-                    except asyncio.TimeoutError:
-                        pass
-
-                    if process.returncode is not None:
-                        break
-
-                    # Check timeout
-                    if asyncio.get_event_loop().time() > deadline:
-                        process.kill()
-                        await process.wait()
-                        task.status = SpiderTaskStatus.FAILED
-                        task.error_message = f"执行超时 (最大 {timeout} 秒)"
-                        task.error_category = "system"
-                        return
+                # 完整日志运行期间分块追加写入，内存中只保留尾部
+                log_writer = await stack.enter_async_context(LogChunkWriter(task.id, task.spider_id))
 
-                    # Check cancellation
-                    await self.db.refresh(task)
-                    if task.status == SpiderTaskStatus.CANCELLED:
+                # stdout 按 NDJSON 流式入库；写入使用独立会话，不与 self.db 并发使用
+                ingest_db = await stack.enter_async_context(TaskSessionLocal())
+                ingestor = StdoutItemIngestor(
+                    ItemSink(ingest_db, task.id, task.spider_id, is_test=task.is_test),
+                    log_writer=log_writer,
+                )
+                # 运行期间跟踪输出目录中追加写入的文件，超时或失败时已写出的数据同样入库
+                tailer = OutputTailer(ingestor.sink, output_dir)
+                tailer.start()
+                stack.push_async_callback(tailer.stop)
+
+                stdout_task = asyncio.create_task(ingestor.consume(process.stdout))
+                stderr_task = asyncio.create_task(
+                    self._read_stream_tail(process.stderr, log_writer, "stderr")
+                )
+
+                # 等待进程退出、超时或取消信号（取消由 Redis 推送，无需轮询数据库）
+                wait_task = asyncio.ensure_future(process.wait())
+                cancel_task = asyncio.ensure_future(cancel_watcher.event.wait())
+                try:
+                    await asyncio.wait(
+                        {wait_task, cancel_task},
+                        timeout=max(deadline - asyncio.get_event_loop().time(), 0),
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                finally:
+                    cancel_task.cancel()
+
+                if process.returncode is None:
+                    if cancel_watcher.cancelled:
                         process.terminate()
-                        await asyncio.sleep(2)
-                        if process.returncode is None:
+                        try:
+                            await asyncio.wait_for(asyncio.shield(wait_task), CANCEL_GRACE_SECONDS)
+                        except asyncio.TimeoutError:
                             process.kill()
-                        await process.wait()
+                        await wait_task
+                        await asyncio.gather(stdout_task, stderr_task, return_exceptions=True)
+                        task.status = SpiderTaskStatus.CANCELLED
                         task.error_message = "任务被用户取消"
                         return
 
-                stdout_data = await stdout_task
+                    process.kill()
+                    await wait_task
+                    await asyncio.gather(stdout_task, stderr_task, return_exceptions=True)
+                    task.status = SpiderTaskStatus.FAILED
+                    task.error_message = f"执行超时 (最大 {timeout} 秒)"
+                    task.error_category = "system"
+                    return
+
+                await stdout_task
                 stderr_data = await stderr_task
-                stdout_str = stdout_data.decode("utf-8", errors="replace")
+                stdout_str = ingestor.log_text()
                 stderr_str = stderr_data.decode("utf-8", errors="replace")
 
                 if process.returncode == 0:
-                    await self._store_spider_data(task, stdout_str)
-                    # 收集文件输出
-                    await self._collect_file_output(task, output_dir)
-                    # 状态必须在 _store_spider_data 之后设置，
-                    # 因为该方法内部 refresh(task) 会从 DB 重载覆盖内存值
+                    await ingestor.finalize()
+                    # 跟踪中的文件读取剩余内容，其余文件结束后整体采集
+                    await tailer.stop()
+                    await FileOutputCollector(ingestor.sink).collect(output_dir, exclude=tailer.offsets)
+                    # 计数由 ItemSink 累加在实时数据中，写回数据库并重载后再设置状态
+                    await self._flush_telemetry(task)
+                    await self.db.refresh(task)
+                    # 状态必须在 refresh(task) 之后设置，否则会被 DB 中的值覆盖
                     task.status = SpiderTaskStatus.COMPLETED
                 else:
                     task.status = SpiderTaskStatus.FAILED
@@ -322,13 +423,63 @@ class SpiderRunnerService(BaseService):
 
                 await self._store_task_log(task, stdout_str, stderr_str)
 
+        except asyncio.CancelledError:
+            task.status = SpiderTaskStatus.FAILED
+            task.error_message = "Worker 关闭，任务被中断"
+            task.error_category = "system"
+            raise
         except Exception as e:
             task.status = SpiderTaskStatus.FAILED
             task.error_message = str(e)
             task.error_category = "system"
         finally:
             task.finished_at = datetime.utcnow()
+            await self._flush_telemetry(task)
+            await self._refresh_counters(task)
             await self.db.commit()
+            task_telemetry.set_status(task.id, task.status)
+            # 结束后 SDK 的数据上报和心跳立即被拒绝，不等运行上下文缓存过期
+            run_contexts.invalidate_task(task.id)
+
+    async def _flush_telemetry(self, task: SpiderTask) -> None:
+        """将任务的实时数据写回数据库（独立会话，失败不影响任务状态的提交）"""
+        try:
+            async with TaskSessionLocal() as session:
+                await task_telemetry.flush(session, [task.id])
+        except Exception as e:
+            logger.warning(f"Failed to flush telemetry for task {task.id}: {e}")
+
+    async def _refresh_counters(self, task: SpiderTask) -> None:
+        """重载写回后的计数：失败、超时、取消路径同样以数据库中的最新值为准（webhook 使用）"""
+        try:
+            await self.db.refresh(task, attribute_names=list(COUNTER_FIELDS))
+        except Exception as e:
+            logger.warning(f"Failed to refresh counters for task {task.id}: {e}")
+
+    @staticmethod
+    async def _read_stream_tail(
+        stream: asyncio.StreamReader,
+        log_writer: LogChunkWriter,
+        name: str,
+        max_bytes: int = STDERR_TAIL_BYTES,
+    ) -> bytes:
+        """读取到 EOF，完整内容写入分块日志，返回末尾 max_bytes 字节"""
+        tail = bytearray()
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                break
+            await log_writer.write(name, chunk)
+            tail += chunk
+            if len(tail) > max_bytes:
+                del tail[:len(tail) - max_bytes]
+        return bytes(tail)
+
+    @staticmethod
+    def _kill_if_running(process) -> None:
+        if process.returncode is None:
+            with contextlib.suppress(ProcessLookupError):
+                process.kill()
 
     async def prepare_project_files(self, spider: Spider, work_dir: Path) -> None:
         """准备项目文件到工作目录（测试运行用）
@@ -384,19 +535,19 @@ class SpiderRunnerService(BaseService):
         """从部署快照准备项目文件（生产执行用）
 
         优先级:
-        1. 有 active_deployment_id -> 从 GridFS 下载快照
+        1. 有 active_deployment_id -> 从 worker 本地缓存展开快照（未命中时从 GridFS 下载）
         2. 有 script_content -> 写入 main.py
         3. 否则抛出错误
         """
         if spider.active_deployment_id:
+            from services.crawlhub.deployment_cache import deployment_cache
             from services.crawlhub.deployment_service import DeploymentService
 
             deployment = await DeploymentService(self.db).get_deployment(
                 spider.active_deployment_id
             )
             if deployment:
-                archive = await DeploymentService.download_archive(deployment.file_archive_id)
-                await DeploymentService.extract_archive(archive, work_dir)
+                await deployment_cache.materialize(deployment, work_dir)
                 return
 
         if spider.script_content:
@@ -439,21 +590,24 @@ if result is not None:
         self,
         spider: Spider,
         task: SpiderTask,
-    ) -> AsyncGenerator[dict, None]:
+        stream: TestRunStream,
+    ) -> None:
         """
         运行测试任务
-        返回 SSE 事件生成器
+        stdout/stderr 并发读取并发布到 stream，由调用方以 SSE 推送给客户端
         """
         task.status = SpiderTaskStatus.RUNNING
         task.started_at = datetime.utcnow()
         await self.db.commit()
+        task_telemetry.start(task)
+        run_contexts.invalidate_task(task.id)
 
-        stdout_lines = []
-        stderr_lines = []
+        stdout_str = ""
+        stderr_str = ""
 
         try:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                work_dir = Path(temp_dir)
+            async with contextlib.AsyncExitStack() as stack:
+                work_dir = Path(stack.enter_context(tempfile.TemporaryDirectory()))
 
                 # 准备文件
                 await self.prepare_project_files(spider, work_dir)
@@ -473,12 +627,17 @@ if result is not None:
                 await self._inject_datasource_env(spider, env)
 
                 # 安装依赖
-                await self._install_requirements(spider, work_dir, env)
+                await self._install_requirements(spider, env, stack)
 
-                yield {"event": "status", "data": {"status": "preparing", "message": "准备执行环境..."}}
+                stream.publish_event("status", {"status": "preparing", "message": "准备执行环境..."})
 
                 cmd = self._build_command(spider, work_dir)
 
+                # 完整输出写入分块日志，环形缓冲区之外的部分重连时从这里补读
+                stream.log_writer = await stack.enter_async_context(
+                    LogChunkWriter(task.id, task.spider_id)
+                )
+
                 process = await asyncio.create_subprocess_exec(
                     *cmd,
                     cwd=str(work_dir),
@@ -486,209 +645,90 @@ if result is not None:
                     stderr=asyncio.subprocess.PIPE,
                     env=env,
                 )
+                stack.callback(self._kill_if_running, process)
 
                 timeout = spider.timeout_seconds or 300
 
-                async def read_stream(stream, event_type):
-                    while True:
-                        line = await stream.readline()
-                        if not line:
-                            break
-                        decoded_line = line.decode("utf-8", errors="replace").rstrip()
-                        if event_type == "stdout":
-                            stdout_lines.append(decoded_line)
-                        else:
-                            stderr_lines.append(decoded_line)
-                        yield {
-                            "event": event_type,
-                            "data": {
-                                "line": decoded_line,
-                                "timestamp": datetime.utcnow().isoformat(),
-                            }
-                        }
-
-                # 读取 stdout 和 stderr
-                try:
-                    async for event in read_stream(process.stdout, "stdout"):
-                        yield event
-                    async for event in read_stream(process.stderr, "stderr"):
-                        yield event
+                # stdout 同时转发给采集器按 NDJSON 入库（测试数据）
+                ingest_db = await stack.enter_async_context(TaskSessionLocal())
+                ingestor = StdoutItemIngestor(
+                    ItemSink(ingest_db, task.id, task.spider_id, is_test=task.is_test)
+                )
+                # 有界转发：入库跟不上时暂停读取 stdout，而不是在内存中堆积
+                tee = TeePipe()
+                ingest_task = asyncio.create_task(ingestor.consume(tee))
+                # 采集器异常退出后不再转发，避免 pump 永远等待
+                ingest_task.add_done_callback(lambda _: tee.close())
+                stdout_task = asyncio.create_task(stream.pump("stdout", process.stdout, tee=tee))
+                stderr_task = asyncio.create_task(
+                    stream.pump("stderr", process.stderr, tail_bytes=STDERR_TAIL_BYTES)
+                )
 
-                    await asyncio.wait_for(process.wait(), timeout=timeout)
+                # 两个管道并发读取，任一管道写满都不会阻塞爬虫
+                wait_task = asyncio.ensure_future(process.wait())
+                detach_task = asyncio.ensure_future(stream.wait_detached())
+                try:
+                    await asyncio.wait(
+                        {wait_task, detach_task},
+                        timeout=timeout,
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                finally:
+                    detach_task.cancel()
 
-                except asyncio.TimeoutError:
+                timed_out = process.returncode is None
+                if timed_out:
                     process.kill()
-                    yield {
-                        "event": "error",
-                        "data": {"message": f"执行超时 (最大 {timeout} 秒)"}
-                    }
+                    await wait_task
+                results = await asyncio.gather(
+                    stdout_task, stderr_task, ingest_task, return_exceptions=True
+                )
+                stdout_str = ingestor.log_text()
+                if isinstance(results[1], bytes):
+                    stderr_str = results[1].decode("utf-8", errors="replace")
+
+                if timed_out:
+                    if detach_task.done() and not detach_task.cancelled():
+                        message = "客户端已断开，测试运行被终止"
+                    else:
+                        message = f"执行超时 (最大 {timeout} 秒)"
+                    stream.publish_event("error", {"message": message})
                     task.status = SpiderTaskStatus.FAILED
-                    task.error_message = "执行超时"
+                    task.error_message = message
                     task.error_category = "system"
+                elif process.returncode == 0:
+                    # 存储测试数据（兼容整段 stdout 为 JSON 的旧协议）
+                    await ingestor.finalize()
+                    await self._flush_telemetry(task)
+                    await self.db.refresh(task)
+                    task.status = SpiderTaskStatus.COMPLETED
                 else:
-                    if process.returncode == 0:
-                        task.status = SpiderTaskStatus.COMPLETED
-                    else:
-                        task.status = SpiderTaskStatus.FAILED
-                        task.error_message = f"进程退出码: {process.returncode}"
-                        stderr_str = "\n".join(stderr_lines)
-                        task.error_category = self._classify_error(
-                            task.error_message, stderr_str
-                        )
+                    task.status = SpiderTaskStatus.FAILED
+                    task.error_message = f"进程退出码: {process.returncode}"
+                    task.error_category = self._classify_error(
+                        task.error_message, stderr_str
+                    )
 
         except Exception as e:
             task.status = SpiderTaskStatus.FAILED
             task.error_message = str(e)
             task.error_category = "system"
-            yield {"event": "error", "data": {"message": str(e)}}
+            stream.publish_event("error", {"message": str(e)})
 
         finally:
             task.finished_at = datetime.utcnow()
+            await self._flush_telemetry(task)
+            await self._refresh_counters(task)
             await self.db.commit()
+            task_telemetry.set_status(task.id, task.status)
+            # 结束后 SDK 的数据上报和心跳立即被拒绝，不等运行上下文缓存过期
+            run_contexts.invalidate_task(task.id)
 
-            # 持久化日志到 MongoDB
-            await self._store_task_log(
-                task,
-                "\n".join(stdout_lines),
-                "\n".join(stderr_lines),
-            )
-
-            # 存储测试数据
-            if task.status == SpiderTaskStatus.COMPLETED:
-                await self._store_spider_data(task, "\n".join(stdout_lines))
+            # 持久化日志摘要到 MongoDB
+            await self._store_task_log(task, stdout_str, stderr_str)
 
             duration = (task.finished_at - task.started_at).total_seconds() if task.started_at else 0
-            yield {
-                "event": "status",
-                "data": {
-                    "status": task.status.value,
-                    "duration": duration,
-                }
-            }
-
-    async def _store_spider_data(self, task: SpiderTask, stdout: str) -> None:
-        """将爬取结果存入 MongoDB spider_data
-
-        优先级:
-        1. task.total_count > 0（SDK 已上报）→ 跳过 stdout 解析
-        2. 解析 stdout 最后一行为 JSON（忽略之前的 print）
-        3. 单行 stdout 整体解析（旧行为兼容）
-        """
-        from extensions.ext_mongodb import mongodb_client
-
-        if not mongodb_client.is_enabled():
-            return
-
-        # 如果 SDK 已上报数据，跳过 stdout 解析
-        await self.db.refresh(task)
-        if task.total_count > 0:
-            return
-
-        try:
-            output = stdout.strip()
-            if not output:
-                return
-
-            # 优先尝试解析最后一行（兼容有 print 输出的情况）
-            data = None
-            lines = output.split("\n")
-            if len(lines) > 1:
-                last_line = lines[-1].strip()
-                try:
-                    data = json.loads(last_line)
-                except json.JSONDecodeError:
-                    pass
-
-            # 回退到整体解析
-            if data is None:
-                data = json.loads(output)
-
-            collection = mongodb_client.get_collection("spider_data")
-
-            if isinstance(data, list):
-                docs = [{
-                    "task_id": str(task.id),
-                    "spider_id": str(task.spider_id),
-                    "data": item,
-                    "is_test": task.is_test,
-                    "created_at": datetime.utcnow(),
-                } for item in data]
-                if docs:
-                    await collection.insert_many(docs)
-                    task.total_count = len(docs)
-                    task.success_count = len(docs)
-            elif isinstance(data, dict):
-                await collection.insert_one({
-                    "task_id": str(task.id),
-                    "spider_id": str(task.spider_id),
-                    "data": data,
-                    "is_test": task.is_test,
-                    "created_at": datetime.utcnow(),
-                })
-                task.total_count = 1
-                task.success_count = 1
-        except json.JSONDecodeError:
-            pass  # stdout 不是 JSON，跳过
-        except Exception as e:
-            logger.warning(f"Failed to store spider data for task {task.id}: {e}")
-
-    async def _collect_file_output(self, task: SpiderTask, output_dir: Path) -> None:
-        """收集文件输出（JSON/JSONL/CSV）到 MongoDB"""
-        from extensions.ext_mongodb import mongodb_client
-
-        if not mongodb_client.is_enabled():
-            return
-        if not output_dir.exists():
-            return
-
-        collection = mongodb_client.get_collection("spider_data")
-        total_inserted = 0
-
-        for file_path in output_dir.iterdir():
-            if not file_path.is_file():
-                continue
-
-            try:
-                items = []
-                suffix = file_path.suffix.lower()
-
-                if suffix == ".json":
-                    content = file_path.read_text(encoding="utf-8")
-                    data = json.loads(content)
-                    if isinstance(data, list):
-                        items = data
-                    elif isinstance(data, dict):
-                        items = [data]
-
-                elif suffix == ".jsonl":
-                    for line in file_path.read_text(encoding="utf-8").splitlines():
-                        line = line.strip()
-                        if line:
-                            items.append(json.loads(line))
-
-                elif suffix == ".csv":
-                    import csv
-                    with open(file_path, newline="", encoding="utf-8") as f:
-                        reader = csv.DictReader(f)
-                        items = list(reader)
-
-                if items:
-                    docs = [{
-                        "task_id": str(task.id),
-                        "spider_id": str(task.spider_id),
-                        "data": item,
-                        "is_test": task.is_test,
-                        "created_at": datetime.utcnow(),
-                    } for item in items]
-                    await collection.insert_many(docs)
-                    total_inserted += len(docs)
-
-            except Exception as e:
-                logger.warning(f"Failed to collect file output {file_path}: {e}")
-
-        if total_inserted > 0:
-            task.total_count = (task.total_count or 0) + total_inserted
-            task.success_count = (task.success_count or 0) + total_inserted
+            stream.publish_event("status", {"status": task.status.value, "duration": duration})
 
     async def _store_task_log(self, task: SpiderTask, stdout: str, stderr: str) -> None:
         """存储任务日志到 MongoDB"""
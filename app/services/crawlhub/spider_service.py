@@ -2,11 +2,15 @@ import logging
 
 from sqlalchemy import func, select
 
-from models.crawlhub import Spider
+from models.crawlhub import Spider, SpiderTask, SpiderTaskStatus
 from schemas.crawlhub import SpiderCreate, SpiderUpdate
 from services.base_service import BaseService
 
 from .coder_workspace_service import CoderWorkspaceService
+from .item_schema import item_schemas
+from .run_context import run_contexts
+from .schedule_service import refresh_next_run
+from .task_control import CONTROL_RATE_LIMIT, send_control
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +60,9 @@ class SpiderService(BaseService):
         """
         spider = Spider(**data.model_dump())
         self.db.add(spider)
+        # 错峰偏移依赖爬虫 ID，flush 后再计算
+        await self.db.flush()
+        refresh_next_run(spider)
         await self.db.commit()
         await self.db.refresh(spider)
 
@@ -82,11 +89,28 @@ class SpiderService(BaseService):
         update_data = data.model_dump(exclude_unset=True)
         for key, value in update_data.items():
             setattr(spider, key, value)
+        if update_data.keys() & {"cron_expr", "schedule_jitter_seconds", "is_active"}:
+            refresh_next_run(spider)
+        if "item_schema" in update_data:
+            item_schemas.invalidate(spider_id)
 
         await self.db.commit()
+        run_contexts.invalidate_spider(spider_id)
+        if "rate_limit_rps" in update_data:
+            await self._push_rate_limit(spider_id, spider.rate_limit_rps)
         await self.db.refresh(spider)
         return spider
 
+    async def _push_rate_limit(self, spider_id: str, rate_limit_rps: float | None) -> None:
+        """限速变更后推送给运行中的任务"""
+        task_ids = await self.db.scalars(
+            select(SpiderTask.id).where(
+                SpiderTask.spider_id == spider_id, SpiderTask.status == SpiderTaskStatus.RUNNING
+            )
+        )
+        for task_id in task_ids:
+            send_control(task_id, CONTROL_RATE_LIMIT, {"rps": rate_limit_rps})
+
     async def delete(self, spider_id: str) -> bool:
         """删除爬虫"""
         spider = await self.get_by_id(spider_id)
@@ -105,6 +129,8 @@ class SpiderService(BaseService):
 
         await self.db.delete(spider)
         await self.db.commit()
+        item_schemas.invalidate(spider_id)
+        run_contexts.invalidate_spider(spider_id)
         return True
 
     def get_templates(self) -> dict[str, str]:
@@ -0,0 +1,224 @@
+import asyncio
+import collections
+import json
+import logging
+import os
+import time
+
+from services.crawlhub.item_sink import ItemSink
+from services.crawlhub.log_service import LogChunkWriter
+
+logger = logging.getLogger(__name__)
+
+STDOUT_BATCH_SIZE = int(os.getenv("CRAWLHUB_STDOUT_BATCH_SIZE", "500"))
+STDOUT_FLUSH_INTERVAL = float(os.getenv("CRAWLHUB_STDOUT_FLUSH_INTERVAL", "2"))
+STDOUT_MAX_LINE_BYTES = int(os.getenv("CRAWLHUB_STDOUT_MAX_LINE_BYTES", str(4 * 1024 * 1024)))
+# 任务日志中保留的 stdout 尾部大小
+STDOUT_LOG_MAX_BYTES = 1024 * 1024
+# 兼容旧协议（整段 stdout 为一个 JSON）时最多缓存的输出大小
+STDOUT_LEGACY_MAX_BYTES = 8 * 1024 * 1024
+
+_READ_SIZE = 64 * 1024
+
+
+class StdoutItemIngestor:
+    """stdout NDJSON 流式采集
+
+    协议: stdout 每行一个 JSON 对象即一条数据，一行 JSON 数组视为多条数据，
+    非 JSON 行只进入日志。运行期间按批次（条数或时间间隔）写入，内存占用与输出总量无关。
+    原始输出同时追加到分块日志（log_writer），本地只保留尾部用于日志摘要。
+
+    如果检测到 SDK 已通过 API 上报数据（任务计数超过 sink 写入的条数），
+    则停止解析 stdout，避免同一批数据写两次。
+    """
+
+    def __init__(
+        self,
+        sink: ItemSink,
+        batch_size: int = STDOUT_BATCH_SIZE,
+        flush_interval: float = STDOUT_FLUSH_INTERVAL,
+        max_line_bytes: int = STDOUT_MAX_LINE_BYTES,
+        log_max_bytes: int = STDOUT_LOG_MAX_BYTES,
+        legacy_max_bytes: int = STDOUT_LEGACY_MAX_BYTES,
+        log_writer: "LogChunkWriter | None" = None,
+    ):
+        self.sink = sink
+        self.log_writer = log_writer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_line_bytes = max_line_bytes
+        self.log_max_bytes = log_max_bytes
+        self.legacy_max_bytes = legacy_max_bytes
+
+        self.enabled = True
+        self.ingested = 0
+        self.failed = 0
+        self.oversized_lines = 0
+        self._parsed_lines = 0
+        self._batch: list = []
+        self._last_flush = time.monotonic()
+
+        self._log_lines: collections.deque[str] = collections.deque()
+        self._log_bytes = 0
+        self._log_dropped = 0
+
+        self._legacy: list[bytes] | None = []
+        self._legacy_bytes = 0
+
+    async def consume(self, stream: asyncio.StreamReader) -> None:
+        """读取 stream 直到 EOF"""
+        if not await self.sink.is_writable():
+            self.enabled = False
+
+        pending: list[bytes] = []
+        pending_bytes = 0
+        discarding = False
+
+        while True:
+            try:
+                chunk = await asyncio.wait_for(stream.read(_READ_SIZE), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                await self._maybe_flush()
+                continue
+            if not chunk:
+                break
+            self._capture_legacy(chunk)
+            if self.log_writer:
+                await self.log_writer.write("stdout", chunk)
+
+            parts = chunk.split(b"\n")
+            for part in parts[:-1]:
+                if discarding:
+                    discarding = False
+                elif pending_bytes + len(part) > self.max_line_bytes:
+                    self._skip_oversized(pending, part)
+                else:
+                    pending.append(part)
+                    await self._handle_line(b"".join(pending))
+                pending.clear()
+                pending_bytes = 0
+
+            tail = parts[-1]
+            if tail and not discarding:
+                if pending_bytes + len(tail) > self.max_line_bytes:
+                    # 超长行剩余部分丢弃到下一个换行
+                    self._skip_oversized(pending, tail)
+                    pending.clear()
+                    pending_bytes = 0
+                    discarding = True
+                else:
+                    pending.append(tail)
+                    pending_bytes += len(tail)
+
+            await self._maybe_flush()
+
+        if pending and not discarding:
+            await self._handle_line(b"".join(pending))
+        await self.flush()
+
+    def _skip_oversized(self, pending: list[bytes], part: bytes) -> None:
+        """超长行不解析，只保留开头进日志"""
+        head = (b"".join(pending) + part[:200])[:200]
+        self._append_log(head.decode("utf-8", errors="replace") + "...[line truncated]")
+        self.oversized_lines += 1
+
+    async def _handle_line(self, raw: bytes) -> None:
+        line = raw.decode("utf-8", errors="replace").rstrip("\r")
+        self._append_log(line)
+        if not self.enabled:
+            return
+
+        stripped = line.strip()
+        if not stripped or stripped[0] not in "{[":
+            return
+        try:
+            data = json.loads(stripped)
+        except json.JSONDecodeError:
+            return
+
+        if isinstance(data, dict):
+            self._batch.append(data)
+        elif isinstance(data, list):
+            self._batch.extend(data)
+        else:
+            return
+        self._parsed_lines += 1
+
+        if len(self._batch) >= self.batch_size:
+            await self.flush()
+
+    async def _maybe_flush(self) -> None:
+        if self._batch and time.monotonic() - self._last_flush >= self.flush_interval:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """写入当前批次"""
+        self._last_flush = time.monotonic()
+        if not self._batch or not self.enabled:
+            self._batch = []
+            return
+
+        batch, self._batch = self._batch, []
+        if await self._sdk_reported():
+            logger.info(
+                f"Task {self.sink.task_id}: items reported via SDK, stop ingesting stdout"
+            )
+            self.enabled = False
+            return
+
+        try:
+            self.ingested += await self.sink.write(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            logger.warning(f"Failed to ingest stdout items for task {self.sink.task_id}: {e}")
+
+    async def _sdk_reported(self) -> bool:
+        # sink 可能与文件采集共享，按 sink 的总写入量比较
+        return await self.sink.task_total_count() > self.sink.written
+
+    async def finalize(self) -> None:
+        """进程正常退出后调用：兼容整段 stdout 为一个（多行）JSON 的旧协议"""
+        legacy, self._legacy = self._legacy, None
+        if not self.enabled or self._parsed_lines or legacy is None:
+            return
+        output = b"".join(legacy).strip()
+        if not output:
+            return
+        try:
+            data = json.loads(output)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return
+        if isinstance(data, dict):
+            data = [data]
+        if not isinstance(data, list):
+            return
+
+        for start in range(0, len(data), self.batch_size):
+            self._batch = data[start:start + self.batch_size]
+            await self.flush()
+            if not self.enabled:
+                break
+
+    def _capture_legacy(self, chunk: bytes) -> None:
+        if self._legacy is None:
+            return
+        self._legacy_bytes += len(chunk)
+        if self._legacy_bytes > self.legacy_max_bytes or self._parsed_lines:
+            self._legacy = None
+        else:
+            self._legacy.append(chunk)
+
+    def _append_log(self, line: str) -> None:
+        self._log_lines.append(line)
+        self._log_bytes += len(line) + 1
+        while self._log_bytes > self.log_max_bytes and len(self._log_lines) > 1:
+            dropped = self._log_lines.popleft()
+            self._log_bytes -= len(dropped) + 1
+            self._log_dropped += 1
+
+    def log_text(self) -> str:
+        """stdout 日志（超出上限时只保留尾部）"""
+        content = "\n".join(self._log_lines)
+        if self._log_dropped:
+            return f"...[{self._log_dropped} lines truncated]\n{content}"
+        return content
@@ -0,0 +1,89 @@
+import json
+import logging
+
+from extensions.ext_redis import redis_client
+from models.engine import AsyncSessionLocal
+from services.crawlhub.run_context import run_contexts
+from services.crawlhub.task_events import TaskEventHub
+
+logger = logging.getLogger(__name__)
+
+CONTROL_PREFIX = "crawlhub:control"
+# 控制消息写入后发布通知，由各 API 进程的 task_control_hub 唤醒等待中的长轮询
+CONTROL_CHANNEL = f"{CONTROL_PREFIX}:events"
+CONTROL_TTL = 24 * 60 * 60
+# 每个任务保留的控制消息数
+_MAX_MESSAGES = 100
+
+CONTROL_CANCEL = "cancel"
+CONTROL_RATE_LIMIT = "rate_limit"
+CONTROL_PROXY = "proxy"
+
+
+def _str(value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def _key(task_id: str) -> str:
+    return f"{CONTROL_PREFIX}:{task_id}"
+
+
+def send_control(task_id: str, message_type: str, data: dict | None = None) -> None:
+    """向运行中任务的 SDK 下发控制消息（取消、限速变更、代理轮换）
+
+    消息按顺序保存在任务的 Redis Stream 中，SDK 通过 /internal/control 长轮询按游标读取，
+    断线重连后不会遗漏。
+    """
+    task_id = str(task_id)
+    key = _key(task_id)
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.xadd(key, {"type": message_type, "data": json.dumps(data or {}, ensure_ascii=False)},
+                  maxlen=_MAX_MESSAGES, approximate=True)
+        pipe.expire(key, CONTROL_TTL)
+        pipe.publish(CONTROL_CHANNEL, json.dumps({"task_id": task_id, "data": {"type": message_type}}))
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Failed to send {message_type} control to task {task_id}: {e}")
+
+
+def read_control(task_id: str, cursor: str | None = None) -> tuple[list[dict], str | None]:
+    """读取游标之后的控制消息，返回 (消息列表, 新游标)"""
+    start = f"({cursor}" if cursor else "-"
+    entries = redis_client.xrange(_key(str(task_id)), min=start, max="+", count=_MAX_MESSAGES)
+    messages = []
+    for entry_id, fields in entries:
+        fields = {_str(k): _str(v) for k, v in fields.items()}
+        cursor = _str(entry_id)
+        messages.append({"id": cursor, "type": fields.get("type"), "data": json.loads(fields.get("data") or "{}")})
+    return messages, cursor
+
+
+task_control_hub = TaskEventHub(CONTROL_CHANNEL, parse=lambda data: data)
+
+
+async def poll_control(
+    task_id: str, spider_id: str, cursor: str | None = None, wait: float = 0.0
+) -> tuple[list[dict], str | None] | None:
+    """SDK 控制通道的一次长轮询，任务不存在时返回 None，spider_id 不匹配时抛出 ValueError
+
+    有新消息时立即返回，否则等待发布通知或超时后返回空列表。
+    校验任务使用单独的数据库会话并在等待前关闭：每个运行中的任务都有一个长轮询，
+    等待期间占用连接会耗尽连接池，阻塞数据上报和心跳。
+    """
+    async with AsyncSessionLocal() as db:
+        context = await run_contexts.get_task(db, task_id)
+    if context is None:
+        return None
+    if context.spider_id != str(spider_id):
+        raise ValueError("spider_id 不匹配")
+
+    messages, next_cursor = read_control(task_id, cursor)
+    if messages or not wait:
+        return messages, next_cursor
+    async with task_control_hub.subscribe(task_id) as subscription:
+        # 订阅建立前发布的消息
+        messages, next_cursor = read_control(task_id, cursor)
+        if not messages and await subscription.next(wait) is not None:
+            messages, next_cursor = read_control(task_id, cursor)
+    return messages, next_cursor
@@ -0,0 +1,127 @@
+import asyncio
+import contextlib
+import json
+import logging
+import threading
+from collections.abc import Callable
+
+from extensions.ext_redis import redis_client
+from services.crawlhub.task_telemetry import TELEMETRY_CHANNEL, TaskTelemetry
+
+logger = logging.getLogger(__name__)
+
+_RESUBSCRIBE_DELAY = 2.0
+
+
+class TaskSubscription:
+    """单个 SSE 客户端的订阅，只保留最新快照（处理不过来时合并中间状态）"""
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self._latest: dict | None = None
+        self._event = asyncio.Event()
+
+    def push(self, data: dict) -> None:
+        self._latest = data
+        self._event.set()
+
+    async def next(self, timeout: float) -> dict | None:
+        """等待下一个快照，超时返回 None"""
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._event.clear()
+        data, self._latest = self._latest, None
+        return data
+
+
+class TaskEventHub:
+    """进程内的任务事件分发
+
+    每个进程只订阅一次频道（后台线程，Redis 客户端为同步客户端），默认为 TELEMETRY_CHANNEL，
+    收到快照后按 task_id 分发给本进程中该任务的所有 SSE 客户端，
+    数据库和 Redis 的负载不随查看人数增长。parse 将消息数据转换为推送的内容，返回空值时不推送。
+    """
+
+    def __init__(
+        self, channel: str = TELEMETRY_CHANNEL, parse: Callable[[dict], dict | None] = TaskTelemetry.parse
+    ):
+        self.channel = channel
+        self._parse = parse
+        self._subscribers: dict[str, set[TaskSubscription]] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, task_id: str):
+        task_id = str(task_id)
+        self._ensure_started()
+        subscription = TaskSubscription(task_id)
+        self._subscribers.setdefault(task_id, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            subscribers = self._subscribers.get(task_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    self._subscribers.pop(task_id, None)
+
+    def _ensure_started(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, name="task-event-hub", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self._stop.set()
+
+    def dispatch(self, task_id: str, data: dict) -> None:
+        """在事件循环中分发快照"""
+        subscribers = self._subscribers.get(task_id)
+        if not subscribers:
+            return
+        parsed = self._parse(data)
+        if parsed:
+            for subscription in list(subscribers):
+                subscription.push(parsed)
+
+    def _on_message(self, payload: bytes) -> None:
+        try:
+            message = json.loads(payload)
+            task_id = message["task_id"]
+        except (ValueError, KeyError, TypeError):
+            return
+        # 在订阅线程中先过滤，本进程没有客户端的任务不进入事件循环
+        if task_id not in self._subscribers:
+            return
+        loop = self._loop
+        if loop and not loop.is_closed():
+            loop.call_soon_threadsafe(self.dispatch, task_id, message.get("data") or {})
+
+    def _listen(self) -> None:
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "message":
+                        self._on_message(message["data"])
+            except Exception as e:
+                logger.warning(f"Task event hub lost redis: {e}")
+                self._stop.wait(_RESUBSCRIBE_DELAY)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+
+task_event_hub = TaskEventHub()
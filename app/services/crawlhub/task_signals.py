@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import threading
+
+from sqlalchemy import select
+
+from extensions.ext_redis import redis_client
+from models.crawlhub import SpiderTask, SpiderTaskStatus
+from models.engine import TaskSessionLocal
+
+logger = logging.getLogger(__name__)
+
+CANCEL_CHANNEL_PREFIX = "crawlhub:task_cancel"
+# 取消标记保留时长，覆盖订阅建立前或订阅断开期间发出的取消
+CANCEL_MARKER_TTL = 24 * 60 * 60
+_RESUBSCRIBE_DELAY = 2.0
+# 兜底的数据库状态检查间隔：取消消息丢失（Redis 故障、发布失败）时仍能在该时间内终止任务
+CANCEL_DB_CHECK_INTERVAL = 45.0
+
+
+def _channel(task_id: str) -> str:
+    return f"{CANCEL_CHANNEL_PREFIX}:{task_id}"
+
+
+def _marker(task_id: str) -> str:
+    return f"{CANCEL_CHANNEL_PREFIX}:flag:{task_id}"
+
+
+def publish_cancel(task_id: str) -> None:
+    """通知运行中的任务立即取消（写入取消标记并发布消息）"""
+    task_id = str(task_id)
+    try:
+        redis_client.set(_marker(task_id), 1, ex=CANCEL_MARKER_TTL)
+        redis_client.publish(_channel(task_id), "cancel")
+    except Exception as e:
+        logger.warning(f"Failed to publish cancel signal for task {task_id}: {e}")
+
+
+def is_cancel_requested(task_id: str) -> bool:
+    try:
+        return bool(redis_client.exists(_marker(str(task_id))))
+    except Exception as e:
+        logger.warning(f"Failed to check cancel marker for task {task_id}: {e}")
+        return False
+
+
+class CancelWatcher:
+    """订阅任务取消频道，收到取消后置位 event
+
+    Redis 客户端为同步客户端，订阅在后台线程中进行；每次（重新）订阅成功后
+    检查一次取消标记，避免遗漏订阅建立前发出的取消。另外每隔 db_check_interval
+    秒低频查询一次数据库中的任务状态，作为取消消息丢失时的兜底。
+
+    用法:
+        async with CancelWatcher(task_id) as watcher:
+            await watcher.event.wait()
+    """
+
+    def __init__(self, task_id: str, db_check_interval: float = CANCEL_DB_CHECK_INTERVAL):
+        self.task_id = str(task_id)
+        self.db_check_interval = db_check_interval
+        self.event = asyncio.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._db_check: asyncio.Task | None = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    async def __aenter__(self) -> "CancelWatcher":
+        self._loop = asyncio.get_running_loop()
+        self._thread = threading.Thread(
+            target=self._listen, name=f"cancel-watcher-{self.task_id}", daemon=True
+        )
+        self._thread.start()
+        self._db_check = asyncio.create_task(self._check_db())
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self._stop.set()
+        if self._db_check:
+            self._db_check.cancel()
+            await asyncio.gather(self._db_check, return_exceptions=True)
+        if self._thread:
+            await asyncio.to_thread(self._thread.join, 5)
+
+    async def _check_db(self) -> None:
+        while not self.event.is_set():
+            try:
+                await asyncio.wait_for(self.event.wait(), self.db_check_interval)
+                return
+            except TimeoutError:
+                pass
+            try:
+                status = await self._load_status()
+            except Exception as e:
+                logger.warning(f"Cancel watcher for task {self.task_id} failed to check db: {e}")
+                continue
+            if status == SpiderTaskStatus.CANCELLED:
+                logger.info(f"Task {self.task_id} cancelled in db without a cancel signal")
+                self.event.set()
+
+    async def _load_status(self) -> SpiderTaskStatus | None:
+        async with TaskSessionLocal() as session:
+            result = await session.execute(
+                select(SpiderTask.status).where(SpiderTask.id == self.task_id)
+            )
+            return result.scalar_one_or_none()
+
+    def _notify(self) -> None:
+        if self._loop and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.event.set)
+
+    def _listen(self) -> None:
+        channel = _channel(self.task_id)
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(channel)
+                if is_cancel_requested(self.task_id):
+                    self._notify()
+                    return
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "message":
+                        self._notify()
+                        return
+            except Exception as e:
+                logger.warning(f"Cancel watcher for task {self.task_id} lost redis: {e}")
+                self._stop.wait(_RESUBSCRIBE_DELAY)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
@@ -0,0 +1,268 @@
+import json
+import logging
+from datetime import datetime
+
+from sqlalchemy import case, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from extensions.ext_redis import redis_client
+from models.crawlhub import SpiderTask, SpiderTaskStatus
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_PREFIX = "crawlhub:telemetry"
+# 实时数据变更后发布完整快照，由各 API 进程的 TaskEventHub 分发给 SSE 客户端
+TELEMETRY_CHANNEL = f"{TELEMETRY_PREFIX}:events"
+# 实时数据保留时长，每次写入时续期
+TELEMETRY_TTL = 24 * 60 * 60
+# 任务结束后保留的时长，供 SSE 读到终态
+_FINISHED_TTL = 10 * 60
+
+COUNTER_FIELDS = ("total_count", "success_count", "failed_count")
+_INT_FIELDS = (*COUNTER_FIELDS, "progress", "peak_memory_mb")
+_TERMINAL_STATUSES = (SpiderTaskStatus.COMPLETED, SpiderTaskStatus.FAILED, SpiderTaskStatus.CANCELLED)
+
+
+def _str(value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def _greater(column, value: int):
+    """列与给定值中较大的一个（列为 NULL 时取给定值）
+
+    用 CASE 而不是 GREATEST：GREATEST 在 SQLite 中不存在，MySQL 中遇到 NULL 返回 NULL。
+    """
+    return case((column > value, column), else_=value)
+
+
+class TaskTelemetry:
+    """运行中任务的实时数据（Redis Hash）
+
+    SDK 心跳、进度上报和数据写入计数只写 Redis，不再逐次 UPDATE crawlhub_tasks；
+    flush() 由定时任务每隔几秒、以及任务结束时调用，批量写回数据库。
+    计数保存的是绝对值（任务开始时以数据库中的值为基准），写回时取较大值，重复写回不会重复累加。
+    SSE 和心跳检查优先读取这里的数据；每次变更后在 TELEMETRY_CHANNEL 上发布快照。
+    """
+
+    def __init__(self, prefix: str = TELEMETRY_PREFIX):
+        self.prefix = prefix
+
+    def _key(self, task_id: str) -> str:
+        return f"{self.prefix}:{task_id}"
+
+    @property
+    def _dirty(self) -> str:
+        return f"{self.prefix}:dirty"
+
+    def _write(self, task_id: str, fields: dict | None = None, incr: dict | None = None) -> bool:
+        """写入字段和计数增量并标记待写回，Redis 不可用时返回 False"""
+        task_id = str(task_id)
+        key = self._key(task_id)
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for field, amount in (incr or {}).items():
+                if amount:
+                    pipe.hincrby(key, field, amount)
+            if fields:
+                pipe.hset(key, mapping=fields)
+            pipe.expire(key, TELEMETRY_TTL)
+            pipe.sadd(self._dirty, task_id)
+            pipe.hgetall(key)
+            snapshot = pipe.execute()[-1]
+        except Exception as e:
+            logger.warning(f"Failed to write telemetry for task {task_id}: {e}")
+            return False
+        self._publish(task_id, snapshot)
+        return True
+
+    def _publish(self, task_id: str, snapshot: dict) -> None:
+        try:
+            redis_client.publish(TELEMETRY_CHANNEL, json.dumps({
+                "task_id": str(task_id),
+                "data": {_str(k): _str(v) for k, v in snapshot.items()},
+            }))
+        except Exception as e:
+            logger.debug(f"Failed to publish telemetry for task {task_id}: {e}")
+
+    # ─── 写入 ───
+
+    def start(self, task: SpiderTask) -> bool:
+        """任务开始运行：以数据库中的计数为基准初始化（重试时沿用已有计数）"""
+        key = self._key(str(task.id))
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for field in COUNTER_FIELDS:
+                pipe.hsetnx(key, field, getattr(task, field) or 0)
+            pipe.hset(key, mapping={
+                "status": task.status.value,
+                "started_at": task.started_at.isoformat() if task.started_at else "",
+            })
+            pipe.expire(key, TELEMETRY_TTL)
+            pipe.hgetall(key)
+            snapshot = pipe.execute()[-1]
+        except Exception as e:
+            logger.warning(f"Failed to init telemetry for task {task.id}: {e}")
+            return False
+        self._publish(task.id, snapshot)
+        return True
+
+    def add_counts(self, task_id: str, success: int = 0, failed: int = 0) -> bool:
+        """累加写入成功条数（同时计入 total_count）和失败条数"""
+        return self._write(task_id, incr={
+            "total_count": success,
+            "success_count": success,
+            "failed_count": failed,
+        })
+
+    def set_progress(self, task_id: str, progress: int) -> bool:
+        return self._write(task_id, {"progress": progress})
+
+    def heartbeat(
+        self, task_id: str, memory_mb: float | None = None, items_per_second: float | None = None
+    ) -> bool:
+        fields: dict = {"last_heartbeat": datetime.utcnow().isoformat()}
+        if items_per_second is not None:
+            fields["items_per_second"] = items_per_second
+        if memory_mb is not None:
+            try:
+                peak = redis_client.hget(self._key(str(task_id)), "peak_memory_mb")
+            except Exception:
+                peak = None
+            if peak is None or memory_mb > int(peak):
+                fields["peak_memory_mb"] = int(memory_mb)
+        return self._write(task_id, fields)
+
+    def set_status(self, task_id: str, status: SpiderTaskStatus) -> None:
+        """同步任务状态并发布（数据库提交之后调用）；结束后缩短保留时长"""
+        key = self._key(str(task_id))
+        snapshot = {"status": status.value}
+        try:
+            if redis_client.exists(key):
+                pipe = redis_client.pipeline(transaction=False)
+                pipe.hset(key, "status", status.value)
+                if status in _TERMINAL_STATUSES:
+                    pipe.expire(key, _FINISHED_TTL)
+                pipe.hgetall(key)
+                snapshot = pipe.execute()[-1]
+        except Exception as e:
+            logger.warning(f"Failed to set telemetry status for task {task_id}: {e}")
+        self._publish(task_id, snapshot)
+
+    def publish_task(self, task: SpiderTask) -> None:
+        """发布数据库中的任务状态（分片父任务汇总、取消等不经过实时数据的变更）"""
+        snapshot = {field: getattr(task, field) or 0 for field in COUNTER_FIELDS}
+        snapshot.update({
+            "status": task.status.value,
+            "progress": task.progress or 0,
+            "items_per_second": task.items_per_second if task.items_per_second is not None else "",
+            "started_at": task.started_at.isoformat() if task.started_at else "",
+        })
+        self._publish(task.id, snapshot)
+
+    # ─── 读取 ───
+
+    @staticmethod
+    def parse(raw: dict) -> dict | None:
+        """将 Redis 中的字符串字段转换为对应类型"""
+        if not raw:
+            return None
+        data = {_str(k): _str(v) for k, v in raw.items()}
+        live: dict = {}
+        for field, value in data.items():
+            if not value:
+                continue
+            if field in _INT_FIELDS:
+                live[field] = int(value)
+            elif field == "items_per_second":
+                live[field] = float(value)
+            elif field in ("last_heartbeat", "started_at"):
+                live[field] = datetime.fromisoformat(value)
+            else:
+                live[field] = value
+        return live
+
+    def get(self, task_id: str) -> dict | None:
+        """任务的实时数据，不存在时返回 None"""
+        try:
+            return self.parse(redis_client.hgetall(self._key(str(task_id))))
+        except Exception as e:
+            logger.warning(f"Failed to read telemetry for task {task_id}: {e}")
+            return None
+
+    def get_many(self, task_ids: list[str]) -> dict[str, dict]:
+        """批量读取，只返回存在实时数据的任务"""
+        task_ids = [str(t) for t in task_ids]
+        if not task_ids:
+            return {}
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for task_id in task_ids:
+                pipe.hgetall(self._key(task_id))
+            results = pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to read telemetry: {e}")
+            return {}
+        return {
+            task_id: live
+            for task_id, raw in zip(task_ids, results)
+            if (live := self.parse(raw))
+        }
+
+    # ─── 写回数据库 ───
+
+    @staticmethod
+    def _values(live: dict) -> dict:
+        values: dict = {}
+        for field in COUNTER_FIELDS:
+            if field in live:
+                values[field] = _greater(getattr(SpiderTask, field), live[field])
+        if "progress" in live:
+            values["progress"] = live["progress"]
+        if "last_heartbeat" in live:
+            values["last_heartbeat"] = live["last_heartbeat"]
+        if "items_per_second" in live:
+            values["items_per_second"] = live["items_per_second"]
+        if "peak_memory_mb" in live:
+            values["peak_memory_mb"] = _greater(SpiderTask.peak_memory_mb, live["peak_memory_mb"])
+        return values
+
+    async def flush(self, db: AsyncSession, task_ids: list[str] | None = None) -> list[str]:
+        """将实时数据写回数据库，返回写回的任务 ID；不指定 task_ids 时写回所有有变更的任务"""
+        try:
+            if task_ids is None:
+                task_ids = [_str(t) for t in redis_client.smembers(self._dirty)]
+            task_ids = [str(t) for t in task_ids]
+            if not task_ids:
+                return []
+            # 先移出变更集合再读取：读取之后的写入会重新标记，下一轮写回
+            redis_client.srem(self._dirty, *task_ids)
+        except Exception as e:
+            logger.warning(f"Failed to load telemetry for flush: {e}")
+            return []
+
+        flushed = []
+        try:
+            for task_id, live in self.get_many(task_ids).items():
+                values = self._values(live)
+                if not values:
+                    continue
+                await db.execute(
+                    update(SpiderTask)
+                    .where(SpiderTask.id == task_id)
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+                flushed.append(task_id)
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            # 写回失败时重新标记，下一轮重试
+            try:
+                redis_client.sadd(self._dirty, *task_ids)
+            except Exception:
+                pass
+            raise
+        return flushed
+
+
+task_telemetry = TaskTelemetry()
@@ -0,0 +1,207 @@
+import asyncio
+import atexit
+import contextlib
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# subprocess: 每个任务启动新的 python 进程；zygote: 从预热进程 fork
+RUNNER_MODE = os.getenv("CRAWLHUB_RUNNER_MODE", "subprocess")
+ZYGOTE_POOL_SIZE = int(os.getenv("CRAWLHUB_ZYGOTE_POOL_SIZE", "1"))
+ZYGOTE_SOCKET_DIR = os.getenv("CRAWLHUB_ZYGOTE_SOCKET_DIR", "/tmp/crawlhub/zygote")
+ZYGOTE_START_TIMEOUT = 60
+
+SERVER_SCRIPT = Path(__file__).with_name("zygote_server.py")
+
+
+class ZygoteError(Exception):
+    """Zygote 不可用（调用方应回退到普通子进程）"""
+
+
+class ZygoteProcess:
+    """zygote fork 出的爬虫进程句柄，接口与 asyncio.subprocess.Process 一致"""
+
+    def __init__(
+        self,
+        pid: int,
+        stdout: asyncio.StreamReader,
+        stderr: asyncio.StreamReader,
+        control: asyncio.StreamReader,
+        control_writer: asyncio.StreamWriter,
+    ):
+        self.pid = pid
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode: int | None = None
+        self._control = control
+        self._control_writer = control_writer
+        self._exit_task = asyncio.create_task(self._wait_exit())
+
+    async def _wait_exit(self) -> int:
+        returncode = None
+        try:
+            line = await self._control.readline()
+            if line:
+                returncode = json.loads(line).get("returncode")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Lost zygote control channel for pid {self.pid}: {e}")
+        finally:
+            self._control_writer.close()
+
+        if returncode is None:
+            # zygote 异常退出，无法再获取退出码，确保子进程不残留
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(self.pid, signal.SIGKILL)
+            returncode = -signal.SIGKILL
+        self.returncode = returncode
+        return returncode
+
+    async def wait(self) -> int:
+        return await asyncio.shield(self._exit_task)
+
+    def send_signal(self, sig: int) -> None:
+        if self.returncode is None:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(self.pid, sig)
+
+    def terminate(self) -> None:
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self) -> None:
+        self.send_signal(signal.SIGKILL)
+
+
+class ZygotePool:
+    """当前 worker 进程持有的 zygote 池
+
+    zygote 在首次使用时启动（预导入常用爬虫库），之后每个任务只需一次 fork。
+    zygote 检测到所属 worker 进程退出后自行结束。
+    """
+
+    def __init__(self, size: int = ZYGOTE_POOL_SIZE, socket_dir: str | Path = ZYGOTE_SOCKET_DIR):
+        self.size = max(size, 1)
+        self.socket_dir = Path(socket_dir)
+        self._servers: dict[int, subprocess.Popen] = {}
+        self._owner_pid = os.getpid()
+        self._next = 0
+
+    def _socket_path(self, index: int) -> Path:
+        return self.socket_dir / f"zygote-{os.getpid()}-{index}.sock"
+
+    def _start(self, index: int) -> None:
+        self.socket_dir.mkdir(parents=True, exist_ok=True)
+        path = self._socket_path(index)
+        with contextlib.suppress(FileNotFoundError):
+            path.unlink()
+        self._servers[index] = subprocess.Popen(
+            ["python", str(SERVER_SCRIPT), str(path)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+        )
+        logger.info(f"Started zygote {index} (pid={self._servers[index].pid})")
+
+    async def _ensure(self, index: int) -> Path:
+        # Celery prefork 子进程继承的池对象不可复用
+        if self._owner_pid != os.getpid():
+            self._servers = {}
+            self._owner_pid = os.getpid()
+
+        server = self._servers.get(index)
+        if server is None or server.poll() is not None:
+            self._start(index)
+            server = self._servers[index]
+
+        path = self._socket_path(index)
+        deadline = time.monotonic() + ZYGOTE_START_TIMEOUT
+        # socket 在预导入完成后才创建
+        while not path.exists():
+            if server.poll() is not None:
+                raise ZygoteError(f"zygote exited with code {server.returncode}")
+            if time.monotonic() > deadline:
+                server.kill()
+                raise ZygoteError("zygote start timeout")
+            await asyncio.sleep(0.1)
+        return path
+
+    async def spawn(
+        self,
+        argv: list[str],
+        cwd: str | Path,
+        env: dict,
+        memory_limit_mb: int | None = None,
+        cgroup_procs: str | None = None,
+    ) -> ZygoteProcess:
+        """通过 zygote fork 执行命令，返回进程句柄"""
+        index = self._next % self.size
+        self._next += 1
+        path = await self._ensure(index)
+
+        payload = json.dumps({
+            "argv": argv,
+            "cwd": str(cwd),
+            "env": env,
+            "memory_limit_mb": memory_limit_mb,
+            "cgroup_procs": cgroup_procs,
+        }).encode() + b"\n"
+
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            try:
+                sock.connect(str(path))
+                # fd 随第一个字节发送，其余内容普通写入
+                socket.send_fds(sock, [payload[:1]], [out_w, err_w])
+                sock.sendall(payload[1:])
+            finally:
+                os.close(out_w)
+                os.close(err_w)
+
+            sock.setblocking(False)
+            control, control_writer = await asyncio.open_unix_connection(sock=sock)
+            line = await asyncio.wait_for(control.readline(), timeout=10)
+            reply = json.loads(line) if line else {}
+            if "pid" not in reply:
+                control_writer.close()
+                raise ZygoteError(reply.get("error", "zygote closed connection"))
+        except ZygoteError:
+            os.close(out_r)
+            os.close(err_r)
+            raise
+        except (OSError, ValueError, asyncio.TimeoutError) as e:
+            sock.close()
+            os.close(out_r)
+            os.close(err_r)
+            raise ZygoteError(str(e)) from e
+
+        stdout = await _pipe_reader(out_r)
+        stderr = await _pipe_reader(err_r)
+        return ZygoteProcess(reply["pid"], stdout, stderr, control, control_writer)
+
+    def shutdown(self) -> None:
+        if self._owner_pid != os.getpid():
+            return
+        for server in self._servers.values():
+            if server.poll() is None:
+                server.terminate()
+        self._servers = {}
+
+
+async def _pipe_reader(fd: int) -> asyncio.StreamReader:
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(fd, "rb", 0)
+    )
+    return reader
+
+
+zygote_pool = ZygotePool()
+atexit.register(zygote_pool.shutdown)
@@ -0,0 +1,230 @@
+"""Zygote 进程：预先导入常用爬虫库，按请求 fork 子进程执行爬虫
+
+独立脚本，只依赖标准库，由 services.crawlhub.zygote.ZygotePool 以
+`python zygote_server.py <socket_path>` 启动，不导入任何应用代码。
+
+协议（unix socket，每个连接对应一次执行）:
+    请求: 一行 JSON {"argv": [...], "cwd": ..., "env": {...}, "memory_limit_mb": ..., "cgroup_procs": ...}，
+          附带 SCM_RIGHTS 传递的两个 fd（子进程的 stdout / stderr）
+    响应: 一行 {"pid": ...}，子进程退出后再发送一行 {"returncode": ...}
+"""
+import contextlib
+import importlib
+import json
+import os
+import selectors
+import signal
+import socket
+import sys
+import traceback
+
+DEFAULT_PRELOAD = "ssl,json,asyncio,httpx,requests,bs4,lxml.html,parsel,scrapy"
+_MAX_REQUEST_BYTES = 16 * 1024 * 1024
+
+
+def _preload() -> None:
+    modules = os.environ.get("CRAWLHUB_ZYGOTE_PRELOAD", DEFAULT_PRELOAD)
+    for name in filter(None, (m.strip() for m in modules.split(","))):
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+
+
+def _read_request(conn: socket.socket) -> tuple[dict, list[int]]:
+    data = b""
+    fds: list[int] = []
+    while not data.endswith(b"\n"):
+        chunk, new_fds, _, _ = socket.recv_fds(conn, 65536, 2)
+        if not chunk:
+            raise ConnectionError("client closed")
+        data += chunk
+        fds.extend(new_fds)
+        if len(data) > _MAX_REQUEST_BYTES:
+            raise ValueError("request too large")
+    return json.loads(data), fds
+
+
+def _child_main(request: dict, stdout_fd: int, stderr_fd: int) -> int:
+    """在 fork 出的子进程中执行爬虫，返回退出码"""
+    for sig in (signal.SIGCHLD, signal.SIGTERM, signal.SIGHUP):
+        signal.signal(sig, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(stdout_fd, 1)
+    os.dup2(stderr_fd, 2)
+    for fd in (devnull, stdout_fd, stderr_fd):
+        os.close(fd)
+
+    env = request["env"]
+    os.environ.clear()
+    os.environ.update(env)
+    os.chdir(request["cwd"])
+
+    cgroup_procs = request.get("cgroup_procs")
+    if cgroup_procs:
+        with open(cgroup_procs, "w") as f:
+            f.write("0")
+
+    memory_limit_mb = request.get("memory_limit_mb")
+    if memory_limit_mb:
+        import resource
+        limit_bytes = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, limit_bytes))
+
+    argv = request["argv"]
+    extra_paths = [p for p in env.get("PYTHONPATH", "").split(os.pathsep) if p]
+    base_path = [p for p in sys.path[1:] if p not in extra_paths]
+
+    try:
+        if argv[0] == "python" and len(argv) >= 3 and argv[1] == "-c":
+            sys.argv = ["-c", *argv[3:]]
+            sys.path[:] = ["", *extra_paths, *base_path]
+            exec(compile(argv[2], "<string>", "exec"), {"__name__": "__main__"})
+        elif argv[0] == "python" and len(argv) >= 2:
+            import runpy
+            sys.argv = argv[1:]
+            sys.path[:] = [os.path.dirname(os.path.abspath(argv[1])), *extra_paths, *base_path]
+            runpy.run_path(argv[1], run_name="__main__")
+        elif argv[0] == "scrapy":
+            from scrapy.cmdline import execute
+            sys.argv = argv
+            sys.path[:] = [*extra_paths, *base_path]
+            execute(argv)
+        else:
+            os.execvpe(argv[0], argv, env)
+        code = 0
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except KeyboardInterrupt:
+        code = 130
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+
+    # 模拟解释器正常退出: 等待非守护线程、执行 atexit
+    with contextlib.suppress(BaseException):
+        import threading
+        threading._shutdown()
+    with contextlib.suppress(BaseException):
+        import atexit
+        atexit._run_exitfuncs()
+    for stream in (sys.stdout, sys.stderr):
+        with contextlib.suppress(BaseException):
+            stream.flush()
+    return code
+
+
+def serve(socket_path: str) -> None:
+    parent_pid = os.getppid()
+    _preload()
+
+    # 先在临时路径 listen 再 rename，socket 文件出现即可连接
+    tmp_path = f"{socket_path}.{os.getpid()}"
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(tmp_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(tmp_path)
+    os.chmod(tmp_path, 0o600)
+    server.listen(64)
+    os.rename(tmp_path, socket_path)
+
+    # SIGCHLD 通过 wakeup fd 唤醒 select，子进程退出后立即回收
+    wakeup_r, wakeup_w = os.pipe()
+    os.set_blocking(wakeup_r, False)
+    os.set_blocking(wakeup_w, False)
+    signal.set_wakeup_fd(wakeup_w)
+    signal.signal(signal.SIGCHLD, lambda *_: None)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    selector = selectors.DefaultSelector()
+    selector.register(server, selectors.EVENT_READ)
+    selector.register(wakeup_r, selectors.EVENT_READ)
+    children: dict[int, socket.socket] = {}
+
+    try:
+        while True:
+            for key, _ in selector.select(timeout=1.0):
+                if key.fileobj is server:
+                    conn, _ = server.accept()
+                    _spawn(conn, server, children, (wakeup_r, wakeup_w))
+                else:
+                    with contextlib.suppress(BlockingIOError):
+                        os.read(wakeup_r, 4096)
+
+            _reap(children)
+
+            # 所属 worker 进程退出后自动结束
+            if os.getppid() != parent_pid:
+                break
+    finally:
+        with contextlib.suppress(OSError):
+            os.unlink(socket_path)
+
+
+def _spawn(
+    conn: socket.socket, server: socket.socket, children: dict, inherited_fds: tuple
+) -> None:
+    fds: list[int] = []
+    try:
+        conn.settimeout(10)
+        request, fds = _read_request(conn)
+        if len(fds) != 2:
+            raise ValueError("expected stdout/stderr fds")
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                signal.set_wakeup_fd(-1)
+                server.close()
+                conn.close()
+                for other in children.values():
+                    other.close()
+                for fd in inherited_fds:
+                    os.close(fd)
+                code = _child_main(request, fds[0], fds[1])
+            finally:
+                os._exit(code)
+
+        children[pid] = conn
+        conn.sendall(json.dumps({"pid": pid}).encode() + b"\n")
+    except Exception as e:
+        with contextlib.suppress(OSError):
+            conn.sendall(json.dumps({"error": str(e)}).encode() + b"\n")
+        conn.close()
+    finally:
+        for fd in fds:
+            with contextlib.suppress(OSError):
+                os.close(fd)
+
+
+def _reap(children: dict) -> None:
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+        conn = children.pop(pid, None)
+        if conn is None:
+            continue
+        with contextlib.suppress(OSError):
+            returncode = os.waitstatus_to_exitcode(status)
+            conn.sendall(json.dumps({"returncode": returncode}).encode() + b"\n")
+        conn.close()
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1])
@@ -3,8 +3,10 @@ import logging
 from datetime import datetime, timedelta
 
 from celery import shared_task
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown, worker_shutdown
 
 from models.engine import TaskSessionLocal, run_async
+from tasks.worker_utils import is_prefork_worker
 
 logger = logging.getLogger(__name__)
 
@@ -68,3 +70,56 @@ async def _archive_expiring_data():
 
         except Exception as e:
             logger.error(f"Failed to archive data for spider {spider_id}: {e}")
+
+
+@shared_task
+def seed_spider_dedup(spider_id: str):
+    """用已有数据重建爬虫的去重索引"""
+    run_async(_seed_spider_dedup(spider_id))
+
+
+async def _seed_spider_dedup(spider_id: str):
+    from models.crawlhub import Spider
+    from services.crawlhub.dedup import dedup_service
+
+    async with TaskSessionLocal() as db:
+        spider = await db.get(Spider, spider_id)
+        if not spider:
+            logger.warning(f"Spider {spider_id} not found, skip dedup seeding")
+            return
+        await dedup_service.seed(db, spider)
+
+
+@shared_task
+def backfill_spider_dedup(spider_id: str):
+    """把 spider_data 中已有的 dedup_hash 补录到去重索引"""
+    from services.crawlhub.dedup import dedup_service
+
+    run_async(dedup_service.backfill(spider_id))
+
+
+# ─── 异步写入队列的常驻消费者（每个执行任务的 worker 进程一个，prefork 在子进程中启动） ───
+
+
+@worker_init.connect
+def _start_ingest_consumer(sender=None, **kwargs):
+    from services.crawlhub.ingest_queue import INGEST_WRITE_BEHIND, ingest_consumer
+
+    if INGEST_WRITE_BEHIND and not is_prefork_worker(sender):
+        ingest_consumer.start()
+
+
+@worker_process_init.connect
+def _start_ingest_consumer_in_child(**kwargs):
+    from services.crawlhub.ingest_queue import INGEST_WRITE_BEHIND, ingest_consumer
+
+    if INGEST_WRITE_BEHIND:
+        ingest_consumer.start()
+
+
+@worker_shutdown.connect
+@worker_process_shutdown.connect
+def _stop_ingest_consumer(**kwargs):
+    from services.crawlhub.ingest_queue import ingest_consumer
+
+    ingest_consumer.stop()
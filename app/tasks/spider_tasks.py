@@ -1,20 +1,53 @@
+import asyncio
 import contextlib
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 
 from celery import shared_task
-from croniter import croniter
-from sqlalchemy import select, func
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown, worker_shutdown
+from sqlalchemy import select
 
-from models.crawlhub import Spider, SpiderTask, SpiderTaskStatus
+from models.crawlhub import Project, Spider, SpiderTask, SpiderTaskStatus
 from models.crawlhub.alert import AlertLevel
 from models.engine import TaskSessionLocal, run_async
 from services.crawlhub.alert_service import AlertService
+from services.crawlhub.fair_queue import (
+    FAIR_QUEUE_ENABLED,
+    QUEUE_DISPATCH_RATE,
+    fair_queue,
+    run_priority,
+)
+from services.crawlhub.heartbeat_service import HEARTBEAT_TIMEOUT_MESSAGE, HeartbeatService
+from services.crawlhub.run_context import run_contexts
+from services.crawlhub.schedule_service import ScheduleService
+from services.crawlhub.shard_service import ShardService
+from services.crawlhub.spider_executor import EXECUTOR_MODE, spider_executor
 from services.crawlhub.spider_runner_service import SpiderRunnerService
+from services.crawlhub.task_telemetry import task_telemetry
+from tasks.worker_utils import is_prefork_worker
 
 logger = logging.getLogger(__name__)
 
 
+@worker_init.connect
+def _start_executor(sender=None, **kwargs):
+    """executor 模式下每个 worker 进程一个常驻事件循环（prefork 在子进程中启动）"""
+    if EXECUTOR_MODE == "async" and not is_prefork_worker(sender):
+        spider_executor.start()
+
+
+@worker_process_init.connect
+def _start_executor_in_child(**kwargs):
+    if EXECUTOR_MODE == "async":
+        spider_executor.start()
+
+
+@worker_shutdown.connect
+@worker_process_shutdown.connect
+def _drain_executor(**kwargs):
+    spider_executor.shutdown()
+
+
 @shared_task
 def run_scheduled_spiders():
     """定时扫描并执行启用了 cron 的爬虫"""
@@ -23,58 +56,159 @@ def run_scheduled_spiders():
 
 async def _run_scheduled_spiders():
     now = datetime.utcnow()
-    one_minute_ago = now - timedelta(minutes=1)
 
     async with TaskSessionLocal() as session:
-        result = await session.execute(
-            select(Spider).where(
-                Spider.is_active == True,
-                Spider.cron_expr.isnot(None),
-                Spider.cron_expr != "",
-            )
-        )
-        spiders = list(result.scalars().all())
+        schedule_service = ScheduleService(session)
+        await schedule_service.init_missing(now)
+        due = await schedule_service.pop_due(now)
+
+    for i, (spider, task) in enumerate(due):
+        # 未启用公平队列时按准入速率错开投递
+        delay = i / QUEUE_DISPATCH_RATE if not FAIR_QUEUE_ENABLED and QUEUE_DISPATCH_RATE > 0 else 0
+        submit_spider_run(spider, task, "schedule", delay=delay, kick=False)
+    if due:
+        _kick_dispatch()
+
+
+def submit_spider_run(
+    spider: Spider,
+    task: SpiderTask,
+    trigger_type: str,
+    retries: int = 0,
+    delay: float = 0,
+    kick: bool = True,
+) -> None:
+    """提交一次运行：进入按项目公平排队的队列（未启用时直接投递 Celery）"""
+    kwargs = {
+        "spider_id": str(spider.id),
+        "task_id": str(task.id),
+        "trigger_type": trigger_type,
+        "shard_index": task.shard_index,
+        "retries": retries,
+    }
+    if not FAIR_QUEUE_ENABLED:
+        execute_spider.apply_async(kwargs=kwargs, countdown=delay or None)
+        return
 
-        for spider in spiders:
-            try:
-                cron = croniter(spider.cron_expr, one_minute_ago)
-                next_run = cron.get_next(datetime)
-                if next_run <= now:
-                    # Skip spiders with active tasks
-                    active_count = await session.scalar(
-                        select(func.count()).select_from(
-                            select(SpiderTask).where(
-                                SpiderTask.spider_id == str(spider.id),
-                                SpiderTask.status.in_([SpiderTaskStatus.PENDING, SpiderTaskStatus.RUNNING]),
-                            ).subquery()
-                        )
+    fair_queue.enqueue(
+        {
+            **kwargs,
+            "project_id": str(spider.project_id),
+            "priority": int(run_priority(trigger_type, retries)),
+        },
+        delay=delay,
+    )
+    if kick and not delay:
+        _kick_dispatch()
+
+
+def _kick_dispatch() -> None:
+    try:
+        dispatch_spider_queue.delay()
+    except Exception as e:
+        logger.warning(f"Failed to trigger queue dispatch: {e}")
+
+
+@shared_task
+def dispatch_spider_queue():
+    """按优先级和项目公平份额从队列下发爬虫运行"""
+    run_async(_dispatch_spider_queue())
+
+
+DISPATCH_LOCK_KEY = "crawlhub:fq:dispatch_lock"
+# 下发进行中又有新的触发时置位，持锁方会再执行一轮
+DISPATCH_PENDING_KEY = "crawlhub:fq:dispatch_pending"
+
+
+async def _dispatch_spider_queue():
+    from extensions.ext_redis import redis_client
+
+    lock = redis_client.lock(DISPATCH_LOCK_KEY, timeout=60, thread_local=False)
+    if not lock.acquire(blocking=False):
+        redis_client.set(DISPATCH_PENDING_KEY, 1, ex=60)
+        return
+
+    try:
+        while True:
+            redis_client.delete(DISPATCH_PENDING_KEY)
+            fair_queue.promote_delayed()
+            project_ids = fair_queue.active_projects()
+            weights: dict[str, int] = {}
+            caps: dict[str, int | None] = {}
+            if project_ids:
+                async with TaskSessionLocal() as session:
+                    result = await session.execute(
+                        select(Project.id, Project.schedule_weight, Project.max_concurrency)
+                        .where(Project.id.in_(project_ids))
                     )
-                    if active_count and active_count > 0:
-                        logger.debug(f"Spider {spider.id} already has active tasks, skipping")
-                        continue
+                    for project_id, weight, max_concurrency in result.all():
+                        weights[str(project_id)] = weight or 1
+                        caps[str(project_id)] = max_concurrency
+
+            count = fair_queue.dispatch(_send_queued_run, weights=weights, caps=caps)
+            if count:
+                logger.info(f"Dispatched {count} queued spider runs")
+            if not redis_client.exists(DISPATCH_PENDING_KEY):
+                break
+    finally:
+        with contextlib.suppress(Exception):
+            lock.release()
 
-                    execute_spider.delay(str(spider.id), trigger_type="schedule")
-            except Exception as e:
-                logger.error(f"Failed to process spider {spider.id} cron '{spider.cron_expr}': {e}")
 
+def _send_queued_run(job: dict) -> None:
+    execute_spider.apply_async(kwargs={
+        "spider_id": job["spider_id"],
+        "task_id": job["task_id"],
+        "trigger_type": job["trigger_type"],
+        "shard_index": job.get("shard_index"),
+        "retries": job.get("retries", 0),
+        "queued": True,
+    })
 
-@shared_task(bind=True, max_retries=3, default_retry_delay=60)
-def execute_spider(self, spider_id: str, task_id: str | None = None, trigger_type: str = "schedule"):
-    """执行单个爬虫任务"""
-    run_async(_execute_spider(self, spider_id, task_id, trigger_type))
+
+@shared_task
+def execute_spider(
+    spider_id: str,
+    task_id: str | None = None,
+    trigger_type: str = "schedule",
+    shard_index: int | None = None,
+    retries: int = 0,
+    queued: bool = False,
+):
+    """执行单个爬虫任务（或分片运行中的一个分片）"""
+    try:
+        run_async(_execute_spider(spider_id, task_id, trigger_type, shard_index, retries))
+    finally:
+        # 由公平队列下发的运行结束后释放项目并发占位，并触发下一轮下发
+        if queued and task_id:
+            try:
+                fair_queue.release(task_id)
+            except Exception as e:
+                logger.warning(f"Failed to release queue slot of task {task_id}: {e}")
+            _kick_dispatch()
 
 
-async def _execute_spider(self, spider_id: str, task_id: str | None = None, trigger_type: str = "schedule"):
+async def _execute_spider(
+    spider_id: str,
+    task_id: str | None = None,
+    trigger_type: str = "schedule",
+    shard_index: int | None = None,
+    retries: int = 0,
+):
     from extensions.ext_redis import redis_client
 
+    # 各分片独立加锁，同一爬虫的不同分片可在多个 worker 上并行
     lock_key = f"crawlhub:spider_lock:{spider_id}"
-    lock = redis_client.lock(lock_key, timeout=3600, blocking_timeout=5)
-    if not lock.acquire(blocking=True):
+    if shard_index is not None:
+        lock_key += f":shard:{shard_index}"
+    # 锁在线程池中获取、在事件循环线程中释放，token 不能存放在线程本地
+    lock = redis_client.lock(lock_key, timeout=3600, blocking_timeout=5, thread_local=False)
+    if not await asyncio.to_thread(lock.acquire, blocking=True):
         logger.warning(f"Spider {spider_id} is already running (lock held)")
         return
 
     try:
-        await _execute_spider_inner(self, spider_id, task_id, trigger_type)
+        await _execute_spider_inner(spider_id, task_id, trigger_type, shard_index, retries)
     finally:
         with contextlib.suppress(Exception):
             lock.release()
@@ -89,7 +223,13 @@ RETRY_STRATEGIES = {
 }
 
 
-async def _execute_spider_inner(self, spider_id: str, task_id: str | None = None, trigger_type: str = "schedule"):
+async def _execute_spider_inner(
+    spider_id: str,
+    task_id: str | None = None,
+    trigger_type: str = "schedule",
+    shard_index: int | None = None,
+    retries: int = 0,
+):
     async with TaskSessionLocal() as session:
         result = await session.execute(
             select(Spider).where(Spider.id == spider_id)
@@ -113,25 +253,54 @@ async def _execute_spider_inner(self, spider_id: str, task_id: str | None = None
         else:
             task = await runner.create_task(spider, trigger_type=trigger_type)
 
-        await runner.run_spider_sync(spider, task)
+        # 分片运行：父任务只负责拆分并分发子任务
+        if spider.shard_count and spider.shard_count > 1 and task.shard_index is None:
+            if task.status == SpiderTaskStatus.CANCELLED:
+                return
+            shards = await ShardService(session).create_shards(spider, task)
+            for shard in shards:
+                if shard.status == SpiderTaskStatus.PENDING:
+                    submit_spider_run(spider, shard, trigger_type, kick=False)
+            _kick_dispatch()
+            logger.info(f"Task {task.id} dispatched as {len(shards)} shards")
+            return
+
+        # 运行期间即记录本次是第几次重试，心跳超时扫描据此决定是否继续重试
+        task.retry_count = retries
+
+        # 共享事件循环中按槽位和内存预算排队；process 模式下不做限制
+        async with spider_executor.slot(spider.memory_limit_mb):
+            await runner.run_spider_sync(spider, task)
 
         # 更新 retry_count (无论成功失败)
-        task.retry_count = self.request.retries
+        task.retry_count = retries
         await session.commit()
 
+        # 分片结果汇总到父任务，Webhook 只在父任务结束时发送
+        notify_task = task
+        if task.parent_task_id:
+            parent = await ShardService(session).rollup(task.parent_task_id)
+            # 失败的分片还会重试时父任务尚未真正结束
+            strategy = RETRY_STRATEGIES.get(task.error_category or "system", RETRY_STRATEGIES["system"])
+            will_retry = task.status == SpiderTaskStatus.FAILED and retries < strategy["max_retries"]
+            notify_task = parent if parent and parent.finished_at and not will_retry else None
+
         # Webhook 通知
-        if spider.webhook_url:
+        if spider.webhook_url and notify_task:
             from services.crawlhub.webhook_service import WebhookService
-            duration = (task.finished_at - task.started_at).total_seconds() if task.started_at and task.finished_at else 0
+            duration = (
+                (notify_task.finished_at - notify_task.started_at).total_seconds()
+                if notify_task.started_at and notify_task.finished_at else 0
+            )
             await WebhookService.notify_task_result(
                 webhook_url=spider.webhook_url,
                 spider_name=spider.name,
                 spider_id=spider_id,
-                task_id=str(task.id),
-                status=task.status.value,
-                total_count=task.total_count,
-                success_count=task.success_count,
-                error_message=task.error_message,
+                task_id=str(notify_task.id),
+                status=notify_task.status.value,
+                total_count=notify_task.total_count,
+                success_count=notify_task.success_count,
+                error_message=notify_task.error_message,
                 duration=duration,
             )
 
@@ -139,11 +308,10 @@ async def _execute_spider_inner(self, spider_id: str, task_id: str | None = None
             category = task.error_category or "system"
             strategy = RETRY_STRATEGIES.get(category, RETRY_STRATEGIES["system"])
 
-            if self.request.retries < strategy["max_retries"]:
-                raise self.retry(
-                    exc=Exception(task.error_message),
-                    countdown=strategy["delay"],
-                    kwargs={"task_id": str(task.id), "trigger_type": trigger_type},
+            if retries < strategy["max_retries"]:
+                # 重试同样经过公平队列，优先级低于手动与定时运行
+                submit_spider_run(
+                    spider, task, trigger_type, retries=retries + 1, delay=strategy["delay"]
                 )
             else:
                 # Retries exhausted — create alert
@@ -151,7 +319,7 @@ async def _execute_spider_inner(self, spider_id: str, task_id: str | None = None
                 await alert_service.create_alert(
                     type="task_failed",
                     level=AlertLevel.ERROR,
-                    message=f"爬虫 [{spider.name}] 执行失败（类别: {category}, 已重试 {self.request.retries} 次）: {task.error_message or '未知错误'}",
+                    message=f"爬虫 [{spider.name}] 执行失败（类别: {category}, 已重试 {retries} 次）: {task.error_message or '未知错误'}",
                     spider_id=spider_id,
                     task_id=str(task.id),
                 )
@@ -165,36 +333,67 @@ def check_task_heartbeats():
 
 async def _check_task_heartbeats():
     now = datetime.utcnow()
-    heartbeat_timeout = timedelta(minutes=2)
-    min_running_time = timedelta(minutes=3)
 
     async with TaskSessionLocal() as session:
-        result = await session.execute(
-            select(SpiderTask).where(
-                SpiderTask.status == SpiderTaskStatus.RUNNING,
-            )
-        )
-        tasks = list(result.scalars().all())
+        # 先写回 Redis 中的最新心跳，再按数据库中的值批量标记超时任务
+        await task_telemetry.flush(session)
+        tasks = await HeartbeatService(session).sweep_timeouts(now)
+        if not tasks:
+            return
 
         for task in tasks:
-            try:
-                # 跳过运行时间不足 3 分钟的任务
-                if task.started_at and (now - task.started_at) < min_running_time:
-                    continue
-
-                # 检查心跳超时
-                if task.last_heartbeat:
-                    if (now - task.last_heartbeat) > heartbeat_timeout:
-                        task.status = SpiderTaskStatus.FAILED
-                        task.error_category = "system"
-                        task.error_message = "心跳超时：任务可能已停止响应"
-                        task.finished_at = now
-                        logger.warning(f"Task {task.id} heartbeat timeout, marking as failed")
-                elif task.started_at and (now - task.started_at) > min_running_time:
-                    # 从未收到心跳且已运行超过3分钟 — 可能未使用 SDK，不强制标记
-                    pass
+            task_telemetry.set_status(task.id, SpiderTaskStatus.FAILED)
+            run_contexts.invalidate_task(task.id)
+
+        # 按 system 类错误的策略批量重试，重试用尽的统一告警
+        strategy = RETRY_STRATEGIES["system"]
+        spider_ids = {task.spider_id for task in tasks}
+        spiders = {
+            str(spider.id): spider
+            for spider in await session.scalars(select(Spider).where(Spider.id.in_(spider_ids)))
+        }
+        alerts = []
+        for task in tasks:
+            spider = spiders.get(str(task.spider_id))
+            if not spider:
+                continue
+            retries = task.retry_count or 0
+            if retries < strategy["max_retries"]:
+                submit_spider_run(
+                    spider, task, task.trigger_type, retries=retries + 1, delay=strategy["delay"]
+                )
+            else:
+                alerts.append({
+                    "type": "task_failed",
+                    "level": AlertLevel.ERROR,
+                    "message": f"爬虫 [{spider.name}] {HEARTBEAT_TIMEOUT_MESSAGE}（已重试 {retries} 次）",
+                    "spider_id": str(spider.id),
+                    "task_id": str(task.id),
+                })
+        await AlertService(session).create_alerts(alerts)
 
-            except Exception as e:
-                logger.error(f"Error checking heartbeat for task {task.id}: {e}")
+        shard_service = ShardService(session)
+        for parent_id in {task.parent_task_id for task in tasks if task.parent_task_id}:
+            await shard_service.rollup(parent_id)
 
-        await session.commit()
+
+@shared_task
+def flush_task_telemetry():
+    """将运行中任务的 Redis 实时数据批量写回数据库"""
+    run_async(_flush_task_telemetry())
+
+
+async def _flush_task_telemetry():
+    async with TaskSessionLocal() as session:
+        flushed = await task_telemetry.flush(session)
+        if not flushed:
+            return
+        # 分片的心跳与计数写回后汇总到父任务
+        parent_ids = await session.scalars(
+            select(SpiderTask.parent_task_id)
+            .where(SpiderTask.id.in_(flushed), SpiderTask.parent_task_id.isnot(None))
+            .distinct()
+        )
+        shard_service = ShardService(session)
+        for parent_id in list(parent_ids):
+            await shard_service.rollup(parent_id)
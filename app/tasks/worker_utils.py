@@ -0,0 +1,4 @@
+def is_prefork_worker(worker) -> bool:
+    """worker 是否使用 prefork 进程池（此时常驻组件应在子进程中启动，而不是在 fork 前的主进程中）"""
+    pool_cls = getattr(worker, "pool_cls", None)
+    return "prefork" in str(getattr(pool_cls, "__module__", pool_cls))
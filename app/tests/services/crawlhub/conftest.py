@@ -0,0 +1,8 @@
+import pytest
+
+from tests.services.crawlhub.fakes import FakeRedis
+
+
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
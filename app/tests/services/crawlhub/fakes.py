@@ -0,0 +1,372 @@
+"""crawlhub 服务测试共用的 Redis / 数据库会话 / MongoDB 游标替身"""
+
+import fnmatch
+import queue
+import time
+
+
+def _b(value) -> bytes:
+    return value if isinstance(value, bytes) else str(value).encode()
+
+
+def _stream_id(entry_id) -> tuple[int, int]:
+    ms, _, seq = _b(entry_id).decode().partition("-")
+    return int(ms), int(seq or 0)
+
+
+class FakeRedis:
+    """crawlhub 服务用到的 Redis 命令的内存实现
+
+    返回值与 redis-py（decode_responses=False）一致为 bytes。每个 Stream 只支持一个消费者组；
+    位图（BITFIELD）按置位的下标集合保存；publish 的消息记录在 published 中，
+    并分发给 pubsub() 的订阅者。
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.streams: dict[str, list] = {}
+        self.bits: dict[str, set[int]] = {}
+        self.pending: dict[bytes, str] = {}
+        self.delivered: set[bytes] = set()
+        self.published: list[tuple[str, str]] = []
+        self.subscribers: dict[str, list[FakePubSub]] = {}
+        self._seq = 0
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    # ─── 键 ───
+
+    def exists(self, key):
+        return int(key in self.data or key in self.streams or key in self.bits)
+
+    def expire(self, key, seconds):
+        return self.exists(key)
+
+    def delete(self, *keys):
+        removed = 0
+        for key in keys:
+            for store in (self.data, self.streams, self.bits):
+                removed += store.pop(key, None) is not None
+        return removed
+
+    def scan_iter(self, match="*", count=None):
+        return [_b(k) for k in list(self.data) if fnmatch.fnmatchcase(k, match)]
+
+    # ─── 字符串 ───
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, ex=None, nx=False, **kwargs):
+        if nx and key in self.data:
+            return None
+        self.data[key] = _b(value)
+        return True
+
+    def incrby(self, key, amount=1):
+        value = int(self.data.get(key, 0)) + amount
+        self.data[key] = _b(value)
+        return value
+
+    # ─── 哈希 ───
+
+    def hget(self, key, field):
+        return self.data.get(key, {}).get(_b(field))
+
+    def hmget(self, key, fields):
+        return [self.hget(key, field) for field in fields]
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        fields = self.data.setdefault(key, {})
+        for f, v in (mapping or {field: value}).items():
+            fields[_b(f)] = _b(v)
+
+    def hsetnx(self, key, field, value):
+        fields = self.data.setdefault(key, {})
+        if _b(field) in fields:
+            return 0
+        fields[_b(field)] = _b(value)
+        return 1
+
+    def hincrby(self, key, field, amount=1):
+        fields = self.data.setdefault(key, {})
+        value = int(fields.get(_b(field), 0)) + amount
+        fields[_b(field)] = _b(value)
+        return value
+
+    def hdel(self, key, *fields):
+        return sum(self.data.get(key, {}).pop(_b(f), None) is not None for f in fields)
+
+    # ─── 集合 ───
+
+    def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(_b(m) for m in members)
+
+    def srem(self, key, *members):
+        self.data.get(key, set()).difference_update(_b(m) for m in members)
+
+    def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    # ─── 列表 ───
+
+    def rpush(self, key, *values):
+        self.data.setdefault(key, []).extend(_b(v) for v in values)
+
+    def lpush(self, key, *values):
+        for value in values:
+            self.data.setdefault(key, []).insert(0, _b(value))
+
+    def lpop(self, key):
+        items = self.data.get(key)
+        return items.pop(0) if items else None
+
+    def llen(self, key):
+        return len(self.data.get(key, []))
+
+    def lindex(self, key, index):
+        items = self.data.get(key, [])
+        return items[index] if -len(items) <= index < len(items) else None
+
+    # ─── 有序集合 ───
+
+    def zadd(self, key, mapping, nx=False, xx=False):
+        zset = self.data.setdefault(key, {})
+        for member, score in mapping.items():
+            member = _b(member)
+            if (nx and member in zset) or (xx and member not in zset):
+                continue
+            zset[member] = float(score)
+
+    def zrem(self, key, member):
+        return int(self.data.get(key, {}).pop(_b(member), None) is not None)
+
+    def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    def zrange(self, key, start, end, withscores=False):
+        items = sorted(self.data.get(key, {}).items(), key=lambda kv: (kv[1], kv[0]))
+        items = items[start:None if end == -1 else end + 1]
+        return items if withscores else [m for m, _ in items]
+
+    def zrangebyscore(self, key, low, high):
+        return [
+            m for m, score in self.zrange(key, 0, -1, withscores=True)
+            if float(low) <= score <= float(high)
+        ]
+
+    # ─── 位图 ───
+
+    def execute_command(self, name, key, *args):
+        assert name == "BITFIELD"
+        bits = self.bits.setdefault(key, set())
+        values = []
+        i = 0
+        while i < len(args):
+            values.append(int(args[i + 2] in bits))
+            if args[i] == "GET":
+                i += 3
+            else:
+                bits.add(args[i + 2])
+                i += 4
+        return values
+
+    def strlen(self, key):
+        return (max(self.bits.get(key, {0})) // 8) + 1
+
+    def bitcount(self, key):
+        return len(self.bits.get(key, ()))
+
+    # ─── Stream ───
+
+    def xadd(self, stream, fields, maxlen=None, approximate=True):
+        self._seq += 1
+        entry_id = f"{int(time.time() * 1000)}-{self._seq}".encode()
+        entries = self.streams.setdefault(stream, [])
+        entries.append((entry_id, {_b(k): _b(v) for k, v in fields.items()}))
+        if maxlen is not None:
+            del entries[:-maxlen]
+        return entry_id
+
+    def xlen(self, stream):
+        return len(self.streams.get(stream, []))
+
+    def xrange(self, stream, min="-", max="+", count=None):
+        def after_min(entry_id):
+            if min == "-":
+                return True
+            if min.startswith("("):
+                return _stream_id(entry_id) > _stream_id(min[1:])
+            return _stream_id(entry_id) >= _stream_id(min)
+
+        entries = [
+            (i, f) for i, f in self.streams.get(stream, [])
+            if after_min(i) and (max == "+" or _stream_id(i) <= _stream_id(max))
+        ]
+        return entries[:count]
+
+    def xdel(self, stream, *ids):
+        ids = {_b(i) for i in ids}
+        self.streams[stream] = [(i, f) for i, f in self.streams.get(stream, []) if i not in ids]
+
+    def xgroup_create(self, stream, group, id="0", mkstream=False):
+        if mkstream:
+            self.streams.setdefault(stream, [])
+
+    def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        (stream, _), = streams.items()
+        new = [(i, f) for i, f in self.streams.get(stream, []) if i not in self.delivered][:count]
+        if not new:
+            return []
+        for entry_id, _ in new:
+            self.delivered.add(entry_id)
+            self.pending[entry_id] = consumer
+        return [[_b(stream), new]]
+
+    def xautoclaim(self, stream, group, consumer, min_idle_time, start_id="0-0", count=None):
+        return [b"0-0", [], []]
+
+    def xack(self, stream, group, *ids):
+        for entry_id in ids:
+            self.pending.pop(_b(entry_id), None)
+
+    # ─── 发布订阅 ───
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+        for sub in self.subscribers.get(channel, []):
+            sub.messages.put({"type": "message", "channel": channel, "data": message})
+        return len(self.subscribers.get(channel, []))
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+
+class FakePipeline:
+    """记录命令，execute() 时按顺序执行并返回全部结果"""
+
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+class FakePubSub:
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.messages = queue.Queue()
+
+    def subscribe(self, channel):
+        self.redis.subscribers.setdefault(channel, []).append(self)
+
+    def get_message(self, timeout=0.0):
+        try:
+            return self.messages.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        for subs in self.redis.subscribers.values():
+            if self in subs:
+                subs.remove(self)
+
+
+class FakeResult:
+    """查询结果：每行为元组（多列查询）或对象（单列查询）"""
+
+    def __init__(self, rows):
+        self._rows = list(rows)
+
+    def all(self):
+        return self._rows
+
+    def scalars(self):
+        return FakeResult(row[0] if isinstance(row, tuple) else row for row in self._rows)
+
+    def scalar_one_or_none(self):
+        rows = self.scalars().all()
+        return rows[0] if rows else None
+
+
+class FakeSession:
+    """AsyncSession 的替身
+
+    execute 按调用顺序依次返回 results 中的每一项（用完后返回空结果）；
+    传入 respond 时改为由 respond(statement) 返回结果行。fail 为 True 时 execute 抛出异常。
+    """
+
+    def __init__(self, *results, respond=None, fail=False):
+        self._results = list(results)
+        self._respond = respond
+        self.fail = fail
+        self.statements = []
+        self.added = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    @property
+    def queries(self) -> int:
+        return len(self.statements)
+
+    async def execute(self, statement):
+        if self.fail:
+            raise RuntimeError("db down")
+        self.statements.append(statement)
+        if self._respond is not None:
+            return FakeResult(self._respond(statement))
+        return FakeResult(self._results.pop(0) if self._results else [])
+
+    def add(self, row):
+        self.added.append(row)
+
+    def add_all(self, rows):
+        self.added.extend(rows)
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    """Motor 游标：支持 sort() 和 async for"""
+
+    def __init__(self, docs):
+        self._docs = list(docs)
+
+    def sort(self, key, direction=1):
+        self._docs = sorted(self._docs, key=lambda d: d[key], reverse=direction < 0)
+        return self
+
+    def __aiter__(self):
+        self._iter = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration from None
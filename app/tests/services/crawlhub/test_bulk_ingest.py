@@ -0,0 +1,96 @@
+import gzip
+import json
+
+import msgpack
+import pytest
+import zstandard
+
+from services.crawlhub.bulk_ingest import BulkDecoder, RecordTooLarge
+
+
+def _chunks(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def _decode(decoder: BulkDecoder, chunks) -> list[dict]:
+    items = []
+    for chunk in chunks:
+        for decoded in decoder.feed(chunk):
+            items += decoded
+    for decoded in decoder.close():
+        items += decoded
+    return items
+
+
+class TestBulkDecoder:
+    def test_gzip_ndjson_split_at_arbitrary_boundaries(self):
+        lines = [json.dumps({"i": i, "text": "数据" * 3}) for i in range(200)]
+        body = gzip.compress(("\n".join(lines) + "\n").encode())
+        decoder = BulkDecoder("application/x-ndjson; charset=utf-8", "gzip")
+
+        items = _decode(decoder, _chunks(body, 7))
+
+        assert [item["i"] for item in items] == list(range(200))
+        assert decoder.errors == 0
+
+    def test_invalid_lines_counted_and_last_line_without_newline(self):
+        body = b'{"a": 1}\nnot json\n[1, 2]\n\n{"a": 2}'
+        decoder = BulkDecoder("application/x-ndjson")
+
+        items = _decode(decoder, _chunks(body, 5))
+
+        assert items == [{"a": 1}, {"a": 2}]
+        assert decoder.errors == 2
+
+    def test_unsupported_format(self):
+        with pytest.raises(ValueError):
+            BulkDecoder("application/json")
+        with pytest.raises(ValueError):
+            BulkDecoder("application/x-ndjson", "br")
+
+    def test_msgpack_stream(self):
+        body = b"".join(msgpack.packb({"i": i}) for i in range(50)) + msgpack.packb([1])
+        decoder = BulkDecoder("application/msgpack")
+
+        items = _decode(decoder, _chunks(body, 3))
+
+        assert [item["i"] for item in items] == list(range(50))
+        assert decoder.errors == 1
+
+    def test_zstd_multiple_frames(self):
+        compressor = zstandard.ZstdCompressor()
+        body = b"".join(
+            compressor.compress(f'{{"i": {i}}}\n'.encode()) for i in range(20)
+        )
+        decoder = BulkDecoder("application/x-ndjson", "zstd")
+
+        items = _decode(decoder, _chunks(body, 4))
+
+        assert [item["i"] for item in items] == list(range(20))
+
+    def test_zstd_output_is_bounded_per_chunk(self, monkeypatch):
+        monkeypatch.setattr("services.crawlhub.bulk_ingest._DECOMPRESS_CHUNK", 4096)
+        line = json.dumps({"text": "x" * 100}).encode() + b"\n"
+        body = zstandard.ZstdCompressor().compress(line * 20000)
+        assert len(body) < 4096
+        decoder = BulkDecoder("application/x-ndjson", "zstd")
+
+        sizes = [len(items) for items in decoder.feed(body)]
+        sizes += [len(items) for items in decoder.close()]
+
+        assert sum(sizes) == 20000
+        assert max(sizes) <= 4096 // len(line) + 1
+
+    def test_line_without_newline_over_limit_rejected(self):
+        decoder = BulkDecoder("application/x-ndjson", "gzip", max_line_bytes=1024)
+        body = gzip.compress(b'{"a": 1}\n' + b"x" * 4096)
+
+        with pytest.raises(RecordTooLarge):
+            _decode(decoder, _chunks(body, 256))
+
+    def test_msgpack_object_over_limit_rejected(self):
+        decoder = BulkDecoder("application/msgpack", max_line_bytes=1024)
+        body = msgpack.packb({"blob": "x" * 2_000_000})
+
+        with pytest.raises(RecordTooLarge):
+            _decode(decoder, _chunks(body, 65536))
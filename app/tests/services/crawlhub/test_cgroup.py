@@ -0,0 +1,34 @@
+from services.crawlhub import cgroup as cgroup_module
+from services.crawlhub.cgroup import TaskCgroup
+
+
+class TestTaskCgroup:
+    def test_usage_parses_cgroup_files(self, tmp_path):
+        (tmp_path / "cpu.stat").write_text("usage_usec 2500000\nuser_usec 2000000\nsystem_usec 500000\n")
+        (tmp_path / "memory.peak").write_text(str(300 * 1024 * 1024) + "\n")
+        (tmp_path / "io.stat").write_text(
+            "8:0 rbytes=1024 wbytes=2048 rios=1 wios=2 dbytes=0 dios=0\n"
+            "8:16 rbytes=100 wbytes=0 rios=1 wios=0 dbytes=0 dios=0\n"
+        )
+        (tmp_path / "memory.events").write_text("low 0\nhigh 0\nmax 3\noom 1\noom_kill 1\n")
+
+        usage = TaskCgroup(tmp_path).usage()
+
+        assert usage.cpu_seconds == 2.5
+        assert usage.peak_memory_mb == 300
+        assert usage.io_read_bytes == 1124
+        assert usage.io_write_bytes == 2048
+        assert usage.oom_killed is True
+
+    def test_usage_tolerates_missing_files(self, tmp_path):
+        usage = TaskCgroup(tmp_path).usage()
+
+        assert usage.cpu_seconds is None
+        assert usage.peak_memory_mb is None
+        assert usage.oom_killed is False
+
+    def test_create_returns_none_without_cgroup_v2(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(cgroup_module, "CGROUP_ROOT", tmp_path / "crawlhub")
+        monkeypatch.setattr(cgroup_module, "_root_ready", None)
+
+        assert TaskCgroup.create("t1", cpu_limit=1.0, memory_limit_mb=512) is None
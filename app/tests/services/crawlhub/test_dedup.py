@@ -0,0 +1,280 @@
+import pytest
+from pymongo.errors import BulkWriteError
+
+from models.crawlhub import Spider
+from services.crawlhub import dedup, item_sink
+from services.crawlhub.dedup import DedupService, bloom_params, dedup_hash
+from services.crawlhub.item_sink import ItemSink
+from tasks import data_tasks
+from tests.services.crawlhub.fakes import FakeCursor
+
+
+class _FakeCollection:
+    """spider_dedup_keys：(spider_id, dedup_hash) 唯一"""
+
+    def __init__(self, hashes=(), insert_error=None):
+        self.hashes = set(hashes)
+        self.queries = []
+        self.inserted = []
+        self.insert_error = insert_error
+
+    def find(self, query, projection=None):
+        self.queries.append(query)
+        wanted = set(query["dedup_hash"]["$in"])
+        return FakeCursor([{"dedup_hash": h} for h in self.hashes & wanted])
+
+    async def insert_many(self, docs, ordered=True):
+        assert ordered is False
+        if self.insert_error:
+            raise self.insert_error
+        errors = []
+        for i, doc in enumerate(docs):
+            if doc.get("dedup_hash") in self.hashes:
+                errors.append({"code": 11000, "index": i})
+            elif doc.get("dedup_hash"):
+                self.hashes.add(doc["dedup_hash"])
+                self.inserted.append(doc)
+        if errors:
+            raise BulkWriteError({"nInserted": len(docs) - len(errors), "writeErrors": errors})
+
+    async def delete_many(self, query):
+        self.hashes -= set(query["dedup_hash"]["$in"])
+
+    async def count_documents(self, query):
+        return len(self.hashes)
+
+
+class _FakeDataCollection:
+    """spider_data：只实现按 dedup_hash 的查询"""
+
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+        self.queries = []
+
+    def find(self, query, projection=None, batch_size=None):
+        self.queries.append(query)
+        wanted = query["dedup_hash"].get("$in")
+        return FakeCursor(
+            d for d in self.docs
+            if d["spider_id"] == query["spider_id"]
+            and (wanted is None or d["dedup_hash"] in wanted)
+        )
+
+
+@pytest.fixture
+def redis(monkeypatch, fake_redis):
+    monkeypatch.setattr(dedup, "redis_client", fake_redis)
+    monkeypatch.setattr(dedup, "BLOOM_CAPACITY", 1000)
+    return fake_redis
+
+
+@pytest.fixture
+def spider_data():
+    return _FakeDataCollection()
+
+
+@pytest.fixture
+def backfills(monkeypatch):
+    queued = []
+    monkeypatch.setattr(data_tasks.backfill_spider_dedup, "delay", queued.append)
+    return queued
+
+
+@pytest.fixture
+def collection(monkeypatch, redis, spider_data, backfills):
+    collection = _FakeCollection()
+    collections = {"spider_dedup_keys": collection, "spider_data": spider_data}
+
+    async def ensure_indexes(self):
+        pass
+
+    monkeypatch.setattr(DedupService, "ensure_indexes", ensure_indexes)
+    monkeypatch.setattr(dedup.mongodb_client, "is_enabled", lambda: True)
+    monkeypatch.setattr(dedup.mongodb_client, "get_collection", collections.__getitem__)
+    return collection
+
+
+def _spider(fields="url"):
+    return Spider(id="s1", name="s1", dedup_enabled=True, dedup_fields=fields)
+
+
+class TestBloomParams:
+    def test_sizing(self):
+        bits, hashes = bloom_params(1_000_000, 0.001)
+
+        assert 14_000_000 < bits < 14_500_000
+        assert hashes == 10
+
+
+class TestDedupService:
+    async def test_in_batch_dedup_and_claim(self, collection):
+        service = DedupService()
+        items = [{"url": "a"}, {"url": "b"}, {"url": "b", "n": 2}, {"url": "c"}]
+
+        filtered = await service.claim(_spider(), items, "t1")
+
+        assert [item["url"] for item in filtered] == ["a", "b", "c"]
+        assert all("_dedup_hash" in item for item in filtered)
+        # 布隆过滤器全部未命中，不查询精确存储
+        assert collection.queries == []
+        assert {doc["task_id"] for doc in collection.inserted} == {"t1"}
+
+    async def test_only_possible_hits_are_confirmed(self, collection):
+        service = DedupService()
+        await service.claim(_spider(), [{"url": "a"}, {"url": "b"}])
+
+        filtered = await service.claim(_spider(), [{"url": "a"}, {"url": "x"}, {"url": "y"}])
+
+        assert [item["url"] for item in filtered] == ["x", "y"]
+        assert len(collection.queries) == 1
+        assert collection.queries[0]["dedup_hash"]["$in"] == [dedup_hash({"url": "a"}, ["url"])]
+
+    async def test_concurrent_claim_loses_to_unique_index(self, collection):
+        # 其他批次已认领，但本进程的布隆过滤器尚未记录
+        collection.hashes.add(dedup_hash({"url": "a"}, ["url"]))
+
+        filtered = await DedupService().claim(_spider(), [{"url": "a"}, {"url": "b"}])
+
+        assert [item["url"] for item in filtered] == ["b"]
+
+    async def test_release_allows_rewrite(self, collection):
+        service = DedupService()
+        filtered = await service.claim(_spider(), [{"url": "a"}])
+
+        await service.release("s1", [filtered[0]["_dedup_hash"]])
+
+        assert await service.claim(_spider(), [{"url": "a"}]) != []
+
+    async def test_bloom_only_without_mongodb(self, monkeypatch, redis):
+        monkeypatch.setattr(dedup.mongodb_client, "is_enabled", lambda: False)
+        service = DedupService()
+
+        first = await service.claim(_spider(), [{"url": "a"}])
+        second = await service.claim(_spider(), [{"url": "a"}, {"url": "b"}])
+
+        assert len(first) == 1
+        assert [item["url"] for item in second] == ["b"]
+
+    async def test_dedup_disabled(self, collection):
+        spider = Spider(id="s1", name="s1", dedup_enabled=False, dedup_fields="url")
+        items = [{"url": "a"}, {"url": "a"}]
+
+        assert await DedupService().claim(spider, items) == items
+        assert collection.queries == []
+
+    async def test_stats(self, collection):
+        service = DedupService()
+        await service.claim(_spider(), [{"url": str(i)} for i in range(20)])
+        await service.claim(_spider(), [{"url": "1"}, {"url": "2"}])
+
+        stats = await service.stats("s1")
+
+        assert stats["checked"] == 22 and stats["new"] == 20 and stats["duplicates"] == 2
+        assert stats["exact_keys"] == 20
+        assert stats["bloom_hashes"] == 10 and stats["bloom_memory_bytes"] > 0
+        assert 0 < stats["estimated_false_positive_rate"] < 0.001
+        assert 15 <= stats["bloom_estimated_items"] <= 25
+
+
+class TestLegacyBackfill:
+    """spider_dedup_keys 启用前的数据只在 spider_data.dedup_hash 中有记录"""
+
+    @pytest.fixture
+    def spider_data(self):
+        return _FakeDataCollection([
+            {"spider_id": "s1", "dedup_hash": dedup_hash({"url": "old"}, ["url"]), "task_id": "t0"},
+            {"spider_id": "s2", "dedup_hash": dedup_hash({"url": "x"}, ["url"]), "task_id": "t9"},
+        ])
+
+    async def test_unseeded_spider_checks_spider_data(self, collection, spider_data, backfills):
+        service = DedupService()
+
+        filtered = await service.claim(_spider(), [{"url": "old"}, {"url": "new"}])
+
+        assert [item["url"] for item in filtered] == ["new"]
+        # 布隆过滤器未命中的也要确认，旧数据不在过滤器中
+        assert len(spider_data.queries[0]["dedup_hash"]["$in"]) == 2
+        assert backfills == ["s1"]
+
+    async def test_backfill_is_queued_once(self, collection, backfills):
+        service = DedupService()
+
+        await service.claim(_spider(), [{"url": "a"}])
+        await service.claim(_spider(), [{"url": "b"}])
+
+        assert backfills == ["s1"]
+
+    async def test_backfill_marks_seeded(self, collection, spider_data, backfills):
+        service = DedupService()
+
+        assert await service.backfill("s1") == 1
+        assert {doc["task_id"] for doc in collection.inserted} == {"t0"}
+
+        spider_data.queries.clear()
+        filtered = await service.claim(_spider(), [{"url": "old"}, {"url": "new"}])
+
+        assert [item["url"] for item in filtered] == ["new"]
+        assert spider_data.queries == [] and backfills == []
+
+    async def test_reset_clears_seed_marker(self, collection, backfills):
+        service = DedupService()
+        await service.backfill("s1")
+
+        await service.reset("s1")
+        await service.claim(_spider(), [{"url": "a"}])
+
+        assert backfills == ["s1"]
+
+
+class _IndexCollection:
+    def __init__(self, indexes):
+        self.indexes = indexes
+
+    async def index_information(self):
+        return dict(self.indexes)
+
+    async def drop_index(self, name):
+        del self.indexes[name]
+
+
+class TestDedupKeyRetention:
+    async def test_unlimited_by_default_drops_old_ttl_index(self, monkeypatch):
+        # 早期版本按 spider_data 的保留期创建过 TTL 索引
+        collection = _IndexCollection({"_id_": {}, "created_at_ttl": {"expireAfterSeconds": 86400}})
+        monkeypatch.setattr(dedup.mongodb_client, "get_collection", lambda name: collection)
+
+        await DedupService()._sync_ttl_index()
+
+        assert "created_at_ttl" not in collection.indexes
+
+    async def test_configured_retention_creates_ttl_index(self, monkeypatch):
+        collection = _IndexCollection({"_id_": {}})
+        created = []
+
+        async def create_ttl_index(name, field, expire_seconds, index_name=None):
+            created.append((name, field, expire_seconds, index_name))
+
+        monkeypatch.setattr(dedup, "DEDUP_KEY_TTL_DAYS", 7)
+        monkeypatch.setattr(dedup.mongodb_client, "get_collection", lambda name: collection)
+        monkeypatch.setattr(dedup.mongodb_client, "create_ttl_index", create_ttl_index)
+
+        await DedupService()._sync_ttl_index()
+
+        assert created == [("spider_dedup_keys", "created_at", 7 * 86400, "created_at_ttl")]
+
+
+class TestInsertDuplicates:
+    async def test_duplicate_key_errors_are_skipped(self, monkeypatch):
+        error = BulkWriteError({"nInserted": 2, "writeErrors": [{"code": 11000, "index": 1}]})
+        monkeypatch.setattr(item_sink.mongodb_client, "get_collection", lambda name: _FakeCollection(insert_error=error))
+        sink = ItemSink(None, "t1", "s1")
+
+        assert await sink._insert_mongo([{"a": 1}, {"a": 2, "_dedup_hash": "h"}, {"a": 3}]) == 2
+
+    async def test_other_write_errors_raise(self, monkeypatch):
+        error = BulkWriteError({"nInserted": 0, "writeErrors": [{"code": 121, "index": 0}]})
+        monkeypatch.setattr(item_sink.mongodb_client, "get_collection", lambda name: _FakeCollection(insert_error=error))
+        sink = ItemSink(None, "t1", "s1")
+
+        with pytest.raises(BulkWriteError):
+            await sink._insert_mongo([{"a": 1}])
@@ -0,0 +1,101 @@
+import io
+import os
+import stat
+import tarfile
+from types import SimpleNamespace
+
+from services.crawlhub.deployment_cache import DeploymentCache
+from services.crawlhub.deployment_service import DeploymentService
+
+
+def _archive(files: dict[str, bytes]) -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return buf.getvalue()
+
+
+class TestDeploymentCache:
+    async def test_materialize_downloads_once(self, tmp_path, monkeypatch):
+        downloads = []
+
+        async def download(file_archive_id):
+            downloads.append(file_archive_id)
+            return _archive({"main.py": b"print(1)", "pkg/util.py": b"X = 1"})
+
+        monkeypatch.setattr(DeploymentService, "download_archive", staticmethod(download))
+        cache = DeploymentCache(tmp_path / "cache", max_mb=10)
+        deployment = SimpleNamespace(id="d1", file_archive_id="a1")
+
+        for run in ("run1", "run2"):
+            work_dir = tmp_path / run
+            work_dir.mkdir()
+            await cache.materialize(deployment, work_dir)
+            assert (work_dir / "main.py").read_bytes() == b"print(1)"
+            assert (work_dir / "pkg" / "util.py").read_bytes() == b"X = 1"
+
+        assert downloads == ["a1"]
+        assert cache.hits == 1
+
+    async def test_replacing_linked_file_keeps_cache_intact(self, tmp_path, monkeypatch):
+        async def download(file_archive_id):
+            return _archive({"crawlhub.py": b"old"})
+
+        monkeypatch.setattr(DeploymentService, "download_archive", staticmethod(download))
+        cache = DeploymentCache(tmp_path / "cache", max_mb=10)
+        work_dir = tmp_path / "run"
+        work_dir.mkdir()
+        await cache.materialize(SimpleNamespace(id="d1", file_archive_id="a1"), work_dir)
+
+        target = work_dir / "crawlhub.py"
+        target.unlink()
+        target.write_bytes(b"new")
+
+        entry = tmp_path / "cache" / "entries" / "d1-a1"
+        assert (entry / "crawlhub.py").read_bytes() == b"old"
+
+    async def test_writing_materialized_file_keeps_cache_intact(self, tmp_path, monkeypatch):
+        async def download(file_archive_id):
+            return _archive({"seeds.txt": b"a\n", "state.db": b"v1"})
+
+        monkeypatch.setattr(DeploymentService, "download_archive", staticmethod(download))
+        cache = DeploymentCache(tmp_path / "cache", max_mb=10)
+        deployment = SimpleNamespace(id="d1", file_archive_id="a1")
+        work_dir = tmp_path / "run1"
+        work_dir.mkdir()
+        await cache.materialize(deployment, work_dir)
+
+        # 爬虫原地改写随包文件（追加 / 覆盖写），不能写穿到缓存
+        with open(work_dir / "seeds.txt", "ab") as f:
+            f.write(b"b\n")
+        with open(work_dir / "state.db", "r+b") as f:
+            f.write(b"v2")
+
+        entry = tmp_path / "cache" / "entries" / "d1-a1"
+        assert (entry / "seeds.txt").read_bytes() == b"a\n"
+        assert (entry / "state.db").read_bytes() == b"v1"
+
+        rerun = tmp_path / "run2"
+        rerun.mkdir()
+        await cache.materialize(deployment, rerun)
+        assert (rerun / "seeds.txt").read_bytes() == b"a\n"
+        assert (rerun / "state.db").read_bytes() == b"v1"
+
+    async def test_materialized_files_are_writable_by_owner(self, tmp_path, monkeypatch):
+        async def download(file_archive_id):
+            return _archive({"main.py": b"print(1)", "pkg/util.py": b"X = 1"})
+
+        monkeypatch.setattr(DeploymentService, "download_archive", staticmethod(download))
+        cache = DeploymentCache(tmp_path / "cache", max_mb=10)
+        work_dir = tmp_path / "run"
+        work_dir.mkdir()
+        await cache.materialize(SimpleNamespace(id="d1", file_archive_id="a1"), work_dir)
+
+        # 缓存条目是只读的（root 运行测试时 os.access 总是可写，因此检查权限位）
+        entry = tmp_path / "cache" / "entries" / "d1-a1"
+        assert not os.stat(entry / "main.py").st_mode & stat.S_IWUSR
+        for path in (work_dir / "main.py", work_dir / "pkg" / "util.py", work_dir / "pkg"):
+            assert os.stat(path).st_mode & stat.S_IWUSR, path
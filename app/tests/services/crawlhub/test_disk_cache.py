@@ -0,0 +1,95 @@
+import asyncio
+import os
+
+import pytest
+
+from services.crawlhub.dependency_cache import requirements_hash
+from services.crawlhub.disk_cache import DiskLRUCache
+
+
+def _builder(calls: list, payload: bytes = b"x" * 100):
+    async def build(target_dir):
+        calls.append(target_dir)
+        (target_dir / "pkg").mkdir()
+        (target_dir / "pkg" / "module.py").write_bytes(payload)
+
+    return build
+
+
+class TestDiskLRUCache:
+    async def test_build_once_then_hit(self, tmp_path):
+        cache = DiskLRUCache("test", tmp_path, max_bytes=10_000)
+        calls = []
+
+        async with cache.lease("k1", _builder(calls)) as entry:
+            assert (entry / "pkg" / "module.py").exists()
+        async with cache.lease("k1", _builder(calls)) as entry:
+            assert (entry / "pkg" / "module.py").exists()
+
+        assert len(calls) == 1
+        assert cache.misses == 1
+        assert cache.hits == 1
+
+    async def test_concurrent_leases_build_once(self, tmp_path):
+        cache = DiskLRUCache("test", tmp_path, max_bytes=10_000)
+        calls = []
+
+        async def use():
+            async with cache.lease("k1", _builder(calls)) as entry:
+                return entry
+
+        entries = await asyncio.gather(*[use() for _ in range(5)])
+
+        assert len(calls) == 1
+        assert len(set(entries)) == 1
+
+    async def test_failed_build_is_not_cached(self, tmp_path):
+        cache = DiskLRUCache("test", tmp_path, max_bytes=10_000)
+
+        async def broken(target_dir):
+            raise RuntimeError("boom")
+
+        with pytest.raises(RuntimeError):
+            async with cache.lease("k1", broken):
+                pass
+
+        assert cache.build_failures == 1
+        assert not (tmp_path / "entries" / "k1").exists()
+        assert list((tmp_path / "tmp").iterdir()) == []
+
+    async def test_evicts_least_recently_used(self, tmp_path):
+        cache = DiskLRUCache("test", tmp_path, max_bytes=250)
+        calls = []
+
+        for key in ("a", "b"):
+            async with cache.lease(key, _builder(calls)):
+                pass
+        # b 为最久未使用
+        os.utime(tmp_path / "meta" / "a.json", (2000, 2000))
+        os.utime(tmp_path / "meta" / "b.json", (1000, 1000))
+        async with cache.lease("c", _builder(calls)):
+            pass
+
+        assert cache.evictions == 1
+        assert (tmp_path / "entries" / "a").exists()
+        assert not (tmp_path / "entries" / "b").exists()
+        assert (tmp_path / "entries" / "c").exists()
+
+    async def test_entry_in_use_is_not_evicted(self, tmp_path):
+        cache = DiskLRUCache("test", tmp_path, max_bytes=150)
+        calls = []
+
+        async with cache.lease("a", _builder(calls)) as held:
+            async with cache.lease("b", _builder(calls)):
+                pass
+            assert held.exists()
+
+
+class TestRequirementsHash:
+    def test_ignores_comments_and_blank_lines(self):
+        a = requirements_hash("httpx==0.28.1\n\n# parser\nlxml>=5.0  # fast\n")
+        b = requirements_hash("httpx==0.28.1\nlxml>=5.0")
+        assert a == b
+
+    def test_changes_with_content(self):
+        assert requirements_hash("httpx==0.28.1") != requirements_hash("httpx==0.28.0")
@@ -0,0 +1,90 @@
+import pytest
+
+from services.crawlhub import fair_queue as fq
+from services.crawlhub.fair_queue import FairQueue, RunPriority
+
+
+@pytest.fixture
+def queue(monkeypatch, fake_redis):
+    monkeypatch.setattr(fq, "redis_client", fake_redis)
+    return FairQueue()
+
+
+def _job(project_id, task_id, priority=RunPriority.SCHEDULE):
+    return {"project_id": project_id, "task_id": task_id, "spider_id": "s", "priority": int(priority)}
+
+
+def _drain(queue, **kwargs):
+    sent = []
+    queue.dispatch(sent.append, **kwargs)
+    return [job["task_id"] for job in sent]
+
+
+class TestFairQueue:
+    def test_burst_project_does_not_starve_others(self, queue):
+        for i in range(50):
+            queue.enqueue(_job("big", f"big-{i}"))
+        queue.enqueue(_job("small", "small-0"))
+        queue.enqueue(_job("small", "small-1"))
+
+        sent = _drain(queue, max_inflight=4)
+
+        assert sent[:4] == ["big-0", "small-0", "big-1", "small-1"]
+
+    def test_weight_and_priority(self, queue):
+        for i in range(6):
+            queue.enqueue(_job("a", f"a-{i}"))
+            queue.enqueue(_job("b", f"b-{i}"))
+        queue.enqueue(_job("b", "b-retry", RunPriority.RETRY))
+        queue.enqueue(_job("b", "b-manual", RunPriority.MANUAL))
+
+        sent = _drain(queue, weights={"a": 2}, max_inflight=7)
+
+        assert sent[0] == "b-manual"
+        # 手动运行同样计入 b 的份额，7 次下发约按 2:1 分配
+        shares = [t[0] for t in sent]
+        assert (shares.count("a"), shares.count("b")) == (5, 2)
+        assert "b-retry" not in sent
+
+    def test_project_cap_and_release(self, queue):
+        for i in range(3):
+            queue.enqueue(_job("a", f"a-{i}"))
+
+        assert _drain(queue, caps={"a": 1}, max_inflight=0) == ["a-0"]
+        assert _drain(queue, caps={"a": 1}, max_inflight=0) == []
+
+        queue.release("a-0")
+
+        assert _drain(queue, caps={"a": 1}, max_inflight=0) == ["a-1"]
+
+    def test_delayed_retry_and_stats(self, queue):
+        queue.enqueue(_job("a", "a-0"))
+        queue.enqueue(_job("a", "a-retry", RunPriority.RETRY), delay=60)
+
+        stats = {s["project_id"]: s for s in queue.stats()}["a"]
+        assert stats["depth"] == 1
+        assert stats["delayed"] == 1
+
+        assert queue.promote_delayed() == 0
+        assert _drain(queue) == ["a-0"]
+        assert queue.promote_delayed(now=fq.time.time() + 61) == 1
+        assert _drain(queue) == ["a-retry"]
+
+        stats = {s["project_id"]: s for s in queue.stats()}["a"]
+        assert stats["dispatched"] == 2
+        assert stats["inflight"] == 2
+        assert stats["avg_wait_seconds"] is not None
+
+    def test_admission_rate_limits_scheduled_runs_only(self, queue, monkeypatch):
+        clock = [1000.0]
+        monkeypatch.setattr(fq.time, "time", lambda: clock[0])
+        for i in range(10):
+            queue.enqueue(_job("a", f"a-{i}"))
+
+        assert _drain(queue, rate=1, burst=3, max_inflight=0) == ["a-0", "a-1", "a-2"]
+
+        queue.enqueue(_job("a", "a-manual", RunPriority.MANUAL))
+        assert _drain(queue, rate=1, burst=3, max_inflight=0) == ["a-manual"]
+
+        clock[0] += 2
+        assert _drain(queue, rate=1, burst=3, max_inflight=0) == ["a-3", "a-4"]
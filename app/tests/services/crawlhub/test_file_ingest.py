@@ -0,0 +1,128 @@
+import asyncio
+import csv
+import gzip
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import zstandard
+
+from services.crawlhub.file_ingest import FileOutputCollector, OutputTailer, iter_file_items
+
+
+class _FakeSink:
+    task_id = "t1"
+
+    def __init__(self):
+        self.batches = []
+        self.failed = 0
+
+    async def is_writable(self):
+        return True
+
+    async def write(self, items):
+        self.batches.append(list(items))
+        return len(items)
+
+    async def add_failed(self, count):
+        self.failed += count
+
+
+class TestIterFileItems:
+    def test_json_array_streamed_across_reads(self, tmp_path, monkeypatch):
+        monkeypatch.setattr("services.crawlhub.file_ingest._READ_SIZE", 7)
+        items = [{"i": i, "price": 1234.5, "tags": ["a", "b"]} for i in range(20)]
+        path = tmp_path / "items.json"
+        path.write_text(json.dumps(items, indent=2))
+
+        assert list(iter_file_items(path)) == items
+
+    def test_json_object(self, tmp_path):
+        path = tmp_path / "item.json"
+        path.write_text('{"a": 1}')
+
+        assert list(iter_file_items(path)) == [{"a": 1}]
+
+    def test_gzip_jsonl_and_csv(self, tmp_path):
+        jsonl = tmp_path / "items.jsonl.gz"
+        with gzip.open(jsonl, "wt") as f:
+            f.write('{"a": 1}\n\n{"a": 2}\n')
+        table = tmp_path / "rows.csv.gz"
+        with gzip.open(table, "wt", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerows([["name", "note"], ["x", "multi\nline"]])
+
+        assert list(iter_file_items(jsonl)) == [{"a": 1}, {"a": 2}]
+        assert list(iter_file_items(table)) == [{"name": "x", "note": "multi\nline"}]
+
+    def test_zstd_jsonl_and_parquet(self, tmp_path):
+        jsonl = tmp_path / "items.jsonl.zst"
+        jsonl.write_bytes(zstandard.ZstdCompressor().compress(b'{"a": 1}\n{"a": 2}\n'))
+        parquet = tmp_path / "rows.parquet"
+        pq.write_table(pa.Table.from_pylist([{"i": i} for i in range(5)]), parquet, row_group_size=2)
+
+        assert list(iter_file_items(jsonl)) == [{"a": 1}, {"a": 2}]
+        assert list(iter_file_items(parquet, batch_size=2)) == [{"i": i} for i in range(5)]
+
+
+class TestFileOutputCollector:
+    async def test_batches_and_counts_bad_rows(self, tmp_path):
+        (tmp_path / "items.jsonl").write_text(
+            "\n".join(json.dumps({"i": i}) for i in range(5)) + "\nnot json\n"
+        )
+        (tmp_path / "image.png").write_bytes(b"\x89PNG")
+        (tmp_path / "data.parquet.zst").write_bytes(b"")
+        sink = _FakeSink()
+
+        collector = FileOutputCollector(sink, batch_size=2)
+        total = await collector.collect(tmp_path)
+
+        assert total == 5
+        assert [len(b) for b in sink.batches] == [2, 2, 1]
+        assert sink.failed == 1
+
+
+class TestOutputTailer:
+    async def test_tails_complete_records_and_drains_on_stop(self, tmp_path):
+        sink = _FakeSink()
+        tailer = OutputTailer(sink, tmp_path)
+        jsonl = tmp_path / "items.jsonl"
+        table = tmp_path / "rows.csv"
+
+        jsonl.write_text('{"a": 1}\n{"a": 2}\n{"a"')
+        table.write_text('name,note\nx,"multi\nline')
+        await tailer.scan()
+
+        assert sink.batches == [[{"a": 1}, {"a": 2}]]
+        assert tailer.offsets == {"items.jsonl": len('{"a": 1}\n{"a": 2}\n'), "rows.csv": len("name,note\n")}
+
+        with open(jsonl, "a") as f:
+            f.write(': 3}\nbad\n{"a": 4}')
+        with open(table, "a") as f:
+            f.write('"\ny,plain\n')
+        await tailer.scan()
+        await tailer.stop()
+
+        items = [item for batch in sink.batches for item in batch]
+        assert items == [
+            {"a": 1}, {"a": 2}, {"a": 3},
+            {"name": "x", "note": "multi\nline"}, {"name": "y", "note": "plain"},
+            {"a": 4},
+        ]
+        assert sink.failed == 1
+        assert tailer.offsets["items.jsonl"] == jsonl.stat().st_size
+
+    async def test_inotify_triggers_scan(self, tmp_path):
+        sink = _FakeSink()
+        tailer = OutputTailer(sink, tmp_path, poll_interval=30)
+        tailer.start()
+        await asyncio.sleep(0.05)
+
+        (tmp_path / "items.jsonl").write_text('{"a": 1}\n')
+        for _ in range(100):
+            if sink.batches:
+                break
+            await asyncio.sleep(0.05)
+        await tailer.stop()
+
+        assert sink.batches == [[{"a": 1}]]
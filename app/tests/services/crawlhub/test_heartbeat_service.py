@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from sqlalchemy.dialects import postgresql
+
+from models.crawlhub import SpiderTask, SpiderTaskStatus
+from services.crawlhub import heartbeat_service
+from services.crawlhub.heartbeat_service import HeartbeatService
+from tests.services.crawlhub.fakes import FakeSession
+
+
+def _tasks(count):
+    return [SpiderTask(id=f"t{i}", spider_id="s", status=SpiderTaskStatus.FAILED) for i in range(count)]
+
+
+class TestHeartbeatService:
+    async def test_sweeps_in_batches_until_partial_batch(self, monkeypatch):
+        monkeypatch.setattr(heartbeat_service, "SWEEP_BATCH_SIZE", 2)
+        session = FakeSession(_tasks(2), _tasks(2), _tasks(1))
+
+        swept = await HeartbeatService(session).sweep_timeouts(datetime(2026, 1, 1))
+
+        assert len(swept) == 5
+        assert len(session.statements) == 3
+        assert session.commits == 3
+
+    async def test_single_indexed_update_statement(self):
+        session = FakeSession([])
+
+        assert await HeartbeatService(session).sweep_timeouts(datetime(2026, 1, 1)) == []
+
+        sql = str(session.statements[0].compile(dialect=postgresql.dialect()))
+        assert sql.startswith("UPDATE crawlhub_tasks SET")
+        assert "crawlhub_tasks.last_heartbeat <" in sql
+        assert "FOR UPDATE SKIP LOCKED" in sql
+        assert "RETURNING" in sql
@@ -0,0 +1,118 @@
+import asyncio
+import json
+
+import pytest
+
+from models.crawlhub import SpiderTaskStatus
+from services.crawlhub import ingest_queue as iq
+from services.crawlhub.ingest_queue import IngestQueue
+from services.crawlhub.run_context import RunContext
+from tests.services.crawlhub.fakes import FakeSession
+
+
+class _Sink:
+    writes = []
+    fail = False
+    failed = 0
+
+    def __init__(self, db, task_id, spider_id, is_test=False, targets=None):
+        self.task_id = task_id
+
+    async def write(self, items):
+        if _Sink.fail:
+            raise RuntimeError("sink down")
+        _Sink.writes.append((self.task_id, list(items)))
+        return len(items)
+
+    async def add_failed(self, count):
+        _Sink.failed += count
+
+
+def _context(task_id="t1", spider_id="s1"):
+    return RunContext(task_id=task_id, spider_id=spider_id, status=SpiderTaskStatus.RUNNING, is_test=False)
+
+
+@pytest.fixture
+def redis(monkeypatch, fake_redis):
+    redis = fake_redis
+    monkeypatch.setattr(iq, "redis_client", redis)
+    monkeypatch.setattr(iq, "TaskSessionLocal", FakeSession)
+    monkeypatch.setattr(iq, "ItemSink", _Sink)
+    _Sink.writes, _Sink.fail, _Sink.failed = [], False, 0
+
+    async def get_context(db, task_id, spider_id):
+        return _context(task_id, spider_id)
+
+    async def claim(spider, items, task_id=None):
+        return items
+
+    monkeypatch.setattr(iq.run_contexts, "get", get_context)
+    monkeypatch.setattr(iq.dedup_service, "claim", claim)
+    return redis
+
+
+class TestIngestQueue:
+    async def test_requests_of_a_task_are_coalesced(self, redis):
+        queue = IngestQueue()
+        queue.enqueue(_context("t1"), [{"n": 1}, {"n": 2}])
+        queue.enqueue(_context("t2", "s2"), [{"n": 3}])
+        queue.enqueue(_context("t1"), [{"n": 4}])
+
+        assert queue.lag()["spiders"] == {"s1": 3, "s2": 1}
+
+        written = await queue.consume("c1", seconds=1)
+
+        assert written == 4
+        assert _Sink.writes == [("t1", [{"n": 1}, {"n": 2}, {"n": 4}]), ("t2", [{"n": 3}])]
+        lag = queue.lag()
+        assert lag["total_items"] == 0 and lag["stream_length"] == 0 and redis.pending == {}
+
+    async def test_failed_writes_stay_pending(self, redis):
+        queue = IngestQueue()
+        queue.enqueue(_context(), [{"n": 1}])
+        _Sink.fail = True
+
+        assert await queue.consume("c1", seconds=1) == 0
+        assert len(redis.pending) == 1
+        assert queue.lag()["total_items"] == 1
+
+    async def test_expired_failures_are_dropped_and_counted(self, redis, monkeypatch):
+        queue = IngestQueue()
+        queue.enqueue(_context(), [{"n": 1}, {"n": 2}])
+        _Sink.fail = True
+        monkeypatch.setattr(iq, "_MAX_AGE_SECONDS", -1)
+
+        await queue.consume("c1", seconds=1)
+
+        assert _Sink.failed == 2 and redis.pending == {} and queue.lag()["total_items"] == 0
+
+    async def test_run_consumes_until_stopped(self, redis):
+        queue = IngestQueue()
+        stop = asyncio.Event()
+        consumer = asyncio.create_task(queue.run(stop, "c1"))
+
+        queue.enqueue(_context(), [{"n": 1}])
+        for _ in range(100):
+            if _Sink.writes:
+                break
+            await asyncio.sleep(0.01)
+        stop.set()
+        await asyncio.wait_for(consumer, 1)
+
+        assert _Sink.writes == [("t1", [{"n": 1}])] and redis.pending == {}
+
+    def test_retry_after_scales_with_lag(self, redis, monkeypatch):
+        monkeypatch.setattr(iq, "INGEST_MAX_LAG", 100)
+        queue = IngestQueue()
+
+        queue.enqueue(_context(), [{}] * 50)
+        assert queue.retry_after() is None
+        queue.enqueue(_context(), [{}] * 150)
+        assert queue.retry_after() == 10
+
+    def test_entries_keep_unicode(self, redis):
+        IngestQueue().enqueue(_context(), [{"title": "标题"}])
+
+        ((_, fields),) = redis.streams[iq.INGEST_STREAM]
+
+        assert json.loads(fields[b"items"]) == [{"title": "标题"}]
@@ -0,0 +1,80 @@
+import json
+
+from models.crawlhub import Spider
+from services.crawlhub import item_schema
+from services.crawlhub.item_schema import ItemSchemaCache
+
+SCHEMA = {
+    "type": "object",
+    "required": ["url", "price"],
+    "properties": {
+        "url": {"type": "string", "format": "uri"},
+        "price": {"type": "number", "minimum": 0},
+        "status": {"enum": ["on_sale", "sold_out"]},
+        "seller": {
+            "type": "object",
+            "required": ["name"],
+            "properties": {"name": {"type": "string"}},
+        },
+    },
+}
+
+
+def _spider(schema=SCHEMA, spider_id="s1"):
+    raw = schema if isinstance(schema, str) else json.dumps(schema)
+    return Spider(id=spider_id, name=spider_id, item_schema=raw)
+
+
+class TestItemValidator:
+    def test_nested_objects_and_enums(self):
+        validator = ItemSchemaCache().get(_spider())
+        items = [
+            {"url": "https://a.com/1", "price": 1.5, "status": "on_sale", "seller": {"name": "x"}},
+            {"url": "https://a.com/2", "price": 2, "seller": {}},
+            {"url": "https://a.com/3", "price": 3, "status": "unknown"},
+            {"url": "https://a.com/4"},
+        ]
+
+        valid, rejected = validator.validate(items)
+
+        assert [item["price"] for item in valid] == [1.5]
+        assert len(rejected) == 3
+        assert validator.describe(rejected[0]).startswith("seller:")
+        assert "required" in validator.describe(rejected[2])
+
+
+class TestItemSchemaCache:
+    def test_compiled_once_per_schema(self, monkeypatch):
+        compiled = []
+        original = item_schema.ItemValidator
+
+        def counting(schema):
+            compiled.append(schema)
+            return original(schema)
+
+        monkeypatch.setattr(item_schema, "ItemValidator", counting)
+        cache = ItemSchemaCache()
+
+        first = cache.get(_spider())
+        assert cache.get(_spider()) is first
+        # schema 变更后重新编译
+        changed = cache.get(_spider({**SCHEMA, "required": ["url"]}))
+
+        assert changed is not first
+        assert len(compiled) == 2
+
+    def test_invalid_schema_disables_validation(self):
+        cache = ItemSchemaCache()
+
+        assert cache.get(_spider("{not json")) is None
+        assert cache.get(_spider({"type": "nope"})) is None
+        assert cache.get(Spider(id="s2", name="s2")) is None
+
+    def test_lru_eviction_and_invalidate(self):
+        cache = ItemSchemaCache(max_size=2)
+        cache.get(_spider(spider_id="a"))
+        cache.get(_spider(spider_id="b"))
+        cache.get(_spider(spider_id="c"))
+        cache.invalidate("c")
+
+        assert list(cache._cache) == ["b"]
@@ -0,0 +1,110 @@
+import operator
+import zlib
+
+import pytest
+
+from extensions.ext_mongodb import mongodb_client
+from services.crawlhub.log_service import LogChunkWriter, LogService
+from tests.services.crawlhub.fakes import FakeCursor
+
+_OPS = {"$lte": operator.le, "$gte": operator.ge, "$lt": operator.lt}
+
+
+def _match(doc, query):
+    for key, cond in query.items():
+        value = doc.get(key)
+        if isinstance(cond, dict):
+            if not all(_OPS[op](value, arg) for op, arg in cond.items()):
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+class _FakeCollection:
+    def __init__(self):
+        self.docs = []
+
+    async def insert_one(self, doc):
+        assert not any(d["task_id"] == doc["task_id"] and d["seq"] == doc["seq"] for d in self.docs)
+        self.docs.append(dict(doc))
+
+    async def find_one(self, query, projection=None, sort=None):
+        docs = [d for d in self.docs if _match(d, query)]
+        if sort:
+            key, direction = sort[0]
+            docs.sort(key=lambda d: d[key], reverse=direction < 0)
+        return docs[0] if docs else None
+
+    def find(self, query):
+        return FakeCursor([d for d in self.docs if _match(d, query)])
+
+
+@pytest.fixture
+def chunks(monkeypatch):
+    collection = _FakeCollection()
+    monkeypatch.setattr(mongodb_client, "is_enabled", lambda: True)
+    monkeypatch.setattr(mongodb_client, "get_collection", lambda name: collection)
+    monkeypatch.setattr(LogService, "_indexes_created", True)
+    return collection
+
+
+class TestLogChunks:
+    async def test_chunks_split_on_line_boundaries(self, chunks):
+        lines = [f"line {i:04d}".encode() for i in range(100)]
+        async with LogChunkWriter("t1", "s1", chunk_bytes=64, flush_interval=60) as writer:
+            for line in lines:
+                await writer.write("stdout", line + b"\n")
+            await writer.write("stderr", b"Traceback\nError: boom")
+
+        stdout = sorted((d for d in chunks.docs if d["stream"] == "stdout"), key=lambda d: d["seq"])
+        assert len(stdout) > 1
+        assert all(d["length"] <= 64 for d in stdout)
+        assert all(zlib.decompress(d["data"]).endswith(b"\n") for d in stdout)
+
+        service = LogService()
+        full = await service.read_range("t1", "stdout", offset=0)
+        assert full["content"].encode() == b"\n".join(lines) + b"\n"
+        assert full["next_offset"] == len(full["content"])
+
+        middle = await service.read_range("t1", "stdout", offset=100, limit=30)
+        assert middle["content"].encode() == (b"\n".join(lines) + b"\n")[100:130]
+
+        tail = await service.read_tail("t1", "stdout", lines=3)
+        assert tail["content"] == "line 0097\nline 0098\nline 0099\n"
+        assert tail["next_offset"] == full["next_offset"]
+
+        stderr = await service.read_tail("t1", "stderr", lines=1)
+        assert stderr["content"] == "Error: boom"
+
+    async def test_retry_appends_after_existing_chunks(self, chunks):
+        async with LogChunkWriter("t1", "s1") as writer:
+            await writer.write("stdout", b"first attempt\n")
+        async with LogChunkWriter("t1", "s1") as writer:
+            await writer.write("stdout", b"second attempt\n")
+
+        assert [d["seq"] for d in chunks.docs] == [0, 1]
+        data = await LogService().read_range("t1", "stdout")
+        assert data["content"] == "first attempt\nsecond attempt\n"
+
+    async def test_failed_insert_does_not_shift_offsets(self, chunks, monkeypatch):
+        monkeypatch.setattr("services.crawlhub.log_service._EMIT_RETRY_DELAY", 0)
+        insert_one = chunks.insert_one
+        failures = iter([True, False, True, True, True])
+
+        async def flaky_insert(doc):
+            if next(failures, False):
+                raise ConnectionError("mongo down")
+            await insert_one(doc)
+
+        monkeypatch.setattr(chunks, "insert_one", flaky_insert)
+        async with LogChunkWriter("t1", "s1", chunk_bytes=8, flush_interval=60) as writer:
+            # 第一块重试后写入，第二块重试耗尽被丢弃，第三块紧接第一块之后
+            await writer.write("stdout", b"aaaaaaa\n")
+            await writer.write("stdout", b"bbbbbbb\n")
+            await writer.write("stdout", b"ccccccc\n")
+
+        assert [(d["seq"], d["offset"]) for d in chunks.docs] == [(0, 0), (1, 8)]
+        data = await LogService().read_range("t1", "stdout")
+        assert data["content"] == "aaaaaaa\nccccccc\n"
+        assert data["next_offset"] == 16
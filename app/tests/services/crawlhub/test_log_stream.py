@@ -0,0 +1,116 @@
+import asyncio
+
+from services.crawlhub import log_stream
+from services.crawlhub.log_service import LogService
+from services.crawlhub.log_stream import TeePipe, parse_event_id
+from services.crawlhub.stdout_ingest import StdoutItemIngestor
+
+
+def _reader(*chunks: bytes) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader()
+    for chunk in chunks:
+        reader.feed_data(chunk)
+    reader.feed_eof()
+    return reader
+
+
+async def _collect(stream: log_stream.TestRunStream, last_event_id: str | None = None) -> list[dict]:
+    return [event async for event in stream.events(last_event_id)]
+
+
+class TestTestRunStream:
+    async def test_pumps_both_pipes_and_batches_lines(self):
+        stream = log_stream.TestRunStream("t1", batch_interval=0)
+        tee = TeePipe()
+
+        tail = await asyncio.gather(
+            stream.pump("stdout", _reader(b"a\nb", b"\nc\n"), tee=tee),
+            stream.pump("stderr", _reader(b"x" * 10 + b"\n"), tail_bytes=4),
+        )
+        stream.close()
+        events = await _collect(stream)
+
+        assert tail[1] == b"xxx\n"
+        assert await tee.read() == b"a\nb\nc\n"
+        stdout = [line for e in events if e["event"] == "stdout" for line in e["data"]["lines"]]
+        assert stdout == ["a", "b", "c"]
+        assert parse_event_id(events[-1]["id"])[0] == {"stdout": 6, "stderr": 11}
+
+    async def test_slow_ingest_bounds_tee_buffer(self):
+        peak = 0
+
+        class _SlowSink:
+            task_id = "t1"
+            written = 0
+
+            async def is_writable(self):
+                return True
+
+            async def write(self, items):
+                nonlocal peak
+                peak = max(peak, tee.buffered)
+                await asyncio.sleep(0.01)
+                self.written += len(items)
+                return len(items)
+
+            async def task_total_count(self):
+                return 0
+
+        line = b'{"text": "' + b"x" * 1000 + b'"}\n'
+        output = line * 4000
+        stream = log_stream.TestRunStream("t1", buffer_bytes=4096, batch_interval=0)
+        tee = TeePipe(max_bytes=64 * 1024)
+        ingestor = StdoutItemIngestor(_SlowSink(), batch_size=50)
+
+        chunks = [output[i:i + 65536] for i in range(0, len(output), 65536)]
+
+        await asyncio.gather(
+            stream.pump("stdout", _reader(*chunks), tee=tee),
+            ingestor.consume(tee),
+        )
+
+        assert ingestor.ingested == 4000
+        # 缓冲区最多超出上限一个读取块
+        assert 0 < peak <= 64 * 1024 + 65536
+
+    async def test_resume_skips_delivered_lines(self):
+        stream = log_stream.TestRunStream("t1", batch_interval=0)
+        for i in range(5):
+            stream.publish_line("stdout", f"line {i}\n".encode())
+        stream.close()
+
+        first = await _collect(stream)
+        resumed_from = f"{len(b'line 0\n') * 2}:0"
+        resumed = await _collect(stream, resumed_from)
+
+        assert sum(len(e["data"]["lines"]) for e in first) == 5
+        assert resumed[0]["data"]["lines"] == ["line 2", "line 3", "line 4"]
+
+    async def test_evicted_lines_replayed_from_chunk_store(self, monkeypatch):
+        reads = []
+
+        async def read_range(self, task_id, stream, offset=0, limit=0):
+            reads.append((stream, offset, limit))
+            content = "".join(f"line {i}\n" for i in range(10))[offset:offset + limit]
+            return {"stream": stream, "offset": offset, "next_offset": offset + len(content), "content": content}
+
+        monkeypatch.setattr(LogService, "read_range", read_range)
+        stream = log_stream.TestRunStream("t1", buffer_bytes=14, batch_interval=0)
+        for i in range(10):
+            stream.publish_line("stdout", f"line {i}\n".encode())
+        stream.close()
+
+        events = await _collect(stream)
+
+        lines = [line for e in events for line in e["data"]["lines"]]
+        assert lines == [f"line {i}" for i in range(10)]
+        assert events[0]["data"]["replayed"] is True
+        assert reads == [("stdout", 0, 56)]
+
+    async def test_wait_detached_after_last_subscriber_leaves(self):
+        stream = log_stream.TestRunStream("t1", batch_interval=0)
+        stream.publish_event("status", {"status": "pending"})
+        stream.close()
+        await _collect(stream)
+
+        await asyncio.wait_for(stream.wait_detached(grace=0.05), timeout=2)
@@ -0,0 +1,105 @@
+from datetime import datetime
+
+import pytest
+
+from models.crawlhub import (
+    DataSource,
+    DataSourceStatus,
+    DataSourceType,
+    Spider,
+    SpiderDataSource,
+    SpiderTask,
+    SpiderTaskStatus,
+)
+from services.crawlhub import run_context
+from services.crawlhub.run_context import RunContextCache
+from tests.services.crawlhub.fakes import FakeSession
+
+
+def _rows():
+    task = SpiderTask(id="t1", spider_id="s1", status=SpiderTaskStatus.RUNNING, is_test=False,
+                      started_at=datetime(2026, 1, 1))
+    spider = Spider(id="s1", name="s1", project_id="p1", item_schema='{"type": "object"}',
+                    dedup_enabled=True, dedup_fields="url", script_content="x" * 1000)
+    assoc = SpiderDataSource(id="a1", spider_id="s1", datasource_id="d1", target_table="items", is_enabled=True)
+    datasource = DataSource(id="d1", name="pg", type=DataSourceType.POSTGRESQL,
+                            status=DataSourceStatus.ACTIVE, host="db", port=5432, password="s3cret",
+                            connection_options={"sslmode": "disable"})
+    return [(task, spider, assoc, datasource)]
+
+
+def _session(rows) -> FakeSession:
+    def respond(statement):
+        # 按 ID 加载数据源的查询只选择 DataSource 一列
+        if len(statement.column_descriptions) == 1:
+            return [row[-1] for row in rows]
+        return rows
+
+    return FakeSession(respond=respond)
+
+
+@pytest.fixture
+def redis(monkeypatch, fake_redis):
+    monkeypatch.setattr(run_context, "redis_client", fake_redis)
+    return fake_redis
+
+
+class TestRunContextCache:
+    async def test_loads_once_then_serves_from_cache(self, redis):
+        session = _session(_rows())
+        cache = RunContextCache()
+
+        context = await cache.get(session, "t1", "s1")
+        again = await cache.get(session, "t1", "s1")
+
+        assert session.queries == 1
+        assert again is context
+        assert context.status == SpiderTaskStatus.RUNNING
+        assert context.spider.dedup_fields == "url"
+        # 不缓存脚本内容
+        assert context.spider.script_content is None
+        assoc, datasource = context.targets[0]
+        assert assoc.target_table == "items"
+        assert datasource.type == DataSourceType.POSTGRESQL and datasource.connection_options == {"sslmode": "disable"}
+
+    async def test_other_process_reads_redis(self, redis):
+        await RunContextCache().get(_session(_rows()), "t1", "s1")
+        session = _session(_rows())
+
+        cache = RunContextCache()
+        context = await cache.get(session, "t1", "s1")
+        cache._local.clear()
+        await cache.get(session, "t1", "s1")
+
+        # 数据源凭据不进入 Redis，按 ID 从数据库加载一次后缓存在进程内
+        assert session.queries == 1
+        assert context.targets[0][1].host == "db"
+        assert context.targets[0][1].password == "s3cret"
+        assert all(b"s3cret" not in value and b'"host"' not in value for value in redis.data.values())
+
+    async def test_invalidate_task_and_spider(self, redis):
+        cache = RunContextCache()
+        session = _session(_rows())
+        await cache.get(session, "t1", "s1")
+
+        cache.invalidate_task("t1")
+        await cache.get(session, "t1", "s1")
+        cache.invalidate_spider("s1")
+        await cache.get(session, "t1", "s1")
+
+        assert session.queries == 3
+
+    async def test_missing_task(self, redis):
+        assert await RunContextCache().get(_session([]), "t1", "s1") is None
+
+    async def test_get_task_reads_only_task_key(self, redis):
+        await RunContextCache().get(_session(_rows()), "t1", "s1")
+        redis.delete("crawlhub:run_context:spider:s1")
+        session = _session([])
+
+        context = await RunContextCache().get_task(session, "t1")
+
+        assert session.queries == 0
+        assert context.status == SpiderTaskStatus.RUNNING
+        assert context.started_at == datetime(2026, 1, 1)
+        assert context.spider is None
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+
+from models.crawlhub import Spider
+from services.crawlhub.schedule_service import (
+    ScheduleService,
+    next_cron_run,
+    refresh_next_run,
+    schedule_offset,
+)
+from tests.services.crawlhub.fakes import FakeSession
+
+
+def _spider(spider_id, next_run_at, cron_expr="*/5 * * * *"):
+    return Spider(id=spider_id, name=spider_id, is_active=True, cron_expr=cron_expr, next_run_at=next_run_at)
+
+
+class TestNextCronRun:
+    def test_next_run(self):
+        assert next_cron_run("*/5 * * * *", datetime(2026, 1, 1, 10, 3)) == datetime(2026, 1, 1, 10, 5)
+
+    def test_empty_or_invalid(self):
+        assert next_cron_run(None) is None
+        assert next_cron_run("  ") is None
+        assert next_cron_run("not a cron") is None
+
+    def test_jitter_is_deterministic_and_bounded(self):
+        spider = _spider("s1", None, cron_expr="0 * * * *")
+        spider.schedule_jitter_seconds = 300
+
+        refresh_next_run(spider, datetime(2026, 1, 1, 10, 30))
+        offset = (spider.next_run_at - datetime(2026, 1, 1, 11, 0)).total_seconds()
+
+        assert 0 <= offset <= 300
+        assert offset == schedule_offset("s1", 300)
+        assert {schedule_offset(f"s{i}", 300) for i in range(20)} != {offset}
+
+    def test_inactive_spider_leaves_index(self):
+        spider = _spider("s1", datetime(2026, 1, 1))
+        spider.is_active = False
+
+        refresh_next_run(spider)
+
+        assert spider.next_run_at is None
+
+
+class TestPopDue:
+    async def test_skips_active_and_misfired_and_advances_all(self):
+        now = datetime(2026, 1, 1, 10, 0, 30)
+        spiders = [
+            _spider("due", datetime(2026, 1, 1, 10, 0)),
+            _spider("busy", datetime(2026, 1, 1, 10, 0)),
+            _spider("stale", now - timedelta(hours=3)),
+        ]
+        session = FakeSession(spiders, ["busy"])
+
+        due = await ScheduleService(session).pop_due(now)
+
+        assert [(spider.id, task.spider_id) for spider, task in due] == [("due", "due")]
+        assert [(t.trigger_type, t.scheduled_for) for t in session.added] == [
+            ("schedule", datetime(2026, 1, 1, 10, 0))
+        ]
+        assert session.queries == 2
+        assert session.commits == 1
+        assert all(s.next_run_at == datetime(2026, 1, 1, 10, 5) for s in spiders)
+
+    async def test_nothing_due(self):
+        session = FakeSession([])
+
+        assert await ScheduleService(session).pop_due(datetime.utcnow()) == []
+        assert session.commits == 0
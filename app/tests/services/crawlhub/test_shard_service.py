@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+from models.crawlhub import SpiderTask, SpiderTaskStatus
+from services.crawlhub.shard_service import ShardService, partition_start_urls
+from tests.services.crawlhub.fakes import FakeSession
+
+
+def _shard(index, status, **kwargs):
+    return SpiderTask(
+        spider_id="s1",
+        parent_task_id="p1",
+        shard_index=index,
+        shard_count=3,
+        status=status,
+        progress=kwargs.pop("progress", 0),
+        total_count=kwargs.pop("total_count", 0),
+        success_count=kwargs.pop("success_count", 0),
+        failed_count=0,
+        **kwargs,
+    )
+
+
+class TestPartitionStartUrls:
+    def test_round_robin(self):
+        urls = "https://a\nhttps://b\n https://c https://d\n\nhttps://e"
+
+        parts = [partition_start_urls(urls, i, 2) for i in range(2)]
+
+        assert parts == [["https://a", "https://c", "https://e"], ["https://b", "https://d"]]
+
+    def test_empty(self):
+        assert partition_start_urls(None, 0, 4) == []
+
+
+class TestShardRollup:
+    async def test_running_shards_roll_up_counts_and_progress(self):
+        now = datetime.utcnow()
+        parent = SpiderTask(id="p1", spider_id="s1", shard_count=3, status=SpiderTaskStatus.RUNNING)
+        shards = [
+            _shard(0, SpiderTaskStatus.COMPLETED, total_count=10, success_count=10, finished_at=now),
+            _shard(1, SpiderTaskStatus.RUNNING, progress=50, total_count=5, success_count=5, last_heartbeat=now),
+            _shard(2, SpiderTaskStatus.PENDING),
+        ]
+
+        result = await ShardService(FakeSession([parent], shards)).rollup("p1")
+
+        assert result.status == SpiderTaskStatus.RUNNING
+        assert result.total_count == 15
+        assert result.success_count == 15
+        assert result.progress == 50
+        assert result.last_heartbeat == now
+        assert result.finished_at is None
+
+    async def test_failed_shard_fails_parent_when_all_done(self):
+        now = datetime.utcnow()
+        parent = SpiderTask(id="p1", spider_id="s1", shard_count=3, status=SpiderTaskStatus.RUNNING)
+        shards = [
+            _shard(0, SpiderTaskStatus.COMPLETED, finished_at=now - timedelta(seconds=5)),
+            _shard(1, SpiderTaskStatus.FAILED, finished_at=now, error_message="boom", error_category="network"),
+            _shard(2, SpiderTaskStatus.COMPLETED, finished_at=now - timedelta(seconds=1)),
+        ]
+
+        result = await ShardService(FakeSession([parent], shards)).rollup("p1")
+
+        assert result.status == SpiderTaskStatus.FAILED
+        assert result.error_category == "network"
+        assert "1/3" in result.error_message and "boom" in result.error_message
+        assert result.finished_at == now
+        assert result.progress == 100
+
+    async def test_cancelled_parent_stays_cancelled(self):
+        parent = SpiderTask(id="p1", spider_id="s1", shard_count=3, status=SpiderTaskStatus.CANCELLED)
+        shards = [_shard(i, SpiderTaskStatus.COMPLETED) for i in range(3)]
+
+        result = await ShardService(FakeSession([parent], shards)).rollup("p1")
+
+        assert result.status == SpiderTaskStatus.CANCELLED
@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import pytest
+
+from models import engine
+from services.crawlhub.spider_executor import SpiderExecutor
+
+
+@pytest.fixture
+def executor():
+    executor = SpiderExecutor(slots=2, memory_budget_mb=1000, default_task_mb=400)
+    executor.start()
+    yield executor
+    executor.shutdown(timeout=1)
+
+
+class TestSpiderExecutor:
+    def test_run_async_uses_shared_loop(self, executor):
+        async def current_loop():
+            return asyncio.get_running_loop()
+
+        assert engine.run_async(current_loop()) is executor.loop
+        assert engine.run_async(current_loop()) is executor.loop
+
+    def test_slots_and_memory_budget_limit_concurrency(self, executor):
+        peak = {"active": 0, "max": 0, "max_mb": 0}
+
+        async def job(memory_mb):
+            async with executor.slot(memory_mb):
+                peak["active"] += 1
+                peak["max"] = max(peak["max"], peak["active"])
+                peak["max_mb"] = max(peak["max_mb"], executor._reserved_mb)
+                await asyncio.sleep(0.05)
+                peak["active"] -= 1
+
+        async def main():
+            # 600 + 600 超出预算，2000 超出总预算时独占执行
+            await asyncio.gather(job(600), job(600), job(None), job(None), job(2000))
+
+        executor.run(main())
+
+        assert peak["max"] == 2
+        assert peak["max_mb"] <= 1000
+        assert executor._active == 0
+        assert executor._reserved_mb == 0
+
+    def test_slot_is_noop_outside_executor_loop(self, executor):
+        async def main():
+            async with executor.slot(10_000):
+                return executor._active
+
+        assert asyncio.run(main()) == 0
+
+    def test_shutdown_cancels_after_drain_timeout(self):
+        executor = SpiderExecutor(slots=1)
+        executor.start()
+        cancelled = []
+
+        async def forever():
+            try:
+                await asyncio.sleep(3600)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        future = asyncio.run_coroutine_threadsafe(executor._track(forever()), executor.loop)
+        while not executor._inflight:
+            time.sleep(0.01)
+        executor.shutdown(timeout=0.1)
+
+        assert cancelled == [True]
+        assert future.cancelled()
+        assert engine._task_runner is None
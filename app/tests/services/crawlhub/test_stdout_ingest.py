@@ -0,0 +1,95 @@
+import asyncio
+import json
+
+from services.crawlhub.stdout_ingest import StdoutItemIngestor
+
+
+class _FakeSink:
+    task_id = "t1"
+
+    def __init__(self):
+        self.batches = []
+        self.total_count = 0
+        self.written = 0
+
+    async def is_writable(self):
+        return True
+
+    async def write(self, items):
+        self.batches.append(list(items))
+        self.total_count += len(items)
+        self.written += len(items)
+        return len(items)
+
+    async def task_total_count(self):
+        return self.total_count
+
+
+def _stream(*chunks: bytes) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader()
+    for chunk in chunks:
+        reader.feed_data(chunk)
+    reader.feed_eof()
+    return reader
+
+
+class TestStdoutItemIngestor:
+    async def test_ndjson_lines_are_batched(self):
+        sink = _FakeSink()
+        ingestor = StdoutItemIngestor(sink, batch_size=2)
+        lines = [json.dumps({"i": i}) for i in range(5)]
+        output = ("starting\n" + "\n".join(lines) + "\n").encode()
+
+        # 拆成小块，验证跨块拼行
+        await ingestor.consume(_stream(*[output[i:i + 7] for i in range(0, len(output), 7)]))
+
+        assert [len(b) for b in sink.batches] == [2, 2, 1]
+        assert ingestor.ingested == 5
+        assert ingestor.log_text().splitlines()[0] == "starting"
+
+    async def test_array_line_yields_multiple_items(self):
+        sink = _FakeSink()
+        ingestor = StdoutItemIngestor(sink)
+
+        await ingestor.consume(_stream(b'[{"a": 1}, {"a": 2}]'))
+
+        assert sink.batches == [[{"a": 1}, {"a": 2}]]
+
+    async def test_oversized_line_is_skipped(self):
+        sink = _FakeSink()
+        ingestor = StdoutItemIngestor(sink, max_line_bytes=64)
+        big = b'{"x": "' + b"a" * 500 + b'"}\n'
+
+        await ingestor.consume(_stream(big[:100], big[100:], b'{"ok": 1}\n'))
+
+        assert sink.batches == [[{"ok": 1}]]
+        assert ingestor.oversized_lines == 1
+
+    async def test_legacy_multiline_json(self):
+        sink = _FakeSink()
+        ingestor = StdoutItemIngestor(sink)
+
+        await ingestor.consume(_stream(json.dumps([{"a": 1}, {"a": 2}], indent=2).encode()))
+        assert sink.batches == []
+        await ingestor.finalize()
+
+        assert sink.batches == [[{"a": 1}, {"a": 2}]]
+
+    async def test_stops_when_sdk_reports(self):
+        sink = _FakeSink()
+        sink.total_count = 10
+        ingestor = StdoutItemIngestor(sink)
+
+        await ingestor.consume(_stream(b'{"a": 1}\n'))
+
+        assert sink.batches == []
+        assert not ingestor.enabled
+
+    async def test_log_keeps_tail(self):
+        ingestor = StdoutItemIngestor(_FakeSink(), log_max_bytes=20)
+
+        await ingestor.consume(_stream(b"".join(f"line{i}\n".encode() for i in range(10))))
+
+        log = ingestor.log_text()
+        assert log.startswith("...[")
+        assert log.endswith("line9")
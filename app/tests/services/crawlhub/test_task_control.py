@@ -0,0 +1,95 @@
+import contextlib
+import json
+
+import pytest
+
+from models.crawlhub import SpiderTaskStatus
+from services.crawlhub import task_control
+from services.crawlhub.run_context import RunContext
+from services.crawlhub.task_control import (
+    CONTROL_CANCEL,
+    CONTROL_CHANNEL,
+    CONTROL_RATE_LIMIT,
+    poll_control,
+    read_control,
+    send_control,
+)
+from tests.services.crawlhub.fakes import FakeSession
+
+
+@pytest.fixture
+def redis(monkeypatch, fake_redis):
+    monkeypatch.setattr(task_control, "redis_client", fake_redis)
+    return fake_redis
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    """poll_control 打开的数据库会话；任务 t1 属于爬虫 s1"""
+    opened = []
+
+    def session_factory():
+        opened.append(FakeSession())
+        return opened[-1]
+
+    async def get_task(db, task_id):
+        if task_id != "t1":
+            return None
+        return RunContext(task_id="t1", spider_id="s1", status=SpiderTaskStatus.RUNNING, is_test=False)
+
+    monkeypatch.setattr(task_control, "AsyncSessionLocal", session_factory)
+    monkeypatch.setattr(task_control.run_contexts, "get_task", get_task)
+    return opened
+
+
+class TestTaskControl:
+    def test_messages_are_read_in_order_after_cursor(self, redis):
+        send_control("t1", CONTROL_RATE_LIMIT, {"rps": 2})
+        send_control("t1", CONTROL_CANCEL)
+
+        messages, cursor = read_control("t1")
+        assert [(m["type"], m["data"]) for m in messages] == [("rate_limit", {"rps": 2}), ("cancel", {})]
+
+        assert read_control("t1", cursor) == ([], cursor)
+        send_control("t1", CONTROL_RATE_LIMIT, {"rps": 5})
+        messages, _ = read_control("t1", cursor)
+        assert [m["data"] for m in messages] == [{"rps": 5}]
+
+    def test_send_wakes_waiting_pollers(self, redis):
+        send_control("t1", CONTROL_CANCEL)
+
+        assert [(channel, json.loads(message)) for channel, message in redis.published] == [
+            (CONTROL_CHANNEL, {"task_id": "t1", "data": {"type": "cancel"}})
+        ]
+
+    async def test_hub_pushes_raw_notification(self):
+        async with task_control.task_control_hub.subscribe("t1") as subscription:
+            task_control.task_control_hub.dispatch("t1", {"type": "cancel"})
+
+            assert await subscription.next(timeout=1) == {"type": "cancel"}
+
+    async def test_poll_releases_db_session_before_waiting(self, redis, sessions, monkeypatch):
+        waited = []
+
+        class _Subscription:
+            async def next(self, timeout):
+                # 等待期间不持有数据库连接
+                waited.append((timeout, [session.closed for session in sessions]))
+                send_control("t1", CONTROL_CANCEL)
+                return {"type": CONTROL_CANCEL}
+
+        @contextlib.asynccontextmanager
+        async def subscribe(task_id):
+            yield _Subscription()
+
+        monkeypatch.setattr(task_control.task_control_hub, "subscribe", subscribe)
+
+        messages, _ = await poll_control("t1", "s1", wait=25)
+
+        assert waited == [(25, [True])]
+        assert [m["type"] for m in messages] == [CONTROL_CANCEL]
+
+    async def test_poll_validates_task(self, redis, sessions):
+        assert await poll_control("missing", "s1") is None
+        with pytest.raises(ValueError):
+            await poll_control("t1", "other")
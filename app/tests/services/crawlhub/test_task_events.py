@@ -0,0 +1,55 @@
+import asyncio
+import json
+
+import pytest
+
+from services.crawlhub import task_events
+from services.crawlhub.task_events import TaskEventHub
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    hub = TaskEventHub()
+    # 不启动订阅线程，直接调用消息回调
+    monkeypatch.setattr(hub, "_ensure_started", lambda: setattr(hub, "_loop", asyncio.get_running_loop()))
+    return hub
+
+
+def _message(task_id: str, **data) -> bytes:
+    return json.dumps({"task_id": task_id, "data": {k: str(v) for k, v in data.items()}}).encode()
+
+
+class TestTaskEventHub:
+    async def test_fans_out_to_all_subscribers_of_task(self, hub):
+        async with hub.subscribe("t1") as a, hub.subscribe("t1") as b, hub.subscribe("t2") as other:
+            hub._on_message(_message("t1", status="running", progress=40))
+
+            first = await a.next(timeout=1)
+            second = await b.next(timeout=1)
+            missing = await other.next(timeout=0.05)
+
+        assert first == second == {"status": "running", "progress": 40}
+        assert missing is None
+        assert hub._subscribers == {}
+
+    async def test_slow_subscriber_gets_latest_snapshot(self, hub):
+        async with hub.subscribe("t1") as subscription:
+            for progress in (10, 20, 30):
+                hub._on_message(_message("t1", progress=progress))
+            await asyncio.sleep(0)
+
+            latest = await subscription.next(timeout=1)
+            nothing = await subscription.next(timeout=0.05)
+
+        assert latest == {"progress": 30}
+        assert nothing is None
+
+    async def test_messages_without_subscribers_are_dropped(self, hub, monkeypatch):
+        dispatched = []
+        monkeypatch.setattr(hub, "dispatch", lambda *args: dispatched.append(args))
+
+        hub._on_message(_message("t1", progress=10))
+        hub._on_message(b"not json")
+
+        assert dispatched == []
+        assert task_events.TELEMETRY_CHANNEL == hub.channel
@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+from models.crawlhub import SpiderTaskStatus
+from services.crawlhub import task_signals
+from services.crawlhub.task_signals import CancelWatcher, publish_cancel
+
+
+@pytest.fixture
+def redis(monkeypatch, fake_redis):
+    monkeypatch.setattr(task_signals, "redis_client", fake_redis)
+    return fake_redis
+
+
+class TestCancelWatcher:
+    async def test_receives_published_cancel(self, redis):
+        async with CancelWatcher("t1") as watcher:
+            for _ in range(50):
+                if redis.subscribers.get("crawlhub:task_cancel:t1"):
+                    break
+                await asyncio.sleep(0.02)
+            publish_cancel("t1")
+            await asyncio.wait_for(watcher.event.wait(), timeout=2)
+
+        assert watcher.cancelled
+
+    async def test_cancel_before_subscribe_is_not_lost(self, redis):
+        publish_cancel("t2")
+
+        async with CancelWatcher("t2") as watcher:
+            await asyncio.wait_for(watcher.event.wait(), timeout=2)
+
+    async def test_other_task_does_not_trigger(self, redis):
+        async with CancelWatcher("t3") as watcher:
+            publish_cancel("t4")
+            await asyncio.sleep(0.2)
+
+        assert not watcher.cancelled
+
+    async def test_db_check_catches_lost_cancel(self, redis, monkeypatch):
+        statuses = iter([SpiderTaskStatus.RUNNING, SpiderTaskStatus.CANCELLED])
+
+        async def load_status(self):
+            return next(statuses)
+
+        monkeypatch.setattr(CancelWatcher, "_load_status", load_status)
+        async with CancelWatcher("t5", db_check_interval=0.05) as watcher:
+            await asyncio.wait_for(watcher.event.wait(), timeout=2)
+
+        assert watcher.cancelled
@@ -0,0 +1,110 @@
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from models.crawlhub import SpiderTask, SpiderTaskStatus
+from services.crawlhub import task_telemetry as tt
+from services.crawlhub.task_telemetry import TaskTelemetry
+from tests.services.crawlhub.fakes import FakeSession
+
+
+@pytest.fixture
+def telemetry(monkeypatch, fake_redis):
+    monkeypatch.setattr(tt, "redis_client", fake_redis)
+    return TaskTelemetry()
+
+
+def _running_task(**kwargs) -> SpiderTask:
+    return SpiderTask(
+        id="t1", spider_id="s1", status=SpiderTaskStatus.RUNNING,
+        started_at=datetime(2026, 1, 1), **kwargs,
+    )
+
+
+class TestTaskTelemetry:
+    def test_counts_accumulate_from_database_baseline(self, telemetry):
+        telemetry.start(_running_task(total_count=10, success_count=8, failed_count=2))
+        telemetry.add_counts("t1", success=5)
+        telemetry.add_counts("t1", failed=3)
+        # 重复 start（如重试）不重置已有计数
+        telemetry.start(_running_task(total_count=0, success_count=0, failed_count=0))
+
+        live = telemetry.get("t1")
+
+        assert (live["total_count"], live["success_count"], live["failed_count"]) == (15, 13, 5)
+        assert live["status"] == "running"
+        assert live["started_at"] == datetime(2026, 1, 1)
+
+    def test_heartbeat_keeps_peak_memory(self, telemetry):
+        telemetry.heartbeat("t1", memory_mb=300.5, items_per_second=1.5)
+        telemetry.heartbeat("t1", memory_mb=120)
+
+        live = telemetry.get("t1")
+
+        assert live["peak_memory_mb"] == 300
+        assert live["items_per_second"] == 1.5
+        assert isinstance(live["last_heartbeat"], datetime)
+
+    async def test_flush_writes_dirty_tasks_once(self, telemetry):
+        telemetry.set_progress("t1", 40)
+        telemetry.add_counts("t2", success=1)
+        session = FakeSession()
+
+        flushed = await telemetry.flush(session)
+        again = await telemetry.flush(FakeSession())
+
+        assert sorted(flushed) == ["t1", "t2"]
+        assert len(session.statements) == 2 and session.commits == 1
+        assert again == []
+
+    async def test_failed_flush_marks_tasks_dirty_again(self, telemetry):
+        telemetry.set_progress("t1", 40)
+
+        with pytest.raises(RuntimeError):
+            await telemetry.flush(FakeSession(fail=True))
+
+        assert await telemetry.flush(FakeSession()) == ["t1"]
+
+    async def test_flush_keeps_larger_database_values(self, telemetry):
+        # 在真实方言（SQLite）上执行写回语句
+        engine = create_async_engine("sqlite+aiosqlite://")
+        async with engine.begin() as conn:
+            await conn.run_sync(SpiderTask.__table__.create)
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        async with sessions() as db:
+            db.add(_running_task(total_count=50, success_count=5, failed_count=0))
+            await db.commit()
+
+        telemetry.start(_running_task(total_count=0, success_count=0, failed_count=0))
+        telemetry.add_counts("t1", success=10, failed=2)
+        telemetry.heartbeat("t1", memory_mb=256)
+        async with sessions() as db:
+            assert await telemetry.flush(db) == ["t1"]
+        async with sessions() as db:
+            task = await db.get(SpiderTask, "t1")
+        await engine.dispose()
+
+        assert (task.total_count, task.success_count, task.failed_count) == (50, 10, 2)
+        assert task.peak_memory_mb == 256
+
+    def test_terminal_status_only_for_existing_entries(self, telemetry):
+        telemetry.set_status("t1", SpiderTaskStatus.FAILED)
+        assert telemetry.get("t1") is None
+
+        telemetry.set_progress("t1", 10)
+        telemetry.set_status("t1", SpiderTaskStatus.FAILED)
+        assert telemetry.get("t1")["status"] == "failed"
+
+    def test_changes_publish_full_snapshot(self, telemetry):
+        telemetry.start(_running_task(total_count=2, success_count=2, failed_count=0))
+        telemetry.set_progress("t1", 30)
+
+        channel, raw = tt.redis_client.published[-1]
+        message = json.loads(raw)
+
+        assert channel == tt.TELEMETRY_CHANNEL
+        assert message["task_id"] == "t1"
+        live = TaskTelemetry.parse(message["data"])
+        assert live["progress"] == 30 and live["total_count"] == 2 and live["status"] == "running"
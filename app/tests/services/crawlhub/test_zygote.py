@@ -0,0 +1,48 @@
+import asyncio
+import os
+
+import pytest
+
+from services.crawlhub.zygote import ZygotePool
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    monkeypatch.setenv("CRAWLHUB_ZYGOTE_PRELOAD", "json")
+    pool = ZygotePool(size=1, socket_dir=tmp_path / "sock")
+    yield pool
+    pool.shutdown()
+
+
+class TestZygotePool:
+    async def test_runs_script_with_env_and_cwd(self, pool, tmp_path):
+        work_dir = tmp_path / "work"
+        work_dir.mkdir()
+        (work_dir / "helper.py").write_text("VALUE = 'from-helper'\n")
+        (work_dir / "main.py").write_text(
+            "import os, sys\n"
+            "from helper import VALUE\n"
+            "print(VALUE, os.environ['CRAWLHUB_TASK_ID'], os.getcwd())\n"
+            "print('err', file=sys.stderr)\n"
+            "sys.exit(3)\n"
+        )
+        env = {**os.environ, "CRAWLHUB_TASK_ID": "t-1"}
+
+        process = await pool.spawn(["python", str(work_dir / "main.py")], work_dir, env)
+        stdout, stderr = await asyncio.gather(process.stdout.read(), process.stderr.read())
+
+        assert await process.wait() == 3
+        assert stdout.decode().split() == ["from-helper", "t-1", str(work_dir)]
+        assert stderr.decode().strip() == "err"
+
+    async def test_inline_code_and_kill(self, pool, tmp_path):
+        process = await pool.spawn(
+            ["python", "-c", "import time; print('started', flush=True); time.sleep(60)"],
+            tmp_path,
+            dict(os.environ),
+        )
+        assert (await process.stdout.readline()).strip() == b"started"
+
+        process.kill()
+
+        assert await asyncio.wait_for(process.wait(), timeout=10) == -9